@@ -1,4 +1,5 @@
 import os
+from typing import List
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -6,11 +7,239 @@ load_dotenv()
 
 class Settings:
     USE_MOCK_AWS: bool = os.getenv("USE_MOCK_AWS", "false").lower() == "true"
-    AWS_REGION: str = os.getenv("APP_AWS_REGION") or os.getenv("AWS_REGION") or "ap-southeast-2"
-    BEDROCK_REGION: str = os.getenv("BEDROCK_REGION","us-east-1")
+    AWS_REGION: str = (
+        os.getenv("APP_AWS_REGION") or os.getenv("AWS_REGION") or "ap-southeast-2"
+    )
+    BEDROCK_REGION: str = os.getenv("BEDROCK_REGION", "us-east-1")
+    # hedged requests go here when the primary region is slow; empty disables hedging
+    BEDROCK_SECONDARY_REGION: str = os.getenv("BEDROCK_SECONDARY_REGION", "")
+    # point bedrock-runtime at a local stand-in (python -m devtools.fake_bedrock)
+    BEDROCK_ENDPOINT_URL: str = os.getenv("BEDROCK_ENDPOINT_URL", "")
+    # use InvokeModelWithResponseStream, so abandoned calls stop generating
+    BEDROCK_STREAMING: bool = os.getenv("BEDROCK_STREAMING", "false").lower() == "true"
     DYNAMODB_TABLE_NAME: str = os.getenv("DYNAMODB_TABLE_NAME", "ai-router-usage-logs")
 
+    # botocore connection tuning (shared by every AWS client, see app/services/aws.py)
+    AWS_MAX_POOL_CONNECTIONS: int = int(os.getenv("AWS_MAX_POOL_CONNECTIONS", "40"))
+    AWS_CONNECT_TIMEOUT: float = float(os.getenv("AWS_CONNECT_TIMEOUT", "2"))
+    AWS_READ_TIMEOUT: float = float(os.getenv("AWS_READ_TIMEOUT", "5"))
+    AWS_MAX_ATTEMPTS: int = int(os.getenv("AWS_MAX_ATTEMPTS", "3"))
+    BEDROCK_READ_TIMEOUT: float = float(os.getenv("BEDROCK_READ_TIMEOUT", "120"))
+
+    # hedged Bedrock requests (see app/services/hedging.py)
+    HEDGE_PERCENTILE: float = float(os.getenv("HEDGE_PERCENTILE", "0.95"))
+    HEDGE_MIN_DELAY_MS: float = float(os.getenv("HEDGE_MIN_DELAY_MS", "250"))
+    HEDGE_MIN_SAMPLES: int = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+    HEDGE_MAX_RATE: float = float(os.getenv("HEDGE_MAX_RATE", "0.05"))
+    HEDGE_TOKEN_BUDGET_PER_HOUR: int = int(
+        os.getenv("HEDGE_TOKEN_BUDGET_PER_HOUR", "200000")
+    )
+
+    # per-request deadline (API Gateway gives up at 29s) and LLM circuit breakers
+    REQUEST_DEADLINE_SECONDS: float = float(os.getenv("REQUEST_DEADLINE_SECONDS", "28"))
+    DEADLINE_SAFETY_MARGIN_SECONDS: float = float(
+        os.getenv("DEADLINE_SAFETY_MARGIN_SECONDS", "1")
+    )
+    CIRCUIT_ERROR_THRESHOLD: float = float(os.getenv("CIRCUIT_ERROR_THRESHOLD", "0.5"))
+    CIRCUIT_MIN_CALLS: int = int(os.getenv("CIRCUIT_MIN_CALLS", "10"))
+    CIRCUIT_WINDOW_SECONDS: float = float(os.getenv("CIRCUIT_WINDOW_SECONDS", "60"))
+    CIRCUIT_COOLDOWN_SECONDS: float = float(os.getenv("CIRCUIT_COOLDOWN_SECONDS", "30"))
+
+    # AIMD concurrency limit per Bedrock model and region (see app/services/concurrency.py)
+    LIMITER_INITIAL_LIMIT: float = float(os.getenv("LIMITER_INITIAL_LIMIT", "8"))
+    LIMITER_MIN_LIMIT: float = float(os.getenv("LIMITER_MIN_LIMIT", "1"))
+    LIMITER_MAX_LIMIT: float = float(os.getenv("LIMITER_MAX_LIMIT", "64"))
+    LIMITER_BACKOFF: float = float(os.getenv("LIMITER_BACKOFF", "0.5"))
+    LIMITER_LATENCY_TOLERANCE: float = float(
+        os.getenv("LIMITER_LATENCY_TOLERANCE", "2.0")
+    )
+    LIMITER_MAX_QUEUE_WAIT_MS: float = float(
+        os.getenv("LIMITER_MAX_QUEUE_WAIT_MS", "2000")
+    )
+    LIMITER_MAX_QUEUE_DEPTH: int = int(os.getenv("LIMITER_MAX_QUEUE_DEPTH", "100"))
+    LIMITER_THROTTLE_RETRIES: int = int(os.getenv("LIMITER_THROTTLE_RETRIES", "2"))
+
+    # generation model routing between Haiku and Sonnet (see app/services/model_router.py)
+    MODEL_ROUTER_SIMPLE_THRESHOLD: float = float(
+        os.getenv("MODEL_ROUTER_SIMPLE_THRESHOLD", "0.35")
+    )
+    MODEL_ROUTER_LATENCY_TARGET_MS: float = float(
+        os.getenv("MODEL_ROUTER_LATENCY_TARGET_MS", "12000")
+    )
+    MODEL_ROUTER_COST_WEIGHT: float = float(
+        os.getenv("MODEL_ROUTER_COST_WEIGHT", "0.2")
+    )
+    MODEL_ROUTER_DECAY: float = float(os.getenv("MODEL_ROUTER_DECAY", "0.98"))
+
+    # logging: records are written from a background thread; success-path request
+    # records and trace segments are kept at this rate, errors always
+    LOG_ASYNC: bool = os.getenv("LOG_ASYNC", "true").lower() == "true"
+    LOG_SUCCESS_SAMPLE_RATE: float = float(os.getenv("LOG_SUCCESS_SAMPLE_RATE", "1.0"))
+
+    # per-stage spans: X-Ray segment documents in the logs and a Server-Timing header
+    TRACING_ENABLED: bool = os.getenv("TRACING_ENABLED", "true").lower() == "true"
+    SERVER_TIMING_ENABLED: bool = (
+        os.getenv("SERVER_TIMING_ENABLED", "true").lower() == "true"
+    )
+
+    # on-demand request profiling (see app/services/profiling.py); a request is
+    # profiled when it carries a valid signed X-Profile header or is sampled
+    PROFILE_SECRET: str = os.getenv("PROFILE_SECRET", "")
+    PROFILE_SAMPLE_RATE: float = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+    PROFILE_INTERVAL_MS: float = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+    PROFILE_MAX_STACKS: int = int(os.getenv("PROFILE_MAX_STACKS", "200"))
+
+    # latency histograms served at /metrics; set a shared directory when running
+    # several uvicorn workers so each scrape sees all of them
+    METRICS_MULTIPROC_DIR: str = os.getenv("METRICS_MULTIPROC_DIR", "")
+
+    # usage records and CloudWatch metrics are written after the response by a
+    # background thread; on Lambda pending work is spooled to disk first so a
+    # frozen or restarted environment picks it up on the next invocation
+    BACKGROUND_WORK: bool = os.getenv("BACKGROUND_WORK", "true").lower() == "true"
+    BACKGROUND_SPOOL_DIR: str = os.getenv("BACKGROUND_SPOOL_DIR", "")
+    BACKGROUND_MAX_ATTEMPTS: int = int(os.getenv("BACKGROUND_MAX_ATTEMPTS", "5"))
+    BACKGROUND_DRAIN_SECONDS: float = float(os.getenv("BACKGROUND_DRAIN_SECONDS", "5"))
+
+    # production server (python -m app.serve): prefork uvicorn workers, 0 means
+    # one per core; workers are replaced after about SERVE_MAX_REQUESTS requests
+    SERVE_HOST: str = os.getenv("SERVE_HOST", "0.0.0.0")
+    SERVE_PORT: int = int(os.getenv("SERVE_PORT", "8000"))
+    SERVE_WORKERS: int = int(os.getenv("SERVE_WORKERS", "0"))
+    SERVE_MAX_REQUESTS: int = int(os.getenv("SERVE_MAX_REQUESTS", "10000"))
+    SERVE_MAX_REQUESTS_JITTER: int = int(os.getenv("SERVE_MAX_REQUESTS_JITTER", "1000"))
+    SERVE_GRACEFUL_TIMEOUT: int = int(os.getenv("SERVE_GRACEFUL_TIMEOUT", "30"))
+
+    # plans and classifications cached in a memory-mapped file shared by every
+    # worker on the host (see app/services/shared_cache.py); the directory
+    # defaults to /dev/shm, or /tmp where there is none
+    SHARED_CACHE_ENABLED: bool = (
+        os.getenv("SHARED_CACHE_ENABLED", "true").lower() == "true"
+    )
+    SHARED_CACHE_DIR: str = os.getenv("SHARED_CACHE_DIR", "")
+    SHARED_CACHE_PLAN_SLOTS: int = int(os.getenv("SHARED_CACHE_PLAN_SLOTS", "2048"))
+    SHARED_CACHE_PLAN_SLOT_BYTES: int = int(
+        os.getenv("SHARED_CACHE_PLAN_SLOT_BYTES", "16384")
+    )
+    SHARED_CACHE_PLAN_TTL_SECONDS: int = int(
+        os.getenv("SHARED_CACHE_PLAN_TTL_SECONDS", "3600")
+    )
+    SHARED_CACHE_CLASSIFICATION_SLOTS: int = int(
+        os.getenv("SHARED_CACHE_CLASSIFICATION_SLOTS", "8192")
+    )
+    SHARED_CACHE_CLASSIFICATION_TTL_SECONDS: int = int(
+        os.getenv("SHARED_CACHE_CLASSIFICATION_TTL_SECONDS", "86400")
+    )
+
+    # asynchronous plan jobs (POST /api/v1/plan-jobs, see app/services/plan_jobs.py);
+    # without a queue URL and table they run in-process and are kept in memory
+    JOBS_QUEUE_URL: str = os.getenv("JOBS_QUEUE_URL", "")
+    JOBS_TABLE_NAME: str = os.getenv("JOBS_TABLE_NAME", "")
+    JOBS_DEADLINE_SECONDS: float = float(os.getenv("JOBS_DEADLINE_SECONDS", "240"))
+    JOBS_MAX_ATTEMPTS: int = int(os.getenv("JOBS_MAX_ATTEMPTS", "3"))
+    # a failed SQS delivery is retried after this, doubled on every receive
+    JOBS_RETRY_DELAY_SECONDS: float = float(os.getenv("JOBS_RETRY_DELAY_SECONDS", "10"))
+    JOBS_TTL_SECONDS: int = int(os.getenv("JOBS_TTL_SECONDS", "604800"))
+    JOBS_LOCAL_CONCURRENCY: int = int(os.getenv("JOBS_LOCAL_CONCURRENCY", "4"))
+    # completion webhooks are signed with this when set (X-Plan-Job-Signature)
+    JOBS_CALLBACK_SECRET: str = os.getenv("JOBS_CALLBACK_SECRET", "")
+    JOBS_CALLBACK_TIMEOUT_SECONDS: float = float(
+        os.getenv("JOBS_CALLBACK_TIMEOUT_SECONDS", "10")
+    )
+    # comma-separated; when set, callbacks may only go to these hosts
+    JOBS_CALLBACK_ALLOWED_HOSTS: List[str] = [
+        host.strip().lower()
+        for host in os.getenv("JOBS_CALLBACK_ALLOWED_HOSTS", "").split(",")
+        if host.strip()
+    ]
+    # local development only: allow http:// callbacks to private and loopback hosts
+    JOBS_CALLBACK_ALLOW_LOCAL: bool = (
+        os.getenv("JOBS_CALLBACK_ALLOW_LOCAL", "false").lower() == "true"
+    )
+
+    # cancel a request whose client disconnected (uvicorn only: API Gateway does
+    # not tell Lambda); with BEDROCK_STREAMING the Bedrock call stops too
+    CANCEL_ON_DISCONNECT: bool = (
+        os.getenv("CANCEL_ON_DISCONNECT", "true").lower() == "true"
+    )
+
+    # Idempotency-Key support on the POST endpoints (see app/services/idempotency.py);
+    # without a table, records are kept in memory per process
+    IDEMPOTENCY_ENABLED: bool = (
+        os.getenv("IDEMPOTENCY_ENABLED", "true").lower() == "true"
+    )
+    IDEMPOTENCY_TABLE_NAME: str = os.getenv("IDEMPOTENCY_TABLE_NAME", "")
+    IDEMPOTENCY_TTL_SECONDS: int = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+    # an in-progress marker older than this belonged to a request that died
+    IDEMPOTENCY_LOCK_SECONDS: int = int(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "60"))
+    IDEMPOTENCY_POLL_INTERVAL_MS: float = float(
+        os.getenv("IDEMPOTENCY_POLL_INTERVAL_MS", "250")
+    )
+    IDEMPOTENCY_MAX_ENTRIES: int = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "10000"))
+    # compressed response bytes the in-memory store keeps before evicting the oldest
+    IDEMPOTENCY_MAX_BYTES: int = int(os.getenv("IDEMPOTENCY_MAX_BYTES", "33554432"))
+
+    # generated plans, kept compressed and served by GET /api/v1/plans/{request_id}
+    # (see app/services/plan_store.py); without a table they are kept in memory
+    PLANS_STORE_ENABLED: bool = (
+        os.getenv("PLANS_STORE_ENABLED", "true").lower() == "true"
+    )
+    PLANS_TABLE_NAME: str = os.getenv("PLANS_TABLE_NAME", "")
+    PLANS_TTL_SECONDS: int = int(os.getenv("PLANS_TTL_SECONDS", "7776000"))
+    # decompressed plans kept per process for reads (~10 KB each for a 12-week plan)
+    PLANS_CACHE_SIZE: int = int(os.getenv("PLANS_CACHE_SIZE", "1000"))
+
+    # precomputed plans for the most requested goals (see app/services/plan_library.py),
+    # from DynamoDB with a table, or from an index file at PLAN_LIBRARY_PATH
+    PLAN_LIBRARY_ENABLED: bool = (
+        os.getenv("PLAN_LIBRARY_ENABLED", "true").lower() == "true"
+    )
+    PLAN_LIBRARY_PATH: str = os.getenv("PLAN_LIBRARY_PATH", "")
+    PLAN_LIBRARY_TABLE_NAME: str = os.getenv("PLAN_LIBRARY_TABLE_NAME", "")
+    PLAN_LIBRARY_RELOAD_SECONDS: float = float(
+        os.getenv("PLAN_LIBRARY_RELOAD_SECONDS", "300")
+    )
+    # the refresh: which goals, how often they are regenerated, how fast
+    PLAN_LIBRARY_TOP_GOALS: int = int(os.getenv("PLAN_LIBRARY_TOP_GOALS", "200"))
+    PLAN_LIBRARY_MIN_REQUESTS: int = int(os.getenv("PLAN_LIBRARY_MIN_REQUESTS", "5"))
+    PLAN_LIBRARY_LOOKBACK_DAYS: int = int(os.getenv("PLAN_LIBRARY_LOOKBACK_DAYS", "30"))
+    PLAN_LIBRARY_MAX_AGE_DAYS: float = float(
+        os.getenv("PLAN_LIBRARY_MAX_AGE_DAYS", "30")
+    )
+    PLAN_LIBRARY_CONCURRENCY: int = int(os.getenv("PLAN_LIBRARY_CONCURRENCY", "4"))
+    PLAN_LIBRARY_REFRESH_SECONDS: float = float(
+        os.getenv("PLAN_LIBRARY_REFRESH_SECONDS", "840")
+    )
+
+    # Bedrock spend from the usage each call reports, priced per model and rolled up
+    # per hour, category and model in memory (see app/services/cost_accounting.py);
+    # the rollups are written as one background job per interval (250 buckets
+    # are the 1000 datums one put_metric_data call takes)
+    COST_FLUSH_SECONDS: float = float(os.getenv("COST_FLUSH_SECONDS", "60"))
+    COST_FLUSH_MAX_BUCKETS: int = int(os.getenv("COST_FLUSH_MAX_BUCKETS", "250"))
+
+    # hourly and daily usage rollups per category behind GET /api/v1/usage/summary
+    # (see app/services/usage_rollups.py); without a table they are kept in memory
+    USAGE_ROLLUPS_ENABLED: bool = (
+        os.getenv("USAGE_ROLLUPS_ENABLED", "true").lower() == "true"
+    )
+    USAGE_ROLLUPS_TABLE_NAME: str = os.getenv("USAGE_ROLLUPS_TABLE_NAME", "")
+    USAGE_ROLLUPS_FLUSH_SECONDS: float = float(
+        os.getenv("USAGE_ROLLUPS_FLUSH_SECONDS", "60")
+    )
+    USAGE_ROLLUPS_MAX_BUCKETS: int = int(os.getenv("USAGE_ROLLUPS_MAX_BUCKETS", "100"))
+    USAGE_ROLLUPS_TTL_DAYS: int = int(os.getenv("USAGE_ROLLUPS_TTL_DAYS", "400"))
+    # 31 days of hourly buckets
+    USAGE_SUMMARY_MAX_BUCKETS: int = int(os.getenv("USAGE_SUMMARY_MAX_BUCKETS", "744"))
+
+    # response compression (brotli is used only when the package is installed)
+    COMPRESSION_MIN_SIZE: int = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+    GZIP_LEVEL: int = int(os.getenv("GZIP_LEVEL", "6"))
+    BROTLI_QUALITY: int = int(os.getenv("BROTLI_QUALITY", "5"))
+
     MOCK_CLASSIFICATION: str = "skill-learning"
+    # mock plan length; 0 derives it from the goal ("in 3 months" -> 12 weeks)
+    MOCK_PLAN_WEEKS: int = int(os.getenv("MOCK_PLAN_WEEKS", "0"))
 
     class Config:
         populate_by_name = True
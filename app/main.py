@@ -1,12 +1,30 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from mangum import Mangum
+from app.middleware import (
+    CompressionMiddleware,
+    DisconnectMiddleware,
+    IdempotencyMiddleware,
+    TracingMiddleware,
+)
+from app.services import (
+    background,
+    cost_accounting,
+    plan_jobs,
+    plan_library,
+    usage_rollups,
+)
+from app.router import router as api_router
+from app.services.histograms import registry
+from app.services.logger import configure_logging, flush_logs
 import logging
 from contextlib import asynccontextmanager
 import json
+from typing import List, Union
 
-# configure logging to use JSON format
-logging.basicConfig(level=logging.INFO, format="%(message)s")
+# records are written from a background thread (see app/services/logger.py)
+configure_logging()
 logger = logging.getLogger(__name__)
 
 
@@ -24,6 +42,10 @@ async def lifespan(app: FastAPI):
         "version": "1.0.0",
     }
     logger.info(json.dumps(startup_log))
+    # post-response work; picks up jobs a previous runtime left in the spool
+    background.worker.start()
+    # writes this worker's histogram snapshot for /metrics, off the event loop
+    registry.start()
 
     yield  # Application runs here
 
@@ -34,6 +56,23 @@ async def lifespan(app: FastAPI):
         "service": "cloud-ai-router",
     }
     logger.info(json.dumps(shutdown_log))
+    buffers: List[Union[cost_accounting.CostAggregator, usage_rollups.RollupBuffer]] = [
+        cost_accounting.aggregator,
+        usage_rollups.buffer,
+    ]
+    for rollups in buffers:
+        if background.on_lambda():
+            # every invocation ends here; flushing each time would be a write per request
+            rollups.maybe_flush()
+        else:
+            rollups.flush()
+    registry.stop()
+    # Mangum runs a lifespan cycle per invocation: on Lambda the background
+    # jobs carry on after the response, and are drained at SIGTERM instead
+    if not background.on_lambda():
+        background.shutdown()
+    # drains the log queue before Lambda freezes the container
+    flush_logs()
 
 
 # create the FastAPI application
@@ -44,6 +83,10 @@ app = FastAPI(
     lifespan=lifespan,
 )
 
+# replay the recorded response for a repeated Idempotency-Key instead of
+# generating again; innermost, so replays pass through everything below
+app.add_middleware(IdempotencyMiddleware)
+
 # add CORS middleware (allows frontend apps to call this API)
 app.add_middleware(
     CORSMiddleware,
@@ -57,6 +100,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# compress large JSON bodies and answer If-None-Match revalidations with 304
+app.add_middleware(CompressionMiddleware)
+
+# per-stage spans: Server-Timing header and X-Ray segment documents in the logs
+app.add_middleware(TracingMiddleware)
+
+# cancel the request, and its Bedrock call, when the client goes away
+app.add_middleware(DisconnectMiddleware)
+
 
 # health check endpoint (important for AWS monitoring)
 @app.get("/health")
@@ -68,22 +120,56 @@ async def health_check():
     return {"status": "healthy", "service": "ai-productivity-router"}
 
 
+# Prometheus scrape endpoint (latency histograms, see app/services/histograms.py)
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def prometheus_metrics():
+    return PlainTextResponse(
+        registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
 # root endpoint with API info
 @app.get("/")
 async def root():
     return {
         "service": "Cloud AI Personal Productivity Router",
         "version": "1.0.0",
-        "endpoints": {"generate_plan": "/api/v1/generate-plan", "health": "/health"},
+        "endpoints": {
+            "generate_plan": "/api/v1/generate-plan",
+            "plan_jobs": "/api/v1/plan-jobs",
+            "health": "/health",
+            "metrics": "/metrics",
+        },
     }
 
 
-# import and include the router
-from app.router import router as api_router
-
+# include the router
 app.include_router(api_router, prefix="/api/v1")
 
 
-# This is the handler that AWS Lambda will call
 # Mangum adapts FastAPI to work with Lambda's event format
-handler = Mangum(app)
+http_handler = Mangum(app)
+
+
+# This is the handler that AWS Lambda will call: API Gateway requests go
+# through Mangum, SQS batches from the plan-jobs queue to the job worker,
+# and the scheduled plan library refresh to plan_library
+def handler(event, context):
+    if plan_jobs.is_sqs_event(event):
+        return plan_jobs.handle_sqs_event(event, context)
+    if plan_library.is_refresh_event(event):
+        return plan_library.handle_refresh_event(event, context)
+    return http_handler(event, context)
+
+
+# the background jobs invocations leave behind are finished at SIGTERM
+def finish_lambda_environment() -> None:
+    """Run when Lambda shuts the environment down, with /tmp about to go."""
+    # the rollups not yet due would go with it
+    cost_accounting.aggregator.flush()
+    usage_rollups.buffer.flush()
+    background.shutdown(background.LAMBDA_SHUTDOWN_SECONDS)
+    flush_logs()
+
+
+background.at_lambda_shutdown(finish_lambda_environment)
@@ -0,0 +1,488 @@
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import time
+from typing import List, Optional, Tuple
+from app.config import settings
+from app.services import idempotency
+from app.services.cancellation import DISCONNECTED
+from app.services.deadline import Deadline
+from app.services.logger import structured_logger, success_sampled
+from app.services.tracing import start_trace
+
+try:
+    import brotli
+except ImportError:  # optional dependency, gzip is always available
+    brotli = None
+
+
+logger = logging.getLogger(__name__)
+
+COMPRESSIBLE_TYPES = ("application/json", "text/")
+# headers that describe the identity body and must be rewritten after encoding
+BODY_HEADERS = (b"content-length", b"content-encoding", b"etag")
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """
+    Pick the best encoding the client accepts: br, then gzip.
+
+    q-values of 0 opt an encoding out; other weights are treated as equal
+    since every browser sends both.
+    """
+    accepted = set()
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(name.strip())
+
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=settings.BROTLI_QUALITY)
+    # mtime=0 keeps the output (and so the ETag) deterministic
+    return gzip.compress(body, compresslevel=settings.GZIP_LEVEL, mtime=0)
+
+
+def make_etag(body: bytes) -> str:
+    """Strong ETag over the identity (uncompressed) representation."""
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """
+    Compare an If-None-Match header against the identity ETag.
+
+    Encoded representations carry a "-gzip"/"-br" suffix, so a client that
+    cached the compressed variant still revalidates against the same body.
+    """
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.strip('"')
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        candidate = candidate.strip('"')
+        if candidate == opaque or candidate.rsplit("-", 1)[0] == opaque:
+            return True
+    return False
+
+
+class CompressionMiddleware:
+    """
+    Negotiated gzip/brotli compression plus strong ETags and 304s.
+
+    Pure ASGI so it behaves the same under uvicorn and under Mangum (which
+    base64-encodes the compressed body for API Gateway on its own).
+
+    - bodies under COMPRESSION_MIN_SIZE bytes are sent as-is
+    - GET 200 responses get an ETag; a matching If-None-Match
+      short-circuits to 304 without sending the body
+    - streaming responses (more than one body message) pass straight through
+    """
+
+    def __init__(self, app, minimum_size: Optional[int] = None):
+        self.app = app
+        self.minimum_size = (
+            settings.COMPRESSION_MIN_SIZE if minimum_size is None else minimum_size
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_headers = {
+            key.decode().lower(): value.decode() for key, value in scope["headers"]
+        }
+        encoding = choose_encoding(request_headers.get("accept-encoding", ""))
+        conditional = scope["method"] == "GET"
+        if_none_match = request_headers.get("if-none-match")
+
+        start_message = None
+        streaming = False
+
+        async def buffered_send(message):
+            nonlocal start_message, streaming
+
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+
+            if message["type"] != "http.response.body" or streaming:
+                await send(message)
+                return
+
+            if message.get("more_body", False):
+                # streaming response: forward untouched from here on
+                streaming = True
+                await send(start_message)
+                await send(message)
+                return
+
+            await self.finalize(
+                start_message,
+                message.get("body", b""),
+                encoding,
+                conditional,
+                if_none_match,
+                send,
+            )
+
+        await self.app(scope, receive, buffered_send)
+
+    async def finalize(
+        self,
+        start_message: dict,
+        body: bytes,
+        encoding: Optional[str],
+        conditional: bool,
+        if_none_match: Optional[str],
+        send,
+    ):
+        status = start_message["status"]
+        headers: List[Tuple[bytes, bytes]] = list(start_message.get("headers", []))
+        header_map = {key.lower(): value for key, value in headers}
+
+        etag = None
+        if conditional and status == 200:
+            existing = header_map.get(b"etag")
+            etag = existing.decode() if existing else make_etag(body)
+            if if_none_match and etag_matches(if_none_match, etag):
+                kept = [
+                    (key, value)
+                    for key, value in headers
+                    if key.lower() not in BODY_HEADERS + (b"content-type",)
+                ]
+                kept.append((b"etag", etag.encode()))
+                if encoding and b"vary" not in header_map:
+                    kept.append((b"vary", b"Accept-Encoding"))
+                await send(
+                    {"type": "http.response.start", "status": 304, "headers": kept}
+                )
+                await send({"type": "http.response.body", "body": b""})
+                return
+
+        content_type = header_map.get(b"content-type", b"").decode()
+        if (
+            encoding
+            and len(body) >= self.minimum_size
+            and b"content-encoding" not in header_map
+            and content_type.startswith(COMPRESSIBLE_TYPES)
+        ):
+            body = compress(body, encoding)
+            headers = [(k, v) for k, v in headers if k.lower() not in BODY_HEADERS]
+            headers.append((b"content-encoding", encoding.encode()))
+            headers.append((b"content-length", str(len(body)).encode()))
+            if etag:
+                opaque = etag.strip('"')
+                headers.append((b"etag", f'"{opaque}-{encoding}"'.encode()))
+            etag = None
+            if b"vary" in header_map:
+                headers = [
+                    (k, v + b", Accept-Encoding" if k.lower() == b"vary" else v)
+                    for k, v in headers
+                ]
+            else:
+                headers.append((b"vary", b"Accept-Encoding"))
+
+        if etag and b"etag" not in header_map:
+            headers.append((b"etag", etag.encode()))
+
+        await send({**start_message, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+
+class TracingMiddleware:
+    """
+    Starts a trace per HTTP request (see app/services/tracing.py).
+
+    The spans finished by the time the response starts go out in a
+    Server-Timing header; the whole trace is logged as an X-Ray segment
+    document once the response is sent (sampled like the other
+    success-path records, always for 5xx).
+    """
+
+    def __init__(self, app, server_timing: Optional[bool] = None):
+        self.app = app
+        self.server_timing = (
+            settings.SERVER_TIMING_ENABLED if server_timing is None else server_timing
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.TRACING_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        trace_header = None
+        for key, value in scope["headers"]:
+            if key.lower() == b"x-amzn-trace-id":
+                trace_header = value.decode()
+        trace = start_trace(trace_header=trace_header)
+        trace.sampled = success_sampled()
+        trace.http["request"] = {"method": scope["method"], "url": scope["path"]}
+
+        async def traced_send(message):
+            if message["type"] == "http.response.start":
+                trace.http["response"] = {"status": message["status"]}
+                if self.server_timing:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", trace.server_timing().encode()))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, traced_send)
+        finally:
+            # no response at all: the client left (499, as nginx logs it) or we failed
+            status = trace.http.get("response", {}).get(
+                "status", 499 if DISCONNECTED in scope else 500
+            )
+            if trace.sampled or status >= 500:
+                structured_logger.log_trace_segment(trace.segment())
+
+
+async def send_json(
+    send,
+    status: int,
+    content: dict,
+    headers: Optional[List[Tuple[bytes, bytes]]] = None,
+):
+    body = json.dumps(content).encode()
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                *(headers or []),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+class IdempotencyMiddleware:
+    """
+    Idempotency-Key support for the POST endpoints (see app/services/idempotency.py).
+
+    The first request with a key claims it and its response is recorded;
+    a later request with the same key and body gets that response again
+    (with Idempotent-Replayed: true) instead of a fresh generation, and
+    one arriving while the first is still running waits for it, within
+    its own request deadline, then gets a 409 if it is still running.
+    The same key with a different body is a 422. 5xx responses are not
+    recorded, so a retry after a failure runs again.
+
+    Innermost, so CORS, compression and Server-Timing apply to replays
+    as to any other response.
+    """
+
+    def __init__(
+        self,
+        app,
+        paths: Tuple[str, ...] = (
+            "/api/v1/generate-plan",
+            "/api/v1/plan-jobs",
+            "/api/v1/revise-plan",
+        ),
+    ):
+        self.app = app
+        self.paths = paths
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope["method"] != "POST"
+            or scope["path"] not in self.paths
+            or not settings.IDEMPOTENCY_ENABLED
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        header = None
+        for key, value in scope["headers"]:
+            if key.lower() == idempotency.HEADER.encode():
+                header = value.decode("latin-1")
+        if header is None:
+            await self.app(scope, receive, send)
+            return
+        if not idempotency.valid_key(header):
+            await send_json(
+                send,
+                400,
+                {
+                    "detail": f"Idempotency-Key must be 1-{idempotency.MAX_KEY_LENGTH} printable characters"
+                },
+            )
+            return
+
+        # the body is part of the fingerprint, so read it here and replay it
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] != "http.request":
+                break
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                break
+        body = b"".join(chunks)
+
+        key = f"{scope['path']}:{header}"
+        digest = idempotency.fingerprint(scope["path"], body)
+        wait = Deadline.for_request(scope).remaining()
+        outcome, record = await idempotency.acquire(key, digest, wait)
+
+        if outcome == idempotency.MISMATCH:
+            await send_json(
+                send,
+                422,
+                {
+                    "detail": "Idempotency-Key was already used with a different request body"
+                },
+            )
+            return
+        if outcome == idempotency.BUSY:
+            await send_json(
+                send,
+                409,
+                {"detail": "A request with this Idempotency-Key is still in progress"},
+                [(b"retry-after", b"2")],
+            )
+            return
+        if outcome == idempotency.REPLAY:
+            headers = idempotency.stored_headers(record) + [
+                (b"idempotent-replayed", b"true")
+            ]
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": record["status_code"],
+                    "headers": headers,
+                }
+            )
+            await send({"type": "http.response.body", "body": record["body"]})
+            return
+
+        token = record["lock_token"]
+        body_sent = False
+
+        async def replay_receive():
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        start_message = None
+        response_chunks = []
+
+        async def recording_send(message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                start_message = message
+            elif message["type"] == "http.response.body":
+                response_chunks.append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, replay_receive, recording_send)
+        except BaseException:
+            await idempotency.release(key, token)
+            raise
+
+        if start_message is None or start_message["status"] >= 500:
+            # transient: let the client's retry run again
+            await idempotency.release(key, token)
+            return
+        await idempotency.complete(
+            key,
+            token,
+            start_message["status"],
+            list(start_message.get("headers", [])),
+            b"".join(response_chunks),
+        )
+
+
+class DisconnectMiddleware:
+    """
+    Cancels a request whose client has gone away.
+
+    Once the app has read the request body, a watcher waits on receive()
+    for http.disconnect; if it arrives before the response is complete, the
+    app is cancelled and the disconnect time is left in the scope for the
+    endpoint to log (see app/services/cancellation.py). Cancellation reaches
+    the Bedrock call, and a streamed one stops at its next chunk.
+
+    Under Mangum there is no connection to watch (API Gateway does not pass
+    disconnects on to Lambda), so Lambda events go straight through.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or "aws.event" in scope
+            or not settings.CANCEL_ON_DISCONNECT
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        body_read = asyncio.Event()
+        response_complete = False
+
+        async def tracking_receive():
+            message = await receive()
+            if message["type"] != "http.request" or not message.get("more_body", False):
+                body_read.set()
+            return message
+
+        async def tracking_send(message):
+            nonlocal response_complete
+            if message["type"] == "http.response.body" and not message.get(
+                "more_body", False
+            ):
+                response_complete = True
+            await send(message)
+
+        app_task = asyncio.ensure_future(
+            self.app(scope, tracking_receive, tracking_send)
+        )
+
+        async def watch():
+            # only once the body is read, so the app and the watcher never
+            # wait on receive() for the same message
+            await body_read.wait()
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    break
+            if not response_complete and not app_task.done():
+                scope[DISCONNECTED] = time.monotonic()
+                logger.info(
+                    f"Client disconnected from {scope['method']} {scope['path']}, cancelling"
+                )
+                app_task.cancel()
+
+        watcher = asyncio.ensure_future(watch())
+        try:
+            await app_task
+        except asyncio.CancelledError:
+            # ours: there is no one left to answer; anyone else's (shutdown) propagates
+            if DISCONNECTED not in scope or asyncio.current_task().cancelling():
+                raise
+        finally:
+            watcher.cancel()
@@ -1,5 +1,5 @@
-from pydantic import BaseModel, Field
-from typing import List, Optional
+from pydantic import BaseModel, Field, model_validator
+from typing import Dict, List, Optional
 from datetime import datetime
 
 
@@ -55,6 +55,19 @@ class Resource(BaseModel):
     relevance_score: Optional[float] = Field(None, ge=0, le=1)
 
 
+# the part of the plan the LLM writes, validated straight from its JSON text
+class GeneratedPlan(BaseModel):
+    estimated_duration_weeks: int = Field(..., ge=1, le=52)
+    weekly_breakdown: List[WeeklyBreakdown]
+    resources: List[Resource] = Field(default_factory=list)
+    total_estimated_hours: float
+
+
+# the weeks a revision rewrites, validated straight from the LLM's JSON text
+class RevisedWeeks(BaseModel):
+    weekly_breakdown: List[WeeklyBreakdown] = Field(..., min_length=1)
+
+
 # Return: structured plan to the user
 class GeneratePlanResponse(BaseModel):
     """
@@ -77,3 +90,87 @@ class GeneratePlanResponse(BaseModel):
     metadata: dict = Field(
         default_factory=dict, description="Internal metadata (tokens used, cost, etc.)"
     )
+
+
+# asynchronous job mode: same request, plus where to push the result
+class PlanJobRequest(GeneratePlanRequest):
+    callback_url: Optional[str] = Field(
+        default=None,
+        max_length=2048,
+        pattern=r"^https?://",
+        description="An https URL on a public host; receives a POST with the job status once it succeeds or fails",
+    )
+
+
+# Return: job status, with the plan once it has been generated
+class PlanJobResponse(BaseModel):
+    job_id: str
+    status: str = Field(..., description="queued, running, succeeded or failed")
+    created_at: datetime
+    updated_at: datetime
+    attempts: int = 0
+    result: Optional[GeneratePlanResponse] = None
+    error: Optional[dict] = Field(
+        default=None, description="status_code and detail of the failure"
+    )
+
+
+# This is what the user sends to revise some weeks of a plan
+class RevisePlanRequest(BaseModel):
+    request_id: Optional[str] = Field(
+        default=None, description="A plan returned earlier (GET /plans/{request_id})"
+    )
+    plan: Optional[GeneratePlanResponse] = Field(
+        default=None, description="Or the plan itself, e.g. one the user has edited"
+    )
+    weeks: List[int] = Field(
+        ..., min_length=1, max_length=12, description="Week numbers to regenerate"
+    )
+    feedback: Optional[str] = Field(
+        default=None,
+        max_length=1000,
+        description="What to change in those weeks",
+    )
+
+    @model_validator(mode="after")
+    def one_plan(self) -> "RevisePlanRequest":
+        if (self.request_id is None) == (self.plan is None):
+            raise ValueError("Pass either request_id or plan")
+        return self
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "request_id": "3f1c9a52-7c1e-4b5e-9d8a-2f64a1b0c7d3",
+                "weeks": [3, 4],
+                "feedback": "I can only practise on weekends",
+            }
+        }
+
+
+# one hour or day of one category, from the usage rollups
+class UsageStats(BaseModel):
+    requests: int
+    errors: int
+    error_rate: float
+    avg_latency_ms: Optional[float] = None
+    p95_latency_ms: Optional[float] = None
+    input_tokens: int
+    output_tokens: int
+    total_tokens: int
+    cost_usd: float
+
+
+class UsageBucket(UsageStats):
+    bucket: str = Field(..., description="UTC hour (2026-10-19-14) or day (2026-10-19)")
+    category: str
+
+
+class UsageSummaryResponse(BaseModel):
+    granularity: str
+    start: str
+    end: str
+    buckets: List[UsageBucket]
+    categories: Dict[str, UsageStats] = Field(
+        ..., description="Totals per category over the whole range"
+    )
@@ -1,15 +1,39 @@
-from fastapi import APIRouter, HTTPException, status
-from app.models.schemas import GeneratePlanRequest, GeneratePlanResponse
-from app.services.classifier import classify_goal
+from fastapi import APIRouter, HTTPException, Request, Response, status
+from fastapi.responses import JSONResponse
+from app.models.schemas import (
+    GeneratePlanRequest,
+    GeneratePlanResponse,
+    PlanJobRequest,
+    PlanJobResponse,
+    RevisePlanRequest,
+    UsageSummaryResponse,
+)
+from app.services.classifier import classify_goal, known_category
 from app.services.planner import generate_plan
+from app.services.reviser import revise_plan
+from app.services.circuit_breaker import CircuitOpenError
+from app.services.concurrency import Overloaded, limiter_snapshots
+from app.services.deadline import Deadline, DeadlineExceeded
 import app.services.cost_guard as cost_guard
-from app.services.db_logger import log_request
-from app.services.logger import structured_logger
-from app.services.metrics import metrics
+from app.services import cancellation, cost_accounting
+from app.services.background import defer
+from app.services.histograms import observe_request
+from app.services.logger import structured_logger, success_sampled
+
+# imported for the background jobs they register: the CloudWatch metrics and "usage_log"
+from app.services import metrics  # noqa: F401
+from app.services import db_logger  # noqa: F401
+from app.services import plan_jobs, plan_library
+from app.services import plan_store  # registers the "plan_store" background job
+from app.services import usage_rollups
+from app.services.profiling import finish_profile, start_profile
+from app.services.tracing import annotate, current_trace, record_span, span
+import asyncio
 import uuid
 import logging
 import time
-from datetime import datetime
+from datetime import datetime, timedelta
+from typing import Any, Dict, Literal, Optional
 
 
 logger = logging.getLogger(__name__)
@@ -17,13 +41,169 @@ logger = logging.getLogger(__name__)
 router = APIRouter(prefix="", tags=["Plan Generation"])
 
 
+def plan_response(plan: GeneratePlanResponse) -> Response:
+    """
+    Serialize the plan once, in pydantic-core, and hand FastAPI the bytes.
+
+    Returning a Response skips FastAPI's response_model re-validation and
+    jsonable_encoder pass; response_model stays on the route for the docs.
+    """
+    return Response(content=plan.model_dump_json(), media_type="application/json")
+
+
+def log_completed(
+    request_id: str,
+    request: GeneratePlanRequest,
+    status_code: int,
+    start_time: float,
+    classification_ms: float,
+    endpoint: str = "/generate-plan",
+    **fields,
+) -> None:
+    """
+    Latency histograms for every request, then the consolidated request
+    record (success-path records are sampled).
+    """
+    trace = current_trace()
+    latency_ms = (time.time() - start_time) * 1000
+    stages = (
+        trace.stage_timings()
+        if trace is not None
+        else {"classification": classification_ms}
+    )
+    observe_request(
+        endpoint,
+        status_code,
+        latency_ms,
+        fields.get("category"),
+        fields.get("model_id"),
+        stages,
+    )
+
+    sampled = trace.sampled if trace is not None else success_sampled()
+    if status_code < 400 and not sampled:
+        return
+    structured_logger.log_request_completed(
+        request_id=request_id,
+        status_code=status_code,
+        latency_ms=latency_ms,
+        goal_length=len(request.goal),
+        stages=stages,
+        **fields,
+    )
+
+
+def defer_usage(
+    request_id: str,
+    request: GeneratePlanRequest,
+    latency_ms: float,
+    success: bool,
+    category: str,
+    usage: Dict[str, Any],
+    metric_category: str,
+    model_id: Optional[str] = None,
+    error: Optional[str] = None,
+    endpoint: str = "/generate-plan",
+) -> None:
+    """
+    CloudWatch metrics and the DynamoDB usage record, written after the
+    response by the background worker (app/services/background.py).
+
+    `usage` is the request's closed cost meter: the tokens Bedrock reported
+    for every call it made, priced per model. The request is also counted
+    in the hourly and daily usage rollups, which are written in batches.
+    """
+    finished_at = time.time()
+    usage_rollups.record(category, success, latency_ms, usage, finished_at)
+    defer(
+        "request_metrics",
+        latency_ms=latency_ms,
+        endpoint=endpoint,
+        success=success,
+        category=metric_category,
+        tokens=usage["total_tokens"] if usage["calls"] else None,
+        model_id=model_id,
+        concurrency=limiter_snapshots(),
+        timestamp=finished_at,
+    )
+    defer(
+        "usage_log",
+        request_id=request_id,
+        goal=request.goal,
+        category=category,
+        tokens_used=usage["total_tokens"],
+        input_tokens=usage["input_tokens"],
+        output_tokens=usage["output_tokens"],
+        cost_usd=usage["cost_usd"],
+        latency_ms=latency_ms,
+        success=success,
+        error=error,
+        model_id=model_id,
+        timestamp=finished_at,
+    )
+
+
+def report_cancelled(
+    request_id: str,
+    request: GeneratePlanRequest,
+    start_time: float,
+    category: Optional[str],
+    reason: str,
+    ledger: cancellation.CancellationLedger,
+    meter: cost_accounting.CostMeter,
+) -> None:
+    """
+    Once the Bedrock calls the request abandoned have stopped: the
+    request_cancelled record, CloudWatch metrics and the usage record, with
+    the tokens they used and what stopping them saved.
+    """
+    latency_ms = (time.time() - start_time) * 1000
+
+    def report(ledger: cancellation.CancellationLedger) -> None:
+        structured_logger.log_request_cancelled(
+            request_id=request_id,
+            reason=reason,
+            latency_ms=latency_ms,
+            abandoned_calls=ledger.calls,
+            tokens_used=ledger.tokens_used,
+            tokens_saved=ledger.tokens_saved,
+            worker_seconds_saved=ledger.worker_seconds_saved,
+            totals=cancellation.savings.snapshot(),
+        )
+        defer(
+            "cancellation_metrics",
+            tokens_used=ledger.tokens_used,
+            tokens_saved=ledger.tokens_saved,
+            worker_seconds_saved=ledger.worker_seconds_saved,
+            timestamp=time.time(),
+        )
+        # the abandoned calls have been charged to the meter by now
+        defer_usage(
+            request_id,
+            request,
+            latency_ms,
+            success=False,
+            category=category or "unknown",
+            usage=meter.close(category),
+            metric_category=category or "cancelled",
+            error=reason,
+        )
+
+    ledger.settle(report)
+
+
 @router.post(
     "/generate-plan",
     response_model=GeneratePlanResponse,
     status_code=status.HTTP_200_OK,
     summary="Generate a structured action plan from a goal",
 )
-async def generate_plan_endpoint(request: GeneratePlanRequest):
+async def generate_plan_endpoint(
+    request: GeneratePlanRequest,
+    # None when called directly, as tests/test_local.py does; FastAPI only
+    # injects the request for a plain Request annotation, not Optional[Request]
+    http_request: Request = None,  # type: ignore[assignment]
+):
     """
     Main endpoint that orchestrates the plan generation process.
 
@@ -31,103 +211,161 @@ async def generate_plan_endpoint(request: GeneratePlanRequest):
     1. Intent classification
     2. Cost estimation and guardrails
     3. Structured plan generation
-    4. Usage logging
+    4. Usage logging and metrics, queued to run after the response
+
+    Stages share one deadline (see app/services/deadline.py); a stage that
+    overruns its slice is cancelled.
     """
     request_id = str(uuid.uuid4())
     start_time = time.time()
+    trace = current_trace()
+    if trace is not None:
+        # everything before the endpoint ran: body read, JSON parse, validation
+        record_span("parse", trace.root.start, time.perf_counter())
+    annotate("request_id", request_id)
+    profiler = start_profile(http_request.headers if http_request else None)
+    deadline = Deadline.for_request(http_request.scope if http_request else None)
+    # Bedrock calls abandoned if the client leaves are accounted for here
+    ledger = cancellation.start(request_id)
+    # what the request's Bedrock calls really used, classification included
+    meter = cost_accounting.start(request_id)
 
-    category = None
-    tokens_used = 0
-
-    structured_logger.log_request(
-        request_id=request_id, goal=request.goal, goal_length=len(request.goal)
-    )
-
-    logger.info(
-        f"Request {request_id}: Starting plan generation",
-        extra={"request_id": request_id, "goal_length": len(request.goal)},
-    )
+    category: Optional[str] = None
+    estimated_tokens = 0
+    classification_latency = 0.0
 
     try:
-        # classify the intent/category
-        logger.info(f"Request {request_id}")
-
-        classification_start = time.time()
-        category = await classify_goal(request.goal)
-        classification_latency = (time.time() - classification_start) * 1000
+        # a head goal with a precomputed plan: no classification, no Bedrock
+        with span("library"):
+            plan = await plan_library.lookup(request.goal, request.context, request_id)
+        if plan is not None:
+            category = plan.category
+            annotate("category", category)
+        else:
+            # classify the intent/category
+            with span("classification") as classification_span:
+                try:
+                    category = await deadline.run(
+                        "classification", classify_goal(request.goal)
+                    )
+                except DeadlineExceeded as e:
+                    # the category only tunes the prompt, so carry on without it
+                    logger.warning(f"Request {request_id}: {e}, using 'other'")
+                    category = "other"
+            classification_latency = classification_span.duration_ms
+            annotate("category", category)
 
-        logger.info("Classifying goal category")
+            # check cost limits before calling LLM - cost guardrail
+            try:
+                with span("cost_guard"):
+                    estimated_tokens = cost_guard.estimate_cost(
+                        request.goal, request.context
+                    )
+                    cost_guard.check_cost_limits(estimated_tokens)
+            except HTTPException as e:
+                structured_logger.log_cost_guard_triggered(
+                    request_id=request_id,
+                    estimated_tokens=estimated_tokens,
+                    max_allowed=3000,  # Use your actual limit from cost_guard
+                    goal_length=len(request.goal),
+                )
+                # counted in the request metrics and rollups as a failure below
+                raise e
 
-        category = await classify_goal(request.goal)
+            # generate plan
+            plan = await deadline.run(
+                "generation",
+                generate_plan(
+                    goal=request.goal,
+                    context=request.context,
+                    category=category,
+                    request_id=request_id,
+                ),
+            )
 
-        logger.info(f"Classified as '{category}'")
+        total_latency = (time.time() - start_time) * 1000
+        usage = meter.close(category)
 
-        structured_logger.log_classification(
-            request_id=request_id, category=category, latency_ms=classification_latency
+        # CloudWatch metrics and the DynamoDB usage record, after the response
+        defer_usage(
+            request_id,
+            request,
+            total_latency,
+            success=True,
+            category=category,
+            usage=usage,
+            metric_category=category,
+            model_id=plan.metadata.get("model_id"),
         )
 
-        # check cost limits before calling LLM - cost guardrail
-        logger.info("Checking cost limits")
-        tokens_used = cost_guard.estimate_cost(request.goal, request.context)
-        try:
-            cost_guard.check_cost_limits(tokens_used)
-        except HTTPException as e:
-            structured_logger.log_cost_guard_triggered(
-                request_id=request_id,
-                estimated_tokens=tokens_used,
-                max_allowed=3000,  # Use your actual limit from cost_guard
-                goal_length=len(request.goal),
-            )
-            metrics.publish_cost_guard_trigger()
-            raise e
-
-        # generate plan
-        logger.info("Generating plan with LLM")
-        plan = await generate_plan(
-            goal=request.goal,
-            context=request.context,
+        log_completed(
+            request_id,
+            request,
+            status.HTTP_200_OK,
+            start_time,
+            classification_latency,
             category=category,
-            request_id=request_id,
+            model_id=plan.metadata.get("model_id"),
+            tokens=plan.metadata.get("tokens_used"),
+            routing=plan.metadata.get("routing"),
+            hedged=plan.metadata.get("hedged", False),
+            cost_usd=usage["cost_usd"],
         )
 
-        total_latency = (time.time() - start_time) * 1000
+        response = plan_response(plan)
+        # kept for GET /plans/{request_id}; written to the store after the response
+        await plan_store.save(request_id, response.body)
+        return response
 
-        # publish metrics to CloudWatch
-        metrics.publish_latency(latency_ms=total_latency, endpoint="/generate-plan")
-        metrics.publish_request_count(success=True, category=category)
-        metrics.publish_token_usage(
-            tokens=tokens_used,
-            model_id="mock-model",  # Use actual model ID in production
+    except asyncio.CancelledError:
+        # cancelled by the disconnect middleware (app/middleware.py): nobody is
+        # waiting for the plan, and the Bedrock call is being aborted
+        disconnected = (
+            http_request is not None and cancellation.DISCONNECTED in http_request.scope
         )
-
-        # log request for observability
-        await log_request(
-            request_id=request_id,
-            goal=request.goal,
+        reason = "client_disconnected" if disconnected else "cancelled"
+        report_cancelled(
+            request_id, request, start_time, category, reason, ledger, meter
+        )
+        log_completed(
+            request_id,
+            request,
+            499,
+            start_time,
+            classification_latency,
             category=category,
-            tokens_used=tokens_used,
-            latency_ms=total_latency,
-            success=True,
+            error_type="Cancelled",
+            reason=reason,
         )
+        raise
 
-        logger.info(
-            f"Request {request_id}: Plan generated successfully",
-            extra={"latency_ms": total_latency, "tokens_used": tokens_used},
+    except HTTPException as e:
+        # cost guard rejections and unparseable plans: failures in the usage
+        # records and rollups like any other
+        defer_usage(
+            request_id,
+            request,
+            (time.time() - start_time) * 1000,
+            success=False,
+            category=category or "unknown",
+            usage=meter.close(category),
+            metric_category=category or "error",
+            error=str(e.detail),
+        )
+        log_completed(
+            request_id,
+            request,
+            e.status_code,
+            start_time,
+            classification_latency,
+            category=category,
+            error_type="HTTPException",
         )
-
-        return plan
-
-    except HTTPException:
         raise
 
     except Exception as e:
         total_latency = (time.time() - start_time) * 1000
 
-        logger.error(
-            f"Request {request_id}: Error generating plan",
-            extra={"error": str(e), "error_type": type(e).__name__},
-        )
-
         structured_logger.log_error(
             request_id=request_id,
             error_type=type(e).__name__,
@@ -135,25 +373,329 @@ async def generate_plan_endpoint(request: GeneratePlanRequest):
             goal_length=len(request.goal),
         )
 
-        metrics.publish_request_count(success=False, category=category or "error")
+        # failure metrics and usage record, after the response
+        defer_usage(
+            request_id,
+            request,
+            total_latency,
+            success=False,
+            category=category or "unknown",
+            usage=meter.close(category),
+            metric_category=category or "error",
+            error=str(e),
+        )
+
+        if isinstance(e, DeadlineExceeded):
+            error = HTTPException(
+                status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+                detail="Plan generation took too long. Please try again.",
+            )
+        elif isinstance(e, (CircuitOpenError, Overloaded)):
+            error = HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Plan generation is temporarily unavailable. Please try again shortly.",
+                headers={"Retry-After": str(int(e.retry_after))},
+            )
+        else:
+            error = HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                # detail=f"Error: {str(e)}"
+                detail="An error occurred while generating your plan. Please try again.",
+            )
+        log_completed(
+            request_id,
+            request,
+            error.status_code,
+            start_time,
+            classification_latency,
+            category=category,
+            error_type=type(e).__name__,
+        )
+        raise error
 
-        metrics.publish_latency(latency_ms=total_latency, endpoint="/generate-plan")
+    finally:
+        finish_profile(profiler, request_id)
 
-        # Log failure to DynamoDB
-        await log_request(
-            request_id=request_id,
-            goal=request.goal,
+
+@router.post(
+    "/plan-jobs",
+    response_model=PlanJobResponse,
+    status_code=status.HTTP_202_ACCEPTED,
+    summary="Queue plan generation and return a job ID",
+)
+async def create_plan_job(request: PlanJobRequest):
+    """
+    Asynchronous variant of /generate-plan for plans that take longer than
+    API Gateway's 29s integration timeout.
+
+    The job is queued (SQS in production, see app/services/plan_jobs.py) and
+    a worker runs the same classification, cost guard and generation. Poll
+    the Location URL, or pass callback_url to have the finished job POSTed
+    to you.
+    """
+    if request.callback_url:
+        try:
+            await asyncio.to_thread(plan_jobs.callback_address, request.callback_url)
+        except ValueError as e:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e)
+            )
+        except OSError:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="callback_url host could not be resolved",
+            )
+    try:
+        job = await plan_jobs.submit(request)
+    except Exception:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Plan jobs are temporarily unavailable. Please try again shortly.",
+            headers={"Retry-After": "5"},
+        )
+    return JSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content=plan_jobs.job_view(job),
+        headers={"Location": f"/api/v1/plan-jobs/{job['job_id']}"},
+    )
+
+
+@router.get(
+    "/plan-jobs/{job_id}",
+    response_model=PlanJobResponse,
+    summary="Status of a plan job, with the plan once it has succeeded",
+)
+async def get_plan_job(job_id: str):
+    job = await plan_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Job not found"
+        )
+    headers = {}
+    if job["status"] not in plan_jobs.TERMINAL:
+        # generation takes seconds; tell pollers not to spin
+        headers["Retry-After"] = "2"
+    return JSONResponse(content=plan_jobs.job_view(job), headers=headers)
+
+
+@router.get(
+    "/plans/{request_id}",
+    response_model=GeneratePlanResponse,
+    summary="A previously generated plan, by the request_id it was returned with",
+)
+async def get_plan(request_id: str):
+    """
+    Plans are stored compressed (app/services/plan_store.py) and never change,
+    so they are returned as stored, cacheable by clients for as long as they like.
+    """
+    body = await plan_store.get(request_id)
+    if body is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Plan not found"
+        )
+    return Response(
+        content=body,
+        media_type="application/json",
+        headers={"Cache-Control": "private, max-age=86400, immutable"},
+    )
+
+
+@router.post(
+    "/revise-plan",
+    response_model=GeneratePlanResponse,
+    summary="Regenerate some weeks of a plan, keeping the rest",
+)
+async def revise_plan_endpoint(
+    request: RevisePlanRequest,
+    http_request: Request = None,  # type: ignore[assignment]
+):
+    """
+    Rewrite only the requested weeks of a stored plan (by request_id) or a
+    submitted one, optionally following the user's feedback, and return the
+    whole plan with its totals recomputed under a new request_id.
+
+    The prompt carries a one-line outline of the plan plus the weeks being
+    replaced, so tokens and latency scale with the weeks revised, not with
+    the plan (see app/services/reviser.py).
+    """
+    request_id = str(uuid.uuid4())
+    start_time = time.time()
+    annotate("request_id", request_id)
+    deadline = Deadline.for_request(http_request.scope if http_request else None)
+    ledger = cancellation.start(request_id)
+    meter = cost_accounting.start(request_id)
+
+    # set once the plan is found; a missing plan or week is logged like any other failure
+    category: Optional[str] = None
+    usage_request = GeneratePlanRequest.model_construct(
+        goal="", context=request.feedback
+    )
+
+    try:
+        plan = request.plan
+        if plan is None:
+            # one_plan() guarantees the id when there is no plan
+            assert request.request_id is not None
+            body = await plan_store.get(request.request_id)
+            if body is None:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND, detail="Plan not found"
+                )
+            plan = GeneratePlanResponse.model_validate_json(body)
+        missing = set(request.weeks) - {
+            week.week_number for week in plan.weekly_breakdown
+        }
+        if missing:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"The plan has no week(s) {sorted(missing)}",
+            )
+        # a submitted plan's category is the client's text
+        category = known_category(plan.category)
+        # the usage helpers expect a plan request
+        usage_request = GeneratePlanRequest.model_construct(
+            goal=plan.goal, context=request.feedback
+        )
+        annotate("category", category)
+
+        revised = await deadline.run(
+            "generation", revise_plan(plan, request.weeks, request.feedback, request_id)
+        )
+    except asyncio.CancelledError:
+        disconnected = (
+            http_request is not None and cancellation.DISCONNECTED in http_request.scope
+        )
+        reason = "client_disconnected" if disconnected else "cancelled"
+        report_cancelled(
+            request_id, usage_request, start_time, category, reason, ledger, meter
+        )
+        log_completed(
+            request_id,
+            usage_request,
+            499,
+            start_time,
+            0.0,
+            endpoint="/revise-plan",
+            category=category,
+            error_type="Cancelled",
+            reason=reason,
+        )
+        raise
+    except HTTPException as e:
+        # unknown plans or weeks, cost guard rejections and unparseable revisions
+        defer_usage(
+            request_id,
+            usage_request,
+            (time.time() - start_time) * 1000,
+            success=False,
             category=category or "unknown",
-            tokens_used=0,
-            latency_ms=total_latency,
+            usage=meter.close(category),
+            metric_category=category or "error",
+            error=str(e.detail),
+            endpoint="/revise-plan",
+        )
+        log_completed(
+            request_id,
+            usage_request,
+            e.status_code,
+            start_time,
+            0.0,
+            endpoint="/revise-plan",
+            category=category,
+            error_type="HTTPException",
+        )
+        raise
+    except Exception as e:
+        structured_logger.log_error(
+            request_id=request_id,
+            error_type=type(e).__name__,
+            error_message=str(e),
+            goal_length=len(usage_request.goal),
+        )
+        defer_usage(
+            request_id,
+            usage_request,
+            (time.time() - start_time) * 1000,
             success=False,
+            category=category or "unknown",
+            usage=meter.close(category),
+            metric_category=category or "error",
             error=str(e),
+            endpoint="/revise-plan",
         )
+        error = plan_jobs.describe_error(e)
+        headers = None
+        if isinstance(e, (CircuitOpenError, Overloaded)):
+            headers = {"Retry-After": str(int(e.retry_after))}
+        log_completed(
+            request_id,
+            usage_request,
+            error["status_code"],
+            start_time,
+            0.0,
+            endpoint="/revise-plan",
+            category=category,
+            error_type=type(e).__name__,
+        )
+        raise HTTPException(headers=headers, **error)
+
+    usage = meter.close(category)
+    defer_usage(
+        request_id,
+        usage_request,
+        (time.time() - start_time) * 1000,
+        success=True,
+        category=category,
+        usage=usage,
+        metric_category=category,
+        model_id=revised.metadata["model_id"],
+        endpoint="/revise-plan",
+    )
+    log_completed(
+        request_id,
+        usage_request,
+        status.HTTP_200_OK,
+        start_time,
+        0.0,
+        endpoint="/revise-plan",
+        category=category,
+        model_id=revised.metadata["model_id"],
+        tokens=revised.metadata["tokens_used"],
+        revised_weeks=revised.metadata["revised_weeks"],
+        cost_usd=usage["cost_usd"],
+    )
+
+    response = plan_response(revised)
+    await plan_store.save(request_id, response.body)
+    return response
 
+
+@router.get(
+    "/usage/summary",
+    response_model=UsageSummaryResponse,
+    tags=["Usage"],
+    summary="Requests, errors, p95 latency and tokens per hour or day, by category",
+)
+async def usage_summary(
+    granularity: Literal["hour", "day"] = "hour",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    category: Optional[str] = None,
+):
+    """
+    Read from the usage rollups (app/services/usage_rollups.py), not the raw
+    usage records: the cost is one item per bucket and category, however
+    many requests they count. Defaults to the last 24 hours, or the last 30
+    days by day; times are UTC.
+    """
+    end = end or datetime.utcnow()
+    if start is None:
+        start = end - (
+            timedelta(hours=23) if granularity == "hour" else timedelta(days=29)
+        )
+    try:
+        return await usage_rollups.summary(granularity, start, end, category)
+    except ValueError as e:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            # detail=f"Error: {str(e)}" 
-            detail="An error occurred while generating your plan. Please try again.",
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e)
         )
-    
-    
@@ -0,0 +1,292 @@
+"""
+Production server: a prefork master supervising uvicorn workers.
+
+    python -m app.serve --workers 4 --port 8000
+
+The master imports the app and creates the AWS clients once, then forks;
+workers share those pages copy-on-write and start serving immediately.
+All workers accept on one listening socket bound by the master.
+
+- SIGTERM / SIGINT: workers stop accepting, finish in-flight requests
+  (including LLM calls) for up to --graceful-timeout, run the lifespan
+  shutdown (background jobs, log queue), then exit.
+- A worker exits after --max-requests (plus per-worker jitter so they do
+  not all restart at once) and the master forks a fresh one.
+- A worker that dies is replaced; one that dies during startup is
+  replaced with backoff.
+- With METRICS_MULTIPROC_DIR, an exited worker's histogram snapshot is
+  folded into the archive, so /metrics keeps counting its requests.
+
+The Lambda deployment keeps using app.main:handler; `uvicorn --reload`
+stays the development server (docker-compose.yml).
+"""
+import argparse
+import logging
+import os
+import random
+import signal
+import socket
+import sys
+import tempfile
+import time
+from typing import Dict, Optional
+from app.config import settings
+
+
+logger = logging.getLogger(__name__)
+
+# a worker that exits sooner than this after starting counts as a crash
+MIN_WORKER_LIFETIME = 1.0
+MAX_RESPAWN_DELAY = 10.0
+STOP_SIGNALS = {signal.SIGTERM, signal.SIGINT}
+
+
+def preload():
+    """Import the app and create the AWS clients before forking."""
+    from app.main import app
+    from app.services.bedrock import get_invoker
+
+    # the classifier calls Bedrock in AWS_REGION, the planner in BEDROCK_REGION;
+    # creating a client loads its service model, which takes tens of ms
+    for region in {settings.BEDROCK_REGION, settings.AWS_REGION}:
+        get_invoker(region)
+    return app
+
+
+def bind_socket(host: str, port: int) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def recycle_after(app, max_requests: int, server_ref: list):
+    """
+    Stop accepting as soon as the last request arrives.
+
+    uvicorn's limit_max_requests is checked on a 100 ms tick, and until then
+    the worker keeps accepting connections that its shutdown closes unanswered.
+    Closing this worker's copy of the listening socket leaves them in the
+    backlog for the other workers.
+    """
+    served = 0
+
+    async def wrapper(scope, receive, send):
+        nonlocal served
+        if scope["type"] == "http":
+            served += 1
+            if served == max_requests:
+                server = server_ref[0]
+                for listener in server.servers:
+                    listener.close()
+                server.should_exit = True
+        await app(scope, receive, send)
+
+    return wrapper
+
+
+def run_worker(
+    app, sock: socket.socket, max_requests: int, graceful_timeout: int
+) -> int:
+    """Serve in this (forked) process until told to stop or recycled."""
+    import uvicorn
+
+    # the master's handlers were inherited; uvicorn installs its own
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    # blocked by the master across the fork (see Master.spawn)
+    signal.pthread_sigmask(signal.SIG_UNBLOCK, STOP_SIGNALS)
+
+    server_ref: list = []
+    config = uvicorn.Config(
+        recycle_after(app, max_requests, server_ref) if max_requests else app,
+        lifespan="on",
+        # records go through the app's log queue; request_completed replaces access logs
+        log_config=None,
+        access_log=False,
+        timeout_graceful_shutdown=graceful_timeout,
+    )
+    server = uvicorn.Server(config)
+    server_ref.append(server)
+    server.run(sockets=[sock])
+    return 0 if server.started else 3
+
+
+class Master:
+    def __init__(
+        self,
+        app,
+        sock: socket.socket,
+        workers: int,
+        max_requests: int,
+        max_requests_jitter: int,
+        graceful_timeout: int,
+    ):
+        self.app = app
+        self.sock = sock
+        self.workers = workers
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.graceful_timeout = graceful_timeout
+        self.children: Dict[int, float] = {}  # pid -> start time
+        self.stopping = False
+        self.respawn_delay = 0.0
+
+    def spawn(self) -> None:
+        max_requests = self.max_requests
+        if max_requests and self.max_requests_jitter:
+            max_requests += random.randint(0, self.max_requests_jitter)
+        # until run_worker resets them the child has the master's handlers,
+        # and its copy of handle_stop would swallow a stop signal: hold them
+        signal.pthread_sigmask(signal.SIG_BLOCK, STOP_SIGNALS)
+        try:
+            pid = os.fork()
+        except OSError:
+            signal.pthread_sigmask(signal.SIG_UNBLOCK, STOP_SIGNALS)
+            raise
+        if pid == 0:
+            code = 1
+            try:
+                code = run_worker(
+                    self.app, self.sock, max_requests, self.graceful_timeout
+                )
+            except Exception as e:
+                logger.error(f"Worker {os.getpid()} failed: {e}")
+            finally:
+                from app.services.logger import flush_logs
+
+                flush_logs()
+                os._exit(code)
+        signal.pthread_sigmask(signal.SIG_UNBLOCK, STOP_SIGNALS)
+        self.children[pid] = time.monotonic()
+        logger.info(
+            f"Started worker {pid} (recycled after {max_requests or 'no'} requests)"
+        )
+
+    def handle_stop(self, sig, frame) -> None:
+        self.stopping = True
+
+    def reap(self) -> None:
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                self.children.clear()
+                return
+            if pid == 0:
+                return
+            started = self.children.pop(pid, None)
+            if settings.METRICS_MULTIPROC_DIR:
+                # imported here: main() sets the directory before the registry exists
+                from app.services.histograms import fold_snapshot
+
+                fold_snapshot(settings.METRICS_MULTIPROC_DIR, pid)
+            if started is None or self.stopping:
+                continue
+            code = os.waitstatus_to_exitcode(status)
+            if time.monotonic() - started < MIN_WORKER_LIFETIME:
+                self.respawn_delay = min(
+                    max(self.respawn_delay * 2, 0.5), MAX_RESPAWN_DELAY
+                )
+                logger.error(f"Worker {pid} exited with {code} during startup")
+            else:
+                self.respawn_delay = 0.0
+                logger.info(f"Worker {pid} exited with {code}, replacing it")
+
+    def run(self) -> int:
+        signal.signal(signal.SIGTERM, self.handle_stop)
+        signal.signal(signal.SIGINT, self.handle_stop)
+        logger.info(
+            f"Serving on {self.sock.getsockname()} with {self.workers} workers (master {os.getpid()})"
+        )
+        while not self.stopping:
+            self.reap()
+            if len(self.children) < self.workers and not self.stopping:
+                if self.respawn_delay:
+                    time.sleep(self.respawn_delay)
+                self.spawn()
+                continue
+            time.sleep(0.1)
+        return self.shutdown()
+
+    def shutdown(self) -> int:
+        logger.info(
+            f"Stopping {len(self.children)} workers, draining in-flight requests"
+        )
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        # uvicorn's own timeout covers the requests; leave time for the lifespan shutdown
+        expires = (
+            time.monotonic()
+            + self.graceful_timeout
+            + settings.BACKGROUND_DRAIN_SECONDS
+            + 1
+        )
+        while self.children and time.monotonic() < expires:
+            self.reap()
+            time.sleep(0.05)
+        for pid in list(self.children):
+            logger.warning(f"Worker {pid} did not stop in time, killing it")
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        self.sock.close()
+        return 0
+
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(description="Prefork production server")
+    parser.add_argument("--host", default=settings.SERVE_HOST)
+    parser.add_argument("--port", type=int, default=settings.SERVE_PORT)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=settings.SERVE_WORKERS,
+        help="0 means one per core",
+    )
+    parser.add_argument(
+        "--max-requests",
+        type=int,
+        default=settings.SERVE_MAX_REQUESTS,
+        help="0 disables recycling",
+    )
+    parser.add_argument(
+        "--max-requests-jitter", type=int, default=settings.SERVE_MAX_REQUESTS_JITTER
+    )
+    parser.add_argument(
+        "--graceful-timeout", type=int, default=settings.SERVE_GRACEFUL_TIMEOUT
+    )
+    args = parser.parse_args(argv)
+
+    workers = args.workers or (
+        len(os.sched_getaffinity(0))
+        if hasattr(os, "sched_getaffinity")
+        else os.cpu_count() or 1
+    )
+    if workers > 1 and not settings.METRICS_MULTIPROC_DIR:
+        # /metrics merges every worker's histograms (app/services/histograms.py);
+        # set before the registry is created on import
+        settings.METRICS_MULTIPROC_DIR = tempfile.mkdtemp(prefix="ai-router-metrics-")
+
+    app = preload()
+    sock = bind_socket(args.host, args.port)
+    master = Master(
+        app,
+        sock,
+        workers=workers,
+        max_requests=args.max_requests,
+        max_requests_jitter=args.max_requests_jitter,
+        graceful_timeout=args.graceful_timeout,
+    )
+    return master.run()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+import boto3
+import logging
+import threading
+from typing import Dict, Optional, Tuple
+from botocore.config import Config
+from app.config import settings
+
+
+logger = logging.getLogger(__name__)
+
+# Clients and resources live for the lifetime of the process, so a warm Lambda
+# (or a uvicorn worker) reuses the same urllib3 pool and its open connections
+_session: Optional[boto3.session.Session] = None
+_clients: Dict[Tuple[str, Optional[str], Optional[str]], object] = {}
+_resources: Dict[Tuple[str, Optional[str], Optional[str]], object] = {}
+_lock = threading.RLock()
+
+# Bedrock generation can stream for tens of seconds, everything else is a
+# single-digit millisecond control-plane call
+READ_TIMEOUTS = {
+    "bedrock-runtime": settings.BEDROCK_READ_TIMEOUT,
+}
+
+# Bedrock throttles are retried by the concurrency limiter
+# (app/services/concurrency.py), which has to see every one of them to back
+# off; botocore retrying them underneath would hide the signal
+RETRIES = {
+    "bedrock-runtime": {"mode": "standard", "total_max_attempts": 1},
+}
+
+
+def build_config(service_name: str) -> Config:
+    """
+    Build the botocore config shared by every client of a service.
+
+    - pool sized to the worker thread count so concurrent calls never
+      discard connections (the botocore default is 10)
+    - TCP keepalive so idle pooled connections survive between invocations
+    - adaptive retries, which add client-side rate limiting on throttles
+      (except for Bedrock, see RETRIES)
+    """
+    return Config(
+        max_pool_connections=settings.AWS_MAX_POOL_CONNECTIONS,
+        tcp_keepalive=True,
+        connect_timeout=settings.AWS_CONNECT_TIMEOUT,
+        read_timeout=READ_TIMEOUTS.get(service_name, settings.AWS_READ_TIMEOUT),
+        retries=RETRIES.get(
+            service_name,
+            {"mode": "adaptive", "max_attempts": settings.AWS_MAX_ATTEMPTS},
+        ),
+    )
+
+
+def get_session() -> boto3.session.Session:
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                _session = boto3.session.Session()
+    return _session
+
+
+def get_client(
+    service_name: str,
+    region_name: Optional[str] = None,
+    endpoint_url: Optional[str] = None,
+):
+    """
+    Return the process-wide client for a service/region, creating it once.
+
+    boto3 clients are thread-safe, sessions are not, so creation is
+    serialized while reads stay lock-free.
+    """
+    key = (service_name, region_name or settings.AWS_REGION, endpoint_url)
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                client = get_session().client(
+                    service_name,
+                    region_name=key[1],
+                    endpoint_url=endpoint_url,
+                    config=build_config(service_name),
+                )
+                _clients[key] = client
+    return client
+
+
+def get_resource(
+    service_name: str,
+    region_name: Optional[str] = None,
+    endpoint_url: Optional[str] = None,
+):
+    """Return the process-wide boto3 resource for a service/region."""
+    key = (service_name, region_name or settings.AWS_REGION, endpoint_url)
+    resource = _resources.get(key)
+    if resource is None:
+        with _lock:
+            resource = _resources.get(key)
+            if resource is None:
+                resource = get_session().resource(
+                    service_name,
+                    region_name=key[1],
+                    endpoint_url=endpoint_url,
+                    config=build_config(service_name),
+                )
+                _resources[key] = resource
+    return resource
+
+
+def reset_clients() -> None:
+    """Drop cached clients (tests and benchmarks that swap endpoints)."""
+    global _session
+    with _lock:
+        _clients.clear()
+        _resources.clear()
+        _session = None
@@ -0,0 +1,306 @@
+import heapq
+import json
+import logging
+import os
+import queue
+import signal
+import sys
+import threading
+import time
+import urllib.request
+import uuid
+from typing import Any, Callable, Dict, Optional
+from app.config import settings
+
+
+logger = logging.getLogger(__name__)
+
+# default spool on Lambda: /tmp outlives the runtime process (a timeout or
+# crash restarts it in the same environment), not the environment itself, so
+# jobs are also drained when the environment shuts down (see at_lambda_shutdown)
+LAMBDA_SPOOL_DIR = "/tmp/ai-router-background"
+
+# Lambda kills the runtime 500 ms after SIGTERM when only internal
+# extensions are registered; leave some of it for the logs
+LAMBDA_SHUTDOWN_SECONDS = 0.4
+EXTENSION_NAME = "ai-router-shutdown"
+
+# kind -> function taking the job's JSON payload as keyword arguments
+_handlers: Dict[str, Callable[..., None]] = {}
+
+
+def handler(kind: str):
+    """Register the function that performs jobs of this kind."""
+
+    def register(fn: Callable[..., None]) -> Callable[..., None]:
+        _handlers[kind] = fn
+        return fn
+
+    return register
+
+
+def on_lambda() -> bool:
+    return bool(os.getenv("AWS_LAMBDA_FUNCTION_NAME"))
+
+
+class BackgroundWorker:
+    """
+    Runs post-response work (usage records, CloudWatch metrics) on a daemon thread.
+
+    A job is a registered kind plus a JSON payload, so it can be written to
+    disk. With a spool directory every job is persisted before it is queued
+    and deleted once its handler succeeds, and whatever a restarted runtime
+    finds in the spool is queued again.
+
+    Failed jobs are retried with backoff up to max_attempts. A job waiting
+    for its retry is held aside until it is due, so it never blocks the jobs
+    behind it.
+    """
+
+    def __init__(
+        self,
+        spool_dir: Optional[str] = None,
+        max_attempts: int = 5,
+        retry_delay: float = 0.2,
+    ):
+        self.spool_dir = spool_dir
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.completed = 0
+        self.dropped = 0
+        self._queue: queue.Queue = queue.Queue()
+        # (not_before, id, job): failed jobs waiting for their retry
+        self._delayed: list = []
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def start(self) -> "BackgroundWorker":
+        """Start the thread (once), queueing what an earlier process left in the spool."""
+        with self._lock:
+            if self._thread is None:
+                recovered = self.recover()
+                if recovered:
+                    logger.info(f"Recovered {recovered} spooled background jobs")
+                self._thread = threading.Thread(
+                    target=self._run, name="background-worker", daemon=True
+                )
+                self._thread.start()
+        return self
+
+    def submit(self, kind: str, **payload: Any) -> None:
+        job = {
+            "id": f"{time.time_ns()}-{uuid.uuid4().hex[:8]}",
+            "kind": kind,
+            "payload": payload,
+            "attempts": 0,
+        }
+        if self.spool_dir:
+            self._spool(job, self.spool_dir)
+        self._queue.put(job)
+
+    def _spool(self, job: Dict[str, Any], spool_dir: str) -> None:
+        path = os.path.join(spool_dir, f"{job['id']}.json")
+        try:
+            os.makedirs(spool_dir, exist_ok=True)
+            tmp = f"{path}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(job, f, default=str)
+            os.replace(tmp, path)
+            job["path"] = path
+        except OSError as e:
+            # still runs, it just would not survive a restart
+            logger.warning(f"Could not spool background job {job['id']}: {e}")
+
+    def recover(self) -> int:
+        if not self.spool_dir or not os.path.isdir(self.spool_dir):
+            return 0
+        recovered = 0
+        for name in sorted(os.listdir(self.spool_dir)):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.spool_dir, name)
+            try:
+                with open(path) as f:
+                    job = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Discarding unreadable background job {path}: {e}")
+                self._remove(path)
+                continue
+            job["path"] = path
+            self._queue.put(job)
+            recovered += 1
+        return recovered
+
+    def pending(self) -> int:
+        with self._lock:
+            return self._queue.unfinished_tasks + len(self._delayed)
+
+    def drain(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every queued job has finished; False if the timeout ran out first."""
+        expires = None if timeout is None else time.monotonic() + timeout
+        while self.pending():
+            if expires is not None and time.monotonic() >= expires:
+                return False
+            time.sleep(0.005)
+        return True
+
+    def _release_due(self) -> Optional[float]:
+        """Queue the delayed jobs that are due; seconds until the next one, if any."""
+        now = time.monotonic()
+        with self._lock:
+            while self._delayed and self._delayed[0][0] <= now:
+                # queued before it leaves _delayed, so pending() never dips to zero
+                self._queue.put(self._delayed[0][2])
+                heapq.heappop(self._delayed)
+            return self._delayed[0][0] - now if self._delayed else None
+
+    def _run(self) -> None:
+        while True:
+            wait = self._release_due()
+            try:
+                job = self._queue.get(timeout=wait)
+            except queue.Empty:
+                continue
+            try:
+                self._execute(job)
+            except Exception as e:
+                logger.error(
+                    f"Background job {job.get('id')} crashed the worker loop: {e}"
+                )
+            finally:
+                self._queue.task_done()
+
+    def _execute(self, job: Dict[str, Any]) -> None:
+        fn = _handlers.get(job["kind"])
+        if fn is None:
+            logger.error(
+                f"No handler for background job kind '{job['kind']}', dropping {job['id']}"
+            )
+            self.dropped += 1
+            self._remove(job.get("path"))
+            return
+
+        try:
+            fn(**job["payload"])
+        except Exception as e:
+            job["attempts"] += 1
+            if job["attempts"] < self.max_attempts:
+                delay = self.retry_delay * 2 ** (job["attempts"] - 1)
+                logger.warning(
+                    f"Background job {job['id']} ({job['kind']}) failed, "
+                    f"retry {job['attempts']} in {delay:.2f}s: {e}"
+                )
+                # the spool file stays until it succeeds; held aside before
+                # task_done so drain() never sees an empty queue in between
+                with self._lock:
+                    heapq.heappush(
+                        self._delayed, (time.monotonic() + delay, job["id"], job)
+                    )
+                return
+            logger.error(
+                f"Dropping background job {job['id']} ({job['kind']}) "
+                f"after {job['attempts']} attempts: {e}"
+            )
+            self.dropped += 1
+        else:
+            self.completed += 1
+        self._remove(job.get("path"))
+
+    @staticmethod
+    def _remove(path: Optional[str]) -> None:
+        if not path:
+            return
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Could not remove spooled background job {path}: {e}")
+
+
+worker = BackgroundWorker(
+    spool_dir=settings.BACKGROUND_SPOOL_DIR
+    or (LAMBDA_SPOOL_DIR if on_lambda() else None),
+    max_attempts=settings.BACKGROUND_MAX_ATTEMPTS,
+)
+
+
+def defer(kind: str, **payload: Any) -> None:
+    """
+    Run a registered job after the response; the payload must be JSON-serializable.
+
+    With BACKGROUND_WORK off the handler runs inline, as before.
+    """
+    if not settings.BACKGROUND_WORK:
+        try:
+            _handlers[kind](**payload)
+        except Exception as e:
+            logger.error(f"Inline {kind} job failed: {e}")
+        return
+    worker.start().submit(kind, **payload)
+
+
+def shutdown(timeout: Optional[float] = None) -> None:
+    """Finish pending work, for up to BACKGROUND_DRAIN_SECONDS, before the process exits."""
+    if not worker.pending():
+        return
+    if timeout is None:
+        timeout = settings.BACKGROUND_DRAIN_SECONDS
+    if not worker.drain(timeout):
+        logger.warning(f"{worker.pending()} background jobs still pending at shutdown")
+
+
+def _register_extension() -> bool:
+    """
+    Register an internal Lambda extension, for no events: the runtime is
+    only sent SIGTERM before the environment is reaped while an extension
+    is registered. Init finishes once every extension has asked for its
+    next event; with none registered for, that call returns at shutdown.
+    """
+    api = os.getenv("AWS_LAMBDA_RUNTIME_API")
+    if not api:
+        return False
+    register = urllib.request.Request(
+        f"http://{api}/2020-01-01/extension/register",
+        data=json.dumps({"events": []}).encode(),
+        headers={"Lambda-Extension-Name": EXTENSION_NAME},
+        method="POST",
+    )
+    try:
+        with urllib.request.urlopen(register, timeout=2) as response:
+            extension_id = response.headers["Lambda-Extension-Identifier"]
+    except (OSError, KeyError) as e:
+        logger.warning(f"Could not register the {EXTENSION_NAME} extension: {e}")
+        return False
+    next_event = urllib.request.Request(
+        f"http://{api}/2020-01-01/extension/event/next",
+        headers={"Lambda-Extension-Identifier": extension_id},
+    )
+    threading.Thread(
+        target=lambda: urllib.request.urlopen(next_event).read(),
+        name="lambda-extension",
+        daemon=True,
+    ).start()
+    return True
+
+
+def at_lambda_shutdown(finish: Callable[[], None]) -> bool:
+    """
+    Call `finish` when the Lambda environment shuts down; call during init.
+
+    Invocations return without waiting for their background jobs: the
+    worker thread carries on with them when the environment is thawed for
+    the next invocation, and the spool brings them back after a restart.
+    Only a shutdown, with /tmp about to go, is worth waiting for.
+    """
+    if not on_lambda() or not _register_extension():
+        return False
+
+    def on_sigterm(signum, frame):
+        try:
+            finish()
+        finally:
+            sys.exit(0)
+
+    signal.signal(signal.SIGTERM, on_sigterm)
+    return True
@@ -0,0 +1,323 @@
+import asyncio
+import contextvars
+import json
+import logging
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from botocore.exceptions import ClientError
+from app.config import settings
+from app.services import cancellation, cost_accounting
+from app.services.aws import get_client
+from app.services.circuit_breaker import call_key, counts_as_failure, get_breaker
+from app.services.concurrency import Overloaded, get_limiter, is_throttle
+from app.services.deadline import stage_expired
+from app.services.hedging import HEDGE_LOST, Hedger
+from app.services.tracing import record_span, span
+
+
+logger = logging.getLogger(__name__)
+
+# boto3 is blocking, so calls run here instead of on the event loop; sized
+# like the connection pool so no call waits for a connection
+executor = ThreadPoolExecutor(
+    max_workers=settings.AWS_MAX_POOL_CONNECTIONS, thread_name_prefix="bedrock"
+)
+
+
+class InvocationResult(NamedTuple):
+    body: dict
+    region: str
+    hedged: bool
+    latency_ms: float
+
+
+def usage_tokens(body: dict) -> int:
+    usage = body.get("usage", {})
+    return usage.get("input_tokens", 0) + usage.get("output_tokens", 0)
+
+
+def _invoke_sync(client, model_id: str, payload: str) -> dict:
+    # InvokeModel only sends headers once generation is done, so time to
+    # first byte is most of the call
+    with span("llm_ttfb"):
+        response = client.invoke_model(
+            modelId=model_id,
+            contentType="application/json",
+            accept="application/json",
+            body=payload,
+        )
+    with span("llm_body"):
+        return json.loads(response["body"].read())
+
+
+class StreamAborted(Exception):
+    """A streamed call was abandoned; carries the tokens generated so far."""
+
+    def __init__(self, tokens: int, output_tokens: int = 0):
+        super().__init__(f"Stream abandoned after {tokens} tokens")
+        self.tokens = tokens
+        self.output_tokens = output_tokens
+
+
+def call_outcome(future: Future) -> Tuple[int, int, bool]:
+    """Tokens used, output tokens, and whether an abandoned call stopped before the end."""
+    if future.cancelled():
+        return 0, 0, True
+    error = future.exception()
+    if error is None:
+        usage = future.result().get("usage", {})
+        return usage_tokens(future.result()), usage.get("output_tokens", 0), False
+    if isinstance(error, StreamAborted):
+        return error.tokens, error.output_tokens, True
+    return 0, 0, False
+
+
+def charge(
+    meter: Optional[cost_accounting.CostMeter], model_id: str, future: Future
+) -> None:
+    """Done callback: what the call really used, from Bedrock's usage fields, to the request's meter."""
+    tokens, output_tokens, _ = call_outcome(future)
+    if tokens:
+        cost_accounting.record(meter, model_id, tokens - output_tokens, output_tokens)
+
+
+def _invoke_stream_sync(
+    client, model_id: str, payload: str, cancelled: threading.Event
+) -> dict:
+    """
+    InvokeModelWithResponseStream, assembled into an InvokeModel-shaped body.
+
+    Unlike invoke_model, a streamed call can be abandoned between chunks:
+    closing the stream drops the connection and Bedrock stops generating.
+    """
+    start = time.perf_counter()
+    response = client.invoke_model_with_response_stream(
+        modelId=model_id,
+        contentType="application/json",
+        accept="application/json",
+        body=payload,
+    )
+    stream = response["body"]
+    text: List[str] = []
+    usage = {"input_tokens": 0, "output_tokens": 0}
+    stop_reason = None
+    first_byte = None
+    try:
+        for event in stream:
+            if first_byte is None:
+                first_byte = time.perf_counter()
+                record_span("llm_ttfb", start, first_byte)
+            if cancelled.is_set():
+                # output_tokens only arrives at the end, so estimate from the text
+                output_tokens = len("".join(text)) // 4
+                raise StreamAborted(
+                    usage["input_tokens"] + output_tokens, output_tokens
+                )
+            chunk = event.get("chunk")
+            if chunk is None:
+                continue
+            data = json.loads(chunk["bytes"])
+            if data["type"] == "message_start":
+                usage["input_tokens"] = data["message"]["usage"].get("input_tokens", 0)
+            elif data["type"] == "content_block_delta":
+                text.append(data["delta"].get("text", ""))
+            elif data["type"] == "message_delta":
+                stop_reason = data["delta"].get("stop_reason")
+                usage["output_tokens"] = data.get("usage", {}).get("output_tokens", 0)
+    finally:
+        stream.close()
+        if first_byte is not None:
+            record_span("llm_body", first_byte, time.perf_counter())
+
+    return {
+        "type": "message",
+        "role": "assistant",
+        "content": [{"type": "text", "text": "".join(text)}],
+        "stop_reason": stop_reason,
+        "usage": usage,
+    }
+
+
+class BedrockInvoker:
+    """
+    Async InvokeModel against a primary region, hedged to a secondary.
+
+    Clients are injected so tests can point both sides at local stubs.
+    """
+
+    def __init__(
+        self,
+        primary_client,
+        primary_region: str,
+        secondary_client=None,
+        secondary_region: Optional[str] = None,
+        hedger: Optional[Hedger] = None,
+        streaming: bool = settings.BEDROCK_STREAMING,
+    ):
+        self.primary_client = primary_client
+        self.primary_region = primary_region
+        self.secondary_client = secondary_client
+        self.secondary_region = secondary_region
+        self.hedger = hedger or Hedger()
+        self.streaming = streaming
+
+    def _charge_loser(self, future: Future) -> None:
+        # a running boto3 call cannot be interrupted, so the loser of a hedge
+        # still completes on its thread; its tokens are the hedge's extra spend
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is None:
+            self.hedger.record_extra_tokens(usage_tokens(future.result()))
+        elif isinstance(error, StreamAborted):
+            self.hedger.record_extra_tokens(error.tokens)
+
+    def _call(self, client, region: str, model_id: str, payload: str):
+        limiter = get_limiter(region, model_id)
+
+        async def run() -> dict:
+            for attempt in range(settings.LIMITER_THROTTLE_RETRIES + 1):
+                await limiter.acquire()
+                # the slot is held until the boto3 call really finishes, even
+                # if we stop waiting for it
+                cancelled = threading.Event()
+                # run with a copy of the context so the call's spans join the trace
+                context = contextvars.copy_context()
+                if self.streaming:
+                    future = executor.submit(
+                        context.run,
+                        _invoke_stream_sync,
+                        client,
+                        model_id,
+                        payload,
+                        cancelled,
+                    )
+                else:
+                    future = executor.submit(
+                        context.run, _invoke_sync, client, model_id, payload
+                    )
+                started = time.perf_counter()
+                future.add_done_callback(partial(limiter.complete, started))
+                # every call is charged when it ends, winner, hedge loser or abandoned
+                future.add_done_callback(
+                    partial(charge, cost_accounting.current(), model_id)
+                )
+                try:
+                    return await asyncio.wrap_future(future)
+                except asyncio.CancelledError as e:
+                    cancelled.set()
+                    if e.args and e.args[0] == HEDGE_LOST:
+                        future.add_done_callback(self._charge_loser)
+                    # a request cancelled because its client left reports what
+                    # this call spent and what stopping it saved
+                    ledger = cancellation.current()
+                    if ledger is not None:
+                        ledger.track(future, model_id, started, call_outcome)
+                    raise
+                except ClientError as e:
+                    if not is_throttle(e):
+                        raise
+                    logger.warning(f"{limiter.name} throttled (attempt {attempt + 1})")
+                    # jittered pause so retries do not arrive as one burst
+                    await asyncio.sleep(random.uniform(0, 0.1 * 2**attempt))
+            raise Overloaded(f"{limiter.name}: throttled by Bedrock", upstream=True)
+
+        return run
+
+    async def invoke(
+        self, model_id: str, body: dict, kind: str = "generation"
+    ) -> InvocationResult:
+        payload = json.dumps(body)
+        secondary = (
+            self._call(self.secondary_client, self.secondary_region, model_id, payload)
+            if self.secondary_client is not None and self.secondary_region is not None
+            else None
+        )
+        # worst case for the duplicate: the whole prompt plus max_tokens
+        estimated_tokens = len(payload) // 4 + body.get("max_tokens", 0)
+
+        key = call_key(model_id, kind)
+        breaker = get_breaker(key)
+        breaker.before_call()
+
+        start = time.perf_counter()
+        try:
+            response_body, hedge_won = await self.hedger.run(
+                key,
+                self._call(self.primary_client, self.primary_region, model_id, payload),
+                secondary,
+                estimated_tokens,
+            )
+        except asyncio.CancelledError:
+            # cancelled by the stage deadline: the model was too slow; any
+            # other cancellation (client gone) says nothing about its health
+            if stage_expired():
+                breaker.record_failure()
+            else:
+                breaker.release()
+            raise
+        except Exception as e:
+            if counts_as_failure(e):
+                breaker.record_failure()
+            else:
+                breaker.release()
+            raise
+        breaker.record_success()
+        latency_ms = (time.perf_counter() - start) * 1000
+        cancellation.baselines.record(
+            model_id,
+            response_body.get("usage", {}).get("output_tokens", 0),
+            latency_ms / 1000,
+        )
+        return InvocationResult(
+            body=response_body,
+            region=(self.secondary_region if hedge_won else None)
+            or self.primary_region,
+            hedged=hedge_won,
+            latency_ms=latency_ms,
+        )
+
+
+# one hedger for the process: the rate and token caps are global
+hedger = Hedger()
+_invokers: Dict[str, BedrockInvoker] = {}
+
+
+def get_invoker(region: str = settings.BEDROCK_REGION) -> BedrockInvoker:
+    invoker = _invokers.get(region)
+    if invoker is None:
+        secondary_region = settings.BEDROCK_SECONDARY_REGION or None
+        if secondary_region == region:
+            secondary_region = None
+        endpoint_url = settings.BEDROCK_ENDPOINT_URL or None
+        invoker = BedrockInvoker(
+            primary_client=get_client(
+                "bedrock-runtime", region_name=region, endpoint_url=endpoint_url
+            ),
+            primary_region=region,
+            secondary_client=get_client(
+                "bedrock-runtime",
+                region_name=secondary_region,
+                endpoint_url=endpoint_url,
+            )
+            if secondary_region
+            else None,
+            secondary_region=secondary_region,
+            hedger=hedger,
+        )
+        _invokers[region] = invoker
+    return invoker
+
+
+async def invoke_model(
+    model_id: str,
+    body: dict,
+    region: str = settings.BEDROCK_REGION,
+    kind: str = "generation",
+) -> InvocationResult:
+    """`kind` ("classification", "generation", "revision") picks the breaker and hedge window."""
+    return await get_invoker(region).invoke(model_id, body, kind)
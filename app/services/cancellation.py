@@ -0,0 +1,170 @@
+import contextvars
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+# scope key the disconnect middleware sets (monotonic time) when the client goes away
+DISCONNECTED = "ai_router.disconnected_at"
+
+# weight of the newest call in the per-model baselines
+BASELINE_ALPHA = 0.1
+
+_ledger: contextvars.ContextVar[
+    Optional["CancellationLedger"]
+] = contextvars.ContextVar("cancellation_ledger", default=None)
+
+
+class Baselines:
+    """
+    Moving averages of a completed call's output tokens and duration per
+    model: what an abandoned call would have cost had it run to the end.
+    """
+
+    def __init__(self, alpha: float = BASELINE_ALPHA):
+        self.alpha = alpha
+        self._averages: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, model_id: str, output_tokens: int, seconds: float) -> None:
+        with self._lock:
+            previous = self._averages.get(model_id)
+            if previous is None:
+                self._averages[model_id] = (float(output_tokens), seconds)
+                return
+            tokens, duration = previous
+            self._averages[model_id] = (
+                tokens + self.alpha * (output_tokens - tokens),
+                duration + self.alpha * (seconds - duration),
+            )
+
+    def expected(self, model_id: str) -> Optional[Tuple[float, float]]:
+        return self._averages.get(model_id)
+
+
+class Savings:
+    """Process totals of what cancelled requests spent and saved."""
+
+    def __init__(self):
+        self.cancelled_requests = 0
+        self.tokens_used = 0
+        self.tokens_saved = 0
+        self.worker_seconds_saved = 0.0
+        self._lock = threading.Lock()
+
+    def add(
+        self, tokens_used: int, tokens_saved: int, worker_seconds_saved: float
+    ) -> None:
+        with self._lock:
+            self.cancelled_requests += 1
+            self.tokens_used += tokens_used
+            self.tokens_saved += tokens_saved
+            self.worker_seconds_saved += worker_seconds_saved
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "cancelled_requests": self.cancelled_requests,
+                "tokens_used": self.tokens_used,
+                "tokens_saved": self.tokens_saved,
+                "worker_seconds_saved": round(self.worker_seconds_saved, 3),
+            }
+
+
+baselines = Baselines()
+savings = Savings()
+
+
+class CancellationLedger:
+    """
+    The Bedrock calls one request abandoned, and what they cost.
+
+    A call abandoned by cancellation keeps its executor thread until it
+    notices: a streamed call stops at the next chunk and closes its
+    connection (StreamAborted), a plain InvokeModel runs to the end. Each
+    is accounted for when its future finishes; settle() reports once all
+    of them have.
+    """
+
+    def __init__(self, request_id: str):
+        self.request_id = request_id
+        self.tokens_used = 0
+        self.tokens_saved = 0
+        self.worker_seconds_saved = 0.0
+        self.calls = 0
+        self._pending = 0
+        self._on_settled: Optional[Callable[["CancellationLedger"], None]] = None
+        self._lock = threading.Lock()
+
+    def track(
+        self,
+        future: Future,
+        model_id: str,
+        started: float,
+        outcome: Callable[[Future], Tuple[int, int, bool]],
+    ) -> None:
+        """
+        Account for an abandoned call when it finishes; `outcome` reads its
+        tokens used, output tokens, and whether it stopped before the end.
+        """
+        with self._lock:
+            self._pending += 1
+            self.calls += 1
+        future.add_done_callback(
+            lambda done: self._finished(outcome(done), model_id, started)
+        )
+
+    def _finished(
+        self, result: Tuple[int, int, bool], model_id: str, started: float
+    ) -> None:
+        tokens_used, output_tokens, stopped_early = result
+        tokens_saved, seconds_saved = 0, 0.0
+        expected = baselines.expected(model_id)
+        if stopped_early and expected is not None:
+            expected_tokens, expected_seconds = expected
+            tokens_saved = max(int(expected_tokens) - output_tokens, 0)
+            seconds_saved = max(expected_seconds - (time.perf_counter() - started), 0.0)
+
+        with self._lock:
+            self.tokens_used += tokens_used
+            self.tokens_saved += tokens_saved
+            self.worker_seconds_saved += seconds_saved
+            self._pending -= 1
+            ready = self._pending == 0 and self._on_settled is not None
+        if ready:
+            self._report()
+
+    def settle(self, on_settled: Callable[["CancellationLedger"], None]) -> None:
+        """Call on_settled once every tracked call has finished (perhaps right away)."""
+        with self._lock:
+            self._on_settled = on_settled
+            ready = self._pending == 0
+        if ready:
+            self._report()
+
+    def _report(self) -> None:
+        callback, self._on_settled = self._on_settled, None
+        if callback is None:
+            return
+        savings.add(self.tokens_used, self.tokens_saved, self.worker_seconds_saved)
+        try:
+            callback(self)
+        except Exception as e:
+            logger.error(
+                f"Request {self.request_id}: reporting the cancellation failed: {e}"
+            )
+
+
+def start(request_id: str) -> CancellationLedger:
+    """Open the ledger for the current request; Bedrock calls it abandons are tracked in it."""
+    ledger = CancellationLedger(request_id)
+    _ledger.set(ledger)
+    return ledger
+
+
+def current() -> Optional[CancellationLedger]:
+    return _ledger.get()
@@ -0,0 +1,143 @@
+import logging
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Tuple
+from botocore.exceptions import ClientError
+from app.config import settings
+from app.services.concurrency import Overloaded
+
+
+logger = logging.getLogger(__name__)
+
+# upstream-health errors; anything else that is a 4xx is the caller's fault
+# (bad request, access denied) and says nothing about the model's health
+UPSTREAM_ERROR_CODES = {
+    "ThrottlingException",
+    "ServiceUnavailableException",
+    "InternalServerException",
+    "ModelTimeoutException",
+    "ModelNotReadyException",
+}
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"Circuit for '{name}' is open, retry in {retry_after:.0f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+def counts_as_failure(error: BaseException) -> bool:
+    if isinstance(error, Overloaded):
+        # load, not health: the concurrency limiter backs off on throttles
+        return False
+    if isinstance(error, ClientError):
+        code = error.response.get("Error", {}).get("Code", "")
+        status = error.response.get("ResponseMetadata", {}).get("HTTPStatusCode", 500)
+        return code in UPSTREAM_ERROR_CODES or status >= 500
+    return True
+
+
+class CircuitBreaker:
+    """
+    Error-rate circuit breaker for one upstream model.
+
+    closed    -> calls flow; opens when the error rate over the last
+                 `window_seconds` reaches `error_threshold` (with at least
+                 `min_calls` samples)
+    open      -> calls fail fast with CircuitOpenError for `cooldown_seconds`
+    half-open -> one probe call at a time; success closes, failure re-opens
+    """
+
+    def __init__(
+        self,
+        name: str,
+        error_threshold: float = settings.CIRCUIT_ERROR_THRESHOLD,
+        min_calls: int = settings.CIRCUIT_MIN_CALLS,
+        window_seconds: float = settings.CIRCUIT_WINDOW_SECONDS,
+        cooldown_seconds: float = settings.CIRCUIT_COOLDOWN_SECONDS,
+    ):
+        self.name = name
+        self.error_threshold = error_threshold
+        self.min_calls = min_calls
+        self.window_seconds = window_seconds
+        self.cooldown_seconds = cooldown_seconds
+
+        self.state = "closed"
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._outcomes: Deque[Tuple[float, bool]] = deque()
+        self._lock = threading.Lock()
+
+    def before_call(self) -> None:
+        with self._lock:
+            if self.state == "closed":
+                return
+            elapsed = time.monotonic() - self.opened_at
+            if self.state == "open" and elapsed >= self.cooldown_seconds:
+                self.state = "half-open"
+            if self.state == "half-open" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return
+            raise CircuitOpenError(self.name, max(self.cooldown_seconds - elapsed, 1))
+
+    def record_success(self) -> None:
+        self._record(True)
+
+    def record_failure(self) -> None:
+        self._record(False)
+
+    def release(self) -> None:
+        """End a call whose outcome says nothing about upstream health."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def _record(self, success: bool) -> None:
+        with self._lock:
+            now = time.monotonic()
+            if self.state == "half-open":
+                self._probe_in_flight = False
+                if success:
+                    logger.info(f"Circuit for {self.name} closed")
+                    self.state = "closed"
+                    self._outcomes.clear()
+                else:
+                    self._open(now)
+                return
+
+            self._outcomes.append((now, success))
+            while self._outcomes and self._outcomes[0][0] < now - self.window_seconds:
+                self._outcomes.popleft()
+
+            failures = sum(1 for _, ok in self._outcomes if not ok)
+            if (
+                self.state == "closed"
+                and len(self._outcomes) >= self.min_calls
+                and failures / len(self._outcomes) >= self.error_threshold
+            ):
+                self._open(now)
+
+    def _open(self, now: float) -> None:
+        logger.warning(f"Circuit for {self.name} opened")
+        self.state = "open"
+        self.opened_at = now
+        self._outcomes.clear()
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def call_key(model_id: str, kind: str) -> str:
+    """
+    Breakers and hedge windows are per model and kind of call: a 50-token
+    classification and a 4000-token plan have nothing in common but the model.
+    """
+    return f"{model_id}/{kind}"
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    breaker = _breakers.get(name)
+    if breaker is None:
+        breaker = _breakers.setdefault(name, CircuitBreaker(name))
+    return breaker
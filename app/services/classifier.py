@@ -1,8 +1,10 @@
-import boto3
-import json
 import logging
-from typing import Literal
+from typing import Literal, get_args
 from app.config import settings
+from app.services.bedrock import invoke_model
+from app.services.circuit_breaker import CircuitOpenError
+from app.services.concurrency import Overloaded
+from app.services.shared_cache import classification_cache, normalize
 
 
 logger = logging.getLogger(__name__)
@@ -13,21 +15,34 @@ logger = logging.getLogger(__name__)
 #     region_name='ap-southeast-2'
 # )
 
-# Only create real client if not mocking
-if not settings.USE_MOCK_AWS:
-    bedrock_runtime = boto3.client(
-        service_name='bedrock-runtime',
-        region_name='ap-southeast-2'
-    )
-
 Category = Literal[
-    "certification",
-    "skill-learning",
-    "fitness",
-    "creative",
-    "productivity",
-    "other"
+    "certification", "skill-learning", "fitness", "creative", "productivity", "other"
 ]
+CATEGORIES = frozenset(get_args(Category))
+
+
+def known_category(category: str) -> str:
+    """
+    The category if it is one of ours, else "other". Categories become metric
+    labels and rollup keys, so free text from the model or a client must not.
+    """
+    return category if category in CATEGORIES else "other"
+
+
+def keyword_category(goal: str) -> str:
+    """Simple keyword-based classification, for mock mode and when Bedrock is overloaded."""
+    goal_lower = goal.lower()
+    if any(word in goal_lower for word in ["cert", "exam", "aws", "test"]):
+        return "certification"
+    elif any(word in goal_lower for word in ["exercise", "fitness", "gym", "run"]):
+        return "fitness"
+    elif any(word in goal_lower for word in ["write", "paint", "music", "art"]):
+        return "creative"
+    elif any(word in goal_lower for word in ["productivity", "organize", "habits"]):
+        return "productivity"
+    else:
+        return "skill-learning"
+
 
 async def classify_goal(goal: str) -> str:
     """
@@ -40,20 +55,15 @@ async def classify_goal(goal: str) -> str:
 
     # MOCK MODE: Return fake classification for local dev
     if settings.USE_MOCK_AWS:
-        logger.info("Using mock classification (local dev mode)")
-        # Simple keyword-based mock classification
-        goal_lower = goal.lower()
-        if any(word in goal_lower for word in ['cert', 'exam', 'aws', 'test']):
-            return "certification"
-        elif any(word in goal_lower for word in ['exercise', 'fitness', 'gym', 'run']):
-            return "fitness"
-        elif any(word in goal_lower for word in ['write', 'paint', 'music', 'art']):
-            return "creative"
-        elif any(word in goal_lower for word in ['productivity', 'organize', 'habits']):
-            return "productivity"
-        else:
-            return "skill-learning"
+        logger.debug("Using mock classification (local dev mode)")
+        return keyword_category(goal)
 
+    # shared by every worker on the host (app/services/shared_cache.py)
+    cache_key = normalize(goal)
+    if settings.SHARED_CACHE_ENABLED:
+        cached = classification_cache.get(cache_key)
+        if cached is not None:
+            return known_category(cached.decode())
 
     # REAL MODE: Call Bedrock
     classification_prompt = f"""
@@ -74,34 +84,42 @@ async def classify_goal(goal: str) -> str:
     """
     try:
         # call Bedrock with Claude
-        response = bedrock_runtime.invoke_model(
-            modelId='anthropic.claude-3-haiku-20240307-v1:0',
-            contentType='application/json',
-            accept='application/json',
-            body=json.dumps({
+        result = await invoke_model(
+            "anthropic.claude-3-haiku-20240307-v1:0",
+            {
                 "anthropic_version": "bedrock-2023-05-31",
-                "max_tokens": 50, 
-                "messages": [
-                        {
-                            "role": "user",
-                            "content": classification_prompt
-                        }
-                    ],
-                    "temperature": 0.1  # for classification pick lower temperature
-            })
+                "max_tokens": 50,
+                "messages": [{"role": "user", "content": classification_prompt}],
+                "temperature": 0.1,  # for classification pick lower temperature
+            },
+            region=settings.AWS_REGION,
+            kind="classification",
         )
 
-        response_body = json.loads(response['body'].read())
-        category = response_body['content'][0]['text'].strip().lower()
-
-        # valid_categories = ["certification", "skill-learning", "fitness", "creative", "productivity", "other"]
-        # if category not in valid_categories:
-        #     logger.warning(f"Invalid category '{category}' returned, defaulting to 'other'")
-        #     category = "other"
-
+        response_body = result.body
+        category = response_body["content"][0]["text"].strip().lower()
+
+        if category not in CATEGORIES:
+            logger.warning(
+                f"Invalid category '{category}' returned, defaulting to 'other'"
+            )
+            category = "other"
+
+        if settings.SHARED_CACHE_ENABLED:
+            classification_cache.put(
+                cache_key,
+                category.encode(),
+                settings.SHARED_CACHE_CLASSIFICATION_TTL_SECONDS,
+            )
         return category
 
+    except (Overloaded, CircuitOpenError) as e:
+        # keep the LLM budget for generation and classify locally
+        logger.warning(
+            f"Classifier skipped Bedrock ({e}), using keyword classification"
+        )
+        return keyword_category(goal)
+
     except Exception as e:
         logger.error(f"Error classifying goal: {str(e)}")
         return "other"
-
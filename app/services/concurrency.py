@@ -0,0 +1,208 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Deque, Dict, List, Optional, Tuple
+from botocore.exceptions import ClientError
+from app.config import settings
+from app.services.deadline import stage_time_left
+from app.services.logger import structured_logger
+
+
+logger = logging.getLogger(__name__)
+
+THROTTLE_CODES = {"ThrottlingException", "TooManyRequestsException"}
+
+
+class Overloaded(Exception):
+    """
+    A model call could not be made in time.
+
+    `upstream` is True when Bedrock throttled us, False when we gave up
+    waiting in our own queue.
+    """
+
+    def __init__(self, message: str, upstream: bool, retry_after: float = 1.0):
+        super().__init__(message)
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+
+def is_throttle(error: BaseException) -> bool:
+    return (
+        isinstance(error, ClientError)
+        and error.response.get("Error", {}).get("Code") in THROTTLE_CODES
+    )
+
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency limit for calls to one model in one region.
+
+    - additive increase: every call that completes within `latency_tolerance`
+      times the baseline latency adds 1/limit, so roughly +1 per round trip
+    - multiplicative decrease: a throttle multiplies the limit by `backoff`,
+      at most once per baseline latency so one burst of 429s counts once
+    - callers over the limit wait in a FIFO queue, bounded in depth and in
+      wait time (and by the current stage deadline)
+
+    Slots are released from executor threads when the boto3 call finishes,
+    so state is guarded by a threading lock and waiters are woken on their
+    own event loop.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        initial_limit: float = settings.LIMITER_INITIAL_LIMIT,
+        min_limit: float = settings.LIMITER_MIN_LIMIT,
+        max_limit: float = settings.LIMITER_MAX_LIMIT,
+        backoff: float = settings.LIMITER_BACKOFF,
+        latency_tolerance: float = settings.LIMITER_LATENCY_TOLERANCE,
+        max_queue_wait_ms: float = settings.LIMITER_MAX_QUEUE_WAIT_MS,
+        max_queue_depth: int = settings.LIMITER_MAX_QUEUE_DEPTH,
+    ):
+        self.name = name
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.max_queue_wait_ms = max_queue_wait_ms
+        self.max_queue_depth = max_queue_depth
+
+        self.in_flight = 0
+        self.baseline_ms: Optional[float] = None
+        self._last_backoff = 0.0
+        self._waiters: Deque[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = deque()
+        self._lock = threading.Lock()
+
+        self.throttles = 0
+        self.queue_timeouts = 0
+        self.queue_rejections = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self) -> None:
+        with self._lock:
+            if not self._waiters and self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return
+            if len(self._waiters) >= self.max_queue_depth:
+                self.queue_rejections += 1
+                raise Overloaded(f"{self.name}: queue full", upstream=False)
+            loop = asyncio.get_running_loop()
+            waiter = (loop, loop.create_future())
+            self._waiters.append(waiter)
+
+        timeout = self.max_queue_wait_ms / 1000
+        time_left = stage_time_left()
+        if time_left is not None:
+            timeout = max(min(timeout, time_left), 0.0)
+
+        try:
+            await asyncio.wait_for(waiter[1], timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            with self._lock:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                else:
+                    # granted just as we gave up: hand the slot back
+                    self.in_flight -= 1
+                    self._grant()
+                if isinstance(e, asyncio.TimeoutError):
+                    self.queue_timeouts += 1
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            raise Overloaded(
+                f"{self.name}: no capacity within {timeout:.2f}s", upstream=False
+            )
+
+    def _grant(self) -> None:
+        # caller holds the lock
+        while self._waiters and self.in_flight < int(self.limit):
+            loop, future = self._waiters.popleft()
+            self.in_flight += 1
+            try:
+                loop.call_soon_threadsafe(_wake, future)
+            except RuntimeError:
+                # the waiter's loop is gone
+                self.in_flight -= 1
+
+    def release(
+        self, latency_ms: Optional[float] = None, throttled: bool = False
+    ) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if throttled:
+                self.throttles += 1
+                window = (self.baseline_ms or 100) / 1000
+                if now - self._last_backoff >= window:
+                    self._last_backoff = now
+                    old_limit = self.limit
+                    self.limit = max(self.min_limit, self.limit * self.backoff)
+                    structured_logger.log_concurrency_backoff(
+                        self.name,
+                        old_limit,
+                        self.limit,
+                        self.in_flight,
+                        len(self._waiters),
+                    )
+            elif latency_ms is not None:
+                if self.baseline_ms is None:
+                    self.baseline_ms = latency_ms
+                if latency_ms <= self.baseline_ms * self.latency_tolerance:
+                    self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+                self.baseline_ms = 0.95 * self.baseline_ms + 0.05 * latency_ms
+            self._grant()
+
+    def complete(self, started: float, future: Future) -> None:
+        """Done-callback for the executor future that held a slot."""
+        if future.cancelled():
+            self.release()
+            return
+        error = future.exception()
+        if error is None:
+            self.release(latency_ms=(time.perf_counter() - started) * 1000)
+        else:
+            self.release(throttled=is_throttle(error))
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "name": self.name,
+                "limit": round(self.limit, 2),
+                "in_flight": self.in_flight,
+                "queue_depth": len(self._waiters),
+                "throttles": self.throttles,
+                "queue_timeouts": self.queue_timeouts,
+                "queue_rejections": self.queue_rejections,
+            }
+
+
+def _wake(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+_limiters: Dict[Tuple[str, str], AdaptiveLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(region: str, model_id: str) -> AdaptiveLimiter:
+    # Bedrock quotas are per model per region
+    key = (region, model_id)
+    limiter = _limiters.get(key)
+    if limiter is None:
+        with _limiters_lock:
+            limiter = _limiters.setdefault(key, AdaptiveLimiter(f"{region}/{model_id}"))
+    return limiter
+
+
+def limiter_snapshots() -> List[dict]:
+    return [limiter.snapshot() for limiter in list(_limiters.values())]
@@ -0,0 +1,225 @@
+import contextvars
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from app.config import settings
+from app.services.background import defer
+
+
+logger = logging.getLogger(__name__)
+
+# USD per 1K input and output tokens, on-demand Bedrock pricing
+PRICES: Dict[str, Tuple[float, float]] = {
+    "anthropic.claude-3-haiku-20240307-v1:0": (0.00025, 0.00125),
+    "anthropic.claude-3-sonnet-20240229-v1:0": (0.003, 0.015),
+    "mock-model": (0.0, 0.0),
+}
+# a model missing from the table is priced like the dearest one we route to,
+# so spend is never under-reported
+DEFAULT_PRICE = (0.003, 0.015)
+
+# calls made outside a request (e.g. the plan library refresh) are rolled up here
+BACKGROUND_CATEGORY = "background"
+
+_meter: contextvars.ContextVar[Optional["CostMeter"]] = contextvars.ContextVar(
+    "cost_meter", default=None
+)
+
+
+def price(model_id: str, input_tokens: int, output_tokens: int) -> float:
+    input_price, output_price = PRICES.get(model_id, DEFAULT_PRICE)
+    return input_tokens / 1000 * input_price + output_tokens / 1000 * output_price
+
+
+def hour_of(timestamp: float) -> str:
+    # the same bucket format as the usage records' "hour" attribute
+    return datetime.utcfromtimestamp(timestamp).strftime("%Y-%m-%d-%H")
+
+
+class Usage:
+    """Calls, tokens and their price; what a request or a rollup bucket adds up."""
+
+    def __init__(self):
+        self.requests = 0
+        self.calls = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cost_usd = 0.0
+
+    def add_call(self, model_id: str, input_tokens: int, output_tokens: int) -> None:
+        self.calls += 1
+        self.input_tokens += input_tokens
+        self.output_tokens += output_tokens
+        self.cost_usd += price(model_id, input_tokens, output_tokens)
+
+    def merge(self, other: "Usage") -> None:
+        self.requests += other.requests
+        self.calls += other.calls
+        self.input_tokens += other.input_tokens
+        self.output_tokens += other.output_tokens
+        self.cost_usd += other.cost_usd
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "calls": self.calls,
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "cost_usd": round(self.cost_usd, 8),
+        }
+
+
+class CostAggregator:
+    """
+    Usage per (hour, category, model) for the process, flushed as one
+    background job every COST_FLUSH_SECONDS or COST_FLUSH_MAX_BUCKETS
+    buckets, whichever comes first.
+
+    Requests add to buckets in memory; only the flush writes, so the
+    accounting adds no write per request.
+    """
+
+    def __init__(self, flush_seconds: float, max_buckets: int):
+        self.flush_seconds = flush_seconds
+        self.max_buckets = max_buckets
+        self._buckets: Dict[Tuple[str, str, str], Usage] = {}
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+    def add(
+        self,
+        category: str,
+        model_id: str,
+        usage: Usage,
+        timestamp: Optional[float] = None,
+    ) -> None:
+        key = (hour_of(timestamp or time.time()), category, model_id)
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = Usage()
+            bucket.merge(usage)
+        self.maybe_flush()
+
+    def due(self) -> bool:
+        return (
+            len(self._buckets) >= self.max_buckets
+            or time.monotonic() - self._last_flush >= self.flush_seconds
+        )
+
+    def maybe_flush(self) -> int:
+        return self.flush() if self._buckets and self.due() else 0
+
+    @staticmethod
+    def _rollups(buckets: Dict[Tuple[str, str, str], Usage]) -> List[Dict[str, Any]]:
+        return [
+            {
+                "hour": hour,
+                "category": category,
+                "model_id": model_id,
+                **usage.as_dict(),
+            }
+            for (hour, category, model_id), usage in buckets.items()
+        ]
+
+    def pending(self) -> List[Dict[str, Any]]:
+        """The buckets not yet flushed, without flushing them."""
+        with self._lock:
+            return self._rollups(self._buckets)
+
+    def flush(self) -> int:
+        with self._lock:
+            buckets, self._buckets = self._buckets, {}
+            self._last_flush = time.monotonic()
+        if not buckets:
+            return 0
+        rollups = self._rollups(buckets)
+        defer("cost_rollup", rollups=rollups)
+        logger.debug(f"Flushed {len(rollups)} cost rollups")
+        return len(rollups)
+
+
+aggregator = CostAggregator(
+    settings.COST_FLUSH_SECONDS, settings.COST_FLUSH_MAX_BUCKETS
+)
+
+
+class CostMeter:
+    """
+    One request's Bedrock usage, per model, from the usage each call
+    reported: classification and generation, hedge losers and calls it
+    abandoned included.
+
+    Calls report from executor threads; one that finishes after the meter
+    is closed goes straight to the aggregator under the request's category.
+    """
+
+    def __init__(self, request_id: str):
+        self.request_id = request_id
+        self.category: Optional[str] = None
+        self._usage: Dict[str, Usage] = {}
+        self._lock = threading.Lock()
+
+    def record(self, model_id: str, input_tokens: int, output_tokens: int) -> None:
+        with self._lock:
+            if self.category is None:
+                usage = self._usage.get(model_id)
+                if usage is None:
+                    usage = self._usage[model_id] = Usage()
+                usage.add_call(model_id, input_tokens, output_tokens)
+                return
+            category = self.category
+        late = Usage()
+        late.add_call(model_id, input_tokens, output_tokens)
+        aggregator.add(category, model_id, late)
+
+    def totals(self) -> Dict[str, Any]:
+        total = Usage()
+        with self._lock:
+            for usage in self._usage.values():
+                total.merge(usage)
+        return {
+            "calls": total.calls,
+            "input_tokens": total.input_tokens,
+            "output_tokens": total.output_tokens,
+            "total_tokens": total.input_tokens + total.output_tokens,
+            "cost_usd": round(total.cost_usd, 8),
+        }
+
+    def close(self, category: Optional[str]) -> Dict[str, Any]:
+        """Roll the request up under its category; returns its totals. Idempotent."""
+        with self._lock:
+            if self.category is not None:
+                closed = {}
+            else:
+                self.category = category or "unknown"
+                closed = self._usage
+        for model_id, usage in closed.items():
+            usage.requests = 1
+            aggregator.add(self.category, model_id, usage)
+        return self.totals()
+
+
+def start(request_id: str) -> CostMeter:
+    """Open the meter for the current request; Bedrock calls made from it are charged to it."""
+    meter = CostMeter(request_id)
+    _meter.set(meter)
+    return meter
+
+
+def current() -> Optional[CostMeter]:
+    return _meter.get()
+
+
+def record(
+    meter: Optional[CostMeter], model_id: str, input_tokens: int, output_tokens: int
+) -> None:
+    """Charge one call to `meter`, or to the background rollup when there is none."""
+    if meter is not None:
+        meter.record(model_id, input_tokens, output_tokens)
+        return
+    usage = Usage()
+    usage.add_call(model_id, input_tokens, output_tokens)
+    aggregator.add(BACKGROUND_CATEGORY, model_id, usage)
@@ -45,7 +45,7 @@ def estimate_cost(goal: str, context: Optional[str] = None) -> int:
 
     total_input_tokens = goal_tokens + context_tokens + system_prompt_tokens
 
-    logger.info(
+    logger.debug(
         f"Token estimation: goal={goal_tokens}, context={context_tokens}, "
         f"system={system_prompt_tokens}, total={total_input_tokens}"
     )
@@ -78,7 +78,7 @@ def check_cost_limits(estimated_tokens: int) -> None:
     output_cost = (MAX_OUTPUT_TOKENS / 1000) * COST_PER_1K_OUTPUT_TOKENS
     total_cost = input_cost + output_cost
 
-    logger.info(
+    logger.debug(
         f"Estimated cost: ${total_cost:.4f} (input: ${input_cost:.4f}, output: ${output_cost:.4f})"
     )
 
@@ -95,4 +95,4 @@ def check_cost_limits(estimated_tokens: int) -> None:
             },
         )
 
-    logger.info(f"Cost check passed: ${total_cost:.4f}")
+    logger.debug(f"Cost check passed: ${total_cost:.4f}")
@@ -1,20 +1,21 @@
-import boto3
 import logging
 from datetime import datetime
 from typing import Optional
 from decimal import Decimal
 from app.config import settings
-from app.services.logger import structured_logger
+from app.services.aws import get_resource
+from app.services.background import handler
 
 logger = logging.getLogger(__name__)
 
 if not settings.USE_MOCK_AWS:
-    dynamodb = boto3.resource("dynamodb", region_name=settings.AWS_REGION)
+    dynamodb = get_resource("dynamodb", region_name=settings.AWS_REGION)
 
 TABLE_NAME = settings.DYNAMODB_TABLE_NAME
 
 
-async def log_request(
+@handler("usage_log")
+def write_request(
     request_id: str,
     goal: str,
     category: str,
@@ -22,89 +23,76 @@ async def log_request(
     latency_ms: float,
     success: bool,
     error: Optional[str] = None,
+    model_id: Optional[str] = None,
+    timestamp: Optional[float] = None,
+    input_tokens: Optional[int] = None,
+    output_tokens: Optional[int] = None,
+    cost_usd: Optional[float] = None,
 ) -> None:
     """
-    Log request details to DynamoDB for observability and cost tracking.
+    Write one request's usage record to DynamoDB.
 
     This enables:
     - Usage analytics (how many requests per day)
     - Cost tracking (how much are we spending)
     - Performance monitoring (average latency)
     - Error tracking (what's failing)
+
+    The router queues this as a background job (app/services/background.py)
+    that runs after the response, so failures are raised for the worker to
+    retry; `timestamp` is when the request finished, not when it is written.
+    Tokens and cost are what Bedrock reported for the request's calls
+    (app/services/cost_accounting.py).
     """
+    when = datetime.utcfromtimestamp(timestamp) if timestamp else datetime.utcnow()
 
     # MOCK MODE: Just log to console
     if settings.USE_MOCK_AWS:
         log_entry = {
             "request_id": request_id,
-            "timestamp": datetime.utcnow().isoformat(),
+            "timestamp": when.isoformat(),
             "goal": goal[:100] + "..." if len(goal) > 100 else goal,
             "category": category,
             "tokens_used": tokens_used,
+            "cost_usd": cost_usd,
             "latency_ms": round(latency_ms, 2),
             "success": success,
         }
         if error:
             log_entry["error"] = error[:200]
 
-        logger.info(f"[MOCK] Request logged to DynamoDB: {log_entry}")
-
-        # Also use structured logger in mock mode
-        structured_logger.log_llm_call(
-            request_id=request_id,
-            model_id="mock-model",
-            input_tokens=tokens_used // 2,  # Estimate
-            output_tokens=tokens_used // 2,  # Estimate
-            latency_ms=latency_ms,
-            success=success,
-        )
+        # the router's request_completed record already carries all of this
+        logger.debug(f"[MOCK] Request logged to DynamoDB: {log_entry}")
         return
 
     # REAL MODE: Log to DynamoDB
-    try:
-        table = dynamodb.Table(settings.DYNAMODB_TABLE_NAME)
-
-        # DynamoDB doesn't support float, use Decimal
-        latency_decimal = Decimal(str(round(latency_ms, 2)))
-
-        item = {
-            "request_id": request_id,
-            "timestamp": datetime.utcnow().isoformat(),
-            "goal": goal[:500],  # truncate long goals
-            "goal_length": len(goal),
-            "category": category,
-            "tokens_used": tokens_used,
-            "latency_ms": latency_decimal,
-            "success": success,
-            "date": datetime.utcnow().strftime("%Y-%m-%d"),  # for daily aggregations
-            "hour": datetime.utcnow().strftime(
-                "%Y-%m-%d-%H"
-            ),  # for hourly aggregations
-        }
-
-        if error:
-            item["error"] = error[:1000]  # truncate long errors
-
-        table.put_item(Item=item)
-
-        logger.info(f"Request {request_id}: Logged to DynamoDB")
-
-        # Also log to CloudWatch with structured logging
-        structured_logger.log_llm_call(
-            request_id=request_id,
-            model_id="bedrock-claude",
-            input_tokens=tokens_used // 2,  # Rough estimate
-            output_tokens=tokens_used // 2,
-            latency_ms=latency_ms,
-            success=success,
-        )
-
-    except Exception as e:
-        # Logging failures should not break the main request
-        # Log the error but don't raise
-        logger.error(f"Failed to log request {request_id} to DynamoDB: {str(e)}")
-
-        # Use structured logger for errors
-        structured_logger.log_error(
-            request_id=request_id, error_type="DynamoDBLogError", error_message=str(e)
-        )
+    table = dynamodb.Table(settings.DYNAMODB_TABLE_NAME)
+
+    # DynamoDB doesn't support float, use Decimal
+    latency_decimal = Decimal(str(round(latency_ms, 2)))
+
+    item = {
+        "request_id": request_id,
+        "timestamp": when.isoformat(),
+        "goal": goal[:500],  # truncate long goals
+        "goal_length": len(goal),
+        "category": category,
+        "tokens_used": tokens_used,
+        "latency_ms": latency_decimal,
+        "success": success,
+        "date": when.strftime("%Y-%m-%d"),  # for daily aggregations
+        "hour": when.strftime("%Y-%m-%d-%H"),  # for hourly aggregations
+    }
+
+    if model_id:
+        item["model_id"] = model_id
+    if input_tokens is not None:
+        item["input_tokens"] = input_tokens
+        item["output_tokens"] = output_tokens or 0
+    if cost_usd is not None:
+        item["cost_usd"] = Decimal(str(cost_usd))
+    if error:
+        item["error"] = error[:1000]  # truncate long errors
+
+    table.put_item(Item=item)
+    logger.debug(f"Request {request_id}: Logged to DynamoDB")
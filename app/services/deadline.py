@@ -0,0 +1,101 @@
+import asyncio
+import contextvars
+import time
+from typing import Any, Awaitable, Mapping, Optional, TypeVar
+from app.config import settings
+
+T = TypeVar("T")
+
+
+# absolute (monotonic) expiry of the stage currently running, so code deep in
+# the call path (the Bedrock invoker) can tell a deadline from a disconnect
+_stage_expiry: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar(
+    "stage_expiry", default=None
+)
+
+# event loop timers may fire slightly before time.monotonic() reaches the
+# expiry: uvloop, which uvicorn installs when it is available, keeps its
+# clock in whole milliseconds
+TIMER_SLACK_SECONDS = 0.005
+
+# share of the request budget reserved for each stage, in execution order;
+# time a stage does not use flows to the next one
+STAGE_SHARES = (
+    ("classification", 0.15),
+    ("generation", 0.85),
+)
+
+
+class DeadlineExceeded(Exception):
+    def __init__(self, stage: str, timeout: float):
+        super().__init__(f"Stage '{stage}' exceeded its {timeout:.2f}s budget")
+        self.stage = stage
+        self.timeout = timeout
+
+
+def stage_time_left() -> Optional[float]:
+    """Seconds left in the current stage, or None outside a deadline."""
+    expiry = _stage_expiry.get()
+    if expiry is None:
+        return None
+    return expiry - time.monotonic()
+
+
+def stage_expired() -> bool:
+    """Whether the current stage has run out of time; False outside a deadline."""
+    time_left = stage_time_left()
+    return time_left is not None and time_left <= TIMER_SLACK_SECONDS
+
+
+class Deadline:
+    """
+    Per-request time budget, split across the pipeline stages.
+
+    Each stage may use everything left except what is reserved for the
+    stages after it, so a fast classification leaves more for generation.
+    """
+
+    def __init__(self, budget_seconds: float):
+        self.budget = max(budget_seconds, 0.0)
+        self.expires_at = time.monotonic() + self.budget
+
+    @classmethod
+    def for_request(
+        cls, scope: Optional[Mapping[str, Any]] = None, budget: Optional[float] = None
+    ) -> "Deadline":
+        """
+        Budget from config, tightened by the Lambda's remaining time.
+
+        Mangum exposes the Lambda context as scope["aws.context"]; a safety
+        margin is kept so we can still answer before Lambda kills us.
+        """
+        seconds = settings.REQUEST_DEADLINE_SECONDS if budget is None else budget
+        context = (scope or {}).get("aws.context")
+        if context is not None and hasattr(context, "get_remaining_time_in_millis"):
+            lambda_left = context.get_remaining_time_in_millis() / 1000
+            seconds = min(
+                seconds, lambda_left - settings.DEADLINE_SAFETY_MARGIN_SECONDS
+            )
+        return cls(seconds)
+
+    def remaining(self) -> float:
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    def stage_timeout(self, stage: str) -> float:
+        names = [name for name, _ in STAGE_SHARES]
+        later = names[names.index(stage) + 1 :]
+        reserved = self.budget * sum(
+            share for name, share in STAGE_SHARES if name in later
+        )
+        return max(self.remaining() - reserved, 0.0)
+
+    async def run(self, stage: str, awaitable: Awaitable[T]) -> T:
+        """Await a stage, cancelling it and raising DeadlineExceeded on overrun."""
+        timeout = self.stage_timeout(stage)
+        token = _stage_expiry.set(time.monotonic() + timeout)
+        try:
+            return await asyncio.wait_for(awaitable, timeout)
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded(stage, timeout)
+        finally:
+            _stage_expiry.reset(token)
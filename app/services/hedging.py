@@ -0,0 +1,205 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Optional, Tuple, TypeVar
+from app.config import settings
+from app.services.logger import structured_logger
+
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# cancellation message of the hedge leg whose tokens are the hedge's extra spend
+HEDGE_LOST = "hedge_lost"
+
+
+class LatencyWindow:
+    """Rolling window of recent latencies for one model, used to pick the hedge delay."""
+
+    def __init__(self, size: int = 200):
+        self.samples: Deque[float] = deque(maxlen=size)
+
+    def record(self, latency_ms: float) -> None:
+        self.samples.append(latency_ms)
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(p * len(ordered)))
+        return ordered[index]
+
+
+class Hedger:
+    """
+    Hedged requests: if the primary call is slower than the recent
+    p-th percentile, fire a duplicate at the secondary and keep the first
+    result.
+
+    Two caps keep the duplicate traffic bounded:
+    - hedge rate: hedges / requests over the last `window_seconds`
+    - extra tokens: tokens spent on losing calls over the last hour
+    """
+
+    def __init__(
+        self,
+        percentile: float = settings.HEDGE_PERCENTILE,
+        min_delay_ms: float = settings.HEDGE_MIN_DELAY_MS,
+        min_samples: int = settings.HEDGE_MIN_SAMPLES,
+        max_rate: float = settings.HEDGE_MAX_RATE,
+        token_budget_per_hour: int = settings.HEDGE_TOKEN_BUDGET_PER_HOUR,
+        window_seconds: float = 300,
+    ):
+        self.percentile = percentile
+        self.min_delay_ms = min_delay_ms
+        self.min_samples = min_samples
+        self.max_rate = max_rate
+        self.token_budget_per_hour = token_budget_per_hour
+        self.window_seconds = window_seconds
+
+        self.windows: Dict[str, LatencyWindow] = {}
+        self._requests: Deque[float] = deque()
+        self._hedges: Deque[float] = deque()
+        self._extra_tokens: Deque[Tuple[float, int]] = deque()
+        # losing calls finish on executor threads, so guard the counters
+        self._lock = threading.Lock()
+
+        self.total_requests = 0
+        self.hedges_fired = 0
+        self.hedge_wins = 0
+        self.skipped_rate_cap = 0
+        self.skipped_token_cap = 0
+        self.extra_tokens_total = 0
+
+    def hedge_delay_ms(self, key: str) -> Optional[float]:
+        """Delay before hedging, or None while there is too little history."""
+        window = self.windows.get(key)
+        if window is None or len(window.samples) < self.min_samples:
+            return None
+        observed = window.percentile(self.percentile)
+        return None if observed is None else max(self.min_delay_ms, observed)
+
+    def record_latency(self, key: str, latency_ms: float) -> None:
+        self.windows.setdefault(key, LatencyWindow()).record(latency_ms)
+
+    def record_extra_tokens(self, tokens: int) -> None:
+        with self._lock:
+            self._extra_tokens.append((time.monotonic(), tokens))
+            self.extra_tokens_total += tokens
+
+    def _prune(self, now: float) -> None:
+        horizon = now - self.window_seconds
+        while self._requests and self._requests[0] < horizon:
+            self._requests.popleft()
+        while self._hedges and self._hedges[0] < horizon:
+            self._hedges.popleft()
+        while self._extra_tokens and self._extra_tokens[0][0] < now - 3600:
+            self._extra_tokens.popleft()
+
+    def try_acquire(self, estimated_tokens: int) -> bool:
+        """Reserve a hedge if both the rate and the token budget allow it."""
+        with self._lock:
+            now = time.monotonic()
+            self._prune(now)
+            # allow a burst of one so a slow request in a quiet window may hedge
+            if len(self._hedges) >= self.max_rate * len(self._requests) + 1:
+                self.skipped_rate_cap += 1
+                return False
+            spent = sum(tokens for _, tokens in self._extra_tokens)
+            if spent + estimated_tokens > self.token_budget_per_hour:
+                self.skipped_token_cap += 1
+                return False
+            self._hedges.append(now)
+            self.hedges_fired += 1
+            return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._prune(time.monotonic())
+            return {
+                "requests": self.total_requests,
+                "hedges_fired": self.hedges_fired,
+                "hedge_wins": self.hedge_wins,
+                "hedge_rate": round(self.hedges_fired / self.total_requests, 4)
+                if self.total_requests
+                else 0.0,
+                "skipped_rate_cap": self.skipped_rate_cap,
+                "skipped_token_cap": self.skipped_token_cap,
+                "extra_tokens_total": self.extra_tokens_total,
+                "extra_tokens_last_hour": sum(t for _, t in self._extra_tokens),
+            }
+
+    async def run(
+        self,
+        key: str,
+        primary: Callable[[], Awaitable[T]],
+        secondary: Optional[Callable[[], Awaitable[T]]],
+        estimated_tokens: int,
+    ) -> Tuple[T, bool]:
+        """
+        Run `primary`, hedging with `secondary` when it is slow.
+
+        Returns (result, hedge_won). The loser is cancelled with HEDGE_LOST;
+        a failure on one side falls back to the other side's result.
+        """
+        with self._lock:
+            self.total_requests += 1
+            self._requests.append(time.monotonic())
+
+        start = time.perf_counter()
+        primary_task = asyncio.ensure_future(primary())
+        secondary_task = None
+        delay_ms = self.hedge_delay_ms(key) if secondary else None
+
+        try:
+            if delay_ms is not None:
+                await asyncio.wait({primary_task}, timeout=delay_ms / 1000)
+
+            if (
+                delay_ms is None
+                or secondary is None
+                or primary_task.done()
+                or not self.try_acquire(estimated_tokens)
+            ):
+                result = await primary_task
+                self.record_latency(key, (time.perf_counter() - start) * 1000)
+                return result, False
+
+            secondary_task = asyncio.ensure_future(secondary())
+            pending = {primary_task, secondary_task}
+            error: Optional[BaseException] = None
+
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is not None:
+                        error = task.exception()
+                        continue
+                    hedge_won = task is secondary_task
+                    if hedge_won:
+                        with self._lock:
+                            self.hedge_wins += 1
+                    # when the hedge wins this under-counts the primary, which
+                    # keeps the delay conservative rather than drifting down
+                    self.record_latency(key, (time.perf_counter() - start) * 1000)
+                    structured_logger.log_hedge(key, delay_ms, hedge_won, self.stats())
+                    return task.result(), hedge_won
+
+            # both legs failed
+            assert error is not None
+            raise error
+        finally:
+            # cancel the loser, or both if our caller was cancelled; once a
+            # hedge is out, the leg left running (the hedge, if both are) is
+            # the duplicate spend
+            for leg in (primary_task, secondary_task):
+                if leg is not None and not leg.done():
+                    lost = secondary_task is not None and (
+                        leg is secondary_task or secondary_task.done()
+                    )
+                    leg.cancel(HEDGE_LOST if lost else None)
@@ -0,0 +1,421 @@
+import json
+import logging
+import math
+import os
+import threading
+import uuid
+from array import array
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from app.config import settings
+
+
+logger = logging.getLogger(__name__)
+
+# log-linear buckets over integer microseconds: values below 2**SUB_BITS get
+# one bucket each, above that every power of two is split into 2**SUB_BITS
+# equal buckets, so the relative error is at most 1 / 2**SUB_BITS
+SUB_BITS = 4
+SUB_BUCKETS = 1 << SUB_BITS
+MAX_EXPONENT = 40  # 2**40 us is about 12 days; longer values land in the last bucket
+BUCKET_COUNT = (MAX_EXPONENT - SUB_BITS + 2) * SUB_BUCKETS
+
+# Prometheus `le` boundaries (seconds), resolved to bucket precision
+EXPORT_BOUNDARIES = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    20,
+    30,
+    60,
+)
+EXPORT_QUANTILES = (0.5, 0.95, 0.99)
+
+
+def bucket_index(micros: int) -> int:
+    if micros < SUB_BUCKETS:
+        return max(micros, 0)
+    shift = micros.bit_length() - SUB_BITS - 1
+    return min(
+        (shift + 1) * SUB_BUCKETS + (micros >> shift) - SUB_BUCKETS, BUCKET_COUNT - 1
+    )
+
+
+def bucket_bounds(index: int) -> Tuple[int, int]:
+    """[lower, upper) of a bucket, in microseconds."""
+    if index < SUB_BUCKETS:
+        return index, index + 1
+    shift = index // SUB_BUCKETS - 1
+    lower = (SUB_BUCKETS + index % SUB_BUCKETS) << shift
+    return lower, lower + (1 << shift)
+
+
+class LogLinearHistogram:
+    """
+    HDR-style latency histogram in milliseconds.
+
+    Recording is a bit_length and one array increment: constant time, and
+    the counts live in one preallocated array. Histograms with the same
+    layout merge by adding counts, so per-worker histograms combine into
+    exact fleet-wide percentiles.
+    """
+
+    __slots__ = ("counts", "count", "sum_ms", "max_ms")
+
+    def __init__(self):
+        self.counts = array("q", bytes(8 * BUCKET_COUNT))
+        self.count = 0
+        self.sum_ms = 0.0
+        self.max_ms = 0.0
+
+    def record(self, value_ms: float) -> None:
+        self.counts[bucket_index(int(value_ms * 1000))] += 1
+        self.count += 1
+        self.sum_ms += value_ms
+        if value_ms > self.max_ms:
+            self.max_ms = value_ms
+
+    def merge(self, other: "LogLinearHistogram") -> None:
+        counts = self.counts
+        for index, value in enumerate(other.counts):
+            if value:
+                counts[index] += value
+        self.count += other.count
+        self.sum_ms += other.sum_ms
+        self.max_ms = max(self.max_ms, other.max_ms)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Value at quantile q (0..1), as the midpoint of its bucket."""
+        if not self.count:
+            return None
+        rank = max(1, math.ceil(q * self.count))
+        seen = 0
+        for index, value in enumerate(self.counts):
+            seen += value
+            if seen >= rank:
+                lower, upper = bucket_bounds(index)
+                return min((lower + upper) / 2000, self.max_ms)
+        return self.max_ms
+
+    def count_at_most(self, bound_ms: float) -> int:
+        """Samples in buckets that end at or below bound_ms."""
+        limit = bound_ms * 1000
+        total = 0
+        for index, value in enumerate(self.counts):
+            if bucket_bounds(index)[1] > limit:
+                break
+            total += value
+        return total
+
+    def to_dict(self) -> dict:
+        return {
+            "counts": {
+                index: value for index, value in enumerate(self.counts) if value
+            },
+            "count": self.count,
+            "sum_ms": self.sum_ms,
+            "max_ms": self.max_ms,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "LogLinearHistogram":
+        histogram = cls()
+        for index, value in data["counts"].items():
+            histogram.counts[int(index)] = value
+        histogram.count = data["count"]
+        histogram.sum_ms = data["sum_ms"]
+        histogram.max_ms = data["max_ms"]
+        return histogram
+
+
+# name -> (help text, label names)
+FAMILIES = {
+    "ai_router_request_duration_seconds": (
+        "End-to-end request latency",
+        ("endpoint", "status"),
+    ),
+    "ai_router_stage_duration_seconds": ("Latency of each request stage", ("stage",)),
+    "ai_router_category_duration_seconds": (
+        "Request latency by goal category",
+        ("category",),
+    ),
+    "ai_router_llm_duration_seconds": (
+        "Plan generation LLM latency by model",
+        ("model",),
+    ),
+}
+
+SeriesKey = Tuple[str, Tuple[str, ...]]
+
+# the counts of workers that have exited, folded in by app.serve's master
+ARCHIVE_NAME = "histograms-archive.json"
+
+
+def merge_entries(
+    merged: Dict[SeriesKey, "LogLinearHistogram"], entries: Iterable[Dict[str, Any]]
+) -> None:
+    for entry in entries:
+        key = (entry["family"], tuple(entry["labels"]))
+        merged.setdefault(key, LogLinearHistogram()).merge(
+            LogLinearHistogram.from_dict(entry)
+        )
+
+
+def read_json(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_json(path: str, data: Any) -> None:
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def fold_snapshot(multiproc_dir: str, pid: int) -> None:
+    """
+    Move the last snapshot of a worker that has exited into the archive, so
+    its counts stay in /metrics (Prometheus counters must not go down) and
+    a new worker that gets the same pid starts from zero.
+
+    The archive lists the snapshots it holds, so a scrape between writing
+    it and removing the snapshot does not count the worker twice.
+    """
+    path = os.path.join(multiproc_dir, f"histograms-{pid}.json")
+    snapshot = read_json(path)
+    if snapshot is None:
+        return
+    archive_path = os.path.join(multiproc_dir, ARCHIVE_NAME)
+    archive = read_json(archive_path) or {"folded": [], "series": []}
+    merged: Dict[SeriesKey, LogLinearHistogram] = {}
+    merge_entries(merged, archive["series"])
+    merge_entries(merged, snapshot["series"])
+    # a snapshot whose removal failed is still listed, so it is never counted twice
+    folded = [
+        token
+        for token in archive["folded"]
+        if os.path.exists(os.path.join(multiproc_dir, f"histograms-{token[0]}.json"))
+    ]
+    try:
+        write_json(
+            archive_path,
+            {
+                "folded": folded + [snapshot["token"]],
+                "series": [
+                    {"family": family, "labels": list(labels), **h.to_dict()}
+                    for (family, labels), h in merged.items()
+                ],
+            },
+        )
+        os.remove(path)
+    except OSError as e:
+        logger.warning(f"Could not archive histogram snapshot {path}: {e}")
+
+
+class HistogramRegistry:
+    """
+    Labelled histograms of this process, exported in Prometheus text format.
+
+    Under uvicorn --workers each process has its own registry. With
+    METRICS_MULTIPROC_DIR set, every worker writes a snapshot there once a
+    second, from a thread of its own rather than the event loop, and
+    /metrics merges all of them, so any worker can answer the scrape.
+    """
+
+    def __init__(self, multiproc_dir: str = "", flush_interval: float = 1.0):
+        self.series: Dict[SeriesKey, LogLinearHistogram] = {}
+        self.multiproc_dir = multiproc_dir
+        self.flush_interval = flush_interval
+        self._observed = 0
+        self._flushed = 0
+        # (pid, id): tells this process's snapshots from those of an earlier
+        # worker with the same pid; renewed in a forked child
+        self._token: Optional[Tuple[int, str]] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def histogram(self, family: str, labels: Tuple[str, ...]) -> LogLinearHistogram:
+        key = (family, labels)
+        histogram = self.series.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self.series.setdefault(key, LogLinearHistogram())
+        return histogram
+
+    def observe(self, family: str, value_ms: float, *labels: str) -> None:
+        self.histogram(family, labels).record(value_ms)
+        self._observed += 1
+
+    def snapshot_path(self, pid: Optional[int] = None) -> str:
+        return os.path.join(self.multiproc_dir, f"histograms-{pid or os.getpid()}.json")
+
+    def token(self) -> Tuple[int, str]:
+        pid = os.getpid()
+        if self._token is None or self._token[0] != pid:
+            self._token = (pid, uuid.uuid4().hex)
+        return self._token
+
+    def start(self) -> "HistogramRegistry":
+        """Start the snapshot thread (once per process), if there is a directory to write to."""
+        with self._lock:
+            if self.multiproc_dir and self._thread is None:
+                self._stop.clear()
+                self._thread = threading.Thread(
+                    target=self._run, name="histogram-flush", daemon=True
+                )
+                self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stop the snapshot thread and write the last observations."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._stop.set()
+        thread.join(timeout=5)
+        self.flush()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            if self._observed != self._flushed:
+                self.flush()
+
+    def flush(self) -> None:
+        self._flushed = self._observed
+        data = [
+            {"family": family, "labels": list(labels), **histogram.to_dict()}
+            for (family, labels), histogram in list(self.series.items())
+        ]
+        path = self.snapshot_path()
+        try:
+            os.makedirs(self.multiproc_dir, exist_ok=True)
+            write_json(path, {"token": self.token(), "series": data})
+        except OSError as e:
+            logger.warning(f"Could not write histogram snapshot {path}: {e}")
+
+    def merged(self) -> Dict[SeriesKey, LogLinearHistogram]:
+        """This process's series plus every other worker's last snapshot."""
+        merged: Dict[SeriesKey, LogLinearHistogram] = {}
+        for key, histogram in list(self.series.items()):
+            merged[key] = LogLinearHistogram()
+            merged[key].merge(histogram)
+        if not self.multiproc_dir or not os.path.isdir(self.multiproc_dir):
+            return merged
+
+        own = os.path.basename(self.snapshot_path())
+        snapshots = []
+        for name in os.listdir(self.multiproc_dir):
+            if (
+                not name.startswith("histograms-")
+                or not name.endswith(".json")
+                or name in (own, ARCHIVE_NAME)
+            ):
+                continue
+            snapshot = read_json(os.path.join(self.multiproc_dir, name))
+            if snapshot is not None:
+                snapshots.append(snapshot)
+        # read after the snapshots: one folded in meanwhile is listed in it
+        archive = read_json(os.path.join(self.multiproc_dir, ARCHIVE_NAME))
+        folded = set()
+        if archive is not None:
+            merge_entries(merged, archive["series"])
+            folded = {tuple(token) for token in archive["folded"]}
+        for snapshot in snapshots:
+            if tuple(snapshot["token"]) not in folded:
+                merge_entries(merged, snapshot["series"])
+        return merged
+
+    def render(self) -> str:
+        """Prometheus text exposition (0.0.4) of the merged histograms."""
+        merged = self.merged()
+        lines: List[str] = []
+        for family, (help_text, label_names) in FAMILIES.items():
+            series = sorted(
+                (labels, h) for (name, labels), h in merged.items() if name == family
+            )
+            lines.append(f"# HELP {family} {help_text}")
+            lines.append(f"# TYPE {family} histogram")
+            for labels, histogram in series:
+                base = format_labels(zip(label_names, labels))
+                for bound in EXPORT_BOUNDARIES:
+                    le = format_labels(
+                        list(zip(label_names, labels)) + [("le", repr(float(bound)))]
+                    )
+                    lines.append(
+                        f"{family}_bucket{le} {histogram.count_at_most(bound * 1000)}"
+                    )
+                le = format_labels(list(zip(label_names, labels)) + [("le", "+Inf")])
+                lines.append(f"{family}_bucket{le} {histogram.count}")
+                lines.append(f"{family}_sum{base} {histogram.sum_ms / 1000:.6f}")
+                lines.append(f"{family}_count{base} {histogram.count}")
+
+        # the sketch's own percentiles, finer than the exported buckets
+        lines.append(
+            "# HELP ai_router_duration_quantile_seconds Latency quantiles from the in-process sketches"
+        )
+        lines.append("# TYPE ai_router_duration_quantile_seconds gauge")
+        for (family, labels), histogram in sorted(merged.items()):
+            label_names = FAMILIES.get(family, ((), ()))[1]
+            for q in EXPORT_QUANTILES:
+                value = histogram.percentile(q)
+                if value is None:
+                    continue
+                pairs = (
+                    [("family", family)]
+                    + list(zip(label_names, labels))
+                    + [("quantile", str(q))]
+                )
+                lines.append(
+                    f"ai_router_duration_quantile_seconds{format_labels(pairs)} {value / 1000:.6f}"
+                )
+        return "\n".join(lines) + "\n"
+
+
+def format_labels(pairs: Iterable[Tuple[str, str]]) -> str:
+    pairs = list(pairs)
+    if not pairs:
+        return ""
+    escaped = (
+        name
+        + '="'
+        + value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        + '"'
+        for name, value in pairs
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+registry = HistogramRegistry(multiproc_dir=settings.METRICS_MULTIPROC_DIR)
+
+
+def observe_request(
+    endpoint: str,
+    status_code: int,
+    latency_ms: float,
+    category: Optional[str],
+    model_id: Optional[str],
+    stages: Dict[str, float],
+) -> None:
+    registry.observe(
+        "ai_router_request_duration_seconds", latency_ms, endpoint, str(status_code)
+    )
+    registry.observe(
+        "ai_router_category_duration_seconds", latency_ms, category or "unknown"
+    )
+    for stage, ms in stages.items():
+        registry.observe("ai_router_stage_duration_seconds", ms, stage)
+    if model_id and "llm" in stages:
+        registry.observe("ai_router_llm_duration_seconds", stages["llm"], model_id)
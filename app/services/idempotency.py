@@ -0,0 +1,291 @@
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple, Union
+from app.config import settings
+from app.services.aws import get_resource
+
+
+logger = logging.getLogger(__name__)
+
+HEADER = "idempotency-key"
+MAX_KEY_LENGTH = 255
+
+IN_PROGRESS = "in_progress"
+COMPLETED = "completed"
+
+# outcomes of acquire()
+CLAIMED = "claimed"  # this request runs and records its response
+REPLAY = "replay"  # an earlier request finished; send its response
+MISMATCH = "mismatch"  # the key was used with a different body
+BUSY = "busy"  # the first request is still running after the wait
+
+
+def fingerprint(path: str, body: bytes) -> str:
+    return hashlib.sha256(path.encode() + b"\0" + body).hexdigest()
+
+
+def valid_key(key: str) -> bool:
+    return 0 < len(key) <= MAX_KEY_LENGTH and key.isprintable()
+
+
+class MemoryIdempotencyStore:
+    """
+    Records in an ordered dict: one process, gone on restart. Expired
+    entries are purged as new ones arrive and the oldest are evicted past
+    max_entries or once the stored responses pass max_bytes, so memory stays
+    bounded. Response bodies are kept zlib-compressed, as in DynamoDB.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._records: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def claim(self, record: Dict[str, Any], now: float) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            existing = self._records.get(record["idempotency_key"])
+            if existing is not None and not claimable(existing, now):
+                return stored(existing)
+            self._remove(record["idempotency_key"])
+            self._records[record["idempotency_key"]] = dict(record)
+            self._purge(now)
+            return None
+
+    def _purge(self, now: float) -> None:
+        # insertion order is roughly expiry order, so stop at the first live one
+        while self._records:
+            key, oldest = next(iter(self._records.items()))
+            if (
+                oldest["expires_at"] >= now
+                and len(self._records) <= self.max_entries
+                and self._bytes <= self.max_bytes
+            ):
+                break
+            self._remove(key)
+
+    def _remove(self, key: str) -> None:
+        record = self._records.pop(key, None)
+        if record is not None:
+            self._bytes -= size(record)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            record = self._records.get(key)
+            return stored(record) if record is not None else None
+
+    def complete(self, key: str, token: str, fields: Dict[str, Any]) -> None:
+        with self._lock:
+            record = self._records.get(key)
+            if record is None or record.get("lock_token") != token:
+                return
+            self._bytes -= size(record)
+            record.update(fields, body=zlib.compress(fields["body"]))
+            self._bytes += size(record)
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._records)))
+
+    def release(self, key: str, token: str) -> None:
+        with self._lock:
+            record = self._records.get(key)
+            if record is not None and record.get("lock_token") == token:
+                self._remove(key)
+
+
+def size(record: Dict[str, Any]) -> int:
+    """Bytes of the recorded response; an in-progress marker counts as 0."""
+    return len(record.get("body", b"")) + len(record.get("headers", ""))
+
+
+def stored(record: Dict[str, Any]) -> Dict[str, Any]:
+    record = dict(record)
+    if "body" in record:
+        record["body"] = zlib.decompress(record["body"])
+    return record
+
+
+class DynamoIdempotencyStore:
+    """
+    Records in DynamoDB, keyed by idempotency_key and deleted by the table's
+    TTL on expires_at. The claim is a conditional put, so exactly one of
+    several concurrent requests (on any instance) wins. TTL deletion lags,
+    so expired records are also claimable here. The response body is stored
+    zlib-compressed to stay far below the 400 KB item limit.
+
+    complete() and release() are conditional on the claim's lock_token: a
+    request that outlived its lock and was taken over must not overwrite or
+    delete the record of the request that now holds the key.
+    """
+
+    def __init__(self, table_name: str):
+        self.table_name = table_name
+
+    @property
+    def table(self):
+        return get_resource("dynamodb", region_name=settings.AWS_REGION).Table(
+            self.table_name
+        )
+
+    def claim(self, record: Dict[str, Any], now: float) -> Optional[Dict[str, Any]]:
+        table = self.table
+        try:
+            table.put_item(
+                Item=record,
+                ConditionExpression=(
+                    "attribute_not_exists(idempotency_key) OR expires_at < :now"
+                    " OR (#s = :in_progress AND locked_until < :now)"
+                ),
+                ExpressionAttributeNames={"#s": "status"},
+                ExpressionAttributeValues={
+                    ":now": int(now),
+                    ":in_progress": IN_PROGRESS,
+                },
+            )
+            return None
+        except table.meta.client.exceptions.ConditionalCheckFailedException:
+            # None if it was released in between; the caller claims again
+            return self.get(record["idempotency_key"]) or {"status": None}
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        item = self.table.get_item(
+            Key={"idempotency_key": key}, ConsistentRead=True
+        ).get("Item")
+        if item is None:
+            return None
+        for name in ("expires_at", "locked_until", "status_code"):
+            if name in item:
+                item[name] = int(item[name])
+        if "body" in item:
+            item["body"] = zlib.decompress(item["body"].value)
+        return item
+
+    def complete(self, key: str, token: str, fields: Dict[str, Any]) -> None:
+        fields = dict(fields, body=zlib.compress(fields["body"]))
+        names = {f"#f{i}": name for i, name in enumerate(fields)}
+        values = {f":v{i}": value for i, value in enumerate(fields.values())}
+        table = self.table
+        try:
+            table.update_item(
+                Key={"idempotency_key": key},
+                UpdateExpression="SET "
+                + ", ".join(f"#f{i} = :v{i}" for i in range(len(fields))),
+                ConditionExpression="lock_token = :t",
+                ExpressionAttributeNames=names,
+                ExpressionAttributeValues=dict(values, **{":t": token}),
+            )
+        except table.meta.client.exceptions.ConditionalCheckFailedException:
+            logger.warning(
+                "Idempotency key %s was taken over before its response was recorded",
+                key,
+            )
+
+    def release(self, key: str, token: str) -> None:
+        table = self.table
+        try:
+            table.delete_item(
+                Key={"idempotency_key": key},
+                ConditionExpression="lock_token = :t",
+                ExpressionAttributeValues={":t": token},
+            )
+        except table.meta.client.exceptions.ConditionalCheckFailedException:
+            pass  # taken over (or already expired): it is no longer ours to give up
+
+
+def claimable(record: Dict[str, Any], now: float) -> bool:
+    """Expired, or an in-progress marker whose request died without releasing it."""
+    if record["expires_at"] < now:
+        return True
+    return record["status"] == IN_PROGRESS and record["locked_until"] < now
+
+
+store: Union[DynamoIdempotencyStore, MemoryIdempotencyStore]
+if settings.IDEMPOTENCY_TABLE_NAME and not settings.USE_MOCK_AWS:
+    store = DynamoIdempotencyStore(settings.IDEMPOTENCY_TABLE_NAME)
+else:
+    store = MemoryIdempotencyStore(
+        settings.IDEMPOTENCY_MAX_ENTRIES, settings.IDEMPOTENCY_MAX_BYTES
+    )
+
+
+def _in_progress(key: str, digest: str, now: float) -> Dict[str, Any]:
+    return {
+        "idempotency_key": key,
+        "fingerprint": digest,
+        "status": IN_PROGRESS,
+        "lock_token": uuid.uuid4().hex,
+        "locked_until": int(now + settings.IDEMPOTENCY_LOCK_SECONDS),
+        "expires_at": int(now + settings.IDEMPOTENCY_TTL_SECONDS),
+    }
+
+
+async def acquire(
+    key: str, digest: str, wait_seconds: float
+) -> Tuple[str, Optional[Dict[str, Any]]]:
+    """
+    Claim the key for this request, or find out what to send instead.
+    On CLAIMED the record is this request's claim; its lock_token is what
+    complete() and release() are called with.
+
+    A duplicate of a request still in progress polls the record (a
+    consistent read, not another conditional write) until that request
+    records its response (REPLAY), gives up the key (this one claims it),
+    or wait_seconds run out (BUSY).
+    """
+    expires = time.monotonic() + wait_seconds
+    interval = settings.IDEMPOTENCY_POLL_INTERVAL_MS / 1000
+    now = time.time()
+    claim = _in_progress(key, digest, now)
+    existing = await asyncio.to_thread(store.claim, claim, now)
+    while True:
+        if existing is None:
+            return CLAIMED, claim
+        if existing["status"] is not None:
+            if existing["fingerprint"] != digest:
+                return MISMATCH, existing
+            if existing["status"] == COMPLETED:
+                return REPLAY, existing
+            if time.monotonic() + interval > expires:
+                return BUSY, existing
+        await asyncio.sleep(interval)
+        existing = await asyncio.to_thread(store.get, key)
+        now = time.time()
+        if existing is None or claimable(existing, now):
+            claim = _in_progress(key, digest, now)
+            existing = await asyncio.to_thread(store.claim, claim, now)
+
+
+async def complete(
+    key: str,
+    token: str,
+    status_code: int,
+    headers: List[Tuple[bytes, bytes]],
+    body: bytes,
+) -> None:
+    fields = {
+        "status": COMPLETED,
+        "status_code": status_code,
+        "headers": json.dumps(
+            [[k.decode("latin-1"), v.decode("latin-1")] for k, v in headers]
+        ),
+        "body": body,
+    }
+    await asyncio.to_thread(store.complete, key, token, fields)
+
+
+async def release(key: str, token: str) -> None:
+    await asyncio.to_thread(store.release, key, token)
+
+
+def stored_headers(record: Dict[str, Any]) -> List[Tuple[bytes, bytes]]:
+    return [
+        (k.encode("latin-1"), v.encode("latin-1"))
+        for k, v in json.loads(record["headers"])
+    ]
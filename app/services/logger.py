@@ -1,72 +1,177 @@
+import atexit
 import json
 import logging
+import os
+import queue
+import random
+import sys
+import time
+from logging.handlers import QueueHandler, QueueListener
 from typing import Any, Dict, Optional
-from datetime import datetime
+from app.config import settings
+
+try:
+    import orjson
+except ImportError:  # optional dependency, the stdlib encoder is the fallback
+    orjson = None  # type: ignore[assignment]
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+_queue: Optional[queue.Queue] = None
+_listener: Optional[QueueListener] = None
 
-class StructuredLogger:
-    @staticmethod
-    def log_request(
-        request_id: str, goal: str, goal_length: int, category: Optional[str] = None
-    ):
-        log_entry = {
-            "timestamp": datetime.utcnow().isoformat(),
-            "event_type": "request_received",
-            "request_id": request_id,
-            "goal_length": goal_length,
-        }
 
-        if category:
-            log_entry["category"] = category
+def dumps(entry: Dict[str, Any]) -> str:
+    if orjson is not None:
+        # default=str matches what the records contained before (Decimal, datetime)
+        return orjson.dumps(entry, default=str).decode()
+    return json.dumps(entry, default=str)
+
+
+_last_second = -1
+_second_prefix = ""
+
+
+def utc_timestamp() -> str:
+    """ISO-8601 UTC with microseconds, like datetime.utcnow().isoformat(), formatted once a second."""
+    global _last_second, _second_prefix
+    now = time.time()
+    second = int(now)
+    if second != _last_second:
+        _second_prefix = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(second))
+        _last_second = second
+    return f"{_second_prefix}.{int((now - second) * 1_000_000):06d}"
+
+
+class _StructuredQueueListener(QueueListener):
+    def prepare(self, record):
+        # structured records are queued as dicts and encoded here, off the caller
+        if isinstance(record.msg, dict):
+            record.msg = dumps(record.msg)
+        return record
+
+
+class _DeferredQueueHandler(QueueHandler):
+    def prepare(self, record):
+        # QueueHandler.prepare formats the message on the calling thread; only
+        # resolve what cannot wait (args may be mutated, tracebacks rendered)
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def configure_logging(level: int = logging.INFO) -> None:
+    """
+    Route every record through a queue to the root handlers on a background thread.
+
+    Whatever handlers the root logger already has (the Lambda runtime's,
+    a test's, a benchmark's) are moved behind the queue; with none, records
+    go to stdout. With LOG_ASYNC off this is plain synchronous logging.
+    """
+    global _queue, _listener
+    root = logging.getLogger()
+    root.setLevel(level)
+    if _listener is not None:
+        return
 
-        logger.info(json.dumps(log_entry))
+    handlers = list(root.handlers)
+    if not handlers:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        handlers = [handler]
+        root.addHandler(handler)
+    if not settings.LOG_ASYNC:
+        return
 
+    for existing in handlers:
+        root.removeHandler(existing)
+    _queue = queue.Queue()
+    root.addHandler(_DeferredQueueHandler(_queue))
+    _listener = _StructuredQueueListener(_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+def _restart_listener_after_fork() -> None:
+    # threads do not survive fork: a prefork worker (app/serve.py) gets its
+    # own queue and listener thread over the same handlers
+    global _queue, _listener
+    if _listener is None:
+        return
+    handlers = _listener.handlers
+    _queue = queue.Queue()
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, _DeferredQueueHandler):
+            handler.queue = _queue
+    _listener = _StructuredQueueListener(_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+os.register_at_fork(after_in_child=_restart_listener_after_fork)
+
+
+def flush_logs() -> None:
+    """Block until queued records are written (Lambda may freeze us right after)."""
+    if _queue is not None:
+        _queue.join()
+
+
+def success_sampled() -> bool:
+    """Whether this request's success-path records are kept; errors always are."""
+    rate = settings.LOG_SUCCESS_SAMPLE_RATE
+    return rate >= 1 or random.random() < rate
+
+
+def _emit(level: int, entry: Dict[str, Any]) -> None:
+    if not logger.isEnabledFor(level):
+        return
+    # behind the queue the listener thread encodes; otherwise encode here
+    logger.log(level, entry if _listener is not None else dumps(entry))
+
+
+class StructuredLogger:
     @staticmethod
-    def log_llm_call(
+    def log_request_completed(
         request_id: str,
-        model_id: str,
-        input_tokens: int,
-        output_tokens: int,
+        status_code: int,
         latency_ms: float,
-        success: bool,
+        goal_length: int,
+        category: Optional[str] = None,
+        model_id: Optional[str] = None,
+        tokens: Optional[Dict[str, int]] = None,
+        stages: Optional[Dict[str, float]] = None,
+        error_type: Optional[str] = None,
+        **fields: Any,
     ):
+        # the one record per request: what was asked, what it cost, where the time went
         log_entry = {
-            "timestamp": datetime.utcnow().isoformat(),
-            "event_type": "llm_call",
+            "timestamp": utc_timestamp(),
+            "event_type": "request_completed",
             "request_id": request_id,
-            "model_id": model_id,
-            "input_tokens": input_tokens,
-            "output_tokens": output_tokens,
-            "total_tokens": input_tokens + output_tokens,
+            "status_code": status_code,
+            "success": status_code < 400,
             "latency_ms": round(latency_ms, 2),
-            "success": success,
-        }
-        logger.info(json.dumps(log_entry))
-
-    @staticmethod
-    def log_classification(
-        request_id: str,
-        category: str,
-        confidence: Optional[float] = None,
-        latency_ms: Optional[float] = None,
-    ):
-        log_entry = {
-            "timestamp": datetime.utcnow().isoformat(),
-            "event_type": "classification",
-            "request_id": request_id,
+            "goal_length": goal_length,
             "category": category,
+            "model_id": model_id,
         }
+        if tokens:
+            log_entry["input_tokens"] = tokens.get("input", 0)
+            log_entry["output_tokens"] = tokens.get("output", 0)
+            log_entry["total_tokens"] = tokens.get("total", 0)
+        if stages:
+            log_entry["stages_ms"] = {name: round(ms, 2) for name, ms in stages.items()}
+        if error_type:
+            log_entry["error_type"] = error_type
+        log_entry.update(fields)
 
-        if confidence is not None:
-            log_entry["confidence"] = round(confidence, 3)
-
-        if latency_ms is not None:
-            log_entry["latency_ms"] = round(latency_ms, 2)
-
-        logger.info(json.dumps(log_entry))
+        _emit(logging.ERROR if status_code >= 500 else logging.INFO, log_entry)
 
     @staticmethod
     def log_error(
@@ -76,8 +181,8 @@ class StructuredLogger:
         goal_length: Optional[int] = None,
         stack_trace: Optional[str] = None,
     ):
-        log_entry = {
-            "timestamp": datetime.utcnow().isoformat(),
+        log_entry: Dict[str, Any] = {
+            "timestamp": utc_timestamp(),
             "event_type": "error",
             "request_id": request_id,
             "error_type": error_type,
@@ -90,21 +195,112 @@ class StructuredLogger:
         if stack_trace:
             log_entry["stack_trace"] = stack_trace[:1000]  # Truncate long traces
 
-        logger.error(json.dumps(log_entry))
+        _emit(logging.ERROR, log_entry)
 
     @staticmethod
     def log_cost_guard_triggered(
         request_id: str, estimated_tokens: int, max_allowed: int, goal_length: int
     ):
         log_entry = {
-            "timestamp": datetime.utcnow().isoformat(),
+            "timestamp": utc_timestamp(),
             "event_type": "cost_guard_triggered",
             "request_id": request_id,
             "estimated_tokens": estimated_tokens,
             "max_allowed_tokens": max_allowed,
             "goal_length": goal_length,
         }
-        logger.warning(json.dumps(log_entry))
+        _emit(logging.WARNING, log_entry)
+
+    @staticmethod
+    def log_hedge(
+        model_id: str, delay_ms: float, hedge_won: bool, stats: Dict[str, Any]
+    ):
+        log_entry = {
+            "timestamp": utc_timestamp(),
+            "event_type": "hedge_fired",
+            "model_id": model_id,
+            "delay_ms": round(delay_ms, 2),
+            "hedge_won": hedge_won,
+            **stats,
+        }
+        _emit(logging.INFO, log_entry)
+
+    @staticmethod
+    def log_concurrency_backoff(
+        limiter: str,
+        old_limit: float,
+        new_limit: float,
+        in_flight: int,
+        queue_depth: int,
+    ):
+        log_entry = {
+            "timestamp": utc_timestamp(),
+            "event_type": "concurrency_backoff",
+            "limiter": limiter,
+            "old_limit": round(old_limit, 2),
+            "new_limit": round(new_limit, 2),
+            "in_flight": in_flight,
+            "queue_depth": queue_depth,
+        }
+        _emit(logging.INFO, log_entry)
+
+    @staticmethod
+    def log_trace_segment(segment: Dict[str, Any]):
+        # "segment" is a complete X-Ray segment document, ready for PutTraceSegments
+        log_entry = {
+            "timestamp": utc_timestamp(),
+            "event_type": "trace_segment",
+            "trace_id": segment["trace_id"],
+            "segment": segment,
+        }
+        _emit(logging.INFO, log_entry)
+
+    @staticmethod
+    def log_profile(
+        request_id: str,
+        interval_ms: float,
+        duration_ms: float,
+        samples: int,
+        stacks: Dict[str, int],
+    ):
+        # stacks are collapsed ("outer;inner;leaf": count), see devtools/profile_aggregate.py
+        log_entry = {
+            "timestamp": utc_timestamp(),
+            "event_type": "profile",
+            "request_id": request_id,
+            "interval_ms": interval_ms,
+            "duration_ms": round(duration_ms, 2),
+            "samples": samples,
+            "stacks": stacks,
+        }
+        _emit(logging.INFO, log_entry)
+
+    @staticmethod
+    def log_request_cancelled(
+        request_id: str,
+        reason: str,
+        latency_ms: float,
+        abandoned_calls: int,
+        tokens_used: int,
+        tokens_saved: int,
+        worker_seconds_saved: float,
+        totals: Dict[str, Any],
+    ):
+        # tokens_used: spent by the abandoned Bedrock calls before they stopped;
+        # *_saved: against the model's typical call, see app/services/cancellation.py
+        log_entry = {
+            "timestamp": utc_timestamp(),
+            "event_type": "request_cancelled",
+            "request_id": request_id,
+            "reason": reason,
+            "latency_ms": round(latency_ms, 2),
+            "abandoned_calls": abandoned_calls,
+            "tokens_used": tokens_used,
+            "tokens_saved": tokens_saved,
+            "worker_seconds_saved": round(worker_seconds_saved, 3),
+            "totals": totals,
+        }
+        _emit(logging.INFO, log_entry)
 
 
 structured_logger = StructuredLogger()
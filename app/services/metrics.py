@@ -1,81 +1,163 @@
-import boto3
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 from app.config import settings
+from app.services.aws import get_client
+from app.services.background import handler
 
 
 # Publish custom metrics to CloudWatch for tracking business KPIs, setting up alarms for anomalies
 class MetricsPublisher:
     def __init__(self, namespace: str = "CloudAIRouter"):
-        self.cloudwatch = boto3.client("cloudwatch", region_name=settings.AWS_REGION)
+        self.cloudwatch = get_client("cloudwatch", region_name=settings.AWS_REGION)
         self.namespace = namespace
 
-    def publish_token_usage(self, tokens: int, model_id: str):
-        try:
-            self.cloudwatch.put_metric_data(
-                Namespace=self.namespace,
-                MetricData=[
+    def publish_request(
+        self,
+        latency_ms: float,
+        endpoint: str,
+        success: bool,
+        category: Optional[str],
+        tokens: Optional[int] = None,
+        model_id: Optional[str] = None,
+        concurrency: Optional[List[dict]] = None,
+        timestamp: Optional[float] = None,
+    ):
+        """
+        Everything one request reports, in a single put_metric_data call.
+
+        Runs as a background job after the response (app/services/background.py),
+        so failures are raised for the worker to retry, and the datums carry
+        the request's own time rather than the time they were sent.
+        """
+        if settings.USE_MOCK_AWS:
+            return  # no CloudWatch in mock mode; the request_completed log has it all
+        when = datetime.utcfromtimestamp(timestamp) if timestamp else datetime.utcnow()
+        metric_data = [
+            {
+                "MetricName": "ResponseLatency",
+                "Value": latency_ms,
+                "Unit": "Milliseconds",
+                "Timestamp": when,
+                "Dimensions": [{"Name": "Endpoint", "Value": endpoint}],
+            },
+            {
+                "MetricName": "RequestCount",
+                "Value": 1,
+                "Unit": "Count",
+                "Timestamp": when,
+                "Dimensions": [
+                    {"Name": "Status", "Value": "Success" if success else "Failure"},
+                    {"Name": "Category", "Value": category or "unknown"},
+                ],
+            },
+        ]
+        if tokens is not None:
+            metric_data.append(
+                {
+                    "MetricName": "TokensUsed",
+                    "Value": tokens,
+                    "Unit": "Count",
+                    "Timestamp": when,
+                    "Dimensions": [{"Name": "ModelId", "Value": model_id or "unknown"}],
+                }
+            )
+        for snapshot in concurrency or []:
+            dimensions = [{"Name": "Limiter", "Value": snapshot["name"]}]
+            for metric_name, key in (
+                ("ConcurrencyLimit", "limit"),
+                ("InFlight", "in_flight"),
+                ("QueueDepth", "queue_depth"),
+            ):
+                metric_data.append(
                     {
-                        "MetricName": "TokensUsed",
-                        "Value": tokens,
+                        "MetricName": metric_name,
+                        "Value": snapshot[key],
                         "Unit": "Count",
-                        "Timestamp": datetime.utcnow(),
-                        "Dimensions": [{"Name": "ModelId", "Value": model_id}],
+                        "Timestamp": when,
+                        "Dimensions": dimensions,
                     }
-                ],
-            )
-        except Exception as e:
-            print(f"Failed to publish metric: {e}")
+                )
+        self.cloudwatch.put_metric_data(
+            Namespace=self.namespace, MetricData=metric_data[:1000]
+        )
 
-    def publish_latency(self, latency_ms: float, endpoint: str):
-        """
-        Track response times
+    def publish_cancellation(
+        self,
+        tokens_used: int,
+        tokens_saved: int,
+        worker_seconds_saved: float,
+        timestamp: Optional[float] = None,
+    ):
+        """A request cancelled because its client left: what it spent and what stopping saved."""
+        if settings.USE_MOCK_AWS:
+            return
+        when = datetime.utcfromtimestamp(timestamp) if timestamp else datetime.utcnow()
+        self.cloudwatch.put_metric_data(
+            Namespace=self.namespace,
+            MetricData=[
+                {
+                    "MetricName": "CancelledRequests",
+                    "Value": 1,
+                    "Unit": "Count",
+                    "Timestamp": when,
+                },
+                {
+                    "MetricName": "CancelledTokensUsed",
+                    "Value": tokens_used,
+                    "Unit": "Count",
+                    "Timestamp": when,
+                },
+                {
+                    "MetricName": "CancelledTokensSaved",
+                    "Value": tokens_saved,
+                    "Unit": "Count",
+                    "Timestamp": when,
+                },
+                {
+                    "MetricName": "CancelledWorkerSecondsSaved",
+                    "Value": worker_seconds_saved,
+                    "Unit": "Seconds",
+                    "Timestamp": when,
+                },
+            ],
+        )
 
-        Important for:
-        - SLA monitoring
-        - Performance optimization
-        - User experience
+    def publish_cost_rollups(self, rollups: List[dict]):
         """
-        try:
-            self.cloudwatch.put_metric_data(
-                Namespace=self.namespace,
-                MetricData=[
+        Hourly Bedrock usage and spend per category and model, as flushed by
+        app/services/cost_accounting.py; one call per 1000 datums.
+        """
+        if settings.USE_MOCK_AWS:
+            return
+        metric_data = []
+        for rollup in rollups:
+            when = datetime.strptime(rollup["hour"], "%Y-%m-%d-%H")
+            dimensions = [
+                {"Name": "Category", "Value": rollup["category"]},
+                {"Name": "ModelId", "Value": rollup["model_id"]},
+            ]
+            for metric_name, key, unit in (
+                ("BedrockCalls", "calls", "Count"),
+                ("InputTokens", "input_tokens", "Count"),
+                ("OutputTokens", "output_tokens", "Count"),
+                ("CostUSD", "cost_usd", "None"),
+            ):
+                metric_data.append(
                     {
-                        "MetricName": "ResponseLatency",
-                        "Value": latency_ms,
-                        "Unit": "Milliseconds",
-                        "Timestamp": datetime.utcnow(),
-                        "Dimensions": [{"Name": "Endpoint", "Value": endpoint}],
+                        "MetricName": metric_name,
+                        "Value": rollup[key],
+                        "Unit": unit,
+                        "Timestamp": when,
+                        "Dimensions": dimensions,
                     }
-                ],
-            )
-        except Exception as e:
-            print(f"Failed to publish metric: {e}")
-
-    # Track failure/success rates
-    def publish_request_count(self, success: bool, category: str):
-        try:
-            metric_value = 1
+                )
+        for start in range(0, len(metric_data), 1000):
             self.cloudwatch.put_metric_data(
-                Namespace=self.namespace,
-                MetricData=[
-                    {
-                        "MetricName": "RequestCount",
-                        "Value": metric_value,
-                        "Unit": "Count",
-                        "Timestamp": datetime.utcnow(),
-                        "Dimensions": [
-                            {
-                                "Name": "Status",
-                                "Value": "Success" if success else "Failure",
-                            },
-                            {"Name": "Category", "Value": category or "unknown"},
-                        ],
-                    }
-                ],
+                Namespace=self.namespace, MetricData=metric_data[start : start + 1000]
             )
-        except Exception as e:
-            print(f"Failed to publish metric: {e}")
 
 
 metrics = MetricsPublisher()
+handler("request_metrics")(metrics.publish_request)
+handler("cancellation_metrics")(metrics.publish_cancellation)
+handler("cost_rollup")(metrics.publish_cost_rollups)
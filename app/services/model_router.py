@@ -0,0 +1,199 @@
+import logging
+import random
+import re
+import threading
+from dataclasses import dataclass
+from typing import Dict, NamedTuple, Optional
+from app.config import settings
+from app.services.circuit_breaker import call_key, get_breaker
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class ModelSpec:
+    name: str
+    model_id: str
+    # USD per 1k tokens
+    input_price: float
+    output_price: float
+
+
+HAIKU = ModelSpec(
+    name="claude-3-haiku",
+    model_id="anthropic.claude-3-haiku-20240307-v1:0",
+    input_price=0.00025,
+    output_price=0.00125,
+)
+SONNET = ModelSpec(
+    name="claude-3-sonnet",
+    model_id="anthropic.claude-3-sonnet-20240229-v1:0",
+    input_price=0.003,
+    output_price=0.015,
+)
+MODELS = (HAIKU, SONNET)
+
+# categories where a weaker plan costs the user more (exam syllabi, open-ended goals)
+CATEGORY_WEIGHT = {
+    "certification": 0.15,
+    "other": 0.1,
+    "creative": 0.05,
+}
+
+HORIZON_PATTERN = re.compile(r"(\d+)\s*(week|month|year)s?", re.IGNORECASE)
+WEEKS_PER_UNIT = {"week": 1, "month": 4, "year": 52}
+
+
+def horizon_weeks(goal: str) -> Optional[int]:
+    """Plan length the goal asks for ("in 3 months" -> 12), if it says."""
+    match = HORIZON_PATTERN.search(goal)
+    if not match:
+        return None
+    return int(match.group(1)) * WEEKS_PER_UNIT[match.group(2).lower()]
+
+
+def complexity_score(goal: str, context: Optional[str], category: str) -> float:
+    """
+    Cheap 0..1 estimate of how much reasoning a plan for this goal needs.
+
+    Long, multi-part goals over long horizons score high; "learn to juggle"
+    scores near zero.
+    """
+    words = len(goal.split())
+    context_words = len(context.split()) if context else 0
+    clauses = len(re.findall(r",|;| and | then ", goal))
+
+    score = 0.35 * min(words / 40, 1.0)
+    score += 0.15 * min(context_words / 80, 1.0)
+    score += 0.2 * min(clauses / 4, 1.0)
+
+    weeks = horizon_weeks(goal)
+    if weeks:
+        score += 0.15 * min(weeks / 26, 1.0)
+
+    score += CATEGORY_WEIGHT.get(category, 0.0)
+    return min(score, 1.0)
+
+
+class ArmStats:
+    """Discounted Beta posterior of one model's reward in one tier."""
+
+    def __init__(self):
+        self.alpha = 1.0
+        self.beta = 1.0
+        self.calls = 0
+        self.errors = 0
+        self.latency_ewma_ms: Optional[float] = None
+
+    def update(self, reward: float, latency_ms: Optional[float], decay: float) -> None:
+        # decay old evidence so the router follows upstream regressions
+        self.alpha = 1.0 + (self.alpha - 1.0) * decay + reward
+        self.beta = 1.0 + (self.beta - 1.0) * decay + (1.0 - reward)
+        self.calls += 1
+        if latency_ms is not None:
+            self.latency_ewma_ms = (
+                latency_ms
+                if self.latency_ewma_ms is None
+                else 0.8 * self.latency_ewma_ms + 0.2 * latency_ms
+            )
+
+    def as_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "mean_reward": round(self.alpha / (self.alpha + self.beta), 3),
+            "latency_ewma_ms": round(self.latency_ewma_ms, 1)
+            if self.latency_ewma_ms is not None
+            else None,
+        }
+
+
+class Route(NamedTuple):
+    model: ModelSpec
+    tier: str
+    complexity: float
+
+
+class ModelRouter:
+    """
+    Picks the generation model per request.
+
+    Simple goals always go to Haiku. Everything else is a Thompson-sampling
+    bandit per tier: the reward of a call is 1 for a valid plan inside the
+    latency target, falling off linearly to 0 at twice the target, and 0 for
+    errors or unparseable output. Sonnet's extra cost is charged against its
+    sampled reward, and a model whose circuit is open is not considered.
+    """
+
+    def __init__(
+        self,
+        simple_threshold: float = settings.MODEL_ROUTER_SIMPLE_THRESHOLD,
+        latency_target_ms: float = settings.MODEL_ROUTER_LATENCY_TARGET_MS,
+        cost_weight: float = settings.MODEL_ROUTER_COST_WEIGHT,
+        decay: float = settings.MODEL_ROUTER_DECAY,
+        rng: Optional[random.Random] = None,
+    ):
+        self.simple_threshold = simple_threshold
+        self.latency_target_ms = latency_target_ms
+        self.cost_weight = cost_weight
+        self.decay = decay
+        self.rng = rng or random.Random()
+        self.arms: Dict[tuple, ArmStats] = {}
+        self._lock = threading.Lock()
+
+    def _arm(self, model: ModelSpec, tier: str) -> ArmStats:
+        return self.arms.setdefault((model.name, tier), ArmStats())
+
+    def _cost_penalty(self, model: ModelSpec) -> float:
+        cheapest = min(m.output_price for m in MODELS)
+        priciest = max(m.output_price for m in MODELS)
+        if priciest == cheapest:
+            return 0.0
+        return (
+            self.cost_weight * (model.output_price - cheapest) / (priciest - cheapest)
+        )
+
+    def choose(self, goal: str, context: Optional[str], category: str) -> Route:
+        complexity = complexity_score(goal, context, category)
+        if complexity < self.simple_threshold:
+            return Route(HAIKU, "simple", complexity)
+
+        tier = "complex"
+        candidates = [
+            m
+            for m in MODELS
+            if get_breaker(call_key(m.model_id, "generation")).state != "open"
+        ] or [HAIKU]
+        with self._lock:
+            scores = {
+                m.name: self.rng.betavariate(
+                    self._arm(m, tier).alpha, self._arm(m, tier).beta
+                )
+                - self._cost_penalty(m)
+                for m in candidates
+            }
+        model = max(candidates, key=lambda m: scores[m.name])
+        return Route(model, tier, complexity)
+
+    def record(self, route: Route, latency_ms: Optional[float], success: bool) -> None:
+        if success and latency_ms is not None:
+            overrun = max(latency_ms - self.latency_target_ms, 0.0)
+            reward = max(1.0 - overrun / self.latency_target_ms, 0.0)
+        else:
+            reward = 0.0
+        with self._lock:
+            arm = self._arm(route.model, route.tier)
+            if not success:
+                arm.errors += 1
+            arm.update(reward, latency_ms, self.decay)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                f"{name}/{tier}": arm.as_dict()
+                for (name, tier), arm in self.arms.items()
+            }
+
+
+model_router = ModelRouter()
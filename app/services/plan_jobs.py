@@ -0,0 +1,578 @@
+import asyncio
+import hashlib
+import hmac
+import http.client
+import ipaddress
+import json
+import logging
+import socket
+import ssl
+import time
+import urllib.parse
+import uuid
+import weakref
+from datetime import datetime
+from typing import Any, Dict, MutableMapping, Optional, Tuple, Union
+from fastapi import HTTPException, status
+from app.config import settings
+from app.models.schemas import GeneratePlanRequest, GeneratePlanResponse, PlanJobRequest
+from app.services import background, cost_accounting
+from app.services.aws import get_client, get_resource
+from app.services.background import defer, handler
+from app.services.circuit_breaker import CircuitOpenError
+from app.services.classifier import classify_goal
+from app.services.concurrency import Overloaded, limiter_snapshots
+from app.services.deadline import Deadline, DeadlineExceeded
+import app.services.cost_guard as cost_guard
+from app.services import db_logger  # noqa: F401  registers the "usage_log" job
+from app.services import plan_library, usage_rollups
+from app.services import plan_store  # registers the "plan_store" background job
+from app.services.logger import flush_logs, structured_logger
+from app.services.planner import generate_plan
+
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+TERMINAL = (SUCCEEDED, FAILED)
+
+ENDPOINT = "/plan-jobs"
+SIGNATURE_HEADER = "X-Plan-Job-Signature"
+# SQS caps a message's visibility timeout at 12 hours
+MAX_VISIBILITY_SECONDS = 43200
+
+
+def sign(body: bytes, timestamp: int, secret: str) -> str:
+    """Value for the webhook signature header: "<unix ts>.<hex HMAC-SHA256 of "<ts>." + body>"."""
+    digest = hmac.new(
+        secret.encode(), f"{timestamp}.".encode() + body, hashlib.sha256
+    ).hexdigest()
+    return f"{timestamp}.{digest}"
+
+
+class MemoryJobStore:
+    """Job records in a dict: one process, gone on restart. For local runs and tests."""
+
+    def __init__(self):
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+
+    def create(self, job: Dict[str, Any]) -> None:
+        self._jobs[job["job_id"]] = dict(job)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self._jobs.get(job_id)
+        return dict(job) if job is not None else None
+
+    def update(self, job_id: str, **fields: Any) -> None:
+        self._jobs[job_id].update(fields)
+
+
+class DynamoJobStore:
+    """
+    Job records in DynamoDB, keyed by job_id, expired by the table's TTL on
+    expires_at. Request, result and error are stored as JSON strings.
+    """
+
+    def __init__(self, table_name: str):
+        self.table_name = table_name
+
+    @property
+    def table(self):
+        return get_resource("dynamodb", region_name=settings.AWS_REGION).Table(
+            self.table_name
+        )
+
+    def create(self, job: Dict[str, Any]) -> None:
+        self.table.put_item(
+            Item=job, ConditionExpression="attribute_not_exists(job_id)"
+        )
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        # strongly consistent, so a poll right after a status change sees it
+        item = self.table.get_item(Key={"job_id": job_id}, ConsistentRead=True).get(
+            "Item"
+        )
+        if item is None:
+            return None
+        # numbers come back as Decimal
+        item["attempts"] = int(item.get("attempts", 0))
+        item["expires_at"] = int(item.get("expires_at", 0))
+        return item
+
+    def update(self, job_id: str, **fields: Any) -> None:
+        names = {f"#f{i}": name for i, name in enumerate(fields)}
+        values = {f":v{i}": value for i, value in enumerate(fields.values())}
+        self.table.update_item(
+            Key={"job_id": job_id},
+            UpdateExpression="SET "
+            + ", ".join(f"#f{i} = :v{i}" for i in range(len(fields))),
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues=values,
+        )
+
+
+class SqsQueue:
+    """Production queue; a Lambda event source mapping delivers to handle_sqs_event."""
+
+    def __init__(self, queue_url: str):
+        self.queue_url = queue_url
+
+    async def send(self, message: Dict[str, Any]) -> None:
+        client = get_client("sqs", region_name=settings.AWS_REGION)
+        await asyncio.to_thread(
+            client.send_message,
+            QueueUrl=self.queue_url,
+            MessageBody=json.dumps(message),
+        )
+
+    def redeliver_after(self, receipt_handle: str, seconds: int) -> None:
+        """Make a failed message visible again in `seconds`, not the queue's timeout."""
+        client = get_client("sqs", region_name=settings.AWS_REGION)
+        client.change_message_visibility(
+            QueueUrl=self.queue_url,
+            ReceiptHandle=receipt_handle,
+            VisibilityTimeout=seconds,
+        )
+
+
+def retry_delay(receive_count: int) -> int:
+    """Seconds before the next delivery of a message received receive_count times."""
+    delay = settings.JOBS_RETRY_DELAY_SECONDS * 2 ** (receive_count - 1)
+    return int(min(delay, MAX_VISIBILITY_SECONDS))
+
+
+class LocalQueue:
+    """
+    In-process stand-in for SQS: each job runs as a task on the event loop
+    that accepted it, at most `concurrency` at a time, and is retried with
+    backoff like a redelivered message. Jobs do not survive a restart.
+    """
+
+    def __init__(self, concurrency: int, retry_delay: float = 1.0):
+        self.concurrency = concurrency
+        self.retry_delay = retry_delay
+        self._tasks: set = set()
+        # asyncio primitives belong to one loop; tests run several
+        self._semaphores: MutableMapping[asyncio.AbstractEventLoop, asyncio.Semaphore]
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    async def send(self, message: Dict[str, Any]) -> None:
+        task = asyncio.get_running_loop().create_task(self._run(message))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, message: Dict[str, Any]) -> None:
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.concurrency)
+        async with semaphore:
+            attempt = 0
+            while not await process(message):
+                await asyncio.sleep(self.retry_delay * 2**attempt)
+                attempt += 1
+
+    async def join(self) -> None:
+        """Wait for every job sent so far (tests, shutdown)."""
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+
+job_queue: Union[SqsQueue, LocalQueue]
+if settings.JOBS_QUEUE_URL and not settings.USE_MOCK_AWS:
+    job_queue = SqsQueue(settings.JOBS_QUEUE_URL)
+else:
+    job_queue = LocalQueue(settings.JOBS_LOCAL_CONCURRENCY)
+
+job_store: Union[DynamoJobStore, MemoryJobStore]
+if settings.JOBS_TABLE_NAME and not settings.USE_MOCK_AWS:
+    job_store = DynamoJobStore(settings.JOBS_TABLE_NAME)
+else:
+    job_store = MemoryJobStore()
+
+
+def job_view(job: Dict[str, Any]) -> Dict[str, Any]:
+    """The job as clients see it, from GET /plan-jobs/{id} or the webhook."""
+    view = {
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"],
+        "attempts": job.get("attempts", 0),
+        "result": None,
+        "error": None,
+    }
+    if job.get("result"):
+        view["result"] = json.loads(job["result"])
+    if job.get("error"):
+        view["error"] = json.loads(job["error"])
+    return view
+
+
+async def submit(request: PlanJobRequest) -> Dict[str, Any]:
+    """Record a queued job and hand it to the queue; raises if the queue is unreachable."""
+    now = datetime.utcnow().isoformat()
+    job: Dict[str, Any] = {
+        "job_id": str(uuid.uuid4()),
+        "status": QUEUED,
+        "request": request.model_dump_json(exclude={"callback_url"}),
+        "attempts": 0,
+        "created_at": now,
+        "updated_at": now,
+        "expires_at": int(time.time() + settings.JOBS_TTL_SECONDS),
+    }
+    if request.callback_url:
+        job["callback_url"] = request.callback_url
+    await asyncio.to_thread(job_store.create, job)
+
+    try:
+        await job_queue.send({"job_id": job["job_id"]})
+    except Exception as e:
+        logger.error(f"Job {job['job_id']}: could not be queued: {e}")
+        await update(
+            job["job_id"],
+            status=FAILED,
+            error=json.dumps(
+                {"status_code": 503, "detail": "Job could not be queued."}
+            ),
+        )
+        raise
+    return job
+
+
+async def get(job_id: str) -> Optional[Dict[str, Any]]:
+    return await asyncio.to_thread(job_store.get, job_id)
+
+
+async def update(job_id: str, **fields: Any) -> Dict[str, Any]:
+    fields["updated_at"] = datetime.utcnow().isoformat()
+    await asyncio.to_thread(job_store.update, job_id, **fields)
+    return fields
+
+
+async def run_pipeline(
+    job_id: str, request: GeneratePlanRequest, deadline: Deadline
+) -> Tuple[GeneratePlanResponse, str]:
+    """Classification, cost guard and generation, as the synchronous endpoint runs them."""
+    plan = await plan_library.lookup(request.goal, request.context, job_id)
+    if plan is not None:
+        return plan, plan.category
+
+    try:
+        category = await deadline.run("classification", classify_goal(request.goal))
+    except DeadlineExceeded as e:
+        logger.warning(f"Job {job_id}: {e}, using 'other'")
+        category = "other"
+
+    cost_guard.check_cost_limits(
+        cost_guard.estimate_cost(request.goal, request.context)
+    )
+
+    plan = await deadline.run(
+        "generation",
+        generate_plan(
+            goal=request.goal,
+            context=request.context,
+            category=category,
+            request_id=job_id,
+        ),
+    )
+    return plan, category
+
+
+def describe_error(e: Exception) -> Dict[str, Any]:
+    """The status code and detail the synchronous endpoint would have answered with."""
+    if isinstance(e, HTTPException):
+        return {"status_code": e.status_code, "detail": e.detail}
+    if isinstance(e, DeadlineExceeded):
+        return {
+            "status_code": status.HTTP_504_GATEWAY_TIMEOUT,
+            "detail": "Plan generation took too long. Please try again.",
+        }
+    if isinstance(e, (CircuitOpenError, Overloaded)):
+        return {
+            "status_code": status.HTTP_503_SERVICE_UNAVAILABLE,
+            "detail": "Plan generation is temporarily unavailable. Please try again shortly.",
+        }
+    return {
+        "status_code": status.HTTP_500_INTERNAL_SERVER_ERROR,
+        "detail": "An error occurred while generating your plan. Please try again.",
+    }
+
+
+def defer_usage(
+    job_id: str,
+    request: GeneratePlanRequest,
+    latency_ms: float,
+    success: bool,
+    category: str,
+    usage: Dict[str, Any],
+    model_id: Optional[str] = None,
+    error: Optional[str] = None,
+) -> None:
+    """Metrics, the usage record and the rollups for one attempt, like the router's."""
+    finished_at = time.time()
+    usage_rollups.record(category, success, latency_ms, usage, finished_at)
+    defer(
+        "request_metrics",
+        latency_ms=latency_ms,
+        endpoint=ENDPOINT,
+        success=success,
+        category=category,
+        tokens=usage["total_tokens"] if usage["calls"] else None,
+        model_id=model_id,
+        concurrency=limiter_snapshots(),
+        timestamp=finished_at,
+    )
+    defer(
+        "usage_log",
+        request_id=job_id,
+        goal=request.goal,
+        category=category,
+        tokens_used=usage["total_tokens"],
+        input_tokens=usage["input_tokens"],
+        output_tokens=usage["output_tokens"],
+        cost_usd=usage["cost_usd"],
+        latency_ms=latency_ms,
+        success=success,
+        error=error,
+        model_id=model_id,
+        timestamp=finished_at,
+    )
+
+
+async def finish(job: Dict[str, Any], job_status: str, **fields: Any) -> None:
+    job.update(await update(job["job_id"], status=job_status, **fields))
+    if job.get("callback_url"):
+        defer("job_callback", url=job["callback_url"], body=json.dumps(job_view(job)))
+
+
+async def process(message: Dict[str, Any], context: Any = None) -> bool:
+    """
+    Run one delivery of a job. Returns False when the attempt failed and the
+    message should be delivered again.
+
+    Deliveries are at least once, so a job that already finished is skipped.
+    Client errors (4xx, e.g. the cost guard) fail the job at once; anything
+    else is retried until JOBS_MAX_ATTEMPTS attempts have been made.
+    """
+    job_id = message["job_id"]
+    job = await get(job_id)
+    if job is None:
+        logger.warning(f"Job {job_id}: no record, dropping the message")
+        return True
+    if job["status"] in TERMINAL:
+        logger.info(f"Job {job_id}: already {job['status']}, skipping redelivery")
+        return True
+
+    attempts = int(job.get("attempts", 0)) + 1
+    job.update(await update(job_id, status=RUNNING, attempts=attempts))
+    request = GeneratePlanRequest.model_validate_json(job["request"])
+    # Lambda's remaining time still caps the budget, as it does for requests
+    deadline = Deadline.for_request(
+        {"aws.context": context}, settings.JOBS_DEADLINE_SECONDS
+    )
+    start_time = time.time()
+    category = None
+    # each attempt is metered on its own, as a request is
+    meter = cost_accounting.start(job_id)
+
+    try:
+        plan, category = await run_pipeline(job_id, request, deadline)
+    except Exception as e:
+        latency_ms = (time.time() - start_time) * 1000
+        error = describe_error(e)
+        permanent = isinstance(e, HTTPException) and e.status_code < 500
+        structured_logger.log_error(
+            request_id=job_id,
+            error_type=type(e).__name__,
+            error_message=str(e),
+            goal_length=len(request.goal),
+        )
+        defer_usage(
+            job_id,
+            request,
+            latency_ms,
+            success=False,
+            category=category or "unknown",
+            usage=meter.close(category),
+            error=str(e),
+        )
+        if permanent or attempts >= settings.JOBS_MAX_ATTEMPTS:
+            await finish(job, FAILED, error=json.dumps(error))
+            return True
+        logger.warning(f"Job {job_id}: attempt {attempts} failed, will retry: {e}")
+        job.update(await update(job_id, status=QUEUED, error=json.dumps(error)))
+        return False
+
+    latency_ms = (time.time() - start_time) * 1000
+    defer_usage(
+        job_id,
+        request,
+        latency_ms,
+        success=True,
+        category=category,
+        usage=meter.close(category),
+        model_id=plan.metadata.get("model_id"),
+    )
+    result = plan.model_dump_json()
+    # also readable as a plan, GET /plans/{job_id}
+    await plan_store.save(job_id, result.encode())
+    await finish(job, SUCCEEDED, result=result, error="")
+    logger.info(
+        f"Job {job_id}: succeeded in {latency_ms:.0f}ms after {attempts} attempt(s)"
+    )
+    return True
+
+
+def callback_address(url: str) -> Tuple[str, int, str]:
+    """
+    The host, port and checked IP address a callback URL is delivered to.
+
+    A callback is a request the server makes on a client's behalf, so it
+    must not reach anything a client could not: the URL must be https, its
+    host in JOBS_CALLBACK_ALLOWED_HOSTS when that is set, and every address
+    the host resolves to public (not loopback, private, link-local like the
+    instance metadata endpoint, or reserved). JOBS_CALLBACK_ALLOW_LOCAL
+    lifts the https and address checks for local development.
+
+    Raises ValueError for a URL outside these rules and OSError if the host
+    does not resolve.
+    """
+    parts = urllib.parse.urlsplit(url)
+    local = settings.JOBS_CALLBACK_ALLOW_LOCAL
+    if parts.scheme != "https" and not (local and parts.scheme == "http"):
+        raise ValueError("callback_url must be an https URL")
+    host = parts.hostname
+    if not host:
+        raise ValueError("callback_url has no host")
+    allowed = settings.JOBS_CALLBACK_ALLOWED_HOSTS
+    if allowed and host not in allowed:
+        raise ValueError(f"callback_url host {host} is not allowed")
+    port = parts.port or (443 if parts.scheme == "https" else 80)
+    addresses = sorted(
+        {info[4][0] for info in socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)}
+    )
+    if not local:
+        for address in addresses:
+            if not ipaddress.ip_address(address.split("%")[0]).is_global:
+                raise ValueError(
+                    f"callback_url host {host} resolves to a non-public address"
+                )
+    return host, port, addresses[0]
+
+
+@handler("job_callback")
+def deliver_callback(url: str, body: str) -> None:
+    """
+    POST the finished job to its callback URL; errors raise so the worker retries.
+
+    The URL is checked again here (DNS may have changed since the job was
+    submitted) and the connection goes to the address that was checked,
+    not to a fresh lookup of the host. Redirects are not followed.
+    """
+    try:
+        host, port, address = callback_address(url)
+    except ValueError as e:
+        logger.warning(f"Job callback to {url} not delivered: {e}")
+        return
+    data = body.encode()
+    headers = {"Content-Type": "application/json", "User-Agent": "ai-router-plan-jobs"}
+    if settings.JOBS_CALLBACK_SECRET:
+        headers[SIGNATURE_HEADER] = sign(
+            data, int(time.time()), settings.JOBS_CALLBACK_SECRET
+        )
+    parts = urllib.parse.urlsplit(url)
+    timeout = settings.JOBS_CALLBACK_TIMEOUT_SECONDS
+    sock = socket.create_connection((address, port), timeout=timeout)
+    connection: http.client.HTTPConnection
+    if parts.scheme == "https":
+        context = ssl.create_default_context()
+        connection = http.client.HTTPSConnection(host, port, timeout=timeout)
+        connection.sock = context.wrap_socket(sock, server_hostname=host)
+    else:
+        connection = http.client.HTTPConnection(host, port, timeout=timeout)
+        connection.sock = sock
+    try:
+        target = parts.path or "/"
+        if parts.query:
+            target += f"?{parts.query}"
+        connection.request("POST", target, body=data, headers=headers)
+        response = connection.getresponse()
+        response.read()
+        if response.status >= 300:
+            raise ConnectionError(f"Job callback to {url} answered {response.status}")
+    finally:
+        connection.close()
+
+
+def is_sqs_event(event: Any) -> bool:
+    if not isinstance(event, dict):
+        return False
+    records = event.get("Records") or []
+    return bool(records) and records[0].get("eventSource") == "aws:sqs"
+
+
+def event_loop() -> asyncio.AbstractEventLoop:
+    # the same loop Mangum runs requests on, so module-level asyncio state
+    # (limiters, circuit breakers) is shared between the two entry points
+    try:
+        loop = asyncio.get_event_loop()
+        if not loop.is_closed():
+            return loop
+    except RuntimeError:
+        pass
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    return loop
+
+
+def handle_sqs_event(event: Dict[str, Any], context: Any = None) -> Dict[str, Any]:
+    """
+    Lambda entry point for the queue's event source mapping.
+
+    Failed messages are reported as batch item failures, so SQS redelivers
+    only those (and moves them to the dead-letter queue once its
+    maxReceiveCount is reached). The queue's visibility timeout is sized
+    for a slow attempt, far longer than a throttle lasts, so each failed
+    message is first made visible again after retry_delay(), doubling with
+    every receive. If that call fails, the message waits out the
+    visibility timeout as before. No client is
+    waiting on this invocation, so webhooks and usage records are drained
+    before it returns instead of waiting for the next one.
+    """
+    background.worker.start()
+    loop = event_loop()
+    failures = []
+    for record in event["Records"]:
+        try:
+            done = loop.run_until_complete(process(json.loads(record["body"]), context))
+        except Exception as e:
+            logger.error(
+                f"SQS message {record.get('messageId')} could not be processed: {e}"
+            )
+            done = False
+        if not done:
+            if isinstance(job_queue, SqsQueue):
+                receive_count = int(
+                    record.get("attributes", {}).get("ApproximateReceiveCount", 1)
+                )
+                try:
+                    job_queue.redeliver_after(
+                        record["receiptHandle"], retry_delay(receive_count)
+                    )
+                except Exception as e:
+                    logger.warning(
+                        f"SQS message {record['messageId']}: could not shorten its visibility timeout: {e}"
+                    )
+            failures.append({"itemIdentifier": record["messageId"]})
+
+    if not background.worker.drain(settings.BACKGROUND_DRAIN_SECONDS):
+        logger.warning(
+            f"{background.worker.pending()} background jobs still pending after the batch"
+        )
+    flush_logs()
+    return {"batchItemFailures": failures}
@@ -0,0 +1,524 @@
+import asyncio
+import json
+import logging
+import mmap
+import os
+import re
+import struct
+import time
+import uuid
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+from boto3.dynamodb.conditions import Key
+from app.config import settings
+from app.models.schemas import GeneratePlanResponse, GeneratedPlan
+from app.services import background, plan_store
+from app.services.aws import get_resource
+from app.services.classifier import classify_goal
+from app.services.deadline import Deadline
+from app.services.logger import flush_logs
+from app.services.planner import build_response, generate_plan
+
+
+logger = logging.getLogger(__name__)
+
+# index layout: MAGIC, a 4-byte header length, the JSON header, then the
+# encoded plans back to back
+MAGIC = b"PLIB\x01"
+HEADER_LENGTH = struct.Struct(">I")
+
+# DynamoDB items are capped at 400 KB; the index is split into parts below that
+PART_BYTES = 350 * 1024
+CURRENT = "current"
+
+# how long a superseded version outlives the pointer move: well past the
+# reload interval of every reader still on it
+SUPERSEDED_TTL_SECONDS = 7 * 86400
+
+# one generation's worth of time left, or the refresh stops and publishes what it has
+GENERATION_SECONDS = 60
+
+
+def normalize_goal(goal: str) -> str:
+    """Near-identical goals share a key: case, punctuation and spacing are ignored."""
+    return " ".join(re.findall(r"[a-z0-9+#]+", goal.lower()))
+
+
+class PlanIndex:
+    """
+    Read-only library: one buffer, its header parsed once at load. A lookup
+    is a dict hit plus one decompression; the plans stay compressed
+    (plan_store.encode) and, from a bundled file, are never copied out of
+    the page cache until read.
+    """
+
+    def __init__(self, data=b""):
+        self.data = memoryview(data)
+        self.version = ""
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        if not data:
+            return
+        if bytes(self.data[: len(MAGIC)]) != MAGIC:
+            raise ValueError("Not a plan library index")
+        (length,) = HEADER_LENGTH.unpack_from(self.data, len(MAGIC))
+        start = len(MAGIC) + HEADER_LENGTH.size
+        header = json.loads(bytes(self.data[start : start + length]))
+        self.version = header["version"]
+        self.entries = header["entries"]
+        self._base = start + length
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def encoded(self, key: str) -> Optional[bytes]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        offset = self._base + entry["offset"]
+        return bytes(self.data[offset : offset + entry["length"]])
+
+    def get(self, key: str) -> Optional[Tuple[Dict[str, Any], GeneratedPlan]]:
+        encoded = self.encoded(key)
+        if encoded is None:
+            return None
+        plan = GeneratedPlan.model_validate_json(plan_store.decode(encoded))
+        return self.entries[key], plan
+
+
+def build_index(
+    entries: Dict[str, Tuple[Dict[str, Any], bytes]], version: str
+) -> bytes:
+    """Index bytes for {key: (entry fields, encoded plan)}."""
+    header: Dict[str, Any] = {"version": version, "entries": {}}
+    blobs, offset = [], 0
+    for key, (fields, encoded) in sorted(entries.items()):
+        header["entries"][key] = {**fields, "offset": offset, "length": len(encoded)}
+        blobs.append(encoded)
+        offset += len(encoded)
+    header_bytes = json.dumps(header, separators=(",", ":")).encode()
+    return (
+        MAGIC + HEADER_LENGTH.pack(len(header_bytes)) + header_bytes + b"".join(blobs)
+    )
+
+
+class FileSource:
+    """The index as a file, memory-mapped so every worker on the host shares one copy."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def version(self) -> Optional[str]:
+        try:
+            return str(os.stat(self.path).st_mtime_ns)
+        except FileNotFoundError:
+            return None
+
+    def load(self):
+        if self.version() is None:
+            return b""
+        with open(self.path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return b""
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def publish(self, data: bytes, version: str) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        staging = f"{self.path}.{uuid.uuid4().hex}.tmp"
+        with open(staging, "wb") as f:
+            f.write(data)
+        os.replace(staging, self.path)
+
+
+class DynamoSource:
+    """
+    The index in DynamoDB: each version split into parts (version, part),
+    plus a pointer item naming the current one with its part count and
+    length. A new version is written in full before the pointer moves, so
+    readers never see a mix.
+
+    Parts are written with a TTL, so those of a publish that never moved the
+    pointer expire; the TTL is removed before the pointer moves to them and
+    set on the superseded version's parts after.
+    """
+
+    def __init__(self, table_name: str):
+        self.table_name = table_name
+
+    @property
+    def table(self):
+        return get_resource("dynamodb", region_name=settings.AWS_REGION).Table(
+            self.table_name
+        )
+
+    def _pointer(self) -> Optional[Dict[str, Any]]:
+        return self.table.get_item(
+            Key={"version": CURRENT, "part": 0}, ConsistentRead=True
+        ).get("Item")
+
+    def version(self) -> Optional[str]:
+        pointer = self._pointer()
+        return pointer["points_to"] if pointer is not None else None
+
+    def load(self) -> bytes:
+        pointer = self._pointer()
+        if pointer is None:
+            return b""
+        version = pointer["points_to"]
+        parts, start = [], None
+        while True:
+            query = {
+                "KeyConditionExpression": Key("version").eq(version),
+                "ConsistentRead": True,
+            }
+            if start:
+                query["ExclusiveStartKey"] = start
+            page = self.table.query(**query)
+            parts.extend(page["Items"])
+            start = page.get("LastEvaluatedKey")
+            if not start:
+                break
+        data = b"".join(
+            item["data"].value for item in sorted(parts, key=lambda i: i["part"])
+        )
+        # a version expired or deleted under us reads as an error, not as a short index
+        expected = (pointer.get("parts", len(parts)), pointer.get("length", len(data)))
+        if (len(parts), len(data)) != expected:
+            raise ValueError(
+                f"Plan library {version}: {len(parts)} parts, {len(data)} bytes; "
+                f"the pointer says {pointer.get('parts')} parts, {pointer.get('length')} bytes"
+            )
+        return data
+
+    def _set_expiry(self, version: str, parts: int, expires_at: Optional[int]) -> None:
+        for part in range(parts):
+            if expires_at is None:
+                self.table.update_item(
+                    Key={"version": version, "part": part},
+                    UpdateExpression="REMOVE expires_at",
+                )
+            else:
+                self.table.update_item(
+                    Key={"version": version, "part": part},
+                    UpdateExpression="SET expires_at = :expires_at",
+                    ExpressionAttributeValues={":expires_at": expires_at},
+                )
+
+    def publish(self, data: bytes, version: str) -> None:
+        expires_at = int(time.time()) + SUPERSEDED_TTL_SECONDS
+        starts = range(0, len(data), PART_BYTES)
+        with self.table.batch_writer() as batch:
+            for part, start in enumerate(starts):
+                batch.put_item(
+                    Item={
+                        "version": version,
+                        "part": part,
+                        "data": data[start : start + PART_BYTES],
+                        "expires_at": expires_at,
+                    }
+                )
+        self._set_expiry(version, len(starts), None)
+        previous = self._pointer()
+        self.table.put_item(
+            Item={
+                "version": CURRENT,
+                "part": 0,
+                "points_to": version,
+                "parts": len(starts),
+                "length": len(data),
+            }
+        )
+        # pointers written before part counts were kept name versions whose
+        # parts already carry a TTL
+        if previous is not None and previous["points_to"] != version:
+            self._set_expiry(
+                previous["points_to"], int(previous.get("parts", 0)), expires_at
+            )
+
+
+class PlanLibrary:
+    """
+    Plans for the most requested goals, generated ahead of time and served
+    without a Bedrock call. The index is reloaded when its source has a new
+    version, checked at most every PLAN_LIBRARY_RELOAD_SECONDS.
+
+    Without a source, or while the source has nothing published yet, the
+    library is empty and every goal is generated; that is logged once.
+    """
+
+    def __init__(self, source, reload_seconds: float):
+        self.source = source
+        self.reload_seconds = reload_seconds
+        self.index = PlanIndex()
+        self.hits = 0
+        self.misses = 0
+        self._version: Optional[str] = None
+        self._checked_at = float("-inf")
+        self._reloading = False
+        self._warned_empty = False
+
+    def reload(self) -> None:
+        if self.source is None:
+            self._warn_if_empty("set PLAN_LIBRARY_TABLE_NAME or PLAN_LIBRARY_PATH")
+            return
+        try:
+            version = self.source.version()
+            if version is not None and version != self._version:
+                self.index = PlanIndex(self.source.load())
+                self._version = version
+                logger.info(
+                    f"Plan library {self.index.version}: {len(self.index)} goals"
+                )
+        except Exception as e:
+            # keep serving the index we have
+            logger.warning(f"Plan library reload failed: {e}")
+        self._warn_if_empty("nothing has been published to its source yet")
+
+    def _warn_if_empty(self, reason: str) -> None:
+        if len(self.index) == 0 and not self._warned_empty:
+            self._warned_empty = True
+            logger.warning(f"Plan library is empty ({reason}); every goal is generated")
+
+    async def _maybe_reload(self) -> None:
+        now = time.monotonic()
+        if self._reloading or now - self._checked_at < self.reload_seconds:
+            return
+        self._reloading, self._checked_at = True, now
+        try:
+            await asyncio.to_thread(self.reload)
+        finally:
+            self._reloading = False
+
+    async def lookup(
+        self, goal: str, context: Optional[str], request_id: str
+    ) -> Optional[GeneratePlanResponse]:
+        """The library's plan for this goal, or None. Goals with context are always generated."""
+        if not settings.PLAN_LIBRARY_ENABLED or context:
+            return None
+        await self._maybe_reload()
+        found = self.index.get(normalize_goal(goal))
+        if found is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        entry, plan = found
+        return build_response(
+            plan,
+            request_id=request_id,
+            goal=goal,
+            category=entry["category"],
+            metadata={
+                "tokens_used": {"input": 0, "output": 0, "total": 0},
+                "model": entry["model"],
+                "model_id": entry["model_id"],
+                "library": self.index.version,
+            },
+        )
+
+
+def default_source() -> Union[DynamoSource, FileSource, None]:
+    if settings.PLAN_LIBRARY_TABLE_NAME and not settings.USE_MOCK_AWS:
+        return DynamoSource(settings.PLAN_LIBRARY_TABLE_NAME)
+    if settings.PLAN_LIBRARY_PATH:
+        return FileSource(settings.PLAN_LIBRARY_PATH)
+    return None
+
+
+library = PlanLibrary(default_source(), settings.PLAN_LIBRARY_RELOAD_SECONDS)
+
+
+async def lookup(
+    goal: str, context: Optional[str], request_id: str
+) -> Optional[GeneratePlanResponse]:
+    return await library.lookup(goal, context, request_id)
+
+
+def query_usage(days: int) -> Iterable[Dict[str, Any]]:
+    """
+    Goals of the usage records (app/services/db_logger.py) of the last
+    `days` days: one Query of the date-index per day, so the cost follows
+    the window, not the table.
+    """
+    table = get_resource("dynamodb", region_name=settings.AWS_REGION).Table(
+        settings.DYNAMODB_TABLE_NAME
+    )
+    today = datetime.utcnow()
+    for offset in range(days, -1, -1):
+        query = {
+            "IndexName": "date-index",
+            "KeyConditionExpression": Key("date").eq(
+                (today - timedelta(days=offset)).strftime("%Y-%m-%d")
+            ),
+            "ProjectionExpression": "goal",
+        }
+        while True:
+            page = table.query(**query)
+            yield from page["Items"]
+            if "LastEvaluatedKey" not in page:
+                break
+            query["ExclusiveStartKey"] = page["LastEvaluatedKey"]
+
+
+def mine_goals(
+    records: Iterable[Dict[str, Any]], top: int, min_requests: int
+) -> List[Tuple[str, str, int]]:
+    """
+    The most requested goals as (key, goal text, requests), most requested
+    first. The text is the most common spelling of the key, so the prompt
+    reads as users write it.
+    """
+    counts: Counter = Counter()
+    spellings: Dict[str, Counter] = defaultdict(Counter)
+    for record in records:
+        goal = (record.get("goal") or "").strip()
+        key = normalize_goal(goal)
+        if not key:
+            continue
+        counts[key] += 1
+        spellings[key][goal] += 1
+    return [
+        (key, spellings[key].most_common(1)[0][0], count)
+        for key, count in counts.most_common(top)
+        if count >= min_requests
+    ]
+
+
+async def generate_entry(goal: str, requests: int) -> Tuple[Dict[str, Any], bytes]:
+    """Classify and plan one goal through the request pipeline; the entry and its encoded plan."""
+    category = await classify_goal(goal)
+    response = await generate_plan(
+        goal=goal, context=None, category=category, request_id=f"library-{uuid.uuid4()}"
+    )
+    plan = GeneratedPlan.model_construct(
+        estimated_duration_weeks=response.estimated_duration_weeks,
+        weekly_breakdown=response.weekly_breakdown,
+        resources=response.resources,
+        total_estimated_hours=response.total_estimated_hours,
+    )
+    fields = {
+        "goal": goal,
+        "category": category,
+        "model": response.metadata.get("model"),
+        "model_id": response.metadata.get("model_id"),
+        "requests": requests,
+        "built_at": int(time.time()),
+    }
+    return fields, plan_store.encode(plan.model_dump_json().encode())
+
+
+async def build(
+    goals: List[Tuple[str, str, int]],
+    current: PlanIndex,
+    deadline: Deadline,
+    concurrency: int = 4,
+    max_age_days: float = 30,
+) -> Tuple[Dict[str, Tuple[Dict[str, Any], bytes]], Dict[str, int]]:
+    """
+    Entries for `goals`: reused from `current` while younger than
+    max_age_days, generated otherwise, at most `concurrency` at a time.
+    Goals that fail, or that there is no time left for, keep their old entry
+    if they have one and are retried on the next refresh.
+    """
+    entries: Dict[str, Tuple[Dict[str, Any], bytes]] = {}
+    stats = {
+        "goals": len(goals),
+        "reused": 0,
+        "generated": 0,
+        "failed": 0,
+        "skipped": 0,
+    }
+    semaphore = asyncio.Semaphore(concurrency)
+    fresh_after = time.time() - max_age_days * 86400
+
+    def keep_old(key: str, requests: int) -> bool:
+        old = current.encoded(key)
+        if old is None:
+            return False
+        entries[key] = ({**current.entries[key], "requests": requests}, old)
+        return True
+
+    async def one(key: str, goal: str, requests: int) -> None:
+        entry = current.entries.get(key)
+        if (
+            entry is not None
+            and entry["built_at"] >= fresh_after
+            and keep_old(key, requests)
+        ):
+            stats["reused"] += 1
+            return
+        async with semaphore:
+            if deadline.remaining() < GENERATION_SECONDS:
+                stats["skipped"] += 1
+                keep_old(key, requests)
+                return
+            try:
+                entries[key] = await asyncio.wait_for(
+                    generate_entry(goal, requests), deadline.remaining()
+                )
+                stats["generated"] += 1
+            except (Exception, asyncio.TimeoutError) as e:
+                logger.warning(f"Plan library: generating '{goal}' failed: {e!r}")
+                stats["failed"] += 1
+                keep_old(key, requests)
+
+    await asyncio.gather(*(one(*goal) for goal in goals))
+    return entries, stats
+
+
+async def refresh(
+    goals: Optional[List[Tuple[str, str, int]]] = None,
+    source=None,
+    deadline: Optional[Deadline] = None,
+) -> Dict[str, Any]:
+    """
+    Rebuild the library from the usage logs (or the given goals) and
+    publish it to the source requests read from.
+    """
+    source = source or library.source
+    if source is None:
+        raise ValueError(
+            "No plan library source: set PLAN_LIBRARY_TABLE_NAME or PLAN_LIBRARY_PATH"
+        )
+    if goals is None:
+        records = await asyncio.to_thread(
+            lambda: list(query_usage(settings.PLAN_LIBRARY_LOOKBACK_DAYS))
+        )
+        goals = mine_goals(
+            records, settings.PLAN_LIBRARY_TOP_GOALS, settings.PLAN_LIBRARY_MIN_REQUESTS
+        )
+    current = PlanIndex(await asyncio.to_thread(source.load))
+    entries, stats = await build(
+        goals,
+        current,
+        deadline or Deadline(settings.PLAN_LIBRARY_REFRESH_SECONDS),
+        settings.PLAN_LIBRARY_CONCURRENCY,
+        settings.PLAN_LIBRARY_MAX_AGE_DAYS,
+    )
+    version = datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+    data = build_index(entries, version)
+    await asyncio.to_thread(source.publish, data, version)
+    summary: Dict[str, Any] = dict(
+        stats, version=version, entries=len(entries), bytes=len(data)
+    )
+    logger.info(f"Plan library {version} published: {json.dumps(summary)}")
+    return summary
+
+
+def is_refresh_event(event: Any) -> bool:
+    # the EventBridge schedule's constant input (terraform/plan_library.tf)
+    return isinstance(event, dict) and event.get("plan_library") == "refresh"
+
+
+def handle_refresh_event(event: Dict[str, Any], context: Any = None) -> Dict[str, Any]:
+    """Lambda entry point for the scheduled refresh; stops in time to publish before the timeout."""
+    from app.services.plan_jobs import event_loop  # plan_jobs imports this module
+
+    deadline = Deadline.for_request(
+        {"aws.context": context}, settings.PLAN_LIBRARY_REFRESH_SECONDS
+    )
+    try:
+        return event_loop().run_until_complete(refresh(deadline=deadline))
+    finally:
+        # the environment may never thaw again: finish queued writes now
+        background.shutdown()
+        flush_logs()
@@ -0,0 +1,179 @@
+import asyncio
+import logging
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Dict, Optional, Union
+from app.config import settings
+from app.services.aws import get_resource
+from app.services.background import defer, handler, on_lambda
+
+
+logger = logging.getLogger(__name__)
+
+# first byte of every stored body, so the encoding can change without a migration
+FORMAT_ZLIB_DICT = b"\x01"
+
+# preset dictionary for zlib: the keys and values every response repeats
+# (GeneratePlanResponse as model_dump_json writes it, metadata from planner.py),
+# so a short plan compresses as well as a long one. zlib favours matches near
+# the end of the dictionary, so the most frequent strings come last. Stored
+# plans decompress only with these exact bytes: a new dictionary needs a new
+# format byte.
+PLAN_DICTIONARY = (
+    b'"metadata":{"tokens_used":{"input":,"output":,"total":},'
+    b'"model":"claude-3-sonnet","model_id":"anthropic.claude-3-sonnet-20240229-v1:0",'
+    b'"model":"claude-3-haiku","model_id":"anthropic.claude-3-haiku-20240307-v1:0",'
+    b'"routing":{"tier":"complex","complexity":0.},"region":"us-east-1","hedged":false}}'
+    b'{"request_id":"","goal":"","category":"skill-learning","category":"fitness",'
+    b'"estimated_duration_weeks":,"total_estimated_hours":.0,"created_at":"T'
+    b'"resources":[{"title":"","url":"https://","resource_type":"course",'
+    b'"resource_type":"book","resource_type":"video","resource_type":"article",'
+    b'"relevance_score":null},{"title":"'
+    b'"weekly_breakdown":[{"week_number":1,"focus_area":"'
+    b'"estimated_hours":1.0,"milestone":true}]},{"week_number":'
+    b'","tasks":[{"task":"'
+    b'","estimated_hours":2.0,"milestone":false},{"task":"'
+)
+
+
+def encode(body: bytes) -> bytes:
+    compressor = zlib.compressobj(
+        9, zlib.DEFLATED, 15, 9, zlib.Z_DEFAULT_STRATEGY, PLAN_DICTIONARY
+    )
+    return FORMAT_ZLIB_DICT + compressor.compress(body) + compressor.flush()
+
+
+def decode(stored: bytes) -> bytes:
+    if stored[:1] != FORMAT_ZLIB_DICT:
+        raise ValueError(f"Unknown stored plan format {stored[:1]!r}")
+    decompressor = zlib.decompressobj(15, PLAN_DICTIONARY)
+    return decompressor.decompress(stored[1:]) + decompressor.flush()
+
+
+class PlanCache:
+    """Least-recently-used plan bodies (response JSON), bounded by entry count."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, request_id: str) -> Optional[bytes]:
+        with self._lock:
+            body = self._entries.get(request_id)
+            if body is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(request_id)
+            self.hits += 1
+            return body
+
+    def put(self, request_id: str, body: bytes) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[request_id] = body
+            self._entries.move_to_end(request_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class MemoryPlanStore:
+    """Encoded plans in a dict: one process, gone on restart. For local runs and tests."""
+
+    def __init__(self):
+        self._items: Dict[str, bytes] = {}
+
+    def put(self, request_id: str, stored: bytes, expires_at: int) -> None:
+        self._items[request_id] = stored
+
+    def get(self, request_id: str) -> Optional[bytes]:
+        return self._items.get(request_id)
+
+
+class DynamoPlanStore:
+    """
+    Encoded plans in DynamoDB, keyed by request_id. A 52-week plan is about
+    35 KB of JSON and a few KB encoded, so a write costs a few WCUs instead of
+    35 and a read half an RCU (see benchmarks/bench_plan_store.py).
+    """
+
+    def __init__(self, table_name: str):
+        self.table_name = table_name
+
+    @property
+    def table(self):
+        return get_resource("dynamodb", region_name=settings.AWS_REGION).Table(
+            self.table_name
+        )
+
+    def put(self, request_id: str, stored: bytes, expires_at: int) -> None:
+        item = {"request_id": request_id, "plan": stored, "stored_bytes": len(stored)}
+        if expires_at:
+            item["expires_at"] = expires_at
+        self.table.put_item(Item=item)
+
+    def get(self, request_id: str) -> Optional[bytes]:
+        # plans never change once written, so an eventually consistent read
+        # (half the RCUs) is enough
+        item = self.table.get_item(Key={"request_id": request_id}).get("Item")
+        return item["plan"].value if item is not None else None
+
+
+store: Union[DynamoPlanStore, MemoryPlanStore]
+if settings.PLANS_TABLE_NAME and not settings.USE_MOCK_AWS:
+    store = DynamoPlanStore(settings.PLANS_TABLE_NAME)
+else:
+    store = MemoryPlanStore()
+
+cache = PlanCache(settings.PLANS_CACHE_SIZE)
+
+
+@handler("plan_store")
+def write_plan(request_id: str, body: str) -> None:
+    """Persist one plan; queued after the response, failures raise for the worker to retry."""
+    ttl = settings.PLANS_TTL_SECONDS
+    store.put(request_id, encode(body.encode()), int(time.time() + ttl) if ttl else 0)
+
+
+async def save(request_id: str, body: bytes) -> None:
+    """
+    Keep a plan that was just returned: in this process's cache right away,
+    in the store after the response.
+
+    On Lambda the store write happens before the response instead, for
+    read-after-write: the client may fetch GET /plans/{request_id} as soon
+    as it has the plan, and that request can land on another instance. A
+    deferred write only runs when this environment is next thawed (or at
+    its shutdown), so that fetch could 404. It is one small item; if it
+    fails, it is retried in the background.
+    """
+    if not settings.PLANS_STORE_ENABLED:
+        return
+    cache.put(request_id, body)
+    if on_lambda():
+        try:
+            await asyncio.to_thread(write_plan, request_id, body.decode())
+            return
+        except Exception as e:
+            logger.warning(
+                f"Plan {request_id}: store write failed, retrying in the background: {e}"
+            )
+    defer("plan_store", request_id=request_id, body=body.decode())
+
+
+async def get(request_id: str) -> Optional[bytes]:
+    """The plan's response JSON, through the cache; None if it was never stored (or expired)."""
+    body = cache.get(request_id)
+    if body is not None:
+        return body
+    stored = await asyncio.to_thread(store.get, request_id)
+    if stored is None:
+        return None
+    body = decode(stored)
+    cache.put(request_id, body)
+    return body
@@ -1,40 +1,36 @@
 from fastapi import HTTPException, status
-import boto3
 import json
 import logging
+import zlib
 from typing import Optional
 from datetime import datetime
-from app.models.schemas import (
-    GeneratePlanResponse,
-    WeeklyBreakdown,
-    WeeklyTask,
-    Resource
-)
+from pydantic import ValidationError
+from app.models.schemas import GeneratePlanResponse, GeneratedPlan
 from app.config import settings
+from app.services.bedrock import invoke_model
+from app.services.circuit_breaker import CircuitOpenError
+from app.services.concurrency import Overloaded
+from app.services.model_router import model_router
+from app.services.shared_cache import normalize, plan_cache
+from app.services import cost_accounting, synthetic_plans
+from app.services.tracing import span
 
 
 logger = logging.getLogger(__name__)
 
-
-if not settings.USE_MOCK_AWS:
-    bedrock_runtime = boto3.client(
-        service_name='bedrock-runtime',
-        region_name=settings.BEDROCK_REGION
-    )
-
 # def build_system_prompt(category: str) -> str:
 #     """
 #     Build a category-specific system prompt
 #     """
 #     base_prompt="""
 #     You are an expert productivity coach and learning strategist.
-#     Your task is to create detailed, actionable plans that help people achieve their goals. 
+#     Your task is to create detailed, actionable plans that help people achieve their goals.
 #     You must respond with a valid JSON object following this exact structure:
 #     {
 #         "estimated_duration_weeks": <number between 1-52>,
 
 #         "weekly_breakdown": [
-#             {  
+#             {
 #                 "week_number": 1,
 #                 "focus_area": "<main theme for this week>",
 #                 "tasks": [
@@ -58,7 +54,7 @@ if not settings.USE_MOCK_AWS:
 #         "total_estimated_hours": <number>
 #     }
 
-    
+
 #     IMPORTANT:
 #     - Be specific and actionable
 #     - Break down complex goals into weekly chunks
@@ -78,6 +74,7 @@ if not settings.USE_MOCK_AWS:
 
 #     return base_prompt + category_guidance.get(category, "")
 
+
 def build_system_prompt(category: str) -> str:
     """
     Build a category-specific system prompt
@@ -123,7 +120,7 @@ def build_system_prompt(category: str) -> str:
     - Be specific and actionable - avoid vague advice
     - Return ONLY valid JSON, no markdown, no explanatory text
     """
-        
+
     # Category-specific guidance
     category_guidance = {
         "certification": """
@@ -132,130 +129,132 @@ def build_system_prompt(category: str) -> str:
             - Include practice exam schedule (weeks 4, 8, final week)
             - Recommend official study guides and practice platforms
             - Build in review weeks before exam""",
-            
         "skill-learning": """
             SKILL-LEARNING FOCUS:
             - Progressive difficulty (beginner → intermediate → advanced)
             - Include daily practice tasks
             - Recommend structured courses, tutorials, and documentation
             - Build in projects to apply learning""",
-            
         "fitness": """
             FITNESS FOCUS:
             - Progressive overload principles
             - Include rest/recovery days
             - Recommend workout programs, nutrition resources
             - Build in deload weeks and form checks""",
-            
         "creative": """
             CREATIVE FOCUS:
             - Daily/regular practice routine
             - Include technique building and creative projects
             - Recommend tutorials, inspiration sources, critique resources
             - Build in milestone projects to showcase progress""",
-                    
         "productivity": """
             PRODUCTIVITY FOCUS:
             - Habit formation and systems
             - Include tracking and measurement
             - Recommend books, apps, and accountability methods
-            - Build in review and adjustment periods"""
+            - Build in review and adjustment periods""",
     }
-    
+
     return base_prompt + category_guidance.get(category, "")
 
 
+def plan_cache_key(goal: str, context: Optional[str], category: str) -> str:
+    return f"{category}\n{normalize(goal)}\n{normalize(context)}"
+
+
+def load_cached_plan(key: str) -> Optional[tuple]:
+    """(plan, model name, model id) from the shared cache, or None."""
+    value = plan_cache.get(key)
+    if value is None:
+        return None
+    try:
+        model, model_id, plan_json = zlib.decompress(value).split(b"\n", 2)
+        return (
+            GeneratedPlan.model_validate_json(plan_json),
+            model.decode(),
+            model_id.decode(),
+        )
+    except (zlib.error, ValueError, ValidationError) as e:
+        logger.warning(f"Ignoring unreadable cached plan: {e}")
+        return None
+
+
+def store_plan(key: str, plan: GeneratedPlan, model: str, model_id: str) -> None:
+    value = zlib.compress(
+        f"{model}\n{model_id}\n".encode() + plan.model_dump_json().encode()
+    )
+    if not plan_cache.put(key, value, settings.SHARED_CACHE_PLAN_TTL_SECONDS):
+        logger.debug(f"Plan of {len(value)} bytes does not fit a cache slot")
+
+
+def generate_mock_plan(goal: str, category: str) -> str:
+    """Generate a mock LLM answer for local development (see synthetic_plans)."""
+    return synthetic_plans.generate_plan_text(
+        goal, category, weeks=settings.MOCK_PLAN_WEEKS or None
+    )
+
 
-def generate_mock_plan(goal: str, category: str) -> dict:
-    """Generate a mock plan for local development."""
-    return {
-        "estimated_duration_weeks": 8,
-        "weekly_breakdown": [
-            {
-                "week_number": 1,
-                "focus_area": "Fundamentals and Setup",
-                "tasks": [
-                    {
-                        "task": "Research and understand the basics of your goal",
-                        "estimated_hours": 5.0,
-                        "milestone": True
-                    },
-                    {
-                        "task": "Set up necessary tools and resources",
-                        "estimated_hours": 3.0,
-                        "milestone": False
-                    }
-                ]
-            },
-            {
-                "week_number": 2,
-                "focus_area": "Building Core Skills",
-                "tasks": [
-                    {
-                        "task": "Practice basic techniques daily",
-                        "estimated_hours": 7.0,
-                        "milestone": False
-                    }
-                ]
-            }
-        ],
-        "resources": [
-            {
-                "title": "Getting Started Guide",
-                "url": "https://example.com/guide",
-                "resource_type": "article"
-            }
-        ],
-        "total_estimated_hours": 64.0
-    }
-        
-    
 async def generate_plan(
-        goal: str,
-        context: Optional[str],
-        category: str,
-        request_id: str
-    ) -> GeneratePlanResponse:
+    goal: str, context: Optional[str], category: str, request_id: str
+) -> GeneratePlanResponse:
+    route = model_router.choose(goal, context, category)
+    routing = {"tier": route.tier, "complexity": round(route.complexity, 3)}
+
     # MOCK MODE: Return fake plan for local dev
     if settings.USE_MOCK_AWS:
-        logger.info(f"Request {request_id}: Using mock plan generation (local dev mode)")
-        plan_json = generate_mock_plan(goal, category)
-
-        # Parse into our structured models
-        weekly_breakdown = [
-            WeeklyBreakdown(
-                week_number=week['week_number'],
-                focus_area=week['focus_area'],
-                tasks=[WeeklyTask(**task) for task in week['tasks']]
-            )
-            for week in plan_json['weekly_breakdown']
-        ]
-
-        resources = [
-            Resource(**resource) 
-            for resource in plan_json.get('resources', [])
-        ]
+        logger.debug(
+            f"Request {request_id}: Using mock plan generation (local dev mode)"
+        )
+        with span("llm", model="mock-model"):
+            plan_text = generate_mock_plan(goal, category)
+        # same parse as a real answer, so mock runs pay the real costs
+        with span("validate"):
+            plan = parse_plan(plan_text)
+        output_tokens = len(plan_text) // 4
+        # metered like a Bedrock call (priced at zero) so local runs exercise the accounting
+        cost_accounting.record(
+            cost_accounting.current(), "mock-model", 500, output_tokens
+        )
 
-        return GeneratePlanResponse(
+        return build_response(
+            plan,
             request_id=request_id,
             goal=goal,
             category=category,
-            estimated_duration_weeks=plan_json['estimated_duration_weeks'],
-            weekly_breakdown=weekly_breakdown,
-            resources=resources,
-            total_estimated_hours=plan_json['total_estimated_hours'],
-            created_at=datetime.utcnow(),
             metadata={
                 "tokens_used": {
                     "input": 500,
-                    "output": 1200,
-                    "total": 1700
+                    "output": output_tokens,
+                    "total": 500 + output_tokens,
                 },
                 "model": "mock-model",
-                "mock_mode": True
-            }
+                "model_id": "mock-model",
+                "routed_model": route.model.name,
+                "routing": routing,
+                "mock_mode": True,
+            },
         )
 
+    # an identical goal already planned on this host, by any worker
+    cache_key = plan_cache_key(goal, context, category)
+    if settings.SHARED_CACHE_ENABLED:
+        cached = load_cached_plan(cache_key)
+        if cached is not None:
+            plan, model, model_id = cached
+            logger.debug(f"Request {request_id}: plan served from the shared cache")
+            return build_response(
+                plan,
+                request_id=request_id,
+                goal=goal,
+                category=category,
+                metadata={
+                    "tokens_used": {"input": 0, "output": 0, "total": 0},
+                    "model": model,
+                    "model_id": model_id,
+                    "routing": routing,
+                    "cached": True,
+                },
+            )
 
     # REAL MODE: Call Bedrock
     system_prompt = build_system_prompt(category)
@@ -266,90 +265,114 @@ async def generate_plan(
         user_message += f"\nAdditional context: {context}"
 
     try:
-        logger.info(f"Request {request_id}:")
-        logger.info("Calling Bedrock for plan generation")
-
-        response = bedrock_runtime.invoke_model(
-            modelId='anthropic.claude-3-haiku-20240307-v1:0',  
-            contentType='application/json',
-            accept='application/json',
-            body=json.dumps({
-                "anthropic_version": "bedrock-2023-05-31",
-                "max_tokens": 4000,
-                "system": system_prompt,
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": user_message
-                    }
-                ],
-                "temperature": 0.7  # for more creative outputs use higher temperature
-            })
+        logger.debug(
+            f"Request {request_id}: Calling Bedrock ({route.model.name}, "
+            f"complexity={route.complexity:.2f}) for plan generation"
         )
 
-        response_body = json.loads(response['body'].read().decode())
-        plan_text = response_body['content'][0]['text']
-
-        plan_json = extract_json(plan_text)
-
-        weekly_breakdown = [
-            WeeklyBreakdown(
-                week_number = week['week_number'],
-                focus_area = week['focus_area'],
-                tasks = [WeeklyTask(**task) for task in week['tasks']]
+        with span("llm", model=route.model.name):
+            result = await invoke_model(
+                route.model.model_id,
+                {
+                    "anthropic_version": "bedrock-2023-05-31",
+                    "max_tokens": 4000,
+                    "system": system_prompt,
+                    "messages": [{"role": "user", "content": user_message}],
+                    "temperature": 0.7,  # for more creative outputs use higher temperature
+                },
             )
-            for week in plan_json['weekly_breakdown']
-        ]
-
-        resources = [
-            Resource(**resource)
-            for resource in plan_json.get('resources', [])
-        ]
-
-        input_tokens = response_body.get('usage',{}).get('input_tokens',0)
-        output_tokens = response_body.get('usage',{}).get('output_tokens',0)
 
-        return GeneratePlanResponse(
+        response_body = result.body
+        plan_text = response_body["content"][0]["text"]
+
+        try:
+            with span("validate"):
+                plan = parse_plan(plan_text)
+        except (json.JSONDecodeError, ValidationError):
+            # a fast but malformed plan is a quality failure for the bandit
+            model_router.record(route, result.latency_ms, success=False)
+            raise
+        model_router.record(route, result.latency_ms, success=True)
+        if settings.SHARED_CACHE_ENABLED:
+            store_plan(cache_key, plan, route.model.name, route.model.model_id)
+
+        input_tokens = response_body.get("usage", {}).get("input_tokens", 0)
+        output_tokens = response_body.get("usage", {}).get("output_tokens", 0)
+
+        return build_response(
+            plan,
             request_id=request_id,
             goal=goal,
             category=category,
-            estimated_duration_weeks=plan_json['estimated_duration_weeks'],
-            weekly_breakdown=weekly_breakdown,
-            resources=resources,
-            total_estimated_hours=plan_json['total_estimated_hours'],
-            created_at=datetime.utcnow(),
             metadata={
                 "tokens_used": {
                     "input": input_tokens,
                     "output": output_tokens,
-                    "total": input_tokens + output_tokens
+                    "total": input_tokens + output_tokens,
                 },
-                "model": "claude-3-haiku"
-            }
+                "model": route.model.name,
+                "model_id": route.model.model_id,
+                "routing": routing,
+                "region": result.region,
+                "hedged": result.hedged,
+            },
         )
 
-    except json.JSONDecodeError as e:
+    except (json.JSONDecodeError, ValidationError) as e:
         logger.error(f"Request {request_id}: Failed to parse LLM response as JSON: {e}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Failed to generate a properly formatted plan. Please try again."
+            detail="Failed to generate a properly formatted plan. Please try again.",
         )
 
     except Exception as e:
         logger.error(f"Request {request_id}: Error in plan generation: {str(e)}")
+        if not isinstance(e, (CircuitOpenError, Overloaded)):
+            model_router.record(route, None, success=False)
         raise
-    
-    
+
+
+def extract_json_text(text: str) -> str:
+    """
+    The JSON object inside the model's answer.
+
+    The model usually wraps it in ```json fences and sometimes adds a
+    sentence before or after, so take the outermost {...}.
+    """
+    start = text.find("{")
+    end = text.rfind("}")
+    if start == -1 or end < start:
+        return text.strip()
+    return text[start : end + 1]
+
 
 def extract_json(text: str) -> dict:
-    # remove markdown code blocks if present
-    text = text.strip()
-    if text.startswith('```json'):
-        text = text[7:]
-    if text.startswith('```'):
-        text = text[3:]
-    if text.endswith('```'):
-        text = text[:-3]
-
-    return json.loads(text.strip())
-    
+    return json.loads(extract_json_text(text))
+
+
+def parse_plan(text: str) -> GeneratedPlan:
+    """
+    Validate the LLM text straight into the plan model.
+
+    pydantic-core parses and validates in one pass, so there is no
+    intermediate dict and no per-task model construction in Python.
+    """
+    return GeneratedPlan.model_validate_json(extract_json_text(text))
+
+
+def build_response(
+    plan: GeneratedPlan, request_id: str, goal: str, category: str, metadata: dict
+) -> GeneratePlanResponse:
+    # every field is already validated (the plan) or produced by us,
+    # so skip a second validation pass over the nested weeks
+    return GeneratePlanResponse.model_construct(
+        request_id=request_id,
+        goal=goal,
+        category=category,
+        estimated_duration_weeks=plan.estimated_duration_weeks,
+        weekly_breakdown=plan.weekly_breakdown,
+        resources=plan.resources,
+        total_estimated_hours=plan.total_estimated_hours,
+        created_at=datetime.utcnow(),
+        metadata=metadata,
+    )
@@ -0,0 +1,209 @@
+from fastapi import HTTPException, status
+import json
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from pydantic import ValidationError
+from app.models.schemas import GeneratePlanResponse, RevisedWeeks, WeeklyBreakdown
+from app.config import settings
+from app.services.bedrock import invoke_model
+from app.services.model_router import model_router
+from app.services.planner import extract_json_text
+from app.services import cost_accounting, cost_guard, synthetic_plans
+from app.services.tracing import span
+
+
+logger = logging.getLogger(__name__)
+
+# a week of 2-4 tasks is ~150-250 output tokens; the margin covers verbose weeks
+TOKENS_PER_WEEK = 300
+MIN_MAX_TOKENS = 600
+MAX_TOKENS = 4000
+
+REVISION_PROMPT = """
+    You are an expert productivity coach revising part of an existing plan.
+    Rewrite ONLY the weeks you are asked for, keeping them consistent with the
+    weeks around them and with the user's feedback.
+
+    Respond with a valid JSON object following this EXACT structure:
+
+    {
+        "weekly_breakdown": [
+            {
+                "week_number": <one of the requested week numbers>,
+                "focus_area": "<main theme for this week>",
+                "tasks": [
+                    {
+                        "task": "<specific actionable task>",
+                        "estimated_hours": <realistic number>,
+                        "milestone": <true if this is a key achievement, false otherwise>
+                    }
+                ]
+            }
+        ]
+    }
+
+    REQUIREMENTS:
+    - Exactly one entry per requested week, with the same week_number
+    - 2-4 specific, actionable tasks per week
+    - Return ONLY valid JSON, no markdown, no explanatory text
+    """
+
+
+def build_revision_message(
+    plan: GeneratePlanResponse, week_numbers: List[int], feedback: Optional[str]
+) -> str:
+    """
+    The whole plan as a one-line-per-week outline, plus the weeks being
+    replaced in full: enough context for continuity at a fraction of the
+    tokens of resending the plan.
+    """
+    wanted = set(week_numbers)
+    lines = [
+        f"Revise weeks: {', '.join(str(n) for n in week_numbers)}",
+        f"Goal: {plan.goal}",
+        "Plan outline:",
+    ]
+    current = []
+    for week in plan.weekly_breakdown:
+        hours = sum(task.estimated_hours for task in week.tasks)
+        lines.append(f"Week {week.week_number}: {week.focus_area} ({hours:g}h)")
+        if week.week_number in wanted:
+            current.append(week.model_dump())
+    lines.append(f"Weeks to replace: {json.dumps(current, separators=(',', ':'))}")
+    if feedback:
+        lines.append(f"Feedback: {feedback}")
+    return "\n".join(lines)
+
+
+def max_tokens_for(week_count: int) -> int:
+    return max(MIN_MAX_TOKENS, min(MAX_TOKENS, week_count * TOKENS_PER_WEEK))
+
+
+def parse_weeks(text: str, week_numbers: List[int]) -> List[WeeklyBreakdown]:
+    """The revised weeks; raises ValueError unless exactly the requested weeks came back."""
+    weeks = RevisedWeeks.model_validate_json(extract_json_text(text)).weekly_breakdown
+    returned = sorted(week.week_number for week in weeks)
+    if returned != sorted(week_numbers):
+        raise ValueError(f"Asked for weeks {sorted(week_numbers)}, got {returned}")
+    return weeks
+
+
+def splice(
+    plan: GeneratePlanResponse,
+    revised: List[WeeklyBreakdown],
+    request_id: str,
+    metadata: dict,
+) -> GeneratePlanResponse:
+    """The plan with the revised weeks in place and its totals recomputed from the tasks."""
+    by_number = {week.week_number: week for week in revised}
+    weekly_breakdown = [
+        by_number.get(week.week_number, week) for week in plan.weekly_breakdown
+    ]
+    total_hours = sum(
+        task.estimated_hours for week in weekly_breakdown for task in week.tasks
+    )
+    return GeneratePlanResponse.model_construct(
+        request_id=request_id,
+        goal=plan.goal,
+        category=plan.category,
+        estimated_duration_weeks=min(
+            max(week.week_number for week in weekly_breakdown), 52
+        ),
+        weekly_breakdown=weekly_breakdown,
+        resources=plan.resources,
+        total_estimated_hours=round(total_hours, 1),
+        created_at=datetime.utcnow(),
+        metadata=metadata,
+    )
+
+
+async def revise_plan(
+    plan: GeneratePlanResponse,
+    week_numbers: List[int],
+    feedback: Optional[str],
+    request_id: str,
+) -> GeneratePlanResponse:
+    """
+    Regenerate only the given weeks of a plan and splice them back in.
+
+    Output tokens, and so latency, scale with the number of weeks revised
+    rather than the length of the plan.
+    """
+    week_numbers = sorted(set(week_numbers))
+    route = model_router.choose(plan.goal, feedback, plan.category)
+    message = build_revision_message(plan, week_numbers, feedback)
+    # a submitted plan can be any size, so the outline is checked like a goal
+    with span("cost_guard"):
+        cost_guard.check_cost_limits(cost_guard.estimate_cost(message))
+    revision: Dict[str, Any] = {
+        "revised_from": plan.request_id,
+        "revised_weeks": week_numbers,
+    }
+
+    if settings.USE_MOCK_AWS:
+        logger.debug(f"Request {request_id}: Using mock revision (local dev mode)")
+        with span("llm", model="mock-model"):
+            text = synthetic_plans.generate_weeks_text(
+                plan.goal,
+                plan.category,
+                week_numbers,
+                len(plan.weekly_breakdown),
+                seed=1,  # not the original plan's weeks
+            )
+        input_tokens = (len(REVISION_PROMPT) + len(message)) // 4
+        output_tokens = len(text) // 4
+        model, model_id = "mock-model", "mock-model"
+        cost_accounting.record(
+            cost_accounting.current(), model_id, input_tokens, output_tokens
+        )
+    else:
+        logger.debug(
+            f"Request {request_id}: Calling Bedrock ({route.model.name}) "
+            f"to revise weeks {week_numbers}"
+        )
+        # no bandit reward: a revision's latency is not comparable with a full plan's
+        with span("llm", model=route.model.name):
+            result = await invoke_model(
+                route.model.model_id,
+                {
+                    "anthropic_version": "bedrock-2023-05-31",
+                    "max_tokens": max_tokens_for(len(week_numbers)),
+                    "system": REVISION_PROMPT,
+                    "messages": [{"role": "user", "content": message}],
+                    "temperature": 0.7,
+                },
+                kind="revision",
+            )
+        text = result.body["content"][0]["text"]
+        usage = result.body.get("usage", {})
+        input_tokens = usage.get("input_tokens", 0)
+        output_tokens = usage.get("output_tokens", 0)
+        model, model_id = route.model.name, route.model.model_id
+        revision.update(region=result.region, hedged=result.hedged)
+
+    try:
+        with span("validate"):
+            revised = parse_weeks(text, week_numbers)
+    except (ValidationError, ValueError) as e:
+        logger.error(f"Request {request_id}: Failed to parse the revised weeks: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to generate a properly formatted revision. Please try again.",
+        )
+
+    return splice(
+        plan,
+        revised,
+        request_id,
+        metadata={
+            "tokens_used": {
+                "input": input_tokens,
+                "output": output_tokens,
+                "total": input_tokens + output_tokens,
+            },
+            "model": model,
+            "model_id": model_id,
+            **revision,
+        },
+    )
@@ -0,0 +1,218 @@
+import fcntl
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+import zlib
+from typing import Iterator, Optional
+from app.config import settings
+
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"AIRCACHE"
+VERSION = 1
+# magic, version, slots, slot size
+FILE_HEADER = struct.Struct("<8sIII")
+FILE_HEADER_SIZE = 64
+# sequence, key digest, expiry (epoch seconds), value length, value crc32
+SLOT_HEADER = struct.Struct("<I16sIII")
+PROBES = 4
+READ_RETRIES = 8
+
+
+def default_dir() -> str:
+    # tmpfs where there is one; Lambda only has /tmp
+    return "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+
+
+def key_digest(key: str) -> bytes:
+    return hashlib.blake2b(key.encode(), digest_size=16).digest()
+
+
+def normalize(text: Optional[str]) -> str:
+    """Case and whitespace do not change the answer, so they do not change the key."""
+    return " ".join((text or "").lower().split())
+
+
+class SharedCache:
+    """
+    Fixed-size hash table in a memory-mapped file, shared by every process on the host.
+
+    Each slot holds one entry: a sequence number, the 16-byte key digest,
+    an expiry, and the value with its CRC32. A key probes PROBES
+    consecutive slots; a put takes the slot already holding the key, else an
+    empty or expired one, else the one expiring soonest.
+
+    Reads take no lock. Writers hold an fcntl lock on the slot (released by
+    the kernel if the process dies) and make the sequence odd while they
+    write, seqlock style; a reader that sees an odd or changed sequence, or
+    a value that fails its CRC, retries and then reports a miss. Forked
+    workers share the master's mapping; other processes map the same file.
+    """
+
+    def __init__(self, path: str, slots: int, slot_size: int):
+        self.path = path
+        self.slots = slots
+        self.slot_size = slot_size
+        self.max_value = slot_size - SLOT_HEADER.size
+        self._fd = -1  # set by _open, with the map
+        self._map: Optional[mmap.mmap] = None
+        self._open_lock = threading.Lock()
+        # fcntl locks are per process, this one orders threads within it
+        self._write_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _open(self) -> mmap.mmap:
+        if self._map is not None:
+            return self._map
+        with self._open_lock:
+            if self._map is not None:
+                return self._map
+            size = FILE_HEADER_SIZE + self.slots * self.slot_size
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            # first process in initializes; a file from another layout is reset
+            fcntl.lockf(fd, fcntl.LOCK_EX, FILE_HEADER_SIZE, 0)
+            try:
+                header = os.pread(fd, FILE_HEADER.size, 0)
+                expected = FILE_HEADER.pack(MAGIC, VERSION, self.slots, self.slot_size)
+                if header != expected:
+                    # the layout is in the file name (cache_path), so this is a new
+                    # file, not one another process has mapped
+                    if header:
+                        logger.warning(
+                            f"Resetting unrecognized shared cache file {self.path}"
+                        )
+                    os.ftruncate(fd, 0)
+                    os.ftruncate(fd, size)
+                    os.pwrite(fd, expected, 0)
+            finally:
+                fcntl.lockf(fd, fcntl.LOCK_UN, FILE_HEADER_SIZE, 0)
+            self._fd = fd
+            self._map = mmap.mmap(
+                fd, size, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE
+            )
+        return self._map
+
+    def _offset(self, slot: int) -> int:
+        return FILE_HEADER_SIZE + slot * self.slot_size
+
+    def _candidates(self, digest: bytes) -> Iterator[int]:
+        start = int.from_bytes(digest[:8], "little") % self.slots
+        for i in range(PROBES):
+            yield (start + i) % self.slots
+
+    def get(self, key: str, now: Optional[float] = None) -> Optional[bytes]:
+        buf = self._open()
+        digest = key_digest(key)
+        now = time.time() if now is None else now
+        for slot in self._candidates(digest):
+            offset = self._offset(slot)
+            for _ in range(READ_RETRIES):
+                seq, slot_key, expires, length, crc = SLOT_HEADER.unpack_from(
+                    buf, offset
+                )
+                if seq & 1:
+                    continue  # write in progress
+                if slot_key != digest:
+                    break
+                start = offset + SLOT_HEADER.size
+                value = buf[start : start + min(length, self.max_value)]
+                if SLOT_HEADER.unpack_from(buf, offset)[0] != seq:
+                    continue  # overwritten while copying
+                if zlib.crc32(value) != crc:
+                    continue
+                if expires < now:
+                    self.misses += 1
+                    return None
+                self.hits += 1
+                return value
+            else:
+                # never got a stable read; treat as a miss rather than wait
+                break
+        self.misses += 1
+        return None
+
+    def put(
+        self, key: str, value: bytes, ttl: float, now: Optional[float] = None
+    ) -> bool:
+        """Store a value; False if it does not fit in a slot."""
+        if len(value) > self.max_value:
+            return False
+        buf = self._open()
+        digest = key_digest(key)
+        now = time.time() if now is None else now
+
+        candidates = list(self._candidates(digest))
+        victim, victim_expires = candidates[0], None
+        for slot in candidates:
+            _, slot_key, expires, _, _ = SLOT_HEADER.unpack_from(
+                buf, self._offset(slot)
+            )
+            if slot_key == digest or expires < now:
+                victim = slot
+                break
+            if victim_expires is None or expires < victim_expires:
+                victim, victim_expires = slot, expires
+
+        offset = self._offset(victim)
+        with self._write_lock:
+            self._write(buf, offset, digest, value, int(now + ttl))
+        return True
+
+    def _write(
+        self, buf: mmap.mmap, offset: int, digest: bytes, value: bytes, expires: int
+    ) -> None:
+        fcntl.lockf(self._fd, fcntl.LOCK_EX, self.slot_size, offset)
+        try:
+            # odd while writing, so readers retry instead of seeing half a value;
+            # a writer that died mid-write left it odd, so round up, not +1
+            seq = SLOT_HEADER.unpack_from(buf, offset)[0] | 1
+            struct.pack_into("<I", buf, offset, seq & 0xFFFFFFFF)
+            start = offset + SLOT_HEADER.size
+            buf[start : start + len(value)] = value
+            SLOT_HEADER.pack_into(
+                buf,
+                offset,
+                (seq + 1) & 0xFFFFFFFF,
+                digest,
+                expires,
+                len(value),
+                zlib.crc32(value),
+            )
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, self.slot_size, offset)
+
+    def clear(self) -> None:
+        buf = self._open()
+        with self._write_lock:
+            for slot in range(self.slots):
+                self._write(buf, self._offset(slot), bytes(16), b"", 0)
+
+
+def cache_path(name: str, slots: int, slot_size: int) -> str:
+    # a deploy that changes the layout gets a new file instead of resizing one
+    # that running workers have mapped
+    directory = settings.SHARED_CACHE_DIR or default_dir()
+    return os.path.join(
+        directory, f"ai-router-{name}-v{VERSION}-{slots}x{slot_size}.cache"
+    )
+
+
+def open_cache(name: str, slots: int, slot_size: int) -> SharedCache:
+    return SharedCache(cache_path(name, slots, slot_size), slots, slot_size)
+
+
+# classifications are a few bytes; plans are zlib-compressed JSON
+classification_cache = open_cache(
+    "classifications", settings.SHARED_CACHE_CLASSIFICATION_SLOTS, 128
+)
+plan_cache = open_cache(
+    "plans", settings.SHARED_CACHE_PLAN_SLOTS, settings.SHARED_CACHE_PLAN_SLOT_BYTES
+)
@@ -0,0 +1,262 @@
+"""
+Deterministic synthetic plans, shaped like what the LLM returns.
+
+Used by mock mode, the fake Bedrock server and the benchmarks, so local
+runs pay realistic parsing, validation, serialization and logging costs.
+The same (goal, seed) always yields the same plan and the same text.
+"""
+import hashlib
+import json
+import random
+import re
+from typing import List, Optional, Tuple
+from app.services.model_router import horizon_weeks
+
+
+VERBS = [
+    "Complete",
+    "Review",
+    "Practice",
+    "Build",
+    "Summarise",
+    "Draft",
+    "Schedule",
+    "Research",
+    "Record",
+    "Revisit",
+    "Outline",
+    "Test yourself on",
+    "Refine",
+]
+SUBJECTS = {
+    "certification": [
+        "the official exam guide domains",
+        "two timed practice exams",
+        "weak areas flagged in the last mock test",
+        "whitepapers on the core services",
+        "hands-on labs for the networking objectives",
+        "flashcards for key limits and quotas",
+    ],
+    "skill-learning": [
+        "a focused tutorial chapter",
+        "a small project applying this week's concepts",
+        "notes from the recommended course",
+        "exercises at the edge of your ability",
+        "feedback from a mentor or community forum",
+        "the fundamentals you found hardest",
+    ],
+    "fitness": [
+        "three strength sessions with progressive overload",
+        "a long easy-paced cardio session",
+        "mobility and stretching routine",
+        "a weekly meal-prep plan",
+        "a benchmark workout to measure progress",
+        "recovery and sleep tracking",
+    ],
+    "creative": [
+        "daily thirty-minute practice sessions",
+        "a finished small piece to share",
+        "studies of work you admire",
+        "a critique session with peers",
+        "an experiment with a new technique",
+        "a portfolio page for finished work",
+    ],
+    "productivity": [
+        "a weekly review of goals and calendar",
+        "a time audit of the past five days",
+        "a single habit tracked every day",
+        "an inbox and task-list cleanup",
+        "a distraction-free deep work block each morning",
+        "an accountability check-in",
+    ],
+}
+FOCUS_AREAS = [
+    "Foundations and setup",
+    "Core concepts",
+    "Deliberate practice",
+    "Applying the basics",
+    "Filling knowledge gaps",
+    "Building momentum",
+    "Intermediate techniques",
+    "Consolidation",
+    "Real-world project work",
+    "Assessment and review",
+    "Advanced topics",
+    "Final preparation",
+]
+QUALIFIERS = [
+    "and write down what still feels unclear",
+    "with a short retrospective at the end of the week",
+    "keeping sessions under ninety minutes to stay focused",
+    "and compare the results with last week's baseline",
+    "then share the outcome for feedback",
+    "",
+]
+RESOURCE_TYPES = ["article", "video", "course", "book"]
+RESOURCE_TITLES = [
+    "A Practical Guide to {topic}",
+    "{topic}: From Beginner to Confident",
+    "The Complete {topic} Handbook",
+    "Understanding {topic} in Depth",
+    "{topic} Crash Course",
+    "Common Mistakes in {topic} and How to Avoid Them",
+]
+
+PREAMBLES = [
+    "Here is your personalised plan:\n\n",
+    "Based on your goal, here is a structured plan in JSON format:\n\n",
+]
+TRAILERS = [
+    "\n\nThis plan balances steady progress with review weeks. Adjust the hours to fit your schedule.",
+    "\n\nLet me know if you would like me to adjust the pace or focus areas.",
+]
+
+
+def goal_weeks(goal: str, default: int = 8) -> int:
+    """Plan length implied by the goal ("in 3 months" -> 12), capped at 52."""
+    weeks = horizon_weeks(goal) or default
+    return max(1, min(weeks, 52))
+
+
+def seed_for(goal: str, seed: Optional[int] = None) -> int:
+    # hash() is salted per process, so derive a stable seed from the text
+    digest = hashlib.sha256(f"{seed}:{goal}".encode()).digest()
+    return int.from_bytes(digest[:8], "big")
+
+
+def generate_plan_dict(
+    goal: str,
+    category: str,
+    weeks: Optional[int] = None,
+    tasks_per_week: Optional[int] = None,
+    resources: Optional[int] = None,
+    seed: Optional[int] = None,
+) -> dict:
+    """
+    A plan dict matching GeneratedPlan.
+
+    Unset sizes are drawn from the seeded generator: 2-5 tasks per week,
+    3-8 resources, weeks from the goal's horizon.
+    """
+    rng = random.Random(seed_for(goal, seed))
+    weeks = max(1, min(weeks or goal_weeks(goal), 52))
+    subjects = SUBJECTS.get(category, SUBJECTS["skill-learning"])
+    topic = " ".join(goal.split()[:4]).rstrip(".,") or "Your Goal"
+
+    weekly_breakdown = []
+    total_hours = 0.0
+    for week in range(1, weeks + 1):
+        stage = FOCUS_AREAS[
+            min((week - 1) * len(FOCUS_AREAS) // weeks, len(FOCUS_AREAS) - 1)
+        ]
+        task_count = tasks_per_week or rng.randint(2, 5)
+        tasks = []
+        for index in range(task_count):
+            hours = rng.choice([0.5, 1.0, 1.5, 2.0, 2.5, 3.0, 4.0, 5.0])
+            total_hours += hours
+            text = f"{rng.choice(VERBS)} {rng.choice(subjects)} {rng.choice(QUALIFIERS)}".strip()
+            tasks.append(
+                {
+                    "task": text,
+                    "estimated_hours": hours,
+                    # the last task of every fourth week (and of the plan) is a checkpoint
+                    "milestone": index == task_count - 1
+                    and (week % 4 == 0 or week == weeks),
+                }
+            )
+        weekly_breakdown.append(
+            {
+                "week_number": week,
+                "focus_area": f"{stage}: {rng.choice(subjects)}",
+                "tasks": tasks,
+            }
+        )
+
+    resource_list = []
+    for index in range(resources if resources is not None else rng.randint(3, 8)):
+        title = rng.choice(RESOURCE_TITLES).format(topic=topic.title())
+        resource_list.append(
+            {
+                "title": title,
+                "url": "https://example.com/"
+                + re.sub(r"[^a-z0-9]+", "-", title.lower()).strip("-")
+                + f"-{index}",
+                "resource_type": rng.choice(RESOURCE_TYPES),
+            }
+        )
+
+    return {
+        "estimated_duration_weeks": weeks,
+        "weekly_breakdown": weekly_breakdown,
+        "resources": resource_list,
+        "total_estimated_hours": round(total_hours, 1),
+    }
+
+
+def render_llm_text(
+    plan: dict,
+    seed: int = 0,
+    fence_rate: float = 0.7,
+    preamble_rate: float = 0.1,
+    trailing_rate: float = 0.2,
+) -> str:
+    """
+    Plan JSON as the model tends to write it: pretty-printed, usually in a
+    ```json fence, sometimes with a sentence before or after.
+    """
+    rng = random.Random(seed)
+    text = json.dumps(plan, indent=2)
+    if rng.random() < fence_rate:
+        text = f"```json\n{text}\n```"
+    if rng.random() < preamble_rate:
+        text = rng.choice(PREAMBLES) + text
+    if rng.random() < trailing_rate:
+        text += rng.choice(TRAILERS)
+    return text
+
+
+def generate_plan_text(
+    goal: str, category: str, seed: Optional[int] = None, **sizes
+) -> str:
+    plan = generate_plan_dict(goal, category, seed=seed, **sizes)
+    return render_llm_text(plan, seed=seed_for(goal, seed))
+
+
+def generate_weeks_text(
+    goal: str,
+    category: str,
+    week_numbers: List[int],
+    weeks: int,
+    seed: Optional[int] = None,
+) -> str:
+    """A revision answer: only the given weeks of a `weeks`-long plan, as the model writes them."""
+    plan = generate_plan_dict(goal, category, weeks=weeks, seed=seed)
+    wanted = set(week_numbers)
+    revised = [
+        week for week in plan["weekly_breakdown"] if week["week_number"] in wanted
+    ]
+    return render_llm_text({"weekly_breakdown": revised}, seed=seed_for(goal, seed))
+
+
+def goal_from_prompt(messages: List[dict]) -> Optional[str]:
+    """The goal line of a planner prompt, or None for other prompts."""
+    for message in messages:
+        content = message.get("content", "")
+        if isinstance(content, str) and content.startswith("Goal: "):
+            return content.splitlines()[0][len("Goal: ") :]
+    return None
+
+
+def revision_from_prompt(messages: List[dict]) -> Optional[Tuple[str, List[int], int]]:
+    """(goal, week numbers, plan length) of a revision prompt, or None for other prompts."""
+    for message in messages:
+        content = message.get("content", "")
+        if isinstance(content, str) and content.startswith("Revise weeks: "):
+            lines = content.splitlines()
+            week_numbers = [
+                int(n) for n in lines[0][len("Revise weeks: ") :].split(",")
+            ]
+            goal = lines[1][len("Goal: ") :]
+            weeks = sum(1 for line in lines if line.startswith("Week "))
+            return goal, week_numbers, max(weeks, max(week_numbers))
+    return None
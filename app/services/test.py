@@ -1,4 +1,3 @@
-import boto3
 import json
 import logging
 from typing import Optional
@@ -11,14 +10,13 @@ from app.models.schemas import (
     Resource,
 )
 from app.config import settings
+from app.services.aws import get_client
 
 logger = logging.getLogger(__name__)
 
 # Only create real client if not mocking
 if not settings.USE_MOCK_AWS:
-    bedrock_runtime = boto3.client(
-        service_name="bedrock-runtime", region_name=settings.AWS_REGION
-    )
+    bedrock_runtime = get_client("bedrock-runtime", region_name=settings.AWS_REGION)
 
 
 def build_system_prompt(category: str) -> str:
@@ -0,0 +1,202 @@
+import contextvars
+import os
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+
+# the trace of the request being handled and the span new spans nest under;
+# boto3 calls run on executor threads, so those are submitted with a copy of
+# the context (see app/services/bedrock.py)
+_trace: contextvars.ContextVar[Optional["Trace"]] = contextvars.ContextVar(
+    "trace", default=None
+)
+_parent: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar(
+    "span", default=None
+)
+
+SERVICE_NAME = "cloud-ai-router"
+
+
+def new_trace_id() -> str:
+    # X-Ray format: version, epoch seconds in hex, 96 random bits
+    return f"1-{int(time.time()):08x}-{secrets.token_hex(12)}"
+
+
+def parse_trace_header(header: Optional[str]) -> Dict[str, str]:
+    """Fields of an X-Amzn-Trace-Id header ("Root=1-...;Parent=...;Sampled=1")."""
+    fields = {}
+    for part in (header or "").split(";"):
+        key, _, value = part.strip().partition("=")
+        if value:
+            fields[key] = value
+    return fields
+
+
+class Span:
+    __slots__ = ("name", "id", "start", "end", "annotations", "children")
+
+    def __init__(self, name: str, start: float):
+        self.name = name
+        self.id = secrets.token_hex(8)
+        self.start = start
+        self.end: Optional[float] = None
+        self.annotations: Dict[str, object] = {}
+        self.children: List["Span"] = []
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end or time.perf_counter()) - self.start) * 1000
+
+
+class Trace:
+    """
+    Spans of one request, timed with perf_counter.
+
+    Wall-clock times are only needed for the X-Ray document, so they are
+    derived from the one time.time() reading taken at the start.
+    """
+
+    def __init__(self, name: str = SERVICE_NAME, trace_header: Optional[str] = None):
+        # join the caller's trace when API Gateway or Lambda passed one on
+        upstream = parse_trace_header(
+            trace_header or os.environ.get("_X_AMZN_TRACE_ID")
+        )
+        self.trace_id = upstream.get("Root") or new_trace_id()
+        self.parent_id = upstream.get("Parent")
+        self.root = Span(name, time.perf_counter())
+        self.wall_start = time.time()
+        self.http: Dict[str, dict] = {}
+        # whether the success-path records of this request are logged
+        self.sampled = True
+        self._lock = threading.Lock()
+
+    def add(self, span: Span, parent: Optional[Span]) -> None:
+        with self._lock:
+            (parent or self.root).children.append(span)
+
+    def record(
+        self, name: str, start: float, end: float, parent: Optional[Span] = None
+    ) -> Span:
+        """Add an already-measured span (e.g. time spent before our code ran)."""
+        span = Span(name, start)
+        span.end = end
+        self.add(span, parent)
+        return span
+
+    def finish(self) -> None:
+        if self.root.end is None:
+            self.root.end = time.perf_counter()
+
+    def spans(self) -> Iterator[Span]:
+        stack = list(self.root.children)
+        while stack:
+            span = stack.pop(0)
+            yield span
+            stack.extend(span.children)
+
+    def stage_timings(self) -> Dict[str, float]:
+        """
+        Milliseconds per span name, summed over finished spans (both
+        calls of a hedged request count towards llm_ttfb).
+        """
+        totals: Dict[str, float] = {}
+        for span in self.spans():
+            if span.end is not None:
+                totals[span.name] = totals.get(span.name, 0.0) + span.duration_ms
+        return totals
+
+    def server_timing(self) -> str:
+        """Server-Timing header value: the stage timings plus the total so far."""
+        entries = [f"{name};dur={ms:.1f}" for name, ms in self.stage_timings().items()]
+        entries.append(f"total;dur={self.root.duration_ms:.1f}")
+        return ", ".join(entries)
+
+    def _wall(self, perf: float) -> float:
+        return round(self.wall_start + (perf - self.root.start), 6)
+
+    def _subsegment(self, span: Span) -> dict:
+        document = {
+            "name": span.name,
+            "id": span.id,
+            "start_time": self._wall(span.start),
+            "end_time": self._wall(
+                span.end if span.end is not None else time.perf_counter()
+            ),
+        }
+        if span.end is None:
+            document["in_progress"] = True
+        if span.annotations:
+            document["annotations"] = dict(span.annotations)
+        if span.children:
+            document["subsegments"] = [
+                self._subsegment(child) for child in span.children
+            ]
+        return document
+
+    def segment(self) -> dict:
+        """The request as an X-Ray segment document, subsegments nested per span."""
+        self.finish()
+        with self._lock:
+            document = self._subsegment(self.root)
+        document["trace_id"] = self.trace_id
+        if "AWS_LAMBDA_FUNCTION_NAME" in os.environ:
+            document["origin"] = "AWS::Lambda::Function"
+        if self.parent_id:
+            document["parent_id"] = self.parent_id
+        if self.http:
+            document["http"] = self.http
+        return document
+
+
+def current_trace() -> Optional[Trace]:
+    return _trace.get()
+
+
+def start_trace(name: str = SERVICE_NAME, trace_header: Optional[str] = None) -> Trace:
+    trace = Trace(name, trace_header)
+    _trace.set(trace)
+    _parent.set(None)
+    return trace
+
+
+def record_span(name: str, start: float, end: float) -> None:
+    """Record an already-measured block (perf_counter times) under the current span."""
+    trace = _trace.get()
+    if trace is not None:
+        trace.record(name, start, end, _parent.get())
+
+
+def annotate(key: str, value) -> None:
+    """Attach an indexed annotation to the current span (or the request)."""
+    trace = _trace.get()
+    if trace is not None:
+        (_parent.get() or trace.root).annotations[key] = value
+
+
+@contextmanager
+def span(name: str, **annotations) -> Iterator[Span]:
+    """
+    Time a block as a child of the current span.
+
+    Outside a traced request the span is still timed (callers may read
+    duration_ms) but not recorded anywhere.
+    """
+    current = Span(name, time.perf_counter())
+    current.annotations.update(annotations)
+    trace = _trace.get()
+    if trace is None:
+        try:
+            yield current
+        finally:
+            current.end = time.perf_counter()
+        return
+    trace.add(current, _parent.get())
+    token = _parent.set(current)
+    try:
+        yield current
+    finally:
+        current.end = time.perf_counter()
+        _parent.reset(token)
@@ -0,0 +1,371 @@
+import asyncio
+import logging
+import math
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple, Union
+from boto3.dynamodb.conditions import Key
+from app.config import settings
+from app.services.aws import get_resource
+from app.services.background import defer, handler
+from app.services.histograms import bucket_bounds, bucket_index
+
+
+logger = logging.getLogger(__name__)
+
+HOUR = "hour"
+DAY = "day"
+# the same formats as the usage records' "hour" and "date" attributes
+BUCKET_FORMATS = {HOUR: "%Y-%m-%d-%H", DAY: "%Y-%m-%d"}
+BUCKET_STEPS = {HOUR: timedelta(hours=1), DAY: timedelta(days=1)}
+
+# latency is kept as counts per log-linear histogram bucket (app/services/histograms.py),
+# one numeric attribute each, so rollups add up and percentiles stay within ~6%
+LATENCY_PREFIX = "lat_"
+
+# last possible sort key character, for the end of a bucket range
+SORT_KEY_END = "\uffff"
+
+
+def bucket_of(granularity: str, when: datetime) -> str:
+    return when.strftime(BUCKET_FORMATS[granularity])
+
+
+def period_of(granularity: str, bucket: str) -> str:
+    """
+    Partition key: an hour's items live under their day, a day's under its
+    month, so a range is one Query per day (or month) it spans.
+    """
+    return f"{granularity}#{bucket[:10] if granularity == HOUR else bucket[:7]}"
+
+
+def request_counters(
+    success: bool, latency_ms: float, usage: Dict[str, Any]
+) -> Dict[str, float]:
+    """One request's contribution to its buckets."""
+    return {
+        "requests": 1,
+        "errors": 0 if success else 1,
+        "latency_sum_ms": latency_ms,
+        "input_tokens": usage.get("input_tokens", 0),
+        "output_tokens": usage.get("output_tokens", 0),
+        "cost_usd": usage.get("cost_usd", 0.0),
+        f"{LATENCY_PREFIX}{bucket_index(int(latency_ms * 1000))}": 1,
+    }
+
+
+def add_counters(into: Dict[str, float], counters: Dict[str, float]) -> None:
+    for name, value in counters.items():
+        into[name] = into.get(name, 0) + value
+
+
+def summarize(counters: Dict[str, float]) -> Dict[str, Any]:
+    """Requests, errors, latency and tokens of a bucket (or of several, added up)."""
+    requests = int(counters.get("requests", 0))
+    errors = int(counters.get("errors", 0))
+    input_tokens = int(counters.get("input_tokens", 0))
+    output_tokens = int(counters.get("output_tokens", 0))
+    return {
+        "requests": requests,
+        "errors": errors,
+        "error_rate": round(errors / requests, 4) if requests else 0.0,
+        "avg_latency_ms": round(counters.get("latency_sum_ms", 0) / requests, 2)
+        if requests
+        else None,
+        "p95_latency_ms": latency_percentile(counters, 0.95),
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "total_tokens": input_tokens + output_tokens,
+        "cost_usd": round(counters.get("cost_usd", 0.0), 6),
+    }
+
+
+def latency_percentile(counters: Dict[str, float], q: float) -> Optional[float]:
+    """Latency at quantile q, as the midpoint of its histogram bucket."""
+    latency = sorted(
+        (int(name[len(LATENCY_PREFIX) :]), int(count))
+        for name, count in counters.items()
+        if name.startswith(LATENCY_PREFIX)
+    )
+    total = sum(count for _, count in latency)
+    if not total:
+        return None
+    rank = max(1, math.ceil(q * total))
+    seen = 0
+    for index, count in latency:
+        seen += count
+        if seen >= rank:
+            lower, upper = bucket_bounds(index)
+            return round((lower + upper) / 2000, 2)
+    return None
+
+
+class RollupBuffer:
+    """
+    Request counters per (granularity, bucket, category) for the process,
+    flushed every USAGE_ROLLUPS_FLUSH_SECONDS: each bucket becomes one
+    increment of its rollup item, however many requests it holds.
+    """
+
+    def __init__(self, flush_seconds: float, max_buckets: int):
+        self.flush_seconds = flush_seconds
+        self.max_buckets = max_buckets
+        self._buckets: Dict[Tuple[str, str, str], Dict[str, float]] = {}
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+    def add(
+        self,
+        category: str,
+        success: bool,
+        latency_ms: float,
+        usage: Dict[str, Any],
+        timestamp: Optional[float] = None,
+    ) -> None:
+        when = datetime.utcfromtimestamp(timestamp or time.time())
+        counters = request_counters(success, latency_ms, usage)
+        with self._lock:
+            for granularity in (HOUR, DAY):
+                key = (granularity, bucket_of(granularity, when), category)
+                add_counters(self._buckets.setdefault(key, {}), counters)
+        self.maybe_flush()
+
+    def due(self) -> bool:
+        return (
+            len(self._buckets) >= self.max_buckets
+            or time.monotonic() - self._last_flush >= self.flush_seconds
+        )
+
+    def maybe_flush(self) -> int:
+        return self.flush() if self._buckets and self.due() else 0
+
+    def flush(self) -> int:
+        with self._lock:
+            buckets, self._buckets = self._buckets, {}
+            self._last_flush = time.monotonic()
+        # one job per item: a retried job re-adds only its own increment
+        for (granularity, bucket, category), counters in buckets.items():
+            defer(
+                "usage_rollup",
+                granularity=granularity,
+                bucket=bucket,
+                category=category,
+                counters=counters,
+            )
+        return len(buckets)
+
+
+class MemoryRollupStore:
+    """
+    Rollup items in a dict with DynamoDB's ADD and Query semantics: the
+    local stand-in for tests and local runs. `reads` counts items returned.
+    """
+
+    def __init__(self):
+        self._items: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+        self.reads = 0
+
+    def add(
+        self,
+        period: str,
+        sort_key: str,
+        attributes: Dict[str, Any],
+        counters: Dict[str, float],
+    ) -> None:
+        with self._lock:
+            item = self._items.setdefault(period, {}).setdefault(
+                sort_key, {"period": period, "bucket": sort_key, **attributes}
+            )
+            add_counters(item, counters)
+
+    def query(self, period: str, start: str, end: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            items = [
+                dict(item)
+                for sort_key, item in sorted(self._items.get(period, {}).items())
+                if start <= sort_key <= end
+            ]
+        self.reads += len(items)
+        return items
+
+
+class DynamoRollupStore:
+    """
+    Rollup items in DynamoDB: partition key `period` (granularity and day or
+    month), sort key `bucket` ("<bucket>#<category>"), counters as numbers.
+    A flush increments each item with one UpdateItem ADD; a summary is one
+    Query per partition it spans.
+    """
+
+    def __init__(self, table_name: str):
+        self.table_name = table_name
+
+    @property
+    def table(self):
+        return get_resource("dynamodb", region_name=settings.AWS_REGION).Table(
+            self.table_name
+        )
+
+    def add(
+        self,
+        period: str,
+        sort_key: str,
+        attributes: Dict[str, Any],
+        counters: Dict[str, float],
+    ) -> None:
+        names: Dict[str, str] = {}
+        values: Dict[str, Any] = {}
+        sets = []
+        for index, (name, value) in enumerate(attributes.items()):
+            names[f"#s{index}"] = name
+            values[f":s{index}"] = value
+            sets.append(f"#s{index} = if_not_exists(#s{index}, :s{index})")
+        adds = []
+        for index, (name, value) in enumerate(counters.items()):
+            names[f"#a{index}"] = name
+            # DynamoDB numbers are Decimals; floats go through str to stay exact
+            values[f":a{index}"] = Decimal(str(round(value, 8)))
+            adds.append(f"#a{index} :a{index}")
+        self.table.update_item(
+            Key={"period": period, "bucket": sort_key},
+            UpdateExpression=f"SET {', '.join(sets)} ADD {', '.join(adds)}",
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues=values,
+        )
+
+    def query(self, period: str, start: str, end: str) -> List[Dict[str, Any]]:
+        items: List[Dict[str, Any]] = []
+        kwargs = {
+            "KeyConditionExpression": Key("period").eq(period)
+            & Key("bucket").between(start, end)
+        }
+        while True:
+            response = self.table.query(**kwargs)
+            for item in response.get("Items", []):
+                items.append(
+                    {
+                        name: float(value) if isinstance(value, Decimal) else value
+                        for name, value in item.items()
+                    }
+                )
+            last = response.get("LastEvaluatedKey")
+            if last is None:
+                return items
+            kwargs["ExclusiveStartKey"] = last
+
+
+store: Union[DynamoRollupStore, MemoryRollupStore]
+if settings.USAGE_ROLLUPS_TABLE_NAME and not settings.USE_MOCK_AWS:
+    store = DynamoRollupStore(settings.USAGE_ROLLUPS_TABLE_NAME)
+else:
+    store = MemoryRollupStore()
+
+buffer = RollupBuffer(
+    settings.USAGE_ROLLUPS_FLUSH_SECONDS, settings.USAGE_ROLLUPS_MAX_BUCKETS
+)
+
+
+@handler("usage_rollup")
+def write_rollup(
+    granularity: str, bucket: str, category: str, counters: Dict[str, float]
+) -> None:
+    """Add one flushed bucket to its rollup item; failures raise for the worker to retry."""
+    attributes: Dict[str, Any] = {"granularity": granularity, "category": category}
+    ttl_days = settings.USAGE_ROLLUPS_TTL_DAYS
+    if ttl_days:
+        attributes["expires_at"] = int(time.time() + ttl_days * 86400)
+    store.add(
+        period_of(granularity, bucket), f"{bucket}#{category}", attributes, counters
+    )
+
+
+def record(
+    category: str,
+    success: bool,
+    latency_ms: float,
+    usage: Dict[str, Any],
+    timestamp: Optional[float] = None,
+) -> None:
+    """Count a finished request in its hourly and daily rollups."""
+    if not settings.USAGE_ROLLUPS_ENABLED:
+        return
+    buffer.add(category or "unknown", success, latency_ms, usage, timestamp)
+
+
+def bucket_range(granularity: str, start: datetime, end: datetime) -> List[str]:
+    if start.tzinfo is not None:
+        start = start.astimezone(timezone.utc).replace(tzinfo=None)
+    if end.tzinfo is not None:
+        end = end.astimezone(timezone.utc).replace(tzinfo=None)
+    if start > end:
+        raise ValueError("start is after end")
+    step = BUCKET_STEPS[granularity]
+    first = datetime.strptime(
+        bucket_of(granularity, start), BUCKET_FORMATS[granularity]
+    )
+    count = int((end - first) / step) + 1
+    if count > settings.USAGE_SUMMARY_MAX_BUCKETS:
+        raise ValueError(
+            f"{count} {granularity} buckets requested, at most "
+            f"{settings.USAGE_SUMMARY_MAX_BUCKETS} per query"
+        )
+    return [bucket_of(granularity, first + step * index) for index in range(count)]
+
+
+def query(granularity: str, buckets: List[str]) -> List[Dict[str, Any]]:
+    """The rollup items of these buckets, every category: one Query per partition."""
+    ranges: Dict[str, Tuple[str, str]] = {}
+    for bucket in buckets:
+        period = period_of(granularity, bucket)
+        first, _ = ranges.get(period, (bucket, bucket))
+        ranges[period] = (first, bucket)
+    items = []
+    for period, (first, last) in ranges.items():
+        items.extend(store.query(period, f"{first}#", f"{last}#{SORT_KEY_END}"))
+    return items
+
+
+async def summary(
+    granularity: str,
+    start: datetime,
+    end: datetime,
+    category: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Requests, errors, p95 latency and tokens per bucket and category, plus
+    the range's totals per category, from the rollup items alone.
+
+    Buckets this process (or another) has not flushed yet are missing, so
+    the latest USAGE_ROLLUPS_FLUSH_SECONDS may be incomplete.
+    """
+    buckets = bucket_range(granularity, start, end)
+    items = await asyncio.to_thread(query, granularity, buckets)
+
+    rows = []
+    totals: Dict[str, Dict[str, float]] = {}
+    for item in items:
+        if category is not None and item["category"] != category:
+            continue
+        bucket, _, item_category = item["bucket"].partition("#")
+        counters = {
+            name: value
+            for name, value in item.items()
+            if name not in ("period", "bucket", "granularity", "category", "expires_at")
+        }
+        rows.append(
+            {"bucket": bucket, "category": item_category, **summarize(counters)}
+        )
+        add_counters(totals.setdefault(item_category, {}), counters)
+
+    return {
+        "granularity": granularity,
+        "start": buckets[0],
+        "end": buckets[-1],
+        "buckets": rows,
+        "categories": {
+            name: summarize(counters) for name, counters in sorted(totals.items())
+        },
+    }
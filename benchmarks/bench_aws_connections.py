@@ -0,0 +1,123 @@
+"""
+Load test: connection reuse of the shared AWS client vs botocore defaults.
+
+Fires bursts of concurrent InvokeModel calls from a thread pool against
+the local fake bedrock-runtime and reports how many TCP connections each
+client setup had to open. With the default pool of 10, every burst wider
+than the pool discards its extra connections and has to handshake (plus
+TLS against the real endpoint) them again on the next burst.
+
+    python -m benchmarks.bench_aws_connections --requests 2000 --concurrency 32
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# the fake server does not check signatures, but botocore still needs credentials
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+
+import boto3  # noqa: E402
+
+from app.services import aws  # noqa: E402
+from devtools.fake_bedrock import FakeBedrockServer  # noqa: E402
+
+MODEL_ID = "anthropic.claude-3-haiku-20240307-v1:0"
+BODY = json.dumps(
+    {
+        "anthropic_version": "bedrock-2023-05-31",
+        "max_tokens": 50,
+        "messages": [{"role": "user", "content": "ping"}],
+    }
+)
+
+
+def invoke(client):
+    response = client.invoke_model(
+        modelId=MODEL_ID,
+        contentType="application/json",
+        accept="application/json",
+        body=BODY,
+    )
+    response["body"].read()
+
+
+def run_scenario(name, server, make_client, requests, concurrency):
+    server.reset_counters()
+    latencies = []
+
+    def call(_):
+        client = make_client()
+        start = time.perf_counter()
+        invoke(client)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for offset in range(0, requests, concurrency):
+            burst = range(offset, min(offset + concurrency, requests))
+            list(pool.map(call, burst))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "scenario": name,
+        "requests": requests,
+        "connections_opened": server.connections,
+        "connections_per_1k_requests": round(server.connections * 1000 / requests, 1),
+        "throughput_rps": round(requests / elapsed, 1),
+        "p50_ms": round(latencies[len(latencies) // 2], 2),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1], 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--latency-ms", type=float, default=5)
+    args = parser.parse_args()
+
+    server = FakeBedrockServer(latency_ms=args.latency_ms).start()
+    region = "us-east-1"
+
+    default_client = boto3.client(
+        "bedrock-runtime", region_name=region, endpoint_url=server.endpoint_url
+    )
+    aws.reset_clients()
+
+    scenarios = [
+        (
+            "client-per-call",
+            # sessions are not thread-safe, so a fresh one per client
+            lambda: boto3.session.Session().client(
+                "bedrock-runtime", region_name=region, endpoint_url=server.endpoint_url
+            ),
+        ),
+        ("shared-default-config", lambda: default_client),
+        (
+            "shared-tuned-config",
+            lambda: aws.get_client(
+                "bedrock-runtime", region_name=region, endpoint_url=server.endpoint_url
+            ),
+        ),
+    ]
+
+    # client-per-call is slow to construct, keep its sample small
+    results = []
+    for name, make_client in scenarios:
+        requests = (
+            min(args.requests, 100) if name == "client-per-call" else args.requests
+        )
+        results.append(
+            run_scenario(name, server, make_client, requests, args.concurrency)
+        )
+
+    server.stop()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
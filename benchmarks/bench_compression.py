@@ -0,0 +1,58 @@
+"""
+Benchmark: bytes on the wire and CPU per response for plan payloads.
+
+Renders plan responses of increasing size through the same
+CompressionMiddleware helpers the app uses and reports identity vs
+gzip/brotli sizes and the compression time per response.
+
+    python -m benchmarks.bench_compression --iterations 200
+"""
+import argparse
+import json
+import time
+
+from app import middleware
+from benchmarks.bench_plan_validation import build_plan_text, fast_path
+
+WEEK_COUNTS = [4, 16, 52]
+
+
+def time_compress(body: bytes, encoding: str, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        middleware.compress(body, encoding)
+    return (time.perf_counter() - start) * 1e6 / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    encodings = ["gzip"] + (["br"] if middleware.brotli is not None else [])
+    results = []
+    for weeks in WEEK_COUNTS:
+        body = fast_path(build_plan_text(weeks, tasks_per_week=4, resources=8))
+        row = {"weeks": weeks, "identity_bytes": len(body)}
+        for encoding in encodings:
+            compressed = middleware.compress(body, encoding)
+            row[f"{encoding}_bytes"] = len(compressed)
+            row[f"{encoding}_ratio"] = round(len(body) / len(compressed), 2)
+            row[f"{encoding}_cpu_us"] = round(
+                time_compress(body, encoding, args.iterations), 1
+            )
+        start = time.perf_counter()
+        for _ in range(args.iterations):
+            middleware.make_etag(body)
+        row["etag_cpu_us"] = round(
+            (time.perf_counter() - start) * 1e6 / args.iterations, 1
+        )
+        results.append(row)
+
+    if middleware.brotli is None:
+        print("brotli not installed, reporting gzip only")
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Per-request logging overhead on the event loop.
+
+Sends each mock-mode request twice in-process, once with logging disabled
+and once with the app's real logging configuration writing to /dev/null,
+and reports the difference in event-loop CPU time per request. Also counts the records
+each request emits.
+
+    python -m benchmarks.bench_logging --requests 500
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import time
+
+from benchmarks.load_test import (
+    DEFAULT_GOALS,
+    ENDPOINT,
+    configure_environment,
+    free_port,
+    load_goals,
+)
+
+
+class CountingHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = 0
+
+    def emit(self, record):
+        self.records += 1
+
+
+async def run(app, payloads, counter):
+    """Each payload twice, logging off then on: (off, on) loop CPU microseconds per pair."""
+    import httpx
+
+    pairs = []
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://bench"
+    ) as client:
+        for payload in payloads:
+            # CPU time of the event-loop thread: what logging takes away from
+            # other requests, without the network waits of the metrics calls
+            logging.disable(logging.CRITICAL)
+            start = time.thread_time()
+            await client.post(ENDPOINT, json=payload)
+            off = time.thread_time() - start
+
+            logging.disable(logging.NOTSET)
+            start = time.thread_time()
+            await client.post(ENDPOINT, json=payload)
+            on = time.thread_time() - start
+            pairs.append((off * 1e6, on * 1e6))
+    return pairs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=300)
+    args = parser.parse_args()
+
+    # the app moves this handler behind its log queue, as it does Lambda's
+    logging.basicConfig(
+        level=logging.INFO, format="%(message)s", stream=open(os.devnull, "w")
+    )
+
+    # CloudWatch writes go to the fake server so metrics cost the same on both sides
+    port = free_port()
+    configure_environment("mock", f"http://127.0.0.1:{port}")
+    from devtools.fake_bedrock import FakeBedrockServer
+
+    server = FakeBedrockServer(port=port).start()
+
+    from app.main import app
+
+    counter = CountingHandler()
+    logging.getLogger().addHandler(counter)
+
+    goals = load_goals(DEFAULT_GOALS)
+    payloads = [goals[i % len(goals)] for i in range(args.requests)]
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(run(app, payloads[:50], counter))
+
+    # back-to-back pairs cancel drift; the median drops GC pauses and outliers
+    counter.records = 0
+    pairs = loop.run_until_complete(run(app, payloads, counter))
+    server.stop()
+
+    print(
+        json.dumps(
+            {
+                "requests": args.requests,
+                "loop_cpu_us_logging_off": round(
+                    statistics.median(off for off, _ in pairs), 1
+                ),
+                "loop_cpu_us_logging_on": round(
+                    statistics.median(on for _, on in pairs), 1
+                ),
+                "logging_overhead_us": round(
+                    statistics.median(on - off for off, on in pairs), 1
+                ),
+                "records_per_request": round(counter.records / args.requests, 2),
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Benchmark: plan library index size and lookup latency.
+
+Builds indexes of synthetic plans for increasing numbers of head goals,
+as the refresh writes them, and times plan_library lookups from a bundled
+(memory-mapped) file: a hit, which decompresses and validates the plan,
+and a miss, which the request path pays on every other goal.
+
+    python -m benchmarks.bench_plan_library --iterations 2000
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from app.services import plan_library, plan_store, planner, synthetic_plans
+from app.services.plan_library import FileSource, PlanLibrary
+
+GOAL_COUNTS = [50, 200, 1000]
+HEAD_GOAL = (
+    "learn skill number 7 in 3 months!"  # as the library has it, spelled differently
+)
+TAIL_GOAL = "Learn to juggle three balls"
+
+
+def build_entries(count: int) -> dict:
+    entries = {}
+    for index in range(count):
+        goal = f"Learn skill number {index} in 3 months"
+        text = synthetic_plans.generate_plan_text(goal, "skill-learning", seed=index)
+        plan = plan_store.encode(planner.parse_plan(text).model_dump_json().encode())
+        fields = {
+            "goal": goal,
+            "category": "skill-learning",
+            "model": "claude-3-haiku",
+            "model_id": "anthropic.claude-3-haiku-20240307-v1:0",
+            "requests": count - index,
+            "built_at": int(time.time()),
+        }
+        entries[plan_library.normalize_goal(goal)] = (fields, plan)
+    return entries
+
+
+def time_lookups(library: PlanLibrary, goal: str, iterations: int) -> float:
+    loop = asyncio.new_event_loop()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        loop.run_until_complete(library.lookup(goal, None, "bench"))
+    elapsed = time.perf_counter() - start
+    loop.close()
+    return elapsed * 1e6 / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for count in GOAL_COUNTS:
+            path = os.path.join(directory, f"library-{count}.bin")
+            data = plan_library.build_index(build_entries(count), "bench")
+            FileSource(path).publish(data, "bench")
+
+            start = time.perf_counter()
+            library = PlanLibrary(FileSource(path), reload_seconds=3600)
+            library.reload()
+            load_ms = (time.perf_counter() - start) * 1000
+            results.append(
+                {
+                    "goals": count,
+                    "index_bytes": len(data),
+                    "bytes_per_goal": len(data) // count,
+                    "load_ms": round(load_ms, 2),
+                    "hit_us": round(
+                        time_lookups(library, HEAD_GOAL, args.iterations), 1
+                    ),
+                    "miss_us": round(
+                        time_lookups(library, TAIL_GOAL, args.iterations), 1
+                    ),
+                }
+            )
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
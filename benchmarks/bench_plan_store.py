@@ -0,0 +1,92 @@
+"""
+Benchmark: stored size and read latency of persisted plans.
+
+Encodes plan responses of increasing size as app/services/plan_store.py
+stores them and reports raw JSON vs plain zlib vs zlib with the preset
+dictionary, the DynamoDB item size and the capacity units one write and
+one (eventually consistent) read consume. Reads are timed through
+plan_store.get for a cache hit and for a miss that decodes the stored item.
+
+    python -m benchmarks.bench_plan_store --iterations 500
+"""
+import argparse
+import asyncio
+import json
+import math
+import time
+import zlib
+
+from app.services import plan_store
+from app.services.plan_store import MemoryPlanStore, PlanCache
+from benchmarks.bench_plan_validation import build_plan_text, fast_path
+
+WEEK_COUNTS = [4, 12, 26, 52]
+REQUEST_ID = "3f1c9a52-7c1e-4b5e-9d8a-2f64a1b0c7d3"
+
+
+def item_bytes(stored: bytes) -> int:
+    """DynamoDB item size: attribute names plus values, as DynamoPlanStore writes them."""
+    numbers = 2 * 8  # stored_bytes and expires_at, generously
+    names = len("request_id") + len("plan") + len("stored_bytes") + len("expires_at")
+    return names + len(REQUEST_ID) + len(stored) + numbers
+
+
+def elapsed_us(fn, *args) -> float:
+    start = time.perf_counter()
+    fn(*args)
+    return (time.perf_counter() - start) * 1e6
+
+
+def time_reads(iterations: int, hit: bool) -> float:
+    loop = asyncio.new_event_loop()
+    total = 0.0
+    for _ in range(iterations):
+        if not hit:
+            plan_store.cache = PlanCache(plan_store.settings.PLANS_CACHE_SIZE)
+        start = time.perf_counter()
+        loop.run_until_complete(plan_store.get(REQUEST_ID))
+        total += time.perf_counter() - start
+    loop.close()
+    return total * 1e6 / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=500)
+    args = parser.parse_args()
+
+    results = []
+    for weeks in WEEK_COUNTS:
+        body = fast_path(build_plan_text(weeks, tasks_per_week=4, resources=8))
+        stored = plan_store.encode(body)
+        assert plan_store.decode(stored) == body
+        size = item_bytes(stored)
+
+        plan_store.store = MemoryPlanStore()
+        plan_store.store.put(REQUEST_ID, stored, 0)
+        plan_store.cache = PlanCache(plan_store.settings.PLANS_CACHE_SIZE)
+        plan_store.cache.put(REQUEST_ID, body)
+        results.append(
+            {
+                "weeks": weeks,
+                "json_bytes": len(body),
+                "zlib_bytes": len(zlib.compress(body, 9)),
+                "stored_bytes": len(stored),
+                "ratio": round(len(body) / len(stored), 2),
+                "item_bytes": size,
+                "write_units": math.ceil(size / 1024),
+                "write_units_uncompressed": math.ceil(item_bytes(body) / 1024),
+                "read_units": math.ceil(size / 4096) / 2,
+                "encode_us": round(
+                    min(elapsed_us(plan_store.encode, body) for _ in range(20)), 1
+                ),
+                "read_hit_us": round(time_reads(args.iterations, hit=True), 1),
+                "read_miss_us": round(time_reads(args.iterations, hit=False), 1),
+            }
+        )
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Benchmark: LLM text -> HTTP response bytes, legacy path vs fast path.
+
+legacy: json.loads, hand-built WeeklyTask/WeeklyBreakdown/Resource models,
+        GeneratePlanResponse, then FastAPI's response_model re-validation
+        and JSONResponse rendering
+fast:   GeneratedPlan.model_validate_json, model_construct, model_dump_json
+
+    python -m benchmarks.bench_plan_validation --iterations 200
+"""
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime
+
+from fastapi.routing import serialize_response
+from fastapi.responses import JSONResponse
+from fastapi.utils import create_response_field
+
+from app.models.schemas import (
+    GeneratePlanResponse,
+    Resource,
+    WeeklyBreakdown,
+    WeeklyTask,
+)
+from app.services import planner, synthetic_plans
+
+WEEK_COUNTS = [2, 4, 8, 16, 26, 52]
+RESPONSE_FIELD = create_response_field(name="response", type_=GeneratePlanResponse)
+# serialize_response is a coroutine; one loop keeps its driving cost negligible
+LOOP = asyncio.new_event_loop()
+
+
+def build_plan_text(weeks: int, tasks_per_week: int = 3, resources: int = 6) -> str:
+    return synthetic_plans.generate_plan_text(
+        "Benchmark goal",
+        "skill-learning",
+        weeks=weeks,
+        tasks_per_week=tasks_per_week,
+        resources=resources,
+        seed=weeks,
+    )
+
+
+def legacy_path(text: str) -> bytes:
+    plan_json = planner.extract_json(text)
+    weekly_breakdown = [
+        WeeklyBreakdown(
+            week_number=week["week_number"],
+            focus_area=week["focus_area"],
+            tasks=[WeeklyTask(**task) for task in week["tasks"]],
+        )
+        for week in plan_json["weekly_breakdown"]
+    ]
+    resources = [Resource(**resource) for resource in plan_json.get("resources", [])]
+    plan = GeneratePlanResponse(
+        request_id="bench",
+        goal="Benchmark goal",
+        category="skill-learning",
+        estimated_duration_weeks=plan_json["estimated_duration_weeks"],
+        weekly_breakdown=weekly_breakdown,
+        resources=resources,
+        total_estimated_hours=plan_json["total_estimated_hours"],
+        created_at=datetime.utcnow(),
+        metadata={},
+    )
+    content = LOOP.run_until_complete(
+        serialize_response(field=RESPONSE_FIELD, response_content=plan)
+    )
+    return JSONResponse(content).body
+
+
+def fast_path(text: str) -> bytes:
+    plan = planner.build_response(
+        planner.parse_plan(text),
+        request_id="bench",
+        goal="Benchmark goal",
+        category="skill-learning",
+        metadata={},
+    )
+    return plan.model_dump_json().encode()
+
+
+def time_per_call(fn, text: str, iterations: int) -> float:
+    fn(text)  # warm up
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn(text)
+    return (time.perf_counter() - start) * 1e6 / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    results = []
+    for weeks in WEEK_COUNTS:
+        text = build_plan_text(weeks)
+        legacy_us = time_per_call(legacy_path, text, args.iterations)
+        fast_us = time_per_call(fast_path, text, args.iterations)
+        results.append(
+            {
+                "weeks": weeks,
+                "payload_bytes": len(fast_path(text)),
+                "legacy_us": round(legacy_us, 1),
+                "fast_us": round(fast_us, 1),
+                "speedup": round(legacy_us / fast_us, 2),
+            }
+        )
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
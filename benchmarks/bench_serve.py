@@ -0,0 +1,219 @@
+"""
+Throughput of the prefork server (app/serve.py) as workers are added.
+
+Runs `python -m app.serve` against the fake Bedrock server (synthetic plans,
+also sinking DynamoDB/CloudWatch writes) once per worker count, drives it
+over HTTP from several client processes, and reports requests per second and
+latency. Throughput should grow with workers until they outnumber the cores
+(or the fake server, which runs in its own process, saturates).
+
+    python -m benchmarks.bench_serve --workers 1,2,4 --duration 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from benchmarks.load_test import (
+    DEFAULT_GOALS,
+    ENDPOINT,
+    free_port,
+    load_goals,
+    percentile,
+)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def wait_ready(url: str, timeout: float = 30) -> None:
+    import httpx
+
+    expires = time.monotonic() + timeout
+    while time.monotonic() < expires:
+        try:
+            if httpx.get(url).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError(f"{url} did not come up")
+
+
+def drive(base_url: str, payloads: list, concurrency: int, duration: float):
+    """One client process: `concurrency` connections for `duration` seconds."""
+    import httpx
+
+    async def run():
+        latencies, errors = [], 0
+        stop_at = time.perf_counter() + duration
+        limits = httpx.Limits(
+            max_connections=concurrency, max_keepalive_connections=concurrency
+        )
+        async with httpx.AsyncClient(
+            base_url=base_url, limits=limits, timeout=60
+        ) as client:
+
+            async def loop(offset):
+                nonlocal errors
+                i = offset
+                while time.perf_counter() < stop_at:
+                    start = time.perf_counter()
+                    try:
+                        response = await client.post(
+                            ENDPOINT, json=payloads[i % len(payloads)]
+                        )
+                        if response.status_code != 200:
+                            errors += 1
+                    except httpx.HTTPError:
+                        errors += 1
+                    latencies.append((time.perf_counter() - start) * 1000)
+                    i += concurrency
+
+            await asyncio.gather(*(loop(n) for n in range(concurrency)))
+        return latencies, errors
+
+    return asyncio.run(run())
+
+
+def measure(workers: int, args, payloads: list, env: dict) -> dict:
+    port = free_port()
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "app.serve",
+            "--host",
+            "127.0.0.1",
+            "--port",
+            str(port),
+            "--workers",
+            str(workers),
+            "--max-requests",
+            "0",
+        ],
+        cwd=ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        wait_ready(f"{base_url}/health")
+        with ProcessPoolExecutor(args.clients) as pool:
+            # warm every worker's connections and code paths first
+            list(
+                pool.map(
+                    drive,
+                    [base_url] * args.clients,
+                    [payloads] * args.clients,
+                    [args.concurrency] * args.clients,
+                    [1.0] * args.clients,
+                )
+            )
+            started = time.perf_counter()
+            results = list(
+                pool.map(
+                    drive,
+                    [base_url] * args.clients,
+                    [payloads] * args.clients,
+                    [args.concurrency] * args.clients,
+                    [args.duration] * args.clients,
+                )
+            )
+            elapsed = time.perf_counter() - started
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=60)
+
+    latencies = [ms for batch, _ in results for ms in batch]
+    errors = sum(e for _, e in results)
+    return {
+        "workers": workers,
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round((len(latencies) - errors) / elapsed, 1),
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50), 2),
+            "p99": round(percentile(latencies, 99), 2),
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--workers",
+        default=None,
+        help="comma-separated, default 1,2,4.. up to the cores",
+    )
+    parser.add_argument(
+        "--clients", type=int, default=4, help="load generator processes"
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=16, help="connections per client"
+    )
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument(
+        "--latency-ms", type=float, default=50, help="fake Bedrock latency"
+    )
+    args = parser.parse_args()
+
+    cores = os.cpu_count() or 1
+    if args.workers:
+        counts = [int(n) for n in args.workers.split(",")]
+    else:
+        counts = [1]
+        while counts[-1] * 2 <= cores:
+            counts.append(counts[-1] * 2)
+
+    fake_port = free_port()
+    fake_url = f"http://127.0.0.1:{fake_port}"
+    fake = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "devtools.fake_bedrock",
+            "--synthetic",
+            "--port",
+            str(fake_port),
+            "--latency-ms",
+            str(args.latency_ms),
+        ],
+        cwd=ROOT,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    env = dict(
+        os.environ,
+        AWS_ACCESS_KEY_ID="testing",
+        AWS_SECRET_ACCESS_KEY="testing",
+        USE_MOCK_AWS="false",
+        BEDROCK_ENDPOINT_URL=fake_url,
+        AWS_ENDPOINT_URL_DYNAMODB=fake_url,
+        AWS_ENDPOINT_URL_CLOUDWATCH=fake_url,
+        LOG_SUCCESS_SAMPLE_RATE="0",
+        SHARED_CACHE_ENABLED=os.environ.get("SHARED_CACHE_ENABLED", "false"),
+    )
+    # long-horizon goals exceed max_tokens on the fake backend and count as errors (see README)
+    payloads = load_goals(DEFAULT_GOALS)
+
+    try:
+        time.sleep(1)
+        runs = [measure(workers, args, payloads, env) for workers in counts]
+    finally:
+        fake.terminate()
+        fake.wait()
+
+    base = runs[0]["throughput_rps"] or 1
+    for run in runs:
+        run["speedup"] = round(run["throughput_rps"] / base, 2)
+    print(json.dumps({"cores": cores, "runs": runs}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
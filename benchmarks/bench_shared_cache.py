@@ -0,0 +1,133 @@
+"""
+Concurrent get/put throughput of the shared plan cache across processes.
+
+Each process runs the same mix: a key drawn from a skewed popularity
+distribution is looked up, and on a miss a plan-sized value is stored.
+Throughput counts every operation for --duration seconds. Hit rates count
+the first --requests lookups of each process, roughly one TTL of real
+traffic. Each process also keeps a private dict over the same key stream,
+which is what a per-worker in-process cache would see, and the report
+compares the two hit rates.
+
+    python -m benchmarks.bench_shared_cache --processes 1,2,4 --duration 5
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+import zlib
+
+from app.services.shared_cache import SharedCache
+from benchmarks.load_test import percentile
+
+
+def plan_value(rng: random.Random) -> bytes:
+    # compressed plan JSON is a few KB; repeated words compress like real plans
+    words = [
+        rng.choice(["week", "practice", "review", "milestone", "read", "build"])
+        for _ in range(2000)
+    ]
+    return zlib.compress(" ".join(words).encode())
+
+
+def worker(path, slots, slot_size, keys, requests, duration, seed, start_at, results):
+    cache = SharedCache(path, slots, slot_size)
+    rng = random.Random(seed)
+    value = plan_value(rng)
+    private = {}
+    gets = puts = shared_hits = private_hits = 0
+    get_us = []
+
+    while time.time() < start_at:
+        time.sleep(0.001)
+    stop_at = time.perf_counter() + duration
+    while time.perf_counter() < stop_at:
+        # log-uniform ranks: a few popular goals, a long tail
+        key = f"goal-{int(keys ** rng.random())}"
+        start = time.perf_counter()
+        hit = cache.get(key)
+        if len(get_us) < 100_000:
+            get_us.append((time.perf_counter() - start) * 1e6)
+        gets += 1
+        if hit is None:
+            cache.put(key, value, ttl=3600)
+            puts += 1
+        if gets <= requests:
+            shared_hits += hit is not None
+            private_hits += key in private
+            private[key] = value
+    results.put((gets, puts, shared_hits, private_hits, get_us))
+
+
+def measure(processes: int, args) -> dict:
+    path = os.path.join(tempfile.mkdtemp(), "bench.cache")
+    SharedCache(path, args.slots, args.slot_size).get("init")
+    ctx = multiprocessing.get_context("fork")
+    results = ctx.Queue()
+    start_at = time.time() + 0.5
+    procs = [
+        ctx.Process(
+            target=worker,
+            args=(
+                path,
+                args.slots,
+                args.slot_size,
+                args.keys,
+                args.requests,
+                args.duration,
+                n,
+                start_at,
+                results,
+            ),
+        )
+        for n in range(processes)
+    ]
+    for proc in procs:
+        proc.start()
+    collected = [results.get() for _ in procs]
+    for proc in procs:
+        proc.join()
+    os.remove(path)
+
+    gets = sum(r[0] for r in collected)
+    puts = sum(r[1] for r in collected)
+    get_us = [us for r in collected for us in r[4]]
+    return {
+        "processes": processes,
+        "ops_per_s": round((gets + puts) / args.duration),
+        "gets_per_s": round(gets / args.duration),
+        "puts_per_s": round(puts / args.duration),
+        "get_us": {
+            "p50": round(percentile(get_us, 50), 2),
+            "p99": round(percentile(get_us, 99), 2),
+        },
+        "shared_hit_rate": round(
+            sum(r[2] for r in collected) / (args.requests * processes), 4
+        ),
+        "per_process_hit_rate": round(
+            sum(r[3] for r in collected) / (args.requests * processes), 4
+        ),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--processes", default="1,2,4")
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--keys", type=int, default=5000, help="distinct goals")
+    parser.add_argument(
+        "--requests", type=int, default=2000, help="lookups per process for hit rates"
+    )
+    parser.add_argument("--slots", type=int, default=2048)
+    parser.add_argument("--slot-size", type=int, default=16384)
+    args = parser.parse_args()
+
+    runs = [measure(int(n), args) for n in args.processes.split(",")]
+    print(json.dumps({"cores": os.cpu_count(), "runs": runs}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,431 @@
+"""
+End-to-end load test for the ASGI app.
+
+Replays a goals file against `POST /api/v1/generate-plan` at a fixed
+concurrency, either in-process through httpx's ASGITransport or through
+the Mangum `handler` with API Gateway HTTP API (v2) events, and prints one
+JSON report:
+
+- throughput, and p50/p95/p99/max latency
+- per-stage breakdown: classification, generation, and
+  everything else (middleware, serialization)
+- allocations per request, from a separate sequential tracemalloc pass
+
+Backends:
+
+- mock: USE_MOCK_AWS=true (synthetic plans, no Bedrock I/O)
+- fake: the real Bedrock, DynamoDB and CloudWatch clients against an
+  in-process devtools.fake_bedrock server
+
+In both, DynamoDB and CloudWatch writes go to the fake server, never AWS.
+
+    python -m benchmarks.load_test --transport asgi --concurrency 16 --requests 400 \\
+        --output before.json
+    python -m benchmarks.load_test --compare before.json after.json
+"""
+import argparse
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+DEFAULT_GOALS = Path(__file__).with_name("goals.txt")
+ENDPOINT = "/api/v1/generate-plan"
+
+# stage name -> ms for the request running in this context
+STAGES: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar(
+    "stages", default=None
+)
+
+
+class Sample(NamedTuple):
+    latency_ms: float
+    status: int
+    response_bytes: int
+    stages: Dict[str, float]
+
+
+class FakeLambdaContext:
+    """The parts of the Lambda context object the app reads."""
+
+    def __init__(self, timeout_ms: int = 300_000):
+        self.aws_request_id = str(uuid.uuid4())
+        self.function_name = "load-test"
+        self.memory_limit_in_mb = 512
+        self._deadline = time.monotonic() + timeout_ms / 1000
+
+    def get_remaining_time_in_millis(self) -> int:
+        return int((self._deadline - time.monotonic()) * 1000)
+
+
+def load_goals(path: Path) -> List[dict]:
+    payloads = []
+    for line in path.read_text().splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        goal, _, context = (part.strip() for part in line.partition("|"))
+        payloads.append({"goal": goal, "context": context or None})
+    return payloads
+
+
+def api_gateway_event(payload: dict) -> dict:
+    now = datetime.utcnow()
+    return {
+        "version": "2.0",
+        "routeKey": "$default",
+        "rawPath": ENDPOINT,
+        "rawQueryString": "",
+        "headers": {
+            "content-type": "application/json",
+            "accept-encoding": "gzip, br",
+            "host": "load-test.execute-api.us-east-1.amazonaws.com",
+        },
+        "requestContext": {
+            "accountId": "123456789012",
+            "apiId": "load-test",
+            "domainName": "load-test.execute-api.us-east-1.amazonaws.com",
+            "http": {
+                "method": "POST",
+                "path": ENDPOINT,
+                "protocol": "HTTP/1.1",
+                "sourceIp": "127.0.0.1",
+                "userAgent": "load-test",
+            },
+            "requestId": str(uuid.uuid4()),
+            "routeKey": "$default",
+            "stage": "$default",
+            "time": now.strftime("%d/%b/%Y:%H:%M:%S +0000"),
+            "timeEpoch": int(now.timestamp() * 1000),
+        },
+        "body": json.dumps(payload),
+        "isBase64Encoded": False,
+    }
+
+
+def configure_environment(backend: str, endpoint_url: str) -> None:
+    """Settings are read at import time, so this runs before importing the app."""
+    os.environ["AWS_ACCESS_KEY_ID"] = "testing"
+    os.environ["AWS_SECRET_ACCESS_KEY"] = "testing"
+    os.environ.pop("AWS_SESSION_TOKEN", None)
+    os.environ["AWS_ENDPOINT_URL_DYNAMODB"] = endpoint_url
+    os.environ["AWS_ENDPOINT_URL_CLOUDWATCH"] = endpoint_url
+    os.environ["USE_MOCK_AWS"] = "true" if backend == "mock" else "false"
+    # the goals repeat, so the shared plan cache would answer most of them
+    os.environ.setdefault("SHARED_CACHE_ENABLED", "false")
+    if backend == "fake":
+        os.environ["BEDROCK_ENDPOINT_URL"] = endpoint_url
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def instrument_stages() -> None:
+    """Time every Deadline.run stage into the STAGES dict of the current request."""
+    from app.services.deadline import Deadline
+
+    original = Deadline.run
+
+    async def timed_run(self, stage, awaitable):
+        start = time.perf_counter()
+        try:
+            return await original(self, stage, awaitable)
+        finally:
+            timings = STAGES.get()
+            if timings is not None:
+                timings[stage] = (
+                    timings.get(stage, 0.0) + (time.perf_counter() - start) * 1000
+                )
+
+    setattr(Deadline, "run", timed_run)
+
+
+async def asgi_request(client, payload: dict) -> Sample:
+    timings: Dict[str, float] = {}
+    STAGES.set(timings)
+    start = time.perf_counter()
+    response = await client.post(
+        ENDPOINT, json=payload, headers={"accept-encoding": "gzip, br"}
+    )
+    latency_ms = (time.perf_counter() - start) * 1000
+    return Sample(latency_ms, response.status_code, len(response.content), timings)
+
+
+def mangum_request(handler, payload: dict) -> Sample:
+    timings: Dict[str, float] = {}
+    STAGES.set(timings)
+    start = time.perf_counter()
+    response = handler(api_gateway_event(payload), FakeLambdaContext())
+    latency_ms = (time.perf_counter() - start) * 1000
+    return Sample(
+        latency_ms, response["statusCode"], len(response.get("body") or ""), timings
+    )
+
+
+async def run_asgi(app, payloads: List[dict], concurrency: int) -> List[Sample]:
+    import httpx
+
+    samples: List[Sample] = []
+    pending = iter(payloads)
+
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://load-test"
+    ) as client:
+
+        async def worker():
+            for payload in pending:
+                samples.append(await asgi_request(client, payload))
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return samples
+
+
+def run_mangum(handler, payloads: List[dict], concurrency: int) -> List[Sample]:
+    # Mangum drives each invocation on the calling thread's event loop
+    with ThreadPoolExecutor(
+        concurrency,
+        initializer=lambda: asyncio.set_event_loop(asyncio.new_event_loop()),
+    ) as pool:
+        return list(
+            pool.map(lambda payload: mangum_request(handler, payload), payloads)
+        )
+
+
+def percentile(values: Sequence[float], p: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(samples: List[Sample], elapsed_s: float) -> dict:
+    latencies = [s.latency_ms for s in samples]
+    stage_names = sorted({name for s in samples for name in s.stages})
+    stages = {}
+    for name in stage_names + ["other"]:
+        if name == "other":
+            values = [s.latency_ms - sum(s.stages.values()) for s in samples]
+        else:
+            values = [s.stages.get(name, 0.0) for s in samples]
+        stages[name] = {
+            "mean_ms": round(statistics.fmean(values), 3),
+            "p50_ms": round(percentile(values, 50), 3),
+            "p95_ms": round(percentile(values, 95), 3),
+        }
+
+    statuses: Dict[str, int] = {}
+    for sample in samples:
+        statuses[str(sample.status)] = statuses.get(str(sample.status), 0) + 1
+
+    return {
+        "requests": len(samples),
+        "elapsed_s": round(elapsed_s, 3),
+        "throughput_rps": round(len(samples) / elapsed_s, 2),
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50), 3),
+            "p95": round(percentile(latencies, 95), 3),
+            "p99": round(percentile(latencies, 99), 3),
+            "max": round(max(latencies), 3),
+            "mean": round(statistics.fmean(latencies), 3),
+        },
+        "stages": stages,
+        "status_codes": statuses,
+        "mean_response_bytes": round(
+            statistics.fmean(s.response_bytes for s in samples)
+        ),
+    }
+
+
+def measure_allocations(run_one, payloads: List[dict]) -> dict:
+    """Sequential pass under tracemalloc: peak and retained bytes per request."""
+    peaks, retained, blocks = [], [], []
+    tracemalloc.start()
+    try:
+        for payload in payloads:
+            tracemalloc.reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+            blocks_before = sys.getallocatedblocks()
+            run_one(payload)
+            after, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - before)
+            retained.append(after - before)
+            blocks.append(sys.getallocatedblocks() - blocks_before)
+    finally:
+        tracemalloc.stop()
+    return {
+        "requests": len(payloads),
+        "peak_kib_p50": round(percentile(peaks, 50) / 1024, 1),
+        "peak_kib_max": round(max(peaks) / 1024, 1),
+        "retained_bytes_mean": round(statistics.fmean(retained)),
+        "net_blocks_mean": round(statistics.fmean(blocks), 1),
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(before: dict, after: dict) -> dict:
+    """Relative change of the headline numbers between two reports."""
+
+    def change(old, new):
+        return round((new - old) / old * 100, 1) if old else None
+
+    result = {
+        "before": before["meta"].get("commit"),
+        "after": after["meta"].get("commit"),
+        "throughput_rps_pct": change(
+            before["load"]["throughput_rps"], after["load"]["throughput_rps"]
+        ),
+    }
+    for key in ("p50", "p95", "p99"):
+        result[f"latency_{key}_pct"] = change(
+            before["load"]["latency_ms"][key], after["load"]["latency_ms"][key]
+        )
+    if before.get("allocations") and after.get("allocations"):
+        result["peak_kib_p50_pct"] = change(
+            before["allocations"]["peak_kib_p50"], after["allocations"]["peak_kib_p50"]
+        )
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--transport", choices=["asgi", "mangum"], default="asgi")
+    parser.add_argument("--backend", choices=["mock", "fake"], default="mock")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument(
+        "--alloc-requests", type=int, default=30, help="0 skips the pass"
+    )
+    parser.add_argument("--goals", type=Path, default=DEFAULT_GOALS)
+    parser.add_argument(
+        "--latency", default="lognormal:5.3,0.5", help="fake backend latency (ms)"
+    )
+    parser.add_argument("--tokens-per-second", type=float, default=None)
+    parser.add_argument(
+        "--sink-latency-ms",
+        type=float,
+        default=0,
+        help="DynamoDB/CloudWatch write round trip",
+    )
+    parser.add_argument("--output", type=Path, default=None)
+    parser.add_argument("--compare", nargs=2, type=Path, metavar=("BEFORE", "AFTER"))
+    args = parser.parse_args()
+
+    if args.compare:
+        before, after = (json.loads(path.read_text()) for path in args.compare)
+        print(json.dumps(compare(before, after), indent=2))
+        return
+
+    # the app logs every step at INFO: keep that cost in the measurement, not on the terminal
+    logging.basicConfig(
+        level=logging.INFO, format="%(message)s", stream=open(os.devnull, "w")
+    )
+
+    # settings are read at import, and the fake server module imports them, so
+    # pick its port and configure the environment before importing either
+    port = free_port()
+    configure_environment(args.backend, f"http://127.0.0.1:{port}")
+    if args.transport == "mangum":
+        # take the app's Lambda paths (spooled background work, the lifespan
+        # per invocation), with the spool in a fresh directory
+        os.environ.setdefault("AWS_LAMBDA_FUNCTION_NAME", "load-test")
+        os.environ.setdefault(
+            "BACKGROUND_SPOOL_DIR", tempfile.mkdtemp(prefix="load-test-spool-")
+        )
+
+    from devtools.fake_bedrock import FakeBedrockServer, parse_latency, synthetic_answer
+
+    server = FakeBedrockServer(
+        port=port,
+        response_fn=synthetic_answer,
+        tokens_per_second=args.tokens_per_second,
+        seed=1,
+        sink_latency_ms=args.sink_latency_ms,
+    )
+    server.latency_fn = parse_latency(args.latency, server.rng)
+    server.start()
+
+    from app.main import app, handler
+
+    instrument_stages()
+
+    goals = load_goals(args.goals)
+    payloads = [goals[i % len(goals)] for i in range(args.requests)]
+    warmup = [goals[i % len(goals)] for i in range(args.warmup)]
+
+    try:
+        if args.transport == "asgi":
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+
+            def run(batch, concurrency):
+                return loop.run_until_complete(run_asgi(app, batch, concurrency))
+
+        else:
+            asyncio.set_event_loop(asyncio.new_event_loop())
+
+            def run(batch, concurrency):
+                return run_mangum(handler, batch, concurrency)
+
+        run(warmup, args.concurrency)
+        start = time.perf_counter()
+        samples = run(payloads, args.concurrency)
+        elapsed = time.perf_counter() - start
+
+        allocations = None
+        if args.alloc_requests:
+            allocations = measure_allocations(
+                lambda payload: run([payload], 1), payloads[: args.alloc_requests]
+            )
+    finally:
+        server.stop()
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.utcnow().isoformat(),
+            "python": platform.python_version(),
+            "transport": args.transport,
+            "backend": args.backend,
+            "concurrency": args.concurrency,
+            "goals_file": str(args.goals),
+            "fake_latency": args.latency if args.backend == "fake" else None,
+        },
+        "load": summarize(samples, elapsed),
+        "allocations": allocations,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
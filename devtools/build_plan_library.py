@@ -0,0 +1,78 @@
+"""
+Build the plan library index (app/services/plan_library.py) offline.
+
+Mines the most requested goals from the usage table, or reads them from a
+goals file (one per line, as benchmarks/goals.txt; lines with context are
+skipped), generates a plan for each through the same classification and
+planner the API uses, and writes the index: to a file with --output, which
+the API serves with PLAN_LIBRARY_PATH set to it (local runs), or with
+--publish to PLAN_LIBRARY_TABLE_NAME, which is what the scheduled refresh
+does in AWS.
+
+    python -m devtools.build_plan_library --days 30 --top 200 --publish
+    USE_MOCK_AWS=true python -m devtools.build_plan_library \
+        --goals benchmarks/goals.txt --output plan_library.bin
+"""
+import argparse
+import asyncio
+import json
+from pathlib import Path
+
+from app.config import settings
+from app.services import plan_library
+from app.services.deadline import Deadline
+
+
+def goals_from_file(path: Path):
+    goals = []
+    for line in path.read_text().splitlines():
+        line = line.strip()
+        if not line or line.startswith("#") or "|" in line:
+            continue
+        goals.append((plan_library.normalize_goal(line), line, 1))
+    return goals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the precomputed plan library")
+    parser.add_argument(
+        "--goals", type=Path, default=None, help="goals file instead of usage logs"
+    )
+    parser.add_argument("--days", type=int, default=settings.PLAN_LIBRARY_LOOKBACK_DAYS)
+    parser.add_argument("--top", type=int, default=settings.PLAN_LIBRARY_TOP_GOALS)
+    parser.add_argument(
+        "--min-requests", type=int, default=settings.PLAN_LIBRARY_MIN_REQUESTS
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=settings.PLAN_LIBRARY_CONCURRENCY
+    )
+    parser.add_argument("--output", default=None, help="write the index to this file")
+    parser.add_argument(
+        "--publish", action="store_true", help="write to the DynamoDB table"
+    )
+    parser.add_argument("--budget-seconds", type=float, default=3600)
+    args = parser.parse_args()
+    if (args.output is None) == (not args.publish):
+        parser.error("pass either --output PATH or --publish")
+
+    if args.goals is not None:
+        goals = goals_from_file(args.goals)
+    else:
+        records = plan_library.query_usage(args.days)
+        goals = plan_library.mine_goals(records, args.top, args.min_requests)
+
+    settings.PLAN_LIBRARY_CONCURRENCY = args.concurrency
+    if args.publish:
+        source = plan_library.DynamoSource(settings.PLAN_LIBRARY_TABLE_NAME)
+    else:
+        source = plan_library.FileSource(args.output)
+    stats = asyncio.run(
+        plan_library.refresh(
+            goals, source=source, deadline=Deadline(args.budget_seconds)
+        )
+    )
+    print(json.dumps(stats, indent=2))
+
+
+if __name__ == "__main__":
+    main()
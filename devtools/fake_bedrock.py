@@ -0,0 +1,495 @@
+"""
+Local stand-in for the bedrock-runtime API.
+
+Speaks the two calls the service makes:
+
+- `POST /model/{modelId}/invoke` returns a Claude-shaped JSON body
+- `POST /model/{modelId}/invoke-with-response-stream` returns the same
+  answer as an `application/vnd.amazon.eventstream` of Anthropic stream
+  events, paced at the configured token rate
+
+Behaviour is configurable so the real networked code path can be load
+tested without AWS:
+
+- latency: a constant, or a distribution spec such as `lognormal:6.2,0.4`
+  (time to first token, ms)
+- token rate: output tokens per second after the first token
+- throttling: requests above `throttle_rps` get the 429 ThrottlingException
+  Bedrock returns when the account quota is exceeded
+- answers: a fixed text, or with `--synthetic` a plan sized from the
+  goal in the prompt (app/services/synthetic_plans.py)
+- truncation: with probability `truncate_rate` (and whenever the answer
+  exceeds the request's max_tokens) the text is cut short and
+  stop_reason is "max_tokens"
+
+Accepted TCP connections are counted, so benchmarks can see how often the
+client had to open (and handshake) a new connection. DynamoDB and
+CloudWatch writes sent here (AWS_ENDPOINT_URL_DYNAMODB /
+AWS_ENDPOINT_URL_CLOUDWATCH) are accepted and dropped, so a fully
+non-mock service can run without AWS.
+
+    python -m devtools.fake_bedrock --port 8787 --latency lognormal:6.2,0.4 \\
+        --tokens-per-second 80 --throttle-rps 20 --truncate-rate 0.02 --synthetic
+
+Point the service at it with BEDROCK_ENDPOINT_URL=http://127.0.0.1:8787
+(and any dummy AWS credentials).
+"""
+import argparse
+import base64
+import binascii
+import json
+import random
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, List, Optional
+
+from app.services.synthetic_plans import (
+    generate_plan_text,
+    generate_weeks_text,
+    goal_from_prompt,
+    revision_from_prompt,
+)
+
+
+DEFAULT_TEXT = '{"estimated_duration_weeks": 1, "weekly_breakdown": [], "total_estimated_hours": 1}'
+
+# characters per token, the same rule of thumb as app/services/cost_guard.py
+CHARS_PER_TOKEN = 4
+
+
+def count_tokens(text: str) -> int:
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def synthetic_answer(request: dict) -> str:
+    """
+    A realistic plan for planner prompts, the requested weeks for revision
+    prompts, a category for classifier prompts.
+    """
+    revision = revision_from_prompt(request.get("messages", []))
+    if revision is not None:
+        goal, week_numbers, weeks = revision
+        return generate_weeks_text(goal, "skill-learning", week_numbers, weeks, seed=1)
+    plan_goal = goal_from_prompt(request.get("messages", []))
+    if plan_goal is None:
+        return "skill-learning"
+    return generate_plan_text(plan_goal, "skill-learning")
+
+
+def parse_latency(spec: str, rng: random.Random) -> Callable[[], float]:
+    """
+    Build a latency sampler (ms) from a spec:
+
+        50                  constant
+        uniform:20,200      uniform between the bounds
+        normal:300,50       mean, stddev (clipped at 0)
+        lognormal:6.2,0.4   mu, sigma of the underlying normal (median e^mu)
+        pareto:100,2.5      scale, shape: heavy tail above `scale`
+    """
+    kind, _, args = spec.partition(":")
+    if not args:
+        value = float(kind)
+        return lambda: value
+    params = [float(p) for p in args.split(",")]
+    if kind == "uniform":
+        return lambda: rng.uniform(*params)
+    if kind == "normal":
+        return lambda: max(0.0, rng.gauss(*params))
+    if kind == "lognormal":
+        return lambda: rng.lognormvariate(*params)
+    if kind == "pareto":
+        scale, shape = params
+        return lambda: scale * rng.paretovariate(shape)
+    raise ValueError(f"Unknown latency distribution '{kind}'")
+
+
+def encode_event(headers: dict, payload: bytes) -> bytes:
+    """Encode one message in the AWS event stream binary format."""
+    encoded_headers = b""
+    for name, value in headers.items():
+        name_bytes, value_bytes = name.encode(), value.encode()
+        # header value type 7 is a string
+        encoded_headers += (
+            struct.pack("B", len(name_bytes))
+            + name_bytes
+            + struct.pack("!BH", 7, len(value_bytes))
+            + value_bytes
+        )
+    total_length = 12 + len(encoded_headers) + len(payload) + 4
+    prelude = struct.pack("!II", total_length, len(encoded_headers))
+    prelude += struct.pack("!I", binascii.crc32(prelude) & 0xFFFFFFFF)
+    message = prelude + encoded_headers + payload
+    return message + struct.pack("!I", binascii.crc32(message) & 0xFFFFFFFF)
+
+
+def chunk_event(event: dict) -> bytes:
+    payload = json.dumps(
+        {"bytes": base64.b64encode(json.dumps(event).encode()).decode()}
+    )
+    return encode_event(
+        {
+            ":event-type": "chunk",
+            ":content-type": "application/json",
+            ":message-type": "event",
+        },
+        payload.encode(),
+    )
+
+
+class FakeBedrockHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 so clients can keep the connection alive between calls
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    server: "FakeBedrockServer"
+
+    def setup(self):
+        super().setup()
+        self.server.record_connection()
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        raw = self.rfile.read(length)
+
+        if self.headers.get("X-Amz-Target") or self.path == "/":
+            self._sink()
+            return
+
+        parts = self.path.strip("/").split("/")
+        if (
+            len(parts) != 3
+            or parts[0] != "model"
+            or parts[2] not in ("invoke", "invoke-with-response-stream")
+        ):
+            self._send_json(404, {"message": f"Unknown operation {self.path}"})
+            return
+
+        self.server.record_request()
+        if not self.server.take_token():
+            self._send_json(
+                429,
+                {"message": "Too many requests, please wait before trying again."},
+                error_type="ThrottlingException",
+            )
+            return
+
+        try:
+            request = json.loads(raw or b"{}")
+        except ValueError:
+            self._send_json(
+                400, {"message": "Malformed input request"}, "ValidationException"
+            )
+            return
+
+        text, stop_reason = self.server.answer(request)
+        input_tokens = count_tokens(raw.decode(errors="ignore"))
+        if parts[2] == "invoke":
+            self._invoke(text, stop_reason, input_tokens)
+        else:
+            self._invoke_stream(text, stop_reason, input_tokens)
+
+    def _sink(self):
+        """Accept DynamoDB (JSON protocol) and CloudWatch (query protocol) writes."""
+        if self.server.sink_latency_ms:
+            time.sleep(self.server.sink_latency_ms / 1000)
+        self.server.record_sunk()
+        if self.headers.get("X-Amz-Target"):
+            self._send_json(200, {})
+            return
+        payload = (
+            '<PutMetricDataResponse xmlns="http://monitoring.amazonaws.com/doc/2010-08-01/">'
+            "<ResponseMetadata><RequestId>fake</RequestId></ResponseMetadata>"
+            "</PutMetricDataResponse>"
+        ).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/xml")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _invoke(self, text: str, stop_reason: str, input_tokens: int):
+        output_tokens = count_tokens(text)
+        delay_ms = self.server.next_latency_ms() + self.server.generation_ms(
+            output_tokens
+        )
+        if delay_ms:
+            time.sleep(delay_ms / 1000)
+
+        self._send_json(
+            200,
+            {
+                "id": "msg_fake",
+                "type": "message",
+                "role": "assistant",
+                "model": "fake",
+                "content": [{"type": "text", "text": text}],
+                "stop_reason": stop_reason,
+                "stop_sequence": None,
+                "usage": {"input_tokens": input_tokens, "output_tokens": output_tokens},
+            },
+        )
+
+    def _invoke_stream(self, text: str, stop_reason: str, input_tokens: int):
+        start = time.perf_counter()
+        first_token_ms = self.server.next_latency_ms()
+        if first_token_ms:
+            time.sleep(first_token_ms / 1000)
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/vnd.amazon.eventstream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.send_header("x-amzn-bedrock-content-type", "application/json")
+        self.end_headers()
+
+        pieces = self.server.split_output(text)
+        events: List[dict] = [
+            {
+                "type": "message_start",
+                "message": {
+                    "id": "msg_fake",
+                    "type": "message",
+                    "role": "assistant",
+                    "model": "fake",
+                    "content": [],
+                    "stop_reason": None,
+                    "usage": {"input_tokens": input_tokens, "output_tokens": 0},
+                },
+            },
+            {
+                "type": "content_block_start",
+                "index": 0,
+                "content_block": {"type": "text", "text": ""},
+            },
+        ]
+        try:
+            self._write_chunk(b"".join(chunk_event(event) for event in events))
+            for piece in pieces:
+                pause_ms = self.server.generation_ms(count_tokens(piece))
+                if pause_ms:
+                    time.sleep(pause_ms / 1000)
+                self._write_chunk(
+                    chunk_event(
+                        {
+                            "type": "content_block_delta",
+                            "index": 0,
+                            "delta": {"type": "text_delta", "text": piece},
+                        }
+                    )
+                )
+
+            output_tokens = count_tokens(text)
+            tail: List[dict] = [
+                {"type": "content_block_stop", "index": 0},
+                {
+                    "type": "message_delta",
+                    "delta": {"stop_reason": stop_reason, "stop_sequence": None},
+                    "usage": {"output_tokens": output_tokens},
+                },
+                {
+                    "type": "message_stop",
+                    "amazon-bedrock-invocationMetrics": {
+                        "inputTokenCount": input_tokens,
+                        "outputTokenCount": output_tokens,
+                        "invocationLatency": int((time.perf_counter() - start) * 1000),
+                        "firstByteLatency": int(first_token_ms),
+                    },
+                },
+            ]
+            self._write_chunk(b"".join(chunk_event(event) for event in tail))
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # the client stopped reading; generation stops with it
+            self.server.record_abort()
+            self.close_connection = True
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def _send_json(self, status: int, body: dict, error_type: Optional[str] = None):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        if error_type:
+            self.send_header("x-amzn-ErrorType", error_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+class FakeBedrockServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # the socketserver default backlog of 5 drops SYNs under bursty load
+    request_queue_size = 256
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency_ms: float = 0,
+        response_text: str = DEFAULT_TEXT,
+        latency_fn: Optional[Callable[[], float]] = None,
+        throttle_rps: Optional[float] = None,
+        tokens_per_second: Optional[float] = None,
+        truncate_rate: float = 0.0,
+        response_fn: Optional[Callable[[dict], str]] = None,
+        seed: Optional[int] = None,
+        sink_latency_ms: float = 0,
+    ):
+        super().__init__((host, port), FakeBedrockHandler)
+        self.rng = random.Random(seed)
+        self.latency_ms = latency_ms
+        # injected latency distribution, e.g. parse_latency("lognormal:6.2,0.4", rng)
+        self.latency_fn = latency_fn
+        self.response_text = response_text
+        # builds the answer text from the request body, e.g. a synthetic plan
+        self.response_fn = response_fn
+        self.tokens_per_second = tokens_per_second
+        self.truncate_rate = truncate_rate
+        # round trip of a DynamoDB or CloudWatch write
+        self.sink_latency_ms = sink_latency_ms
+        # token bucket holding one second of burst
+        self.throttle_rps = throttle_rps
+        self._tokens = throttle_rps or 0.0
+        self._refilled_at = time.monotonic()
+        self.connections = 0
+        self.requests = 0
+        self.throttled = 0
+        self.truncated = 0
+        self.aborted = 0
+        self.sunk = 0
+        self._counter_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def endpoint_url(self) -> str:
+        host, port = self.server_address[:2]
+        assert isinstance(host, str)  # AF_INET
+        return f"http://{host}:{port}"
+
+    def next_latency_ms(self) -> float:
+        with self._counter_lock:
+            return self.latency_fn() if self.latency_fn else self.latency_ms
+
+    def generation_ms(self, output_tokens: int) -> float:
+        if not self.tokens_per_second:
+            return 0.0
+        return output_tokens / self.tokens_per_second * 1000
+
+    def answer(self, request: dict):
+        """Answer text and stop reason for a request, truncated when configured."""
+        text = self.response_fn(request) if self.response_fn else self.response_text
+        max_chars = request.get("max_tokens", 4096) * CHARS_PER_TOKEN
+        with self._counter_lock:
+            cut_short = self.truncate_rate and self.rng.random() < self.truncate_rate
+            if cut_short:
+                max_chars = min(max_chars, int(len(text) * self.rng.uniform(0.2, 0.9)))
+            if len(text) > max_chars:
+                self.truncated += 1
+                return text[:max_chars], "max_tokens"
+        return text, "end_turn"
+
+    def split_output(self, text: str, tokens_per_chunk: int = 8) -> List[str]:
+        size = tokens_per_chunk * CHARS_PER_TOKEN
+        return [text[i : i + size] for i in range(0, len(text), size)] or [""]
+
+    def record_connection(self):
+        with self._counter_lock:
+            self.connections += 1
+
+    def record_request(self):
+        with self._counter_lock:
+            self.requests += 1
+
+    def record_sunk(self):
+        with self._counter_lock:
+            self.sunk += 1
+
+    def record_abort(self):
+        with self._counter_lock:
+            self.aborted += 1
+
+    def take_token(self) -> bool:
+        if not self.throttle_rps:
+            return True
+        with self._counter_lock:
+            now = time.monotonic()
+            elapsed = now - self._refilled_at
+            self._tokens = min(
+                self.throttle_rps, self._tokens + elapsed * self.throttle_rps
+            )
+            self._refilled_at = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            self.throttled += 1
+            return False
+
+    def reset_counters(self):
+        with self._counter_lock:
+            self.connections = 0
+            self.requests = 0
+            self.throttled = 0
+            self.truncated = 0
+            self.aborted = 0
+            self.sunk = 0
+
+    def start(self) -> "FakeBedrockServer":
+        """Serve from a daemon thread and return self."""
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local bedrock-runtime stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument(
+        "--latency", default=None, help="distribution spec, e.g. lognormal:6.2,0.4"
+    )
+    parser.add_argument("--tokens-per-second", type=float, default=None)
+    parser.add_argument("--throttle-rps", type=float, default=None)
+    parser.add_argument("--truncate-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--sink-latency-ms", type=float, default=0)
+    parser.add_argument(
+        "--synthetic",
+        action="store_true",
+        help="answer planner prompts with synthetic plans",
+    )
+    args = parser.parse_args()
+
+    server = FakeBedrockServer(
+        args.host,
+        args.port,
+        latency_ms=args.latency_ms,
+        throttle_rps=args.throttle_rps,
+        tokens_per_second=args.tokens_per_second,
+        truncate_rate=args.truncate_rate,
+        seed=args.seed,
+        sink_latency_ms=args.sink_latency_ms,
+        response_fn=synthetic_answer if args.synthetic else None,
+    )
+    if args.latency:
+        server.latency_fn = parse_latency(args.latency, server.rng)
+    print(f"Fake bedrock-runtime listening on {server.endpoint_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Merge request profiles from the logs into one flame-graph input.
+
+Reads log lines (CloudWatch Logs exports, `aws logs tail` output or local
+stdout) from files or stdin, picks out the `profile` events written by
+app/services/profiling.py and sums their collapsed stacks. The output is
+the folded format that flamegraph.pl, speedscope and inferno all read:
+
+    app.router:generate_plan_endpoint;app.services.planner:parse_plan 12
+
+    aws logs tail /aws/lambda/ai-router --since 1h > profiles.log
+    python -m devtools.profile_aggregate profiles.log -o plan.folded
+    flamegraph.pl plan.folded > plan.svg
+
+Samples are weighted by the profile's interval, so profiles taken at
+different rates add up in milliseconds.
+"""
+import argparse
+import json
+import sys
+from collections import Counter
+from typing import Iterable, Iterator, Optional, TextIO
+
+
+def profile_events(lines: Iterable[str]) -> Iterator[dict]:
+    for line in lines:
+        # exports prefix the message with a timestamp and request id
+        start = line.find("{")
+        if start == -1 or '"profile"' not in line:
+            continue
+        try:
+            event = json.loads(line[start:])
+        except json.JSONDecodeError:
+            continue
+        if event.get("event_type") == "profile":
+            yield event
+
+
+def aggregate(
+    events: Iterable[dict],
+    request_id: Optional[str] = None,
+    min_duration_ms: float = 0,
+    per_request: bool = False,
+) -> Counter:
+    """Collapsed stack -> milliseconds, across every matching profile."""
+    totals: Counter = Counter()
+    for event in events:
+        if request_id and event.get("request_id") != request_id:
+            continue
+        if event.get("duration_ms", 0) < min_duration_ms:
+            continue
+        interval = event.get("interval_ms", 1)
+        # a root frame per request keeps their stacks apart in the graph
+        prefix = f"request {event.get('request_id')};" if per_request else ""
+        for stack, count in event.get("stacks", {}).items():
+            totals[prefix + stack] += count * interval
+    return totals
+
+
+def write_folded(totals: Counter, out: TextIO) -> None:
+    for stack, weight in sorted(totals.items()):
+        out.write(f"{stack} {round(weight)}\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Merge profile log events into a folded-stacks file"
+    )
+    parser.add_argument("logs", nargs="*", help="log files (default: stdin)")
+    parser.add_argument("-o", "--output", help="folded stacks file (default: stdout)")
+    parser.add_argument("--request-id", help="only this request")
+    parser.add_argument(
+        "--min-duration-ms", type=float, default=0, help="skip faster requests"
+    )
+    parser.add_argument(
+        "--per-request", action="store_true", help="one root frame per request"
+    )
+    args = parser.parse_args()
+
+    def lines():
+        if not args.logs:
+            yield from sys.stdin
+        for path in args.logs:
+            with open(path, errors="replace") as f:
+                yield from f
+
+    events = list(profile_events(lines()))
+    totals = aggregate(events, args.request_id, args.min_duration_ms, args.per_request)
+    if args.output:
+        with open(args.output, "w") as out:
+            write_folded(totals, out)
+    else:
+        write_folded(totals, sys.stdout)
+    print(
+        f"{len(events)} profiles, {len(totals)} stacks, {round(sum(totals.values()))} ms",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
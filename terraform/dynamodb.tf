@@ -42,4 +42,108 @@ resource "aws_dynamodb_table" "usage_logs" {
     Environment = var.environment
     ManagedBy   = "Terraform"
   }
-}
\ No newline at end of file
+}
+
+# DynamoDB table for asynchronous plan jobs (status and result, polled by clients)
+resource "aws_dynamodb_table" "plan_jobs" {
+  name         = "${var.project_name}-plan-jobs-${var.environment}"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "job_id"
+
+  attribute {
+    name = "job_id"
+    type = "S"
+  }
+
+  # finished jobs are deleted after JOBS_TTL_SECONDS
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+
+  tags = {
+    Name        = "${var.project_name}-plan-jobs"
+    Environment = var.environment
+    ManagedBy   = "Terraform"
+  }
+}
+
+# DynamoDB table for Idempotency-Key records (in-progress markers and recorded responses)
+resource "aws_dynamodb_table" "idempotency" {
+  name         = "${var.project_name}-idempotency-${var.environment}"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "idempotency_key"
+
+  attribute {
+    name = "idempotency_key"
+    type = "S"
+  }
+
+  # records are deleted after IDEMPOTENCY_TTL_SECONDS
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+
+  tags = {
+    Name        = "${var.project_name}-idempotency"
+    Environment = var.environment
+    ManagedBy   = "Terraform"
+  }
+}
+
+# DynamoDB table for generated plans, zlib-compressed, served by GET /api/v1/plans/{request_id}
+resource "aws_dynamodb_table" "plans" {
+  name         = "${var.project_name}-plans-${var.environment}"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "request_id"
+
+  attribute {
+    name = "request_id"
+    type = "S"
+  }
+
+  # plans are deleted after PLANS_TTL_SECONDS
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+
+  tags = {
+    Name        = "${var.project_name}-plans"
+    Environment = var.environment
+    ManagedBy   = "Terraform"
+  }
+}
+
+# Hourly and daily usage rollups per category, served by GET /api/v1/usage/summary.
+# Hours are partitioned by day and days by month ("hour#2026-10-19", "day#2026-10"),
+# sorted by "<bucket>#<category>", so a summary is one Query per day or month
+resource "aws_dynamodb_table" "usage_rollups" {
+  name         = "${var.project_name}-usage-rollups-${var.environment}"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "period"
+  range_key    = "bucket"
+
+  attribute {
+    name = "period"
+    type = "S"
+  }
+
+  attribute {
+    name = "bucket"
+    type = "S"
+  }
+
+  # rollups are deleted after USAGE_ROLLUPS_TTL_DAYS
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+
+  tags = {
+    Name        = "${var.project_name}-usage-rollups"
+    Environment = var.environment
+    ManagedBy   = "Terraform"
+  }
+}
@@ -1,3 +1,20 @@
+# Environment shared by the API and plan-job worker functions
+locals {
+  lambda_environment = {
+    USE_MOCK_AWS             = "false"
+    APP_AWS_REGION           = var.aws_region
+    BEDROCK_REGION           = "us-east-1"
+    BEDROCK_SECONDARY_REGION = var.bedrock_secondary_region
+    DYNAMODB_TABLE_NAME      = aws_dynamodb_table.usage_logs.name
+    JOBS_QUEUE_URL           = aws_sqs_queue.plan_jobs.url
+    JOBS_TABLE_NAME          = aws_dynamodb_table.plan_jobs.name
+    IDEMPOTENCY_TABLE_NAME   = aws_dynamodb_table.idempotency.name
+    PLANS_TABLE_NAME         = aws_dynamodb_table.plans.name
+    PLAN_LIBRARY_TABLE_NAME  = aws_dynamodb_table.plan_library.name
+    USAGE_ROLLUPS_TABLE_NAME = aws_dynamodb_table.usage_rollups.name
+  }
+}
+
 # Lambda function
 resource "aws_lambda_function" "api" {
   filename         = var.lambda_zip_path
@@ -12,12 +29,7 @@ resource "aws_lambda_function" "api" {
 
   # Environment variables
   environment {
-    variables = {
-      USE_MOCK_AWS = "false"
-      APP_AWS_REGION = var.aws_region
-      BEDROCK_REGION = "us-east-1"
-      DYNAMODB_TABLE_NAME = aws_dynamodb_table.usage_logs.name
-    }
+    variables = local.lambda_environment
   }
 
   # Tags
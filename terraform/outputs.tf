@@ -26,4 +26,15 @@ output "lambda_log_group" {
 output "api_log_group" {
   description = "CloudWatch log group for API Gateway"
   value       = aws_cloudwatch_log_group.api_logs.name
-}
\ No newline at end of file
+}
+
+# Output the plan-jobs queue and its dead-letter queue
+output "plan_jobs_queue_url" {
+  description = "SQS queue URL for plan jobs"
+  value       = aws_sqs_queue.plan_jobs.url
+}
+
+output "plan_jobs_dlq_url" {
+  description = "Dead-letter queue for plan jobs that kept failing"
+  value       = aws_sqs_queue.plan_jobs_dlq.url
+}
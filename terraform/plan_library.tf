@@ -0,0 +1,53 @@
+# Precomputed plans for the most requested goals (app/services/plan_library.py).
+# The index is stored in versioned parts; the "current" item points at the
+# version requests read
+resource "aws_dynamodb_table" "plan_library" {
+  name         = "${var.project_name}-plan-library-${var.environment}"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "version"
+  range_key    = "part"
+
+  attribute {
+    name = "version"
+    type = "S"
+  }
+
+  attribute {
+    name = "part"
+    type = "N"
+  }
+
+  # superseded versions expire a week after they were written
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+
+  tags = {
+    Name        = "${var.project_name}-plan-library"
+    Environment = var.environment
+    ManagedBy   = "Terraform"
+  }
+}
+
+# The refresh mines the usage logs and regenerates stale plans on the job
+# worker, which app.main.handler routes {"plan_library": "refresh"} to
+resource "aws_cloudwatch_event_rule" "plan_library_refresh" {
+  name                = "${var.project_name}-plan-library-refresh-${var.environment}"
+  description         = "Rebuild the precomputed plan library"
+  schedule_expression = var.plan_library_schedule
+}
+
+resource "aws_cloudwatch_event_target" "plan_library_refresh" {
+  rule  = aws_cloudwatch_event_rule.plan_library_refresh.name
+  arn   = aws_lambda_function.jobs_worker.arn
+  input = jsonencode({ plan_library = "refresh" })
+}
+
+resource "aws_lambda_permission" "plan_library_refresh" {
+  statement_id  = "AllowPlanLibraryRefresh"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.jobs_worker.function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.plan_library_refresh.arn
+}
@@ -0,0 +1,79 @@
+# Queue for asynchronous plan jobs (POST /api/v1/plan-jobs)
+resource "aws_sqs_queue" "plan_jobs_dlq" {
+  name                      = "${var.project_name}-plan-jobs-dlq-${var.environment}"
+  message_retention_seconds = 1209600 # 14 days, to inspect and redrive
+
+  tags = {
+    Name        = "${var.project_name}-plan-jobs-dlq"
+    Environment = var.environment
+    ManagedBy   = "Terraform"
+  }
+}
+
+resource "aws_sqs_queue" "plan_jobs" {
+  name = "${var.project_name}-plan-jobs-${var.environment}"
+  # AWS recommends six times the consumer's timeout, so a slow attempt is
+  # not redelivered to a second worker while it is still running; a failed
+  # attempt shortens it (JOBS_RETRY_DELAY_SECONDS, doubling per receive)
+  visibility_timeout_seconds = var.lambda_timeout * 6
+  message_retention_seconds  = 86400
+
+  redrive_policy = jsonencode({
+    deadLetterTargetArn = aws_sqs_queue.plan_jobs_dlq.arn
+    maxReceiveCount     = var.jobs_max_receive_count
+  })
+
+  tags = {
+    Name        = "${var.project_name}-plan-jobs"
+    Environment = var.environment
+    ManagedBy   = "Terraform"
+  }
+}
+
+# Worker: same package and handler as the API (app.main.handler routes SQS
+# events to app/services/plan_jobs.py), scaled separately from it
+resource "aws_lambda_function" "jobs_worker" {
+  filename         = var.lambda_zip_path
+  function_name    = "${var.project_name}-jobs-worker-${var.environment}"
+  role             = aws_iam_role.lambda_role.arn
+  handler          = "app.main.handler"
+  source_code_hash = filebase64sha256(var.lambda_zip_path)
+  runtime          = "python3.12"
+  architectures    = ["x86_64"]
+  timeout          = var.lambda_timeout
+  memory_size      = var.lambda_memory
+
+  environment {
+    variables = merge(local.lambda_environment, {
+      JOBS_MAX_ATTEMPTS = tostring(var.jobs_max_receive_count)
+    })
+  }
+
+  tags = {
+    Name        = "${var.project_name}-jobs-worker"
+    Environment = var.environment
+    ManagedBy   = "Terraform"
+  }
+}
+
+resource "aws_lambda_event_source_mapping" "plan_jobs" {
+  event_source_arn        = aws_sqs_queue.plan_jobs.arn
+  function_name           = aws_lambda_function.jobs_worker.arn
+  batch_size              = 1 # one plan per invocation, so each gets the whole timeout
+  function_response_types = ["ReportBatchItemFailures"]
+
+  scaling_config {
+    maximum_concurrency = var.jobs_worker_concurrency
+  }
+}
+
+resource "aws_cloudwatch_log_group" "jobs_worker_logs" {
+  name              = "/aws/lambda/${aws_lambda_function.jobs_worker.function_name}"
+  retention_in_days = 7
+
+  tags = {
+    Name        = "${var.project_name}-jobs-worker-logs"
+    Environment = var.environment
+    ManagedBy   = "Terraform"
+  }
+}
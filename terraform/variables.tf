@@ -12,6 +12,13 @@ variable "aws_region" {
   default     = "ap-southeast-2"
 }
 
+# Secondary Bedrock region for hedged requests (empty disables hedging)
+variable "bedrock_secondary_region" {
+  description = "Bedrock region used for hedged requests"
+  type        = string
+  default     = ""
+}
+
 # Environment (dev, staging, prod)
 variable "environment" {
   description = "Environment name"
@@ -37,4 +44,23 @@ variable "lambda_zip_path" {
   description = "Path to Lambda deployment zip"
   type        = string
   default     = "../lambda-deployment.zip"
-}
\ No newline at end of file
+}
+
+# Plan-job workers
+variable "jobs_worker_concurrency" {
+  description = "Maximum concurrent plan-job worker invocations"
+  type        = number
+  default     = 10
+}
+
+variable "jobs_max_receive_count" {
+  description = "Deliveries of a plan-job message before it moves to the dead-letter queue"
+  type        = number
+  default     = 3
+}
+
+variable "plan_library_schedule" {
+  description = "How often the precomputed plan library is rebuilt"
+  type        = string
+  default     = "rate(1 day)"
+}
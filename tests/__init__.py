@@ -0,0 +1,7 @@
+import os
+
+# the local stubs do not check signatures, but botocore still needs credentials;
+# set here, the first test code imported, so they are in place before any
+# client is created
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
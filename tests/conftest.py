@@ -0,0 +1,110 @@
+import pytest
+
+import app.main  # noqa: F401  registers every background job before the fixtures stub them
+from app.config import settings
+from app.services import background, bedrock
+from app.services.aws import get_client
+from app.services.bedrock import BedrockInvoker
+from devtools.fake_bedrock import FakeBedrockServer
+
+MODEL_ID = "anthropic.claude-3-haiku-20240307-v1:0"
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers", "real_metrics: run the request_metrics job instead of the no-op stub"
+    )
+
+
+@pytest.fixture(autouse=True)
+def no_request_metrics(request, monkeypatch):
+    """
+    The CloudWatch client is created at import and there is no network here,
+    so the request_metrics job is a no-op unless a test is marked real_metrics.
+    """
+    if request.node.get_closest_marker("real_metrics") is None:
+        monkeypatch.setitem(
+            background._handlers, "request_metrics", lambda **fields: None
+        )
+
+
+@pytest.fixture
+def model_id():
+    return MODEL_ID
+
+
+@pytest.fixture
+def bedrock_body():
+    """A minimal InvokeModel body."""
+    return {
+        "anthropic_version": "bedrock-2023-05-31",
+        "max_tokens": 50,
+        "messages": [{"role": "user", "content": "ping"}],
+    }
+
+
+@pytest.fixture
+def fake_bedrock():
+    """Start a FakeBedrockServer with the given options; every one started is stopped after the test."""
+    servers = []
+
+    def start(**options) -> FakeBedrockServer:
+        server = FakeBedrockServer(**options).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.stop()
+
+
+@pytest.fixture
+def make_invoker():
+    """A BedrockInvoker on fake servers: the primary in us-east-1, an optional secondary in us-west-2."""
+
+    def make(primary, secondary=None, **options) -> BedrockInvoker:
+        return BedrockInvoker(
+            primary_client=get_client(
+                "bedrock-runtime", "us-east-1", endpoint_url=primary.endpoint_url
+            ),
+            primary_region="us-east-1",
+            secondary_client=get_client(
+                "bedrock-runtime", "us-west-2", endpoint_url=secondary.endpoint_url
+            )
+            if secondary is not None
+            else None,
+            secondary_region="us-west-2" if secondary is not None else None,
+            **options,
+        )
+
+    return make
+
+
+@pytest.fixture
+def app_bedrock(monkeypatch, fake_bedrock):
+    """
+    Point the app's Bedrock calls (classification and generation) at a fake
+    server started with the given options, with mock mode and the shared
+    cache off. Returns the server.
+    """
+
+    def use(
+        streaming: bool = settings.BEDROCK_STREAMING, **options
+    ) -> FakeBedrockServer:
+        server = fake_bedrock(**options)
+        invoker = BedrockInvoker(
+            get_client(
+                "bedrock-runtime",
+                settings.BEDROCK_REGION,
+                endpoint_url=server.endpoint_url,
+            ),
+            settings.BEDROCK_REGION,
+            streaming=streaming,
+        )
+        for region in {settings.BEDROCK_REGION, settings.AWS_REGION}:
+            monkeypatch.setitem(bedrock._invokers, region, invoker)
+        monkeypatch.setattr(settings, "USE_MOCK_AWS", False)
+        monkeypatch.setattr(settings, "SHARED_CACHE_ENABLED", False)
+        return server
+
+    return use
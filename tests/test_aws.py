@@ -0,0 +1,60 @@
+import threading
+
+from app.config import settings
+from app.services import aws
+from app.services.aws import build_config, get_client, get_resource
+
+
+def test_clients_are_cached_per_service_region_and_endpoint(monkeypatch):
+    monkeypatch.setattr(aws, "_clients", {})
+    monkeypatch.setattr(aws, "_resources", {})
+
+    client = get_client("dynamodb", "us-east-1")
+    assert get_client("dynamodb", "us-east-1") is client
+    # no region means the configured one
+    assert get_client("dynamodb") is get_client("dynamodb", settings.AWS_REGION)
+    assert get_client("dynamodb", "us-west-2") is not client
+    assert (
+        get_client("dynamodb", "us-east-1", endpoint_url="http://127.0.0.1:1")
+        is not client
+    )
+    assert get_client("cloudwatch", "us-east-1") is not client
+
+    resource = get_resource("dynamodb", "us-east-1")
+    assert get_resource("dynamodb", "us-east-1") is resource
+
+    # concurrent first calls still build one client
+    clients = []
+    threads = [
+        threading.Thread(target=lambda: clients.append(get_client("sqs", "eu-west-1")))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len({id(c) for c in clients}) == 1
+
+
+def test_bedrock_config_leaves_throttle_retries_to_the_limiter(monkeypatch):
+    monkeypatch.setattr(aws, "_clients", {})
+    bedrock = build_config("bedrock-runtime")
+    assert bedrock.retries == {"mode": "standard", "total_max_attempts": 1}
+    assert bedrock.read_timeout == settings.BEDROCK_READ_TIMEOUT
+    assert bedrock.max_pool_connections == settings.AWS_MAX_POOL_CONNECTIONS
+    assert bedrock.tcp_keepalive
+
+    dynamodb = build_config("dynamodb")
+    assert dynamodb.retries == {
+        "mode": "adaptive",
+        "max_attempts": settings.AWS_MAX_ATTEMPTS,
+    }
+    assert dynamodb.read_timeout == settings.AWS_READ_TIMEOUT
+    assert dynamodb.max_pool_connections == settings.AWS_MAX_POOL_CONNECTIONS
+
+    # and the client really carries it
+    client = get_client(
+        "bedrock-runtime", "us-east-1", endpoint_url="http://127.0.0.1:1"
+    )
+    assert client.meta.config.max_pool_connections == settings.AWS_MAX_POOL_CONNECTIONS
+    assert client.meta.config.retries["total_max_attempts"] == 1
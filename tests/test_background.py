@@ -0,0 +1,256 @@
+import asyncio
+import json
+import os
+import signal
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import httpx
+import pytest
+
+from app.config import settings
+from app.services import background
+from app.services.aws import get_client
+from app.services.background import BackgroundWorker, handler
+from app.services.metrics import metrics
+from devtools.fake_bedrock import synthetic_answer
+
+written = []
+
+
+@handler("test_record")
+def write_record(value, delay=0.0):
+    time.sleep(delay)
+    written.append(value)
+
+
+def test_submit_returns_before_the_job_runs():
+    written.clear()
+    worker = BackgroundWorker().start()
+    start = time.perf_counter()
+    worker.submit("test_record", value="a", delay=0.2)
+    assert time.perf_counter() - start < 0.05
+    assert written == []
+
+    assert worker.drain(timeout=2)
+    assert written == ["a"]
+
+
+def test_spooled_jobs_survive_a_runtime_restart(tmp_path):
+    written.clear()
+    # queued but never run: the environment froze, then the runtime restarted
+    frozen = BackgroundWorker(spool_dir=str(tmp_path))
+    frozen.submit("test_record", value="b")
+    assert len(os.listdir(tmp_path)) == 1
+
+    restarted = BackgroundWorker(spool_dir=str(tmp_path)).start()
+    assert restarted.drain(timeout=2)
+    assert written == ["b"]
+    assert os.listdir(tmp_path) == []
+
+
+def test_failed_jobs_are_retried_until_written(tmp_path):
+    attempts = []
+
+    @handler("test_flaky")
+    def flaky(value):
+        attempts.append(value)
+        if len(attempts) < 3:
+            raise ConnectionError("connection reset after thaw")
+
+    worker = BackgroundWorker(spool_dir=str(tmp_path), retry_delay=0.01).start()
+    worker.submit("test_flaky", value="c")
+    assert worker.drain(timeout=2)
+    assert attempts == ["c", "c", "c"]
+    assert worker.completed == 1 and worker.dropped == 0
+    assert os.listdir(tmp_path) == []
+
+
+def test_a_job_waiting_for_its_retry_does_not_block_the_queue():
+    written.clear()
+
+    @handler("test_down")
+    def down():
+        raise ConnectionError("still unreachable")
+
+    worker = BackgroundWorker(max_attempts=2, retry_delay=1.0).start()
+    worker.submit("test_down")
+    start = time.perf_counter()
+    worker.submit("test_record", value="d")
+    while written != ["d"] and time.perf_counter() - start < 2:
+        time.sleep(0.005)
+    assert written == ["d"] and time.perf_counter() - start < 0.5
+    # the failed job is still pending until its retry has run
+    assert worker.pending() == 1
+    assert worker.drain(timeout=3)
+    assert worker.dropped == 1
+
+
+def health_event() -> dict:
+    """An API Gateway v2 event for GET /health, as Mangum receives it."""
+    return {
+        "version": "2.0",
+        "routeKey": "$default",
+        "rawPath": "/health",
+        "rawQueryString": "",
+        "headers": {"host": "test.execute-api.us-east-1.amazonaws.com"},
+        "requestContext": {
+            "http": {
+                "method": "GET",
+                "path": "/health",
+                "protocol": "HTTP/1.1",
+                "sourceIp": "127.0.0.1",
+            },
+            "routeKey": "$default",
+            "stage": "$default",
+        },
+        "isBase64Encoded": False,
+    }
+
+
+def test_lambda_invocations_return_without_draining(monkeypatch, tmp_path):
+    written.clear()
+    monkeypatch.setenv("AWS_LAMBDA_FUNCTION_NAME", "api")
+    worker = BackgroundWorker(spool_dir=str(tmp_path)).start()
+    monkeypatch.setattr(background, "worker", worker)
+    worker.submit("test_record", value="e", delay=0.5)
+
+    from app.main import handler as lambda_handler
+
+    start = time.perf_counter()
+    response = lambda_handler(health_event(), None)
+    assert response["statusCode"] == 200
+    # the job is left to the worker thread, spooled in case the runtime restarts
+    assert time.perf_counter() - start < 0.3
+    assert written == [] and worker.pending() == 1
+    assert len(os.listdir(tmp_path)) == 1
+    assert worker.drain(timeout=2)
+    assert written == ["e"]
+
+
+class RuntimeAPIHandler(BaseHTTPRequestHandler):
+    """The Extensions API endpoints the shutdown hook calls."""
+
+    calls: list = []
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        RuntimeAPIHandler.calls.append(
+            (self.path, self.headers["Lambda-Extension-Name"], body)
+        )
+        self.send_response(200)
+        self.send_header("Lambda-Extension-Identifier", "ext-1")
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self):
+        RuntimeAPIHandler.calls.append(
+            (self.path, self.headers["Lambda-Extension-Identifier"], None)
+        )
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def test_the_environment_is_finished_at_sigterm(monkeypatch):
+    RuntimeAPIHandler.calls = []
+    server = HTTPServer(("127.0.0.1", 0), RuntimeAPIHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setenv("AWS_LAMBDA_FUNCTION_NAME", "api")
+    monkeypatch.setenv("AWS_LAMBDA_RUNTIME_API", f"127.0.0.1:{server.server_port}")
+    finished = []
+    previous = signal.getsignal(signal.SIGTERM)
+    try:
+        assert background.at_lambda_shutdown(lambda: finished.append(True))
+        deadline = time.monotonic() + 2
+        while len(RuntimeAPIHandler.calls) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert RuntimeAPIHandler.calls == [
+            (
+                "/2020-01-01/extension/register",
+                background.EXTENSION_NAME,
+                {"events": []},
+            ),
+            ("/2020-01-01/extension/event/next", "ext-1", None),
+        ]
+        on_sigterm = signal.getsignal(signal.SIGTERM)
+        with pytest.raises(SystemExit):
+            on_sigterm(signal.SIGTERM, None)
+        assert finished == [True]
+    finally:
+        signal.signal(signal.SIGTERM, previous)
+        server.shutdown()
+
+    # off Lambda there is no hook: uvicorn's lifespan drains instead
+    monkeypatch.delenv("AWS_LAMBDA_FUNCTION_NAME")
+    assert not background.at_lambda_shutdown(lambda: None)
+
+
+@pytest.mark.real_metrics
+def test_request_metrics_reach_cloudwatch_after_the_response(monkeypatch, app_bedrock):
+    server = app_bedrock(response_fn=synthetic_answer)
+    monkeypatch.setattr(
+        metrics,
+        "cloudwatch",
+        get_client("cloudwatch", "us-east-1", endpoint_url=server.endpoint_url),
+    )
+    # hold the worker until the response is back, as a frozen Lambda would
+    gate = threading.Event()
+    monkeypatch.setitem(
+        background._handlers, "usage_log", lambda **fields: gate.wait(2)
+    )
+
+    from app.main import app
+
+    async def post():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://test"
+        ) as client:
+            return await client.post(
+                "/api/v1/generate-plan", json={"goal": "Learn Python in 3 months"}
+            )
+
+    try:
+        response = asyncio.run(post())
+        assert response.status_code == 200
+        gate.set()
+        assert background.worker.drain(timeout=5)
+        # the latency, count, token and concurrency datums go out in one call
+        assert server.sunk == 1
+    finally:
+        gate.set()
+
+
+def test_cloudwatch_jobs_do_nothing_in_mock_mode(monkeypatch, fake_bedrock):
+    server = fake_bedrock()
+    monkeypatch.setattr(settings, "USE_MOCK_AWS", True)
+    monkeypatch.setattr(
+        metrics,
+        "cloudwatch",
+        get_client("cloudwatch", "us-east-1", endpoint_url=server.endpoint_url),
+    )
+    metrics.publish_request(
+        latency_ms=12.0, endpoint="/generate-plan", success=True, category=None
+    )
+    metrics.publish_cancellation(
+        tokens_used=10, tokens_saved=90, worker_seconds_saved=1.5
+    )
+    metrics.publish_cost_rollups(
+        [
+            {
+                "hour": "2024-05-01-10",
+                "category": "fitness",
+                "model_id": "haiku",
+                "calls": 1,
+                "input_tokens": 10,
+                "output_tokens": 20,
+                "cost_usd": 0.001,
+            }
+        ]
+    )
+    assert server.sunk == 0
@@ -0,0 +1,93 @@
+import threading
+import time
+
+import httpx
+import uvicorn
+
+from app.services import background, cancellation
+from app.services.cancellation import Baselines, Savings
+from benchmarks.load_test import free_port
+from devtools.fake_bedrock import synthetic_answer
+
+
+def test_ledger_reports_once_every_abandoned_call_has_stopped(monkeypatch):
+    monkeypatch.setattr(cancellation, "savings", Savings())
+    monkeypatch.setattr(cancellation, "baselines", Baselines())
+    cancellation.baselines.record("sonnet", output_tokens=2000, seconds=20.0)
+
+    from concurrent.futures import Future
+
+    ledger = cancellation.CancellationLedger("req-1")
+    streamed, plain = Future(), Future()
+    ledger.track(streamed, "sonnet", time.perf_counter(), lambda f: (900, 400, True))
+    ledger.track(plain, "sonnet", time.perf_counter(), lambda f: (2500, 2000, False))
+    reports = []
+    ledger.settle(reports.append)
+
+    streamed.set_result(None)
+    assert reports == []
+    plain.set_result(None)
+    assert reports == [ledger]
+    # only the streamed call stopped early; the plain one ran to the end
+    assert ledger.tokens_used == 3400
+    assert ledger.tokens_saved == 1600
+    assert 19 < ledger.worker_seconds_saved <= 20
+    assert cancellation.savings.snapshot()["cancelled_requests"] == 1
+
+
+def test_client_disconnect_aborts_the_streamed_generation(monkeypatch, app_bedrock):
+    # ~1500 output tokens at 100 tokens/s: a 15s generation
+    fake = app_bedrock(
+        streaming=True, response_fn=synthetic_answer, tokens_per_second=100
+    )
+    monkeypatch.setattr(cancellation, "savings", Savings())
+    monkeypatch.setattr(cancellation, "baselines", Baselines())
+    for kind in ("usage_log", "cancellation_metrics"):
+        monkeypatch.setitem(background._handlers, kind, lambda **fields: None)
+
+    from app.main import app
+    from app.services import model_router
+
+    for model in model_router.MODELS:
+        cancellation.baselines.record(model.model_id, output_tokens=1500, seconds=15.0)
+
+    port = free_port()
+    server = uvicorn.Server(
+        uvicorn.Config(
+            app, host="127.0.0.1", port=port, lifespan="off", log_config=None
+        )
+    )
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    try:
+        while not server.started:
+            time.sleep(0.05)
+        started = time.perf_counter()
+        try:
+            httpx.post(
+                f"http://127.0.0.1:{port}/api/v1/generate-plan",
+                json={"goal": "Learn Python in 3 months"},
+                timeout=1.5,
+            )
+        except httpx.ReadTimeout:
+            pass  # the user closed the tab
+
+        expires = time.monotonic() + 10
+        while (
+            cancellation.savings.cancelled_requests == 0 and time.monotonic() < expires
+        ):
+            time.sleep(0.05)
+        stopped_after = time.perf_counter() - started
+        # the fake notices the closed stream on its own thread
+        while not fake.aborted and time.monotonic() < expires:
+            time.sleep(0.05)
+    finally:
+        server.should_exit = True
+        thread.join(timeout=10)
+
+    totals = cancellation.savings.snapshot()
+    assert totals["cancelled_requests"] == 1
+    assert fake.aborted == 1
+    assert stopped_after < 5
+    assert 0 < totals["tokens_used"] and totals["tokens_saved"] > 1000
+    assert totals["worker_seconds_saved"] > 10
@@ -0,0 +1,142 @@
+import asyncio
+import gzip
+
+import pytest
+
+from app.middleware import CompressionMiddleware, brotli, choose_encoding, make_etag
+
+needs_brotli = pytest.mark.skipif(
+    brotli is None, reason="brotli is an optional dependency"
+)
+
+BODY = b'{"plan": "' + b"run three times a week, " * 100 + b'"}'
+
+
+def json_app(body=BODY, content_type=b"application/json", chunks=None):
+    async def app(scope, receive, send):
+        headers = [(b"content-type", content_type)]
+        await send({"type": "http.response.start", "status": 200, "headers": headers})
+        for chunk in chunks or []:
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body", "body": b"" if chunks else body})
+
+    return app
+
+
+def call(app, headers=None, method="GET", minimum_size=500):
+    """Run one request through the middleware: status, headers, body and the body messages."""
+    messages = []
+    scope = {
+        "type": "http",
+        "method": method,
+        "path": "/",
+        "headers": [(k.encode(), v.encode()) for k, v in (headers or {}).items()],
+    }
+
+    async def send(message):
+        messages.append(message)
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    asyncio.run(
+        CompressionMiddleware(app, minimum_size=minimum_size)(scope, receive, send)
+    )
+    start, *bodies = messages
+    response_headers = {k.decode(): v.decode() for k, v in start["headers"]}
+    return (
+        start["status"],
+        response_headers,
+        b"".join(m.get("body", b"") for m in bodies),
+        bodies,
+    )
+
+
+def test_bodies_under_the_minimum_size_are_sent_as_is():
+    status, headers, body, _ = call(
+        json_app(b'{"ok": true}'), {"accept-encoding": "gzip"}
+    )
+    assert (status, body) == (200, b'{"ok": true}')
+    assert "content-encoding" not in headers
+    assert "vary" not in headers
+
+    status, headers, body, _ = call(json_app(), {"accept-encoding": "gzip"})
+    assert headers["content-encoding"] == "gzip"
+    assert headers["content-length"] == str(len(body))
+    assert gzip.decompress(body) == BODY
+
+
+def test_q0_opts_an_encoding_out():
+    assert choose_encoding("br;q=0, gzip") == "gzip"
+    assert choose_encoding("br; q=0.0, gzip;q=0") is None
+    assert choose_encoding("*") == "gzip"
+    assert choose_encoding("") is None
+
+    _, headers, body, _ = call(json_app(), {"accept-encoding": "gzip;q=0"})
+    assert "content-encoding" not in headers and body == BODY
+    _, headers, body, _ = call(json_app(), {"accept-encoding": "identity"})
+    assert "content-encoding" not in headers and body == BODY
+
+
+@needs_brotli
+def test_brotli_is_preferred_to_gzip():
+    assert choose_encoding("gzip, deflate, br") == "br"
+    _, headers, body, _ = call(json_app(), {"accept-encoding": "gzip, br"})
+    assert headers["content-encoding"] == "br"
+    assert brotli.decompress(body) == BODY
+
+
+def test_etags_name_the_identity_body_and_the_encoding():
+    opaque = make_etag(BODY).strip('"')
+    _, identity, _, _ = call(json_app())
+    _, gzipped, _, _ = call(json_app(), {"accept-encoding": "gzip"})
+    assert identity["etag"] == f'"{opaque}"'
+    assert gzipped["etag"] == f'"{opaque}-gzip"'
+    if brotli is not None:
+        _, brotlied, _, _ = call(json_app(), {"accept-encoding": "br"})
+        assert brotlied["etag"] == f'"{opaque}-br"'
+    # only GETs are conditional
+    _, posted, _, _ = call(json_app(), method="POST")
+    assert "etag" not in posted
+
+
+def test_if_none_match_revalidates_any_variant():
+    opaque = make_etag(BODY).strip('"')
+    validators = [
+        f'"{opaque}"',
+        f'"{opaque}-gzip"',
+        f'W/"{opaque}-br"',
+        f'"x", "{opaque}"',
+        "*",
+    ]
+    for validator in validators:
+        request = {"accept-encoding": "gzip", "if-none-match": validator}
+        status, headers, body, _ = call(json_app(), request)
+        assert (status, body) == (304, b""), validator
+        assert headers["etag"] == f'"{opaque}"'
+        assert headers["vary"] == "Accept-Encoding"
+        assert "content-length" not in headers and "content-type" not in headers
+
+    status, _, body, _ = call(json_app(), {"if-none-match": '"stale"'})
+    assert (status, body) == (200, BODY)
+    status, _, _, _ = call(json_app(), {"if-none-match": f'"{opaque}"'}, method="POST")
+    assert status == 200
+
+
+def test_vary_only_when_the_body_is_encoded():
+    _, headers, _, _ = call(json_app(), {"accept-encoding": "gzip"})
+    assert headers["vary"] == "Accept-Encoding"
+    for app in (json_app(b"{}"), json_app(content_type=b"image/png")):
+        _, headers, _, _ = call(app, {"accept-encoding": "gzip"})
+        assert "vary" not in headers and "content-encoding" not in headers
+
+
+def test_streaming_responses_pass_through():
+    chunks = [b"data: 1\n\n" * 100, b"data: 2\n\n" * 100]
+    status, headers, body, messages = call(
+        json_app(chunks=chunks), {"accept-encoding": "gzip"}
+    )
+    assert status == 200
+    assert body == b"".join(chunks)
+    assert [m.get("more_body", False) for m in messages] == [True, True, False]
+    assert "content-encoding" not in headers and "etag" not in headers
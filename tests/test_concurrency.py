@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+from botocore.exceptions import ClientError
+
+from app.services.concurrency import (
+    AdaptiveLimiter,
+    Overloaded,
+    get_limiter,
+    is_throttle,
+)
+
+
+def test_limit_grows_when_healthy_and_halves_on_throttle():
+    limiter = AdaptiveLimiter("t", initial_limit=4, max_limit=100)
+
+    async def cycle(count, **outcome):
+        for _ in range(count):
+            await limiter.acquire()
+            limiter.release(**outcome)
+
+    asyncio.run(cycle(40, latency_ms=100))
+    grown = limiter.limit
+    assert grown > 8
+
+    asyncio.run(cycle(1, throttled=True))
+    assert limiter.limit == pytest.approx(grown / 2)
+    # a burst of throttles from the same window only backs off once
+    asyncio.run(cycle(5, throttled=True))
+    assert limiter.limit == pytest.approx(grown / 2)
+    assert limiter.throttles == 6
+
+
+def test_waiters_queue_with_a_bounded_wait():
+    limiter = AdaptiveLimiter(
+        "t", initial_limit=1, max_queue_wait_ms=50, max_queue_depth=1
+    )
+
+    async def run():
+        await limiter.acquire()
+        queued = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        assert limiter.queue_depth == 1
+        with pytest.raises(Overloaded) as full:
+            await limiter.acquire()
+        with pytest.raises(Overloaded) as timed_out:
+            await queued
+        limiter.release(latency_ms=10)
+        return full.value, timed_out.value
+
+    full, timed_out = asyncio.run(run())
+    assert not full.upstream and not timed_out.upstream
+    assert limiter.queue_rejections == 1
+    assert limiter.queue_timeouts == 1
+    assert limiter.in_flight == 0 and limiter.queue_depth == 0
+
+
+def test_limiter_backs_off_against_a_throttling_stub(
+    fake_bedrock, make_invoker, bedrock_body
+):
+    model_id = "test.throttled-model"
+    server = fake_bedrock(latency_ms=20, throttle_rps=40)
+    invoker = make_invoker(server)
+    limiter = get_limiter("us-east-1", model_id)
+    limiter.limit = 32
+
+    async def burst():
+        calls = [invoker.invoke(model_id, bedrock_body) for _ in range(200)]
+        return await asyncio.gather(*calls, return_exceptions=True)
+
+    results = asyncio.run(burst())
+
+    errors = [r for r in results if isinstance(r, BaseException)]
+    assert all(isinstance(e, Overloaded) for e in errors), errors[:3]
+    assert len(errors) < len(results)
+    assert server.throttled > 0
+    assert limiter.throttles > 0
+    assert limiter.limit < 32
+    assert limiter.in_flight == 0
+
+
+def test_throttling_exception_is_recognised():
+    error = ClientError(
+        {"Error": {"Code": "ThrottlingException", "Message": "slow down"}},
+        "InvokeModel",
+    )
+    assert is_throttle(error)
+    assert not is_throttle(ValueError())
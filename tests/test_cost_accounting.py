@@ -0,0 +1,132 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app import main
+from app.config import settings
+from app.main import app
+from app.services import background, cost_accounting
+from app.services.cost_accounting import CostAggregator, price
+from devtools.fake_bedrock import synthetic_answer
+
+HAIKU = "anthropic.claude-3-haiku-20240307-v1:0"
+SONNET = "anthropic.claude-3-sonnet-20240229-v1:0"
+
+
+def use_aggregator(monkeypatch, flush_seconds=3600, max_buckets=250):
+    aggregator = CostAggregator(flush_seconds, max_buckets)
+    monkeypatch.setattr(cost_accounting, "aggregator", aggregator)
+    return aggregator
+
+
+def test_calls_are_priced_per_model_and_rolled_up_by_category(monkeypatch):
+    aggregator = use_aggregator(monkeypatch)
+    meter = cost_accounting.CostMeter("r-1")
+    meter.record(HAIKU, 200, 3)  # classification
+    meter.record(SONNET, 900, 1500)  # generation
+    totals = meter.close("fitness")
+
+    assert (totals["calls"], totals["input_tokens"], totals["output_tokens"]) == (
+        2,
+        1100,
+        1503,
+    )
+    assert totals["cost_usd"] == pytest.approx(
+        price(HAIKU, 200, 3) + price(SONNET, 900, 1500)
+    )
+    assert price(SONNET, 1000, 1000) == pytest.approx(0.018)
+
+    # a hedge loser finishing after the response is still the request's spend
+    meter.record(SONNET, 900, 1400)
+    other = cost_accounting.CostMeter("r-2")
+    other.record(SONNET, 800, 1200)
+    other.close("fitness")
+
+    rollups = {(r["category"], r["model_id"]): r for r in aggregator.pending()}
+    assert set(rollups) == {("fitness", HAIKU), ("fitness", SONNET)}
+    assert (
+        rollups["fitness", SONNET]["requests"],
+        rollups["fitness", SONNET]["calls"],
+    ) == (2, 3)
+    assert rollups["fitness", SONNET]["output_tokens"] == 1500 + 1400 + 1200
+
+
+def test_rollups_are_flushed_in_batches(monkeypatch):
+    monkeypatch.setattr(settings, "BACKGROUND_WORK", False)
+    flushed = []
+    monkeypatch.setitem(
+        background._handlers, "cost_rollup", lambda rollups: flushed.append(rollups)
+    )
+    aggregator = use_aggregator(monkeypatch, max_buckets=3)
+
+    for index in range(10):
+        meter = cost_accounting.CostMeter(f"r-{index}")
+        meter.record(HAIKU, 100, 5)
+        meter.close(["fitness", "creative"][index % 2])
+    assert flushed == []  # two buckets, under the limit and the interval
+
+    cost_accounting.record(None, SONNET, 1000, 2000)  # the plan library refresh
+    assert len(flushed) == 1 and len(flushed[0]) == 3
+    assert {r["category"] for r in flushed[0]} == {"fitness", "creative", "background"}
+    assert sum(r["requests"] for r in flushed[0]) == 10
+    assert aggregator.pending() == []
+
+
+def test_rollups_are_flushed_when_the_lambda_environment_shuts_down(monkeypatch):
+    monkeypatch.setattr(settings, "BACKGROUND_WORK", False)
+    flushed = []
+    monkeypatch.setitem(
+        background._handlers, "cost_rollup", lambda rollups: flushed.append(rollups)
+    )
+    aggregator = use_aggregator(monkeypatch)
+    meter = cost_accounting.CostMeter("r-1")
+    meter.record(HAIKU, 100, 5)
+    meter.close("fitness")
+    assert flushed == []  # not due yet
+
+    main.finish_lambda_environment()
+    assert [r["category"] for r in flushed[0]] == ["fitness"]
+    assert aggregator.pending() == []
+
+
+def test_usage_records_carry_what_bedrock_reported(monkeypatch, app_bedrock):
+    app_bedrock(response_fn=synthetic_answer)
+    monkeypatch.setattr(settings, "PLAN_LIBRARY_ENABLED", False)
+    monkeypatch.setattr(settings, "BACKGROUND_WORK", False)
+    aggregator = use_aggregator(monkeypatch)
+    records = []
+    monkeypatch.setitem(
+        background._handlers, "usage_log", lambda **fields: records.append(fields)
+    )
+    monkeypatch.setitem(background._handlers, "plan_store", lambda **fields: None)
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://test"
+        ) as client:
+            return await client.post(
+                "/api/v1/generate-plan", json={"goal": "Run a marathon in 4 months"}
+            )
+
+    response = asyncio.run(run())
+
+    assert response.status_code == 200
+    generation = response.json()["metadata"]["tokens_used"]
+    [record] = records
+    rollups = aggregator.pending()
+    assert sum(r["calls"] for r in rollups) == 2  # classification and generation
+    assert (
+        record["input_tokens"]
+        == sum(r["input_tokens"] for r in rollups)
+        > generation["input"]
+    )
+    assert (
+        record["output_tokens"]
+        == sum(r["output_tokens"] for r in rollups)
+        > generation["output"]
+    )
+    assert record["tokens_used"] == record["input_tokens"] + record["output_tokens"]
+    assert record["cost_usd"] == pytest.approx(sum(r["cost_usd"] for r in rollups))
+    assert {r["category"] for r in rollups} == {record["category"]}
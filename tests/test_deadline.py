@@ -0,0 +1,116 @@
+import asyncio
+import time
+
+import pytest
+
+from app.services.circuit_breaker import (
+    CircuitBreaker,
+    CircuitOpenError,
+    call_key,
+    get_breaker,
+)
+from app.services.deadline import (
+    Deadline,
+    DeadlineExceeded,
+    stage_expired,
+    stage_time_left,
+)
+
+
+class FakeLambdaContext:
+    def __init__(self, remaining_ms):
+        self.remaining_ms = remaining_ms
+
+    def get_remaining_time_in_millis(self):
+        return self.remaining_ms
+
+
+def test_unused_stage_time_flows_to_later_stages():
+    deadline = Deadline(10)
+    assert deadline.stage_timeout("classification") == pytest.approx(1.5, abs=0.05)
+    # classification returned immediately, so generation gets its own share too
+    assert deadline.stage_timeout("generation") == pytest.approx(10.0, abs=0.05)
+
+
+def test_lambda_remaining_time_tightens_the_budget():
+    scope = {"aws.context": FakeLambdaContext(remaining_ms=5000)}
+    assert Deadline.for_request(scope, budget=28).budget == pytest.approx(4.0)
+    assert Deadline.for_request({}, budget=28).budget == 28
+
+
+def test_overrunning_stage_is_cancelled():
+    cancelled = []
+
+    async def slow():
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    start = time.perf_counter()
+    with pytest.raises(DeadlineExceeded) as info:
+        asyncio.run(Deadline(1).run("classification", slow()))
+
+    assert info.value.stage == "classification"
+    assert cancelled
+    assert time.perf_counter() - start < 1
+
+
+def test_a_timer_firing_a_millisecond_early_still_finds_the_stage_expired():
+    # uvloop's clock has millisecond resolution, so the stage timer can fire
+    # just before time.monotonic() reaches the expiry
+    async def probe():
+        time_left = stage_time_left()
+        assert time_left is not None and not stage_expired()
+        await asyncio.sleep(time_left - 0.003)
+        return stage_expired()
+
+    assert asyncio.run(Deadline(0.2).run("generation", probe()))
+    assert not stage_expired()
+
+
+def test_breaker_opens_on_errors_and_recovers_after_cooldown():
+    breaker = CircuitBreaker(
+        "m", error_threshold=0.5, min_calls=4, cooldown_seconds=0.1
+    )
+    for ok in (True, False, True, False):
+        breaker.before_call()
+        breaker.record_success() if ok else breaker.record_failure()
+
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    time.sleep(0.15)
+    breaker.before_call()  # the half-open probe
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()  # only one probe at a time
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+def test_deadline_timeouts_count_against_the_model_breaker(
+    fake_bedrock, make_invoker, bedrock_body
+):
+    model_id = "test.deadline-model"
+    server = fake_bedrock(latency_ms=500)
+    invoker = make_invoker(server)
+    breaker = get_breaker(call_key(model_id, "generation"))
+    breaker.min_calls = 2
+
+    async def call():
+        return await Deadline(0.5).run(
+            "generation", invoker.invoke(model_id, bedrock_body)
+        )
+
+    for _ in range(2):
+        with pytest.raises(DeadlineExceeded):
+            asyncio.run(call())
+    # the breaker is open: the next call fails without touching the server
+    requests_before = server.requests
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(call())
+    time.sleep(0.6)
+    assert server.requests == requests_before
+    # classification calls to the same model are unaffected
+    assert get_breaker(call_key(model_id, "classification")).state == "closed"
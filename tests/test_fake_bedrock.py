@@ -0,0 +1,85 @@
+import asyncio
+import random
+import time
+
+import pytest
+
+from app.services.aws import get_client
+from app.services.hedging import Hedger
+from devtools.fake_bedrock import parse_latency
+
+TEXT = "word " * 400
+
+
+@pytest.fixture
+def body(bedrock_body):
+    return dict(bedrock_body, max_tokens=4000)
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_invoke_and_stream_return_the_same_body(
+    streaming, fake_bedrock, make_invoker, model_id, body
+):
+    server = fake_bedrock(response_text=TEXT)
+    result = asyncio.run(
+        make_invoker(server, streaming=streaming).invoke(model_id, body)
+    )
+
+    assert result.body["content"][0]["text"] == TEXT
+    assert result.body["stop_reason"] == "end_turn"
+    assert result.body["usage"]["output_tokens"] == len(TEXT) // 4
+    assert result.body["usage"]["input_tokens"] > 0
+
+
+def test_answers_longer_than_max_tokens_are_truncated(
+    fake_bedrock, make_invoker, model_id, bedrock_body
+):
+    server = fake_bedrock(response_text=TEXT)
+    invoker = make_invoker(server, streaming=True)
+    result = asyncio.run(invoker.invoke(model_id, dict(bedrock_body, max_tokens=10)))
+
+    assert result.body["content"][0]["text"] == TEXT[:40]
+    assert result.body["stop_reason"] == "max_tokens"
+    assert server.truncated == 1
+
+
+def test_cancelled_stream_stops_generation(fake_bedrock, make_invoker, model_id, body):
+    # 400 tokens at 200/s takes two seconds to stream
+    server = fake_bedrock(response_text=TEXT, tokens_per_second=200)
+    invoker = make_invoker(server, streaming=True)
+    invoker.hedger = Hedger()
+
+    async def run():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(invoker.invoke(model_id, body), 0.3)
+
+    asyncio.run(run())
+    deadline = time.time() + 2
+    while not server.aborted and time.time() < deadline:
+        time.sleep(0.05)
+
+    assert server.aborted == 1
+
+
+def test_latency_specs():
+    rng = random.Random(1)
+    assert parse_latency("50", rng)() == 50
+    samples = [parse_latency("lognormal:4.6,0.5", rng)() for _ in range(2000)]
+    median = sorted(samples)[1000]
+    assert 80 < median < 120
+    assert all(100 <= parse_latency("pareto:100,2", rng)() for _ in range(100))
+    with pytest.raises(ValueError):
+        parse_latency("zipf:1", rng)
+
+
+def test_dynamodb_and_cloudwatch_writes_are_sunk(fake_bedrock):
+    server = fake_bedrock()
+    dynamodb = get_client("dynamodb", "us-east-1", endpoint_url=server.endpoint_url)
+    dynamodb.put_item(TableName="logs", Item={"request_id": {"S": "1"}})
+    cloudwatch = get_client("cloudwatch", "us-east-1", endpoint_url=server.endpoint_url)
+    cloudwatch.put_metric_data(
+        Namespace="AIRouter", MetricData=[{"MetricName": "Requests", "Value": 1}]
+    )
+
+    assert server.sunk == 2
+    assert server.requests == 0
@@ -0,0 +1,126 @@
+import asyncio
+import random
+import time
+
+import pytest
+
+from app.services.circuit_breaker import call_key
+from app.services.hedging import Hedger
+
+
+@pytest.fixture
+def hedged_invoker(fake_bedrock, make_invoker):
+    """An invoker across two fake regions with the given latency functions."""
+
+    def make(primary_latency, secondary_latency, hedger):
+        return make_invoker(
+            fake_bedrock(latency_fn=primary_latency),
+            fake_bedrock(latency_fn=secondary_latency),
+            hedger=hedger,
+        )
+
+    return make
+
+
+@pytest.fixture
+def run_calls(model_id, bedrock_body):
+    def run_calls(invoker, count):
+        async def run():
+            results = []
+            for _ in range(count):
+                results.append(await invoker.invoke(model_id, bedrock_body))
+            return results
+
+        return asyncio.run(run())
+
+    return run_calls
+
+
+def slow_after(fast_calls, fast_ms=5, slow_ms=200):
+    """Primary latency that degrades once the hedger has learned a fast p95."""
+    calls = iter(range(10**6))
+    return lambda: fast_ms if next(calls) < fast_calls else slow_ms
+
+
+def test_slow_primary_is_hedged_to_secondary(hedged_invoker, run_calls):
+    rng = random.Random(7)
+    # 80% fast, 20% pathological tail on the primary; the secondary is steady
+    invoker = hedged_invoker(
+        lambda: 1000 if rng.random() < 0.2 else 5,
+        lambda: 20,
+        Hedger(percentile=0.5, min_delay_ms=10, min_samples=10, max_rate=1.0),
+    )
+    results = run_calls(invoker, 60)
+
+    hedged = [r for r in results if r.hedged]
+    assert hedged, "expected at least one hedge to win"
+    assert all(r.region == "us-west-2" for r in hedged)
+    assert max(r.latency_ms for r in hedged) < 500
+    assert invoker.hedger.stats()["hedge_wins"] == len(hedged)
+
+
+def test_hedge_rate_and_token_caps(hedged_invoker, run_calls):
+    rate_capped = Hedger(min_delay_ms=1, min_samples=2, max_rate=0.0)
+    token_capped = Hedger(min_delay_ms=1, min_samples=2, token_budget_per_hour=0)
+
+    for hedger in (rate_capped, token_capped):
+        run_calls(hedged_invoker(slow_after(2), lambda: 5, hedger), 6)
+
+    # a zero rate still allows the single burst hedge, never more
+    assert rate_capped.hedges_fired == 1
+    assert rate_capped.skipped_rate_cap >= 1
+    assert token_capped.hedges_fired == 0
+    assert token_capped.skipped_token_cap >= 1
+
+
+def test_losing_call_tokens_are_reported_as_extra_spend(hedged_invoker, run_calls):
+    hedger = Hedger(min_delay_ms=1, min_samples=2, max_rate=1.0)
+    run_calls(hedged_invoker(slow_after(2), lambda: 5, hedger), 5)
+    # the cancelled primaries finish on their threads and are charged then
+    deadline = time.time() + 2
+    while hedger.extra_tokens_total < 20 and time.time() < deadline:
+        time.sleep(0.05)
+
+    stats = hedger.stats()
+    assert stats["hedge_wins"] >= 1
+    assert stats["extra_tokens_total"] >= 20
+
+
+def test_calls_cancelled_by_the_caller_are_not_hedge_spend(
+    hedged_invoker, model_id, bedrock_body
+):
+    hedger = Hedger(min_delay_ms=1, min_samples=2, max_rate=1.0)
+    invoker = hedged_invoker(lambda: 300, lambda: 5, hedger)
+
+    async def run():
+        # no latency history yet, so no hedge: the deadline abandons the call
+        with_deadline = asyncio.wait_for(
+            invoker.invoke(model_id, bedrock_body), timeout=0.05
+        )
+        try:
+            await with_deadline
+        except asyncio.TimeoutError:
+            pass
+
+    asyncio.run(run())
+    time.sleep(0.5)  # the abandoned call finishes on its thread
+
+    assert hedger.hedges_fired == 0
+    assert hedger.extra_tokens_total == 0
+
+
+def test_each_kind_of_call_has_its_own_hedge_window(
+    hedged_invoker, model_id, bedrock_body
+):
+    hedger = Hedger(min_delay_ms=1, min_samples=2, max_rate=1.0)
+    invoker = hedged_invoker(lambda: 5, lambda: 5, hedger)
+
+    async def run():
+        for _ in range(5):
+            await invoker.invoke(model_id, bedrock_body, kind="classification")
+
+    asyncio.run(run())
+
+    # fast classifications say nothing about how long a plan takes
+    assert hedger.hedge_delay_ms(call_key(model_id, "classification")) is not None
+    assert hedger.hedge_delay_ms(call_key(model_id, "generation")) is None
@@ -0,0 +1,149 @@
+import os
+import random
+import time
+
+from app.services import histograms
+from app.services.histograms import (
+    BUCKET_COUNT,
+    HistogramRegistry,
+    LogLinearHistogram,
+    bucket_bounds,
+    bucket_index,
+    fold_snapshot,
+)
+
+
+def test_buckets_cover_values_with_bounded_relative_error():
+    for micros in [0, 1, 15, 16, 17, 31, 32, 1000, 123_456, 29_000_000]:
+        lower, upper = bucket_bounds(bucket_index(micros))
+        assert lower <= micros < upper
+        assert (upper - lower) <= max(1, lower / 16)
+    assert bucket_index(10**15) == BUCKET_COUNT - 1
+
+
+def test_percentiles_match_exact_values_within_bucket_error():
+    rng = random.Random(7)
+    values = [rng.lognormvariate(6.5, 0.6) for _ in range(20_000)]
+    histogram = LogLinearHistogram()
+    for value in values:
+        histogram.record(value)
+
+    ordered = sorted(values)
+    for q in (0.5, 0.95, 0.99):
+        exact = ordered[int(q * len(ordered)) - 1]
+        assert abs(histogram.percentile(q) - exact) / exact < 0.07
+    assert histogram.count_at_most(10**6) == len(values)
+
+
+def test_merged_workers_equal_one_histogram():
+    rng = random.Random(3)
+    values = [rng.uniform(1, 5000) for _ in range(5000)]
+    whole, left, right = (
+        LogLinearHistogram(),
+        LogLinearHistogram(),
+        LogLinearHistogram(),
+    )
+    for index, value in enumerate(values):
+        whole.record(value)
+        (left if index % 2 else right).record(value)
+    left.merge(right)
+    assert list(left.counts) == list(whole.counts)
+    assert left.percentile(0.99) == whole.percentile(0.99)
+
+
+def test_metrics_merge_snapshots_from_other_workers(tmp_path):
+    other = HistogramRegistry(multiproc_dir=str(tmp_path))
+    other.observe("ai_router_stage_duration_seconds", 120.0, "llm")
+    other.flush()
+    # pretend the snapshot came from another process
+    os.replace(other.snapshot_path(), os.path.join(tmp_path, "histograms-999999.json"))
+
+    this = HistogramRegistry(multiproc_dir=str(tmp_path))
+    this.observe("ai_router_stage_duration_seconds", 80.0, "llm")
+    this.observe("ai_router_request_duration_seconds", 200.0, "/generate-plan", "200")
+    text = this.render()
+
+    assert 'ai_router_stage_duration_seconds_count{stage="llm"} 2' in text
+    assert 'ai_router_stage_duration_seconds_bucket{stage="llm",le="0.1"} 1' in text
+    assert 'ai_router_stage_duration_seconds_bucket{stage="llm",le="+Inf"} 2' in text
+    assert "# TYPE ai_router_request_duration_seconds histogram" in text
+    assert (
+        'ai_router_request_duration_seconds_sum{endpoint="/generate-plan",status="200"} 0.200000'
+        in text
+    )
+
+
+def worker_snapshot(directory, pid, *latencies_ms):
+    """Write a snapshot as the worker `pid` would, with its own token."""
+    worker = HistogramRegistry(multiproc_dir=str(directory))
+    for latency_ms in latencies_ms:
+        worker.observe("ai_router_stage_duration_seconds", latency_ms, "llm")
+    worker.flush()
+    os.replace(
+        worker.snapshot_path(), os.path.join(directory, f"histograms-{pid}.json")
+    )
+    return worker
+
+
+def test_exited_workers_stay_counted_and_their_pid_starts_afresh(tmp_path):
+    scraper = HistogramRegistry(multiproc_dir=str(tmp_path))
+    count = 'ai_router_stage_duration_seconds_count{stage="llm"}'
+    worker_snapshot(tmp_path, 999998, 100.0, 200.0)
+    worker_snapshot(tmp_path, 999999, 300.0)
+    assert f"{count} 3" in scraper.render()
+
+    # the master reaped 999999: its counts move to the archive
+    fold_snapshot(str(tmp_path), 999999)
+    assert not os.path.exists(tmp_path / "histograms-999999.json")
+    assert f"{count} 3" in scraper.render()
+
+    # a new worker with the same pid adds to the total instead of replacing it
+    worker_snapshot(tmp_path, 999999, 400.0)
+    assert f"{count} 4" in scraper.render()
+    fold_snapshot(str(tmp_path), 999999)
+    fold_snapshot(str(tmp_path), 999999)  # already folded: nothing to do
+    assert f"{count} 4" in scraper.render()
+    assert sorted(os.listdir(tmp_path)) == [
+        "histograms-999998.json",
+        "histograms-archive.json",
+    ]
+
+
+def test_a_scrape_during_a_fold_counts_the_worker_once(tmp_path, monkeypatch):
+    scraper = HistogramRegistry(multiproc_dir=str(tmp_path))
+    worker_snapshot(tmp_path, 999999, 100.0)
+    # the snapshot is read, then the master folds it before the archive is read
+    real_read = histograms.read_json
+    folded = []
+
+    def read_then_fold(path):
+        data = real_read(path)
+        if path.endswith("histograms-999999.json") and not folded:
+            folded.append(path)
+            fold_snapshot(str(tmp_path), 999999)
+        return data
+
+    monkeypatch.setattr(histograms, "read_json", read_then_fold)
+    text = scraper.render()
+    assert 'ai_router_stage_duration_seconds_count{stage="llm"} 1' in text
+
+
+def test_snapshots_are_written_off_the_request_path(tmp_path):
+    registry = HistogramRegistry(multiproc_dir=str(tmp_path), flush_interval=0.05)
+    registry.observe("ai_router_stage_duration_seconds", 80.0, "llm")
+    # observing never writes; the snapshot thread does
+    assert not os.path.exists(registry.snapshot_path())
+
+    registry.start()
+    deadline = time.time() + 2
+    while not os.path.exists(registry.snapshot_path()) and time.time() < deadline:
+        time.sleep(0.01)
+    assert os.path.exists(registry.snapshot_path())
+
+    registry.observe("ai_router_stage_duration_seconds", 90.0, "llm")
+    registry.stop()  # and the last observations are written on the way out
+    reader = HistogramRegistry(multiproc_dir=str(tmp_path))
+    os.replace(
+        registry.snapshot_path(), os.path.join(tmp_path, "histograms-999999.json")
+    )
+    assert 'ai_router_stage_duration_seconds_count{stage="llm"} 2' in reader.render()
@@ -0,0 +1,239 @@
+import asyncio
+import os
+import zlib
+
+import httpx
+
+from app import router
+from app.config import settings
+from app.services import idempotency
+from app.services.idempotency import (
+    COMPLETED,
+    DynamoIdempotencyStore,
+    MemoryIdempotencyStore,
+)
+
+URL = "/api/v1/generate-plan"
+GOAL = {"goal": "Learn Python in 3 months"}
+
+
+def setup(monkeypatch, fail_first=False):
+    monkeypatch.setattr(settings, "USE_MOCK_AWS", True)
+    monkeypatch.setattr(settings, "SHARED_CACHE_ENABLED", False)
+    monkeypatch.setattr(settings, "IDEMPOTENCY_POLL_INTERVAL_MS", 10)
+    monkeypatch.setattr(
+        idempotency, "store", MemoryIdempotencyStore(max_entries=100, max_bytes=1 << 20)
+    )
+
+    calls = []
+    real_generate = router.generate_plan
+
+    async def counted_generate(**kwargs):
+        calls.append(kwargs["goal"])
+        await asyncio.sleep(0.2)
+        if fail_first and len(calls) == 1:
+            raise ConnectionError("Bedrock connection reset")
+        return await real_generate(**kwargs)
+
+    monkeypatch.setattr(router, "generate_plan", counted_generate)
+    return calls
+
+
+def post_all(*requests):
+    from app.main import app
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://test"
+        ) as client:
+            return await asyncio.gather(
+                *(
+                    client.post(URL, json=body, headers=headers)
+                    for body, headers in requests
+                )
+            )
+
+    return asyncio.run(run())
+
+
+def test_concurrent_and_later_duplicates_share_one_generation(monkeypatch):
+    calls = setup(monkeypatch)
+    key = {"Idempotency-Key": "retry-1"}
+
+    responses = post_all((GOAL, key), (GOAL, key), (GOAL, key))
+    [later] = post_all((GOAL, key))
+
+    assert calls == [GOAL["goal"]]
+    assert [r.status_code for r in responses + [later]] == [200] * 4
+    assert len({r.json()["request_id"] for r in responses + [later]}) == 1
+    replayed = [r.headers.get("idempotent-replayed") for r in responses + [later]]
+    assert replayed.count("true") == 3
+
+    # no key: every request generates
+    post_all((GOAL, {}), (GOAL, {}))
+    assert len(calls) == 3
+
+
+def test_key_reused_with_another_body_is_rejected(monkeypatch):
+    setup(monkeypatch)
+    key = {"Idempotency-Key": "retry-2"}
+    (first,) = post_all((GOAL, key))
+    (other,) = post_all(({"goal": "Run a marathon next spring"}, key))
+    assert first.status_code == 200
+    assert other.status_code == 422
+
+
+def test_server_errors_are_not_recorded(monkeypatch):
+    calls = setup(monkeypatch, fail_first=True)
+    key = {"Idempotency-Key": "retry-3"}
+    (failed,) = post_all((GOAL, key))
+    (retried,) = post_all((GOAL, key))
+    assert failed.status_code == 500
+    assert retried.status_code == 200 and "idempotent-replayed" not in retried.headers
+    assert len(calls) == 2
+
+
+def test_waiting_duplicates_poll_with_reads(monkeypatch):
+    setup(monkeypatch)
+    store = idempotency.store
+    ops = []
+
+    def counted(name):
+        op = getattr(store, name)
+
+        def call(*args):
+            ops.append(name)
+            return op(*args)
+
+        return call
+
+    for name in ("claim", "get"):
+        monkeypatch.setattr(store, name, counted(name))
+    key = {"Idempotency-Key": "retry-4"}
+
+    responses = post_all((GOAL, key), (GOAL, key), (GOAL, key))
+
+    assert [r.status_code for r in responses] == [200] * 3
+    # one conditional write per request; the 200 ms wait is spent on reads
+    assert ops.count("claim") == 3
+    assert ops.count("get") >= 10
+
+
+def record(key, now, token="t"):
+    return {
+        "idempotency_key": key,
+        "fingerprint": "f",
+        "status": "in_progress",
+        "lock_token": token,
+        "locked_until": now + 30,
+        "expires_at": now + 60,
+    }
+
+
+def response(body=b"{}"):
+    return {"status": COMPLETED, "status_code": 200, "headers": "[]", "body": body}
+
+
+def test_memory_store_expires_and_stays_bounded():
+    store = MemoryIdempotencyStore(max_entries=3, max_bytes=1 << 20)
+
+    assert store.claim(record("a", 1000), now=1000) is None
+    assert store.claim(record("a", 1010), now=1010)["status"] == "in_progress"
+    # the request holding it died: the lock runs out before the record expires
+    assert store.claim(record("a", 1031), now=1031) is None
+    store.complete("a", "t", response())
+    assert store.claim(record("a", 1040), now=1040)["status"] == COMPLETED
+    assert store.claim(record("a", 1100), now=1100) is None  # expired
+
+    for key in "bcde":
+        store.claim(record(key, 1100), now=1100)
+    assert store.get("a") is None and store.get("b") is None
+    assert store.get("e") is not None
+
+
+def test_a_taken_over_claim_cannot_record_or_release():
+    store = MemoryIdempotencyStore(max_entries=10, max_bytes=1 << 20)
+    store.claim(record("a", 1000, token="first"), now=1000)
+    # the first request outlives its lock and a retry takes the key over
+    assert store.claim(record("a", 1031, token="retry"), now=1031) is None
+
+    store.complete("a", "first", response(b'{"late": true}'))
+    store.release("a", "first")
+    assert store.get("a")["status"] == "in_progress"
+
+    store.complete("a", "retry", response())
+    assert store.get("a")["body"] == b"{}"
+    store.release("a", "first")
+    assert store.get("a")["status"] == COMPLETED
+
+
+def test_memory_store_is_bounded_by_compressed_bytes():
+    incompressible = os.urandom(4000)
+    store = MemoryIdempotencyStore(max_entries=100, max_bytes=10000)
+    for key in "abc":
+        store.claim(record(key, 1000), now=1000)
+        store.complete(key, "t", response(incompressible))
+    assert store.get("a") is None
+    assert store.get("c")["body"] == incompressible
+
+    # repetitive plan JSON compresses well, so many more of those fit
+    plan = b'{"task": "Practice scales", "estimated_hours": 2}' * 80
+    for key in "defgh":
+        store.claim(record(key, 1000), now=1000)
+        store.complete(key, "t", response(plan))
+    assert all(store.get(key)["body"] == plan for key in "defgh")
+    assert store._bytes <= 10000
+
+
+class ConditionalCheckFailedException(Exception):
+    pass
+
+
+class FakeTable:
+    """Just enough of a boto3 Table to check the lock_token conditions."""
+
+    class meta:
+        class client:
+            class exceptions:
+                ConditionalCheckFailedException = ConditionalCheckFailedException
+
+    def __init__(self, item):
+        self.item = item
+
+    def _check(self, ConditionExpression, ExpressionAttributeValues):
+        assert ConditionExpression == "lock_token = :t"
+        if (
+            self.item is None
+            or self.item["lock_token"] != ExpressionAttributeValues[":t"]
+        ):
+            raise ConditionalCheckFailedException()
+
+    def update_item(self, Key, UpdateExpression, ConditionExpression, **expression):
+        self._check(ConditionExpression, expression["ExpressionAttributeValues"])
+        names, values = (
+            expression["ExpressionAttributeNames"],
+            expression["ExpressionAttributeValues"],
+        )
+        for name, value in zip(names.values(), values.values()):
+            self.item[name] = value
+
+    def delete_item(self, Key, ConditionExpression, ExpressionAttributeValues):
+        self._check(ConditionExpression, ExpressionAttributeValues)
+        self.item = None
+
+
+def test_dynamo_writes_are_conditional_on_the_lock_token(monkeypatch):
+    table = FakeTable(record("a", 1031, token="retry"))
+    monkeypatch.setattr(DynamoIdempotencyStore, "table", table)
+    store = DynamoIdempotencyStore("idempotency")
+
+    store.complete("a", "first", response(b'{"late": true}'))
+    store.release("a", "first")
+    assert table.item["status"] == "in_progress"
+
+    store.complete("a", "retry", response())
+    assert table.item["status"] == COMPLETED
+    assert zlib.decompress(table.item["body"]) == b"{}"
+    store.release("a", "retry")
+    assert table.item is None
@@ -21,7 +21,7 @@
 
 import asyncio
 import logging
-from app.models.schemas import GeneratePlanRequest
+from app.models.schemas import GeneratePlanRequest, GeneratePlanResponse
 from app.router import generate_plan_endpoint
 
 # Only show INFO level and above (hide DEBUG)
@@ -31,7 +31,8 @@ logging.basicConfig(
 )
 
 
-async def test():
+# a script (python -m tests.test_local), not a pytest test: named so pytest skips it
+async def main():
     request = GeneratePlanRequest(
         goal="Learn to play jazz piano improvisation",
         context="I can read sheet music but have no improv experience",
@@ -39,24 +40,26 @@ async def test():
 
     try:
         print("\nTesting AI Personal Productivity Router...\n")
-        response = await generate_plan_endpoint(request)
+        # the endpoint returns pre-serialized JSON bytes
+        raw_response = await generate_plan_endpoint(request)
+        response = GeneratePlanResponse.model_validate_json(raw_response.body)
 
         print(f"✅ Success! Generated {len(response.weekly_breakdown)}-week plan")
         print(f"📁 Category: {response.category}")
         print(f"⏱️  Total hours: {response.total_estimated_hours}")
-        print(f"\n📅 Weekly Breakdown:")
+        print("\n📅 Weekly Breakdown:")
         for week in response.weekly_breakdown:
             print(f"\n  Week {week.week_number}: {week.focus_area}")
             for task in week.tasks:
                 milestone = "🎯" if task.milestone else "  "
                 print(f"    {milestone} {task.task} ({task.estimated_hours}h)")
 
-        print(f"\n📚 Resources:")
+        print("\n📚 Resources:")
         for resource in response.resources:
             print(f"  - {resource.title} ({resource.resource_type})")
             print(f"    {resource.url}")
 
-        print(f"\n🔧 Metadata:")
+        print("\n🔧 Metadata:")
         print(f"  Model: {response.metadata.get('model')}")
         print(f"  Tokens: {response.metadata.get('tokens_used', {}).get('total')}")
         print(f"  Mock mode: {response.metadata.get('mock_mode', False)}")
@@ -69,7 +72,7 @@ async def test():
 
 
 if __name__ == "__main__":
-    asyncio.run(test())
+    asyncio.run(main())
 
 
 # import asyncio
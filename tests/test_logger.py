@@ -0,0 +1,74 @@
+import io
+import json
+import logging
+import queue
+import threading
+from datetime import datetime
+
+from app.config import settings
+from app.services import logger as structured
+from app.services.logger import (
+    _DeferredQueueHandler,
+    _StructuredQueueListener,
+    structured_logger,
+    success_sampled,
+    utc_timestamp,
+)
+
+
+def test_utc_timestamp_matches_isoformat():
+    stamp = utc_timestamp()
+    parsed = datetime.fromisoformat(stamp)
+    assert abs((datetime.utcnow() - parsed).total_seconds()) < 1
+    assert len(stamp) == len("2024-01-01T00:00:00.000000")
+
+
+def test_structured_records_are_encoded_on_the_listener_thread(monkeypatch):
+    out = io.StringIO()
+    handler = logging.StreamHandler(out)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    records = queue.Queue()
+    listener = _StructuredQueueListener(records, handler)
+
+    encoded_on = []
+    real_dumps = structured.dumps
+
+    def dumps(entry):
+        encoded_on.append(threading.current_thread().name)
+        return real_dumps(entry)
+
+    monkeypatch.setattr(structured, "dumps", dumps)
+    monkeypatch.setattr(structured, "_listener", listener)
+    root = logging.getLogger()
+    queue_handler = _DeferredQueueHandler(records)
+    root.addHandler(queue_handler)
+    listener.start()
+    try:
+        structured_logger.log_request_completed(
+            request_id="r1",
+            status_code=200,
+            latency_ms=12.345,
+            goal_length=10,
+            tokens={"input": 5, "output": 7, "total": 12},
+            stages={"llm": 10.0},
+        )
+        logging.getLogger("app.test").warning("plain %s", "message")
+        records.join()
+    finally:
+        listener.stop()
+        root.removeHandler(queue_handler)
+
+    lines = out.getvalue().splitlines()
+    record = json.loads(lines[0])
+    assert record["event_type"] == "request_completed"
+    assert record["total_tokens"] == 12
+    assert record["stages_ms"] == {"llm": 10.0}
+    assert lines[1] == "plain message"
+    assert encoded_on and threading.main_thread().name not in encoded_on
+
+
+def test_success_sampling(monkeypatch):
+    monkeypatch.setattr(settings, "LOG_SUCCESS_SAMPLE_RATE", 1.0)
+    assert all(success_sampled() for _ in range(100))
+    monkeypatch.setattr(settings, "LOG_SUCCESS_SAMPLE_RATE", 0.0)
+    assert not any(success_sampled() for _ in range(100))
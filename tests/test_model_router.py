@@ -0,0 +1,52 @@
+import random
+
+from app.services.circuit_breaker import call_key, get_breaker
+from app.services.model_router import HAIKU, SONNET, ModelRouter, complexity_score
+
+COMPLEX_GOAL = (
+    "Prepare for the AWS Solutions Architect Professional exam in 6 months, "
+    "covering networking, security, migrations and cost optimisation, then "
+    "build three portfolio projects and mentor two colleagues through the associate exam"
+)
+
+
+def test_simple_goals_go_to_haiku():
+    router = ModelRouter(rng=random.Random(1))
+    assert complexity_score("Learn to juggle", None, "skill-learning") < 0.2
+    for _ in range(20):
+        assert router.choose("Learn to juggle", None, "skill-learning").model is HAIKU
+
+
+def test_complex_goals_score_higher_than_simple_ones():
+    simple = complexity_score("Run a 5k", None, "fitness")
+    complex_ = complexity_score(COMPLEX_GOAL, "I work full time", "certification")
+    assert complex_ > 0.6 > simple
+
+
+def test_bandit_moves_away_from_a_failing_model():
+    router = ModelRouter(cost_weight=0.0, latency_target_ms=1000, rng=random.Random(3))
+    picks = {HAIKU.name: 0, SONNET.name: 0}
+    for _ in range(200):
+        route = router.choose(COMPLEX_GOAL, None, "certification")
+        picks[route.model.name] += 1
+        # sonnet keeps blowing the latency budget; haiku answers well within it
+        slow = route.model is SONNET
+        router.record(route, 2500 if slow else 300, success=True)
+
+    assert picks[HAIKU.name] > 150
+    stats = router.stats()
+    assert stats[f"{SONNET.name}/complex"]["mean_reward"] < 0.5
+    assert stats[f"{HAIKU.name}/complex"]["mean_reward"] > 0.9
+
+
+def test_open_circuit_removes_model_from_the_choice():
+    router = ModelRouter(
+        cost_weight=-1.0, rng=random.Random(5)
+    )  # strongly favour sonnet
+    breaker = get_breaker(call_key(SONNET.model_id, "generation"))
+    breaker.state = "open"
+    try:
+        for _ in range(10):
+            assert router.choose(COMPLEX_GOAL, None, "certification").model is HAIKU
+    finally:
+        breaker.state = "closed"
@@ -0,0 +1,273 @@
+import asyncio
+import hmac
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from typing import List, Optional, Tuple
+
+import httpx
+import pytest
+
+from app.config import settings
+from app.services import background, plan_jobs
+from app.services.concurrency import Overloaded
+from app.services.plan_jobs import LocalQueue, MemoryJobStore
+
+GOAL = {"goal": "Learn Python in 3 months"}
+
+
+def use_local_backends(monkeypatch):
+    monkeypatch.setattr(settings, "USE_MOCK_AWS", True)
+    monkeypatch.setattr(plan_jobs, "job_store", MemoryJobStore())
+    monkeypatch.setattr(
+        plan_jobs, "job_queue", LocalQueue(concurrency=2, retry_delay=0.01)
+    )
+    # the CloudWatch client was created at import; no network here
+
+
+def test_job_is_accepted_at_once_and_polled_to_completion(monkeypatch):
+    use_local_backends(monkeypatch)
+    from app.main import app
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://test"
+        ) as client:
+            created = await client.post("/api/v1/plan-jobs", json=GOAL)
+            queued = await client.get(created.headers["location"])
+            await plan_jobs.job_queue.join()
+            done = await client.get(created.headers["location"])
+            missing = await client.get("/api/v1/plan-jobs/nope")
+            return created, queued, done, missing
+
+    created, queued, done, missing = asyncio.run(run())
+    assert created.status_code == 202
+    assert created.json()["status"] == "queued"
+    assert queued.json()["status"] in ("queued", "running")
+    assert queued.headers["retry-after"] == "2"
+
+    body = done.json()
+    assert body["status"] == "succeeded" and body["attempts"] == 1
+    assert body["result"]["request_id"] == body["job_id"]
+    assert body["result"]["weekly_breakdown"]
+    assert "retry-after" not in done.headers
+    assert missing.status_code == 404
+
+
+class CallbackHandler(BaseHTTPRequestHandler):
+    received: List[Tuple[Optional[str], bytes]] = []
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        CallbackHandler.received.append(
+            (self.headers.get(plan_jobs.SIGNATURE_HEADER), body)
+        )
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def test_sqs_batch_retries_transient_failures_and_signs_the_webhook(monkeypatch):
+    use_local_backends(monkeypatch)
+    monkeypatch.setattr(settings, "JOBS_CALLBACK_SECRET", "s3cret")
+    monkeypatch.setattr(settings, "JOBS_CALLBACK_ALLOW_LOCAL", True)
+    server = HTTPServer(("127.0.0.1", 0), CallbackHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    CallbackHandler.received.clear()
+
+    calls = []
+    real_pipeline = plan_jobs.run_pipeline
+
+    async def flaky_pipeline(job_id, request, deadline):
+        calls.append(job_id)
+        if len(calls) == 1:
+            raise Overloaded("Bedrock is throttling", upstream=True)
+        return await real_pipeline(job_id, request, deadline)
+
+    monkeypatch.setattr(plan_jobs, "run_pipeline", flaky_pipeline)
+
+    async def create():
+        request = plan_jobs.PlanJobRequest(
+            callback_url=f"http://127.0.0.1:{server.server_port}/hook", **GOAL
+        )
+        # recorded, but the message is delivered by hand below
+        monkeypatch.setattr(
+            plan_jobs.job_queue, "send", lambda message: asyncio.sleep(0)
+        )
+        return await plan_jobs.submit(request)
+
+    job = asyncio.run(create())
+    event = {
+        "Records": [
+            {
+                "messageId": "m-1",
+                "eventSource": "aws:sqs",
+                "body": json.dumps({"job_id": job["job_id"]}),
+            }
+        ]
+    }
+
+    try:
+        from app.main import handler
+
+        first = handler(event, None)
+        assert first == {"batchItemFailures": [{"itemIdentifier": "m-1"}]}
+        assert plan_jobs.job_store.get(job["job_id"])["status"] == "queued"
+        assert CallbackHandler.received == []
+
+        # redelivered after the visibility timeout, then once more by accident
+        assert handler(event, None) == {"batchItemFailures": []}
+        assert handler(event, None) == {"batchItemFailures": []}
+        assert len(calls) == 2
+        assert background.worker.drain(timeout=5)
+    finally:
+        server.shutdown()
+
+    [(signature, body)] = CallbackHandler.received
+    timestamp = int(signature.split(".")[0])
+    assert hmac.compare_digest(signature, plan_jobs.sign(body, timestamp, "s3cret"))
+    pushed = json.loads(body)
+    assert pushed["status"] == "succeeded" and pushed["attempts"] == 2
+    assert pushed["error"] is None
+
+
+def test_client_errors_fail_the_job_without_retrying(monkeypatch):
+    use_local_backends(monkeypatch)
+    monkeypatch.setattr(
+        plan_jobs.cost_guard, "estimate_cost", lambda goal, context: 10**6
+    )
+
+    async def run():
+        job = await plan_jobs.submit(plan_jobs.PlanJobRequest(**GOAL))
+        await plan_jobs.job_queue.join()
+        return plan_jobs.job_view(await plan_jobs.get(job["job_id"]))
+
+    view = asyncio.run(run())
+    assert view["status"] == "failed" and view["attempts"] == 1
+    assert view["error"]["status_code"] == 413
+
+
+def resolving(monkeypatch, *addresses):
+    """Resolve every host to these addresses."""
+    monkeypatch.setattr(
+        plan_jobs.socket,
+        "getaddrinfo",
+        lambda host, port, **kwargs: [
+            (None, None, None, "", (address, port)) for address in addresses
+        ],
+    )
+
+
+@pytest.mark.parametrize(
+    "url, addresses",
+    [
+        ("http://hooks.example.com/plans", ["93.184.216.34"]),
+        ("https://localhost/plans", ["127.0.0.1"]),
+        ("https://169.254.169.254/latest/meta-data/", ["169.254.169.254"]),
+        ("https://hooks.example.com/plans", ["93.184.216.34", "10.0.0.5"]),
+        ("https://[::ffff:127.0.0.1]/plans", ["::ffff:127.0.0.1"]),
+        ("https://[fd00::1]/plans", ["fd00::1"]),
+    ],
+)
+def test_callbacks_to_private_hosts_are_refused(monkeypatch, url, addresses):
+    resolving(monkeypatch, *addresses)
+    with pytest.raises(ValueError):
+        plan_jobs.callback_address(url)
+
+
+def test_callback_hosts_are_checked_against_the_allowlist(monkeypatch):
+    resolving(monkeypatch, "93.184.216.34")
+    monkeypatch.setattr(settings, "JOBS_CALLBACK_ALLOWED_HOSTS", ["hooks.example.com"])
+    assert plan_jobs.callback_address("https://Hooks.example.com:8443/plans") == (
+        "hooks.example.com",
+        8443,
+        "93.184.216.34",
+    )
+    with pytest.raises(ValueError):
+        plan_jobs.callback_address("https://other.example.com/plans")
+
+
+def test_refused_callbacks_are_rejected_at_submit_and_never_connected(monkeypatch):
+    use_local_backends(monkeypatch)
+    from app.main import app
+
+    resolving(monkeypatch, "169.254.169.254")
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://test"
+        ) as client:
+            return await client.post(
+                "/api/v1/plan-jobs",
+                json=dict(GOAL, callback_url="https://metadata.example.com/"),
+            )
+
+    response = asyncio.run(run())
+    assert response.status_code == 422
+    assert "non-public" in response.json()["detail"]
+    assert plan_jobs.job_store._jobs == {}
+
+    # accepted while the host was public, then rebound to the metadata address
+    connections = []
+    monkeypatch.setattr(
+        plan_jobs.socket,
+        "create_connection",
+        lambda *args, **kwargs: connections.append(args),
+    )
+    plan_jobs.deliver_callback("https://metadata.example.com/", "{}")
+    assert connections == []
+
+
+def test_failed_sqs_messages_come_back_with_backoff(monkeypatch):
+    monkeypatch.setattr(settings, "JOBS_RETRY_DELAY_SECONDS", 10)
+    monkeypatch.setattr(plan_jobs, "job_queue", plan_jobs.SqsQueue("queue-url"))
+    changes = []
+
+    class FakeSqs:
+        def change_message_visibility(self, **request):
+            changes.append(request)
+            if len(changes) == 3:
+                raise ConnectionError("SQS unreachable")
+
+    monkeypatch.setattr(plan_jobs, "get_client", lambda *args, **kwargs: FakeSqs())
+
+    async def failing(message, context=None):
+        return message["job_id"] == "done"
+
+    monkeypatch.setattr(plan_jobs, "process", failing)
+
+    def received(message_id, job_id, count):
+        return {
+            "messageId": message_id,
+            "receiptHandle": f"handle-{message_id}",
+            "eventSource": "aws:sqs",
+            "attributes": {"ApproximateReceiveCount": str(count)},
+            "body": json.dumps({"job_id": job_id}),
+        }
+
+    event = {
+        "Records": [
+            received("m-1", "failing", 1),
+            received("m-2", "done", 1),
+            received("m-3", "failing", 3),
+            received("m-4", "failing", 20),
+        ]
+    }
+    result = plan_jobs.handle_sqs_event(event)
+
+    # the last call fails; the message still comes back, after the visibility timeout
+    assert [f["itemIdentifier"] for f in result["batchItemFailures"]] == [
+        "m-1",
+        "m-3",
+        "m-4",
+    ]
+    assert [(c["ReceiptHandle"], c["VisibilityTimeout"]) for c in changes] == [
+        ("handle-m-1", 10),
+        ("handle-m-3", 40),
+        ("handle-m-4", plan_jobs.MAX_VISIBILITY_SECONDS),
+    ]
+    assert {c["QueueUrl"] for c in changes} == {"queue-url"}
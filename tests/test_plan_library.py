@@ -0,0 +1,202 @@
+import asyncio
+import time
+from datetime import datetime
+
+import httpx
+import pytest
+from boto3.dynamodb.types import Binary
+
+from app import router
+from app.config import settings
+from app.main import app
+from app.services import plan_library
+from app.services.deadline import Deadline
+from app.services.plan_library import FileSource, PlanIndex, PlanLibrary
+
+
+def test_head_goals_are_mined_by_normalized_text():
+    records = (
+        [{"goal": "Learn piano"}] * 3
+        + [{"goal": "learn  piano!"}]
+        + [{"goal": "Run a marathon"}] * 2
+        + [{"goal": "Learn Rust"}]
+    )
+    goals = plan_library.mine_goals(records, top=10, min_requests=2)
+    assert goals == [
+        ("learn piano", "Learn piano", 4),
+        ("run a marathon", "Run a marathon", 2),
+    ]
+
+
+def test_refresh_reuses_fresh_entries_and_regenerates_stale_ones(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "USE_MOCK_AWS", True)
+    monkeypatch.setattr(settings, "SHARED_CACHE_ENABLED", False)
+    source = FileSource(str(tmp_path / "library.bin"))
+    goals = [("learn piano", "Learn piano", 9), ("run a marathon", "Run a marathon", 5)]
+
+    first = asyncio.run(
+        plan_library.refresh(goals, source=source, deadline=Deadline(600))
+    )
+    assert (first["generated"], first["entries"]) == (2, 2)
+
+    index = PlanIndex(source.load())
+    index.entries["learn piano"]["built_at"] = 0  # older than PLAN_LIBRARY_MAX_AGE_DAYS
+    stale = {key: (fields, index.encoded(key)) for key, fields in index.entries.items()}
+    stale_data = plan_library.build_index(stale, "old")
+    monkeypatch.setattr(source, "load", lambda: stale_data)
+    second = asyncio.run(
+        plan_library.refresh(goals, source=source, deadline=Deadline(600))
+    )
+    assert (second["reused"], second["generated"]) == (1, 1)
+
+    # no time left: nothing is generated, the old entries are kept
+    third = asyncio.run(
+        plan_library.refresh(goals, source=source, deadline=Deadline(0))
+    )
+    assert (third["skipped"], third["entries"]) == (1, 2)
+
+
+def test_head_goals_are_served_without_classification_or_generation(
+    monkeypatch, tmp_path
+):
+    monkeypatch.setattr(settings, "USE_MOCK_AWS", True)
+    monkeypatch.setattr(settings, "SHARED_CACHE_ENABLED", False)
+    source = FileSource(str(tmp_path / "library.bin"))
+    goals = [("learn python in 3 months", "Learn Python in 3 months", 12)]
+    asyncio.run(plan_library.refresh(goals, source=source, deadline=Deadline(600)))
+    monkeypatch.setattr(plan_library, "library", PlanLibrary(source, reload_seconds=60))
+
+    calls = []
+    real_classify = router.classify_goal
+
+    async def counted_classify(goal):
+        calls.append(goal)
+        return await real_classify(goal)
+
+    monkeypatch.setattr(router, "classify_goal", counted_classify)
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://test"
+        ) as client:
+
+            def post(body):
+                return client.post("/api/v1/generate-plan", json=body)
+
+            started = time.perf_counter()
+            head = await post({"goal": "learn python in 3 months!"})
+            head_ms = (time.perf_counter() - started) * 1000
+            with_context = await post(
+                {"goal": "Learn Python in 3 months", "context": "I know Java"}
+            )
+            tail = await post({"goal": "Run a 5k without stopping"})
+            return head, head_ms, with_context, tail
+
+    head, head_ms, with_context, tail = asyncio.run(run())
+    assert head.status_code == with_context.status_code == tail.status_code == 200
+    plan = head.json()
+    assert plan["goal"] == "learn python in 3 months!"
+    assert plan["metadata"]["library"] and plan["metadata"]["tokens_used"]["total"] == 0
+    assert plan["weekly_breakdown"] and head_ms < 100
+    assert "library" not in with_context.json()["metadata"]
+    assert calls == ["Learn Python in 3 months", "Run a 5k without stopping"]
+    assert (plan_library.library.hits, plan_library.library.misses) == (1, 1)
+
+
+class FakeTable:
+    """Just enough of a boto3 Table for DynamoSource and query_usage."""
+
+    def __init__(self, items=None):
+        self.items = {}
+        self.queries = []
+        for item in items or []:
+            self.put_item(Item=item)
+
+    def put_item(self, Item):
+        item = dict(Item)
+        if "data" in item:
+            item["data"] = Binary(item["data"])  # as boto3 reads it back
+        self.items[(item.get("version"), item.get("part"))] = item
+
+    def get_item(self, Key, ConsistentRead=False):
+        item = self.items.get((Key["version"], Key["part"]))
+        return {"Item": dict(item)} if item is not None else {}
+
+    def update_item(self, Key, UpdateExpression, ExpressionAttributeValues=None):
+        item = self.items[(Key["version"], Key["part"])]
+        if UpdateExpression.startswith("REMOVE"):
+            item.pop("expires_at", None)
+        else:
+            item["expires_at"] = ExpressionAttributeValues[":expires_at"]
+
+    def batch_writer(self):
+        table = self
+
+        class Batch:
+            def __enter__(self):
+                return table
+
+            def __exit__(self, *exc):
+                return False
+
+        return Batch()
+
+    def query(self, **query):
+        self.queries.append(query)
+        condition = query["KeyConditionExpression"].get_expression()
+        name, value = condition["values"][0].name, condition["values"][1]
+        return {
+            "Items": [item for item in self.items.values() if item.get(name) == value]
+        }
+
+
+def test_dynamo_versions_expire_only_once_superseded(monkeypatch):
+    table = FakeTable()
+    source = plan_library.DynamoSource("library")
+    monkeypatch.setattr(plan_library.DynamoSource, "table", table)
+    monkeypatch.setattr(plan_library, "PART_BYTES", 10)
+
+    source.publish(b"a" * 25, "v1")
+    assert source.load() == b"a" * 25
+    assert all("expires_at" not in item for item in table.items.values())
+
+    source.publish(b"b" * 15, "v2")
+    assert source.load() == b"b" * 15
+    expiring = {key for key, item in table.items.items() if "expires_at" in item}
+    assert expiring == {("v1", 0), ("v1", 1), ("v1", 2)}
+
+    # a part gone from under the pointer fails the load instead of serving a short index
+    del table.items[("v2", 1)]
+    with pytest.raises(ValueError):
+        source.load()
+
+
+def test_usage_goals_are_queried_per_day(monkeypatch):
+    today = datetime.utcnow().strftime("%Y-%m-%d")
+    table = FakeTable()
+    table.items = {("r-1", 0): {"date": today, "goal": "Learn piano"}}
+    resource = type("Resource", (), {"Table": lambda self, name: table})()
+    monkeypatch.setattr(plan_library, "get_resource", lambda *args, **kwargs: resource)
+
+    assert list(plan_library.query_usage(6)) == [{"date": today, "goal": "Learn piano"}]
+    assert len(table.queries) == 7
+    assert {query["IndexName"] for query in table.queries} == {"date-index"}
+
+
+def test_an_empty_library_is_logged_once_and_every_goal_generated(
+    monkeypatch, tmp_path, caplog
+):
+    without_source = PlanLibrary(None, reload_seconds=0)
+    unpublished = PlanLibrary(FileSource(str(tmp_path / "none.bin")), reload_seconds=0)
+    with caplog.at_level("WARNING", logger=plan_library.logger.name):
+        for library in (without_source, unpublished):
+            for _ in range(3):
+                assert asyncio.run(library.lookup("Learn piano", None, "r")) is None
+    warnings = [r.getMessage() for r in caplog.records]
+    assert len(warnings) == 2
+    assert all("Plan library is empty" in message for message in warnings)
+
+    monkeypatch.setattr(plan_library, "library", without_source)
+    with pytest.raises(ValueError):
+        asyncio.run(plan_library.refresh([], deadline=Deadline(1)))
@@ -0,0 +1,78 @@
+import asyncio
+
+import httpx
+
+from app.config import settings
+from app.main import app
+from app.services import background, plan_store
+from app.services.plan_store import MemoryPlanStore, PlanCache
+from benchmarks.bench_plan_validation import build_plan_text, fast_path
+
+
+def test_encoding_round_trips_and_keeps_long_plans_small():
+    body = fast_path(build_plan_text(52, tasks_per_week=4, resources=8))
+    stored = plan_store.encode(body)
+    assert plan_store.decode(stored) == body
+    # a 52-week plan fits in a few DynamoDB write units
+    assert len(stored) < 4096 < len(body)
+
+
+def test_cache_is_bounded_and_least_recently_used():
+    cache = PlanCache(max_entries=2)
+    cache.put("a", b"1")
+    cache.put("b", b"2")
+    assert cache.get("a") == b"1"
+    cache.put("c", b"3")
+    assert cache.get("b") is None
+    assert cache.get("a") == b"1" and cache.get("c") == b"3"
+    assert (cache.hits, cache.misses) == (3, 1)
+
+
+def test_generated_plan_is_served_by_request_id(monkeypatch):
+    monkeypatch.setattr(settings, "USE_MOCK_AWS", True)
+    monkeypatch.setattr(settings, "SHARED_CACHE_ENABLED", False)
+    monkeypatch.setattr(plan_store, "store", MemoryPlanStore())
+    monkeypatch.setattr(plan_store, "cache", PlanCache(max_entries=10))
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://test"
+        ) as client:
+            created = await client.post(
+                "/api/v1/generate-plan", json={"goal": "Learn Python in 3 months"}
+            )
+            request_id = created.json()["request_id"]
+            assert background.worker.drain(timeout=5)
+            # a cold process: read from the store and decoded
+            plan_store.cache = PlanCache(max_entries=10)
+            stored = await client.get(f"/api/v1/plans/{request_id}")
+            cached = await client.get(f"/api/v1/plans/{request_id}")
+            missing = await client.get("/api/v1/plans/no-such-plan")
+            return created, stored, cached, missing
+
+    created, stored, cached, missing = asyncio.run(run())
+    assert created.status_code == stored.status_code == cached.status_code == 200
+    assert stored.json() == created.json() == cached.json()
+    assert "immutable" in stored.headers["cache-control"]
+    assert (plan_store.cache.hits, plan_store.cache.misses) == (1, 2)
+    assert missing.status_code == 404
+
+
+def test_on_lambda_the_plan_is_stored_before_the_response(monkeypatch):
+    monkeypatch.setenv("AWS_LAMBDA_FUNCTION_NAME", "api")
+    monkeypatch.setattr(plan_store, "store", MemoryPlanStore())
+    monkeypatch.setattr(plan_store, "cache", PlanCache(max_entries=10))
+    deferred = []
+    monkeypatch.setattr(
+        plan_store, "defer", lambda kind, **payload: deferred.append(kind)
+    )
+
+    asyncio.run(plan_store.save("r-1", b'{"request_id": "r-1"}'))
+    assert plan_store.decode(plan_store.store.get("r-1")) == b'{"request_id": "r-1"}'
+    assert deferred == []
+
+    # a failed write is not lost: the background worker retries it
+    monkeypatch.setattr(plan_store.store, "put", lambda *args: 1 / 0)
+    asyncio.run(plan_store.save("r-2", b"{}"))
+    assert deferred == ["plan_store"]
@@ -0,0 +1,79 @@
+import asyncio
+import json
+
+import pytest
+from fastapi import HTTPException
+from pydantic import ValidationError
+
+from app.models.schemas import GeneratePlanResponse
+from app.router import plan_response
+from app.services.classifier import classify_goal
+from app.services.planner import (
+    build_response,
+    extract_json_text,
+    generate_plan,
+    parse_plan,
+)
+from app.services.synthetic_plans import generate_plan_text
+
+GOAL = "Learn Python in 3 months"
+
+
+def test_plans_are_found_inside_fences_and_prose():
+    text = extract_json_text(generate_plan_text(GOAL, "skill-learning"))
+    plain = parse_plan(text)
+    assert parse_plan(f"```json\n{text}\n```") == plain
+    assert parse_plan(f"Here is your plan:\n{text}\nGood luck!") == plain
+    assert (
+        parse_plan(f"Sure! Here it is.\n\n```\n{text}\n```\nLet me know if it helps.")
+        == plain
+    )
+
+
+def test_invalid_plans_raise_validation_errors():
+    with pytest.raises(ValidationError):
+        parse_plan("I cannot help with that.")
+    plan = json.loads(extract_json_text(generate_plan_text(GOAL, "skill-learning")))
+    plan["estimated_duration_weeks"] = 60  # over the 52-week limit
+    with pytest.raises(ValidationError):
+        parse_plan(json.dumps(plan))
+    del plan["weekly_breakdown"]
+    with pytest.raises(ValidationError):
+        parse_plan(json.dumps(plan))
+
+
+def test_an_unparseable_answer_is_a_500(app_bedrock):
+    answer = '```json\n{"weekly_breakdown": []}\n```'  # fenced, but not a plan
+    app_bedrock(response_fn=lambda request: answer)
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(generate_plan(GOAL, None, "skill-learning", "r-1"))
+    assert error.value.status_code == 500
+
+
+def test_categories_outside_the_list_are_other(app_bedrock):
+    answers = iter(["Fitness", "Fitness, with some music on the side"])
+    app_bedrock(response_fn=lambda request: next(answers))
+    assert asyncio.run(classify_goal("Run a marathon")) == "fitness"
+    # free text would become a metric label and a rollup key
+    assert asyncio.run(classify_goal("Run a marathon to music")) == "other"
+
+
+def test_response_bytes_are_the_response_model():
+    plan = build_response(
+        parse_plan(generate_plan_text(GOAL, "skill-learning")),
+        request_id="r-1",
+        goal=GOAL,
+        category="skill-learning",
+        metadata={
+            "tokens_used": {"input": 1, "output": 2, "total": 3},
+            "model": "mock",
+        },
+    )
+    response = plan_response(plan)
+
+    assert response.media_type == "application/json"
+    # what FastAPI would have sent through response_model, field for field
+    expected = GeneratePlanResponse.model_validate(plan.model_dump())
+    assert GeneratePlanResponse.model_validate_json(response.body) == expected
+    assert json.loads(response.body) == json.loads(expected.model_dump_json())
+    assert list(json.loads(response.body)) == list(GeneratePlanResponse.model_fields)
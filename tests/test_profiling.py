@@ -0,0 +1,86 @@
+import json
+import time
+
+from app.services import profiling
+from app.services.profiling import SamplingProfiler, sign, verify
+from devtools.profile_aggregate import aggregate, profile_events
+
+
+def busy_loop(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        sum(range(100))
+
+
+def test_signed_header_is_checked_against_secret_and_age():
+    now = int(time.time())
+    assert verify(sign(now, "s3cret"), "s3cret")
+    assert not verify(sign(now, "s3cret"), "other")
+    assert not verify(sign(now - 3600, "s3cret"), "s3cret")
+    assert not verify(sign(now, ""), "")
+    assert not verify("garbage", "s3cret")
+
+
+def test_sampling_profiler_collapses_the_callers_stack():
+    profiler = SamplingProfiler(interval_ms=1).start()
+    busy_loop(0.2)
+    profiler.stop()
+    profiler.join()
+
+    assert profiler.samples > 20
+    hottest = max(profiler.stacks, key=profiler.stacks.get)
+    assert any(
+        frame.endswith("test_profiling:busy_loop") for frame in hottest.split(";")
+    )
+    collapsed = profiler.collapsed(limit=1)
+    assert sum(collapsed.values()) == profiler.samples
+
+
+def test_one_request_is_profiled_at_a_time(monkeypatch):
+    monkeypatch.setattr(profiling.settings, "PROFILE_SAMPLE_RATE", 1.0)
+    logged = []
+    monkeypatch.setattr(
+        profiling.structured_logger,
+        "log_profile",
+        lambda **fields: logged.append(fields),
+    )
+
+    first = profiling.start_profile({})
+    assert first is not None
+    assert profiling.start_profile({}) is None
+
+    started = time.perf_counter()
+    profiling.finish_profile(first, "r-1")
+    # the event loop does not wait for the sampling thread
+    assert time.perf_counter() - started < first.interval
+    first.join()
+    assert [fields["request_id"] for fields in logged] == ["r-1"]
+
+    second = profiling.start_profile({})
+    assert second is not None
+    profiling.finish_profile(second, "r-2")
+    second.join()
+
+
+def test_aggregate_merges_profiles_from_log_lines():
+    def line(request_id, stacks, interval_ms):
+        event = {
+            "event_type": "profile",
+            "request_id": request_id,
+            "interval_ms": interval_ms,
+            "duration_ms": 100,
+            "samples": sum(stacks.values()),
+            "stacks": stacks,
+        }
+        return f"2024-05-01T00:00:00Z abc-123 {json.dumps(event)}\n"
+
+    lines = [
+        line("a", {"main;parse": 3, "main;llm": 1}, 5),
+        "not json\n",
+        '{"event_type": "request_received"}\n',
+        line("b", {"main;parse": 2}, 10),
+    ]
+    events = list(profile_events(lines))
+    assert aggregate(events) == {"main;parse": 35, "main;llm": 5}
+    assert aggregate(events, request_id="b") == {"main;parse": 20}
+    assert "request a;main;llm" in aggregate(events, per_request=True)
@@ -0,0 +1,172 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+from app.config import settings
+from app.main import app
+from app import router
+from app.services import cost_accounting, plan_store, reviser
+from app.services.cost_accounting import CostAggregator
+from app.services.plan_store import MemoryPlanStore, PlanCache
+from app.services.planner import generate_plan
+from devtools.fake_bedrock import synthetic_answer
+
+GOAL = "Learn Python in 3 months"
+
+
+def test_only_the_requested_weeks_change_and_totals_follow(monkeypatch):
+    monkeypatch.setattr(settings, "USE_MOCK_AWS", True)
+    plan = asyncio.run(generate_plan(GOAL, None, "skill-learning", "original"))
+    revised = asyncio.run(
+        reviser.revise_plan(plan, [4, 3, 3], "Weekends only", "revised")
+    )
+
+    assert revised.request_id == "revised"
+    assert revised.metadata["revised_from"] == "original"
+    assert revised.metadata["revised_weeks"] == [3, 4]
+    for before, after in zip(plan.weekly_breakdown, revised.weekly_breakdown):
+        assert after.week_number == before.week_number
+        assert (after == before) == (before.week_number not in (3, 4))
+    hours = sum(t.estimated_hours for w in revised.weekly_breakdown for t in w.tasks)
+    assert revised.total_estimated_hours == round(hours, 1)
+    assert revised.estimated_duration_weeks == len(plan.weekly_breakdown)
+    assert revised.resources == plan.resources
+
+
+def test_answers_with_other_weeks_are_rejected(monkeypatch):
+    monkeypatch.setattr(settings, "USE_MOCK_AWS", True)
+    plan = asyncio.run(generate_plan(GOAL, None, "skill-learning", "original"))
+    monkeypatch.setattr(
+        reviser.synthetic_plans,
+        "generate_weeks_text",
+        lambda goal, category, week_numbers, weeks, seed=None: '{"weekly_breakdown": '
+        '[{"week_number": 9, "focus_area": "x", "tasks": [{"task": "y", "estimated_hours": 1}]}]}',
+    )
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(reviser.revise_plan(plan, [2], None, "revised"))
+    assert error.value.status_code == 500
+
+
+def test_revision_costs_a_fraction_of_the_plan(app_bedrock):
+    requests = []
+
+    def answer(request):
+        requests.append(request)
+        return synthetic_answer(request)
+
+    app_bedrock(response_fn=answer)
+    plan = asyncio.run(generate_plan(GOAL, None, "skill-learning", "original"))
+    revised = asyncio.run(reviser.revise_plan(plan, [2], None, "revised"))
+
+    weeks = len(plan.weekly_breakdown)
+    assert requests[-1]["max_tokens"] < requests[0]["max_tokens"] / 4
+    full, partial = plan.metadata["tokens_used"], revised.metadata["tokens_used"]
+    # output scales with the weeks revised
+    assert partial["output"] < full["output"] * 2 / weeks
+    assert partial["total"] < full["total"] / 2
+
+
+def test_stored_plans_are_revised_by_request_id(monkeypatch):
+    monkeypatch.setattr(settings, "USE_MOCK_AWS", True)
+    monkeypatch.setattr(settings, "SHARED_CACHE_ENABLED", False)
+    monkeypatch.setattr(plan_store, "store", MemoryPlanStore())
+    monkeypatch.setattr(plan_store, "cache", PlanCache(max_entries=10))
+    logged = []
+    log_completed = router.log_completed
+
+    def log(request_id, request, status_code, *args, **fields):
+        if fields.get("endpoint") == "/revise-plan":
+            logged.append(status_code)
+        log_completed(request_id, request, status_code, *args, **fields)
+
+    monkeypatch.setattr(router, "log_completed", log)
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://test"
+        ) as client:
+            created = (
+                await client.post("/api/v1/generate-plan", json={"goal": GOAL})
+            ).json()
+
+            def revise(body):
+                return client.post("/api/v1/revise-plan", json=body)
+
+            by_id = await revise({"request_id": created["request_id"], "weeks": [1]})
+            submitted = await revise(
+                {"plan": created, "weeks": [2], "feedback": "Less reading"}
+            )
+            fetched = await client.get(f"/api/v1/plans/{by_id.json()['request_id']}")
+            errors = [
+                await revise({"request_id": "no-such-plan", "weeks": [1]}),
+                await revise({"request_id": created["request_id"], "weeks": [99]}),
+                await revise({"weeks": [1]}),
+            ]
+            return created, by_id, submitted, fetched, errors
+
+    created, by_id, submitted, fetched, errors = asyncio.run(run())
+    assert by_id.status_code == submitted.status_code == 200
+    assert by_id.json()["weekly_breakdown"][1:] == created["weekly_breakdown"][1:]
+    assert submitted.json()["metadata"]["revised_weeks"] == [2]
+    assert fetched.json() == by_id.json()
+    assert [r.status_code for r in errors] == [404, 422, 422]
+    # the body validation error never reaches the endpoint
+    assert logged == [200, 200, 404, 422]
+
+
+def test_submitted_categories_are_not_used_as_labels(monkeypatch):
+    monkeypatch.setattr(settings, "USE_MOCK_AWS", True)
+    monkeypatch.setattr(settings, "SHARED_CACHE_ENABLED", False)
+    monkeypatch.setattr(plan_store, "store", MemoryPlanStore())
+    monkeypatch.setattr(plan_store, "cache", PlanCache(max_entries=10))
+    observed = []
+
+    def observe(endpoint, status_code, latency_ms, category, *args):
+        observed.append(category)
+
+    monkeypatch.setattr(router, "observe_request", observe)
+    plan = asyncio.run(generate_plan(GOAL, None, "skill-learning", "original"))
+    submitted = plan.model_copy(update={"category": "x' OR 1=1; one label per request"})
+    aggregator = CostAggregator(3600, 250)
+    monkeypatch.setattr(cost_accounting, "aggregator", aggregator)
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://test"
+        ) as client:
+            return await client.post(
+                "/api/v1/revise-plan",
+                json={"plan": submitted.model_dump(mode="json"), "weeks": [1]},
+            )
+
+    response = asyncio.run(run())
+    assert response.status_code == 200
+    assert observed == ["other"]
+    assert {rollup["category"] for rollup in aggregator.pending()} == {"other"}
+
+
+def test_oversized_submitted_plans_are_rejected_before_bedrock(monkeypatch):
+    monkeypatch.setattr(settings, "USE_MOCK_AWS", True)
+    plan = asyncio.run(generate_plan(GOAL, None, "skill-learning", "original"))
+    padded = plan.model_copy(
+        update={
+            "weekly_breakdown": [
+                week.model_copy(update={"focus_area": "x" * 400, "week_number": number})
+                for number, week in enumerate(plan.weekly_breakdown * 4, start=1)
+            ]
+        }
+    )
+    calls = []
+    monkeypatch.setattr(
+        reviser.synthetic_plans,
+        "generate_weeks_text",
+        lambda *args, **kwargs: calls.append(args),
+    )
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(reviser.revise_plan(padded, [1], None, "revised"))
+    assert error.value.status_code == 413
+    assert calls == []
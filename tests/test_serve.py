@@ -0,0 +1,131 @@
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+import httpx
+
+from benchmarks.load_test import free_port
+from devtools.fake_bedrock import synthetic_answer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PAYLOAD = {"goal": "Run a 5k in 4 weeks"}
+
+
+def start_server(port, extra_env, *args):
+    env = dict(
+        os.environ,
+        AWS_ACCESS_KEY_ID="testing",
+        AWS_SECRET_ACCESS_KEY="testing",
+        BACKGROUND_DRAIN_SECONDS="1",
+        # every request has to reach the backend
+        SHARED_CACHE_ENABLED="false",
+        **extra_env,
+    )
+    proc = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "app.serve",
+            "--host",
+            "127.0.0.1",
+            "--port",
+            str(port),
+            *args,
+        ],
+        cwd=ROOT,
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+    )
+    deadline = time.monotonic() + 20
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/health").status_code == 200:
+                return proc
+        except httpx.TransportError:
+            time.sleep(0.1)
+    proc.kill()
+    raise AssertionError(proc.communicate()[0])
+
+
+def test_workers_are_recycled_and_replaced(tmp_path):
+    port = free_port()
+    proc = start_server(
+        port,
+        {"USE_MOCK_AWS": "true", "METRICS_MULTIPROC_DIR": str(tmp_path)},
+        "--workers",
+        "2",
+        "--max-requests",
+        "3",
+        "--max-requests-jitter",
+        "0",
+    )
+    try:
+        codes = [
+            httpx.post(
+                f"http://127.0.0.1:{port}/api/v1/generate-plan", json=PAYLOAD
+            ).status_code
+            for _ in range(12)
+        ]
+        time.sleep(1.5)  # the live workers' next snapshot
+        metrics = httpx.get(f"http://127.0.0.1:{port}/metrics").text
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        output = proc.communicate(timeout=30)[0]
+
+    assert codes == [200] * 12
+    assert proc.returncode == 0
+    assert "replacing it" in output
+    # the recycled workers' requests are still counted, from the archive
+    assert (
+        'ai_router_request_duration_seconds_count{endpoint="/generate-plan",status="200"} 12'
+        in metrics
+    )
+    assert os.listdir(tmp_path) == ["histograms-archive.json"]
+
+
+def test_sigterm_waits_for_in_flight_llm_calls(fake_bedrock):
+    server = fake_bedrock(latency_ms=600, response_fn=synthetic_answer)
+    port = free_port()
+    proc = start_server(
+        port,
+        {
+            "USE_MOCK_AWS": "false",
+            "BEDROCK_ENDPOINT_URL": server.endpoint_url,
+            "AWS_ENDPOINT_URL_DYNAMODB": server.endpoint_url,
+            "AWS_ENDPOINT_URL_CLOUDWATCH": server.endpoint_url,
+        },
+        "--workers",
+        "1",
+    )
+    responses = []
+
+    def call():
+        responses.append(
+            httpx.post(
+                f"http://127.0.0.1:{port}/api/v1/generate-plan",
+                json=PAYLOAD,
+                timeout=30,
+            )
+        )
+
+    try:
+        client = threading.Thread(target=call)
+        client.start()
+        # classification takes 600 ms, so this lands in the middle of generation
+        time.sleep(0.9)
+        proc.send_signal(signal.SIGTERM)
+        client.join(timeout=30)
+        proc.communicate(timeout=30)
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+
+    assert [r.status_code for r in responses] == [200]
+    assert proc.returncode == 0
+    # usage record, metrics and the cost rollup were written by the lifespan shutdown
+    assert server.sunk == 3
@@ -0,0 +1,92 @@
+import asyncio
+import multiprocessing
+import struct
+
+from app.config import settings
+from app.services import classifier
+from app.services.bedrock import InvocationResult
+from app.services.shared_cache import SLOT_HEADER, SharedCache, key_digest
+
+
+def test_put_get_overwrite_and_expiry(tmp_path):
+    cache = SharedCache(str(tmp_path / "c.cache"), slots=64, slot_size=256)
+    assert cache.get("goal") is None
+
+    assert cache.put("goal", b"fitness", ttl=60, now=1000)
+    assert cache.get("goal", now=1010) == b"fitness"
+    cache.put("goal", b"creative", ttl=60, now=1000)
+    assert cache.get("goal", now=1010) == b"creative"
+    assert cache.get("goal", now=1100) is None
+    # larger than a slot: not stored
+    assert not cache.put("big", b"x" * 300, ttl=60)
+
+
+def _child_put(path):
+    SharedCache(path, slots=64, slot_size=256).put("from-child", b"hello", ttl=60)
+
+
+def test_entries_are_shared_across_processes(tmp_path):
+    path = str(tmp_path / "c.cache")
+    parent = SharedCache(path, slots=64, slot_size=256)
+    parent.get("warm")  # mapped before the fork, like the prefork master
+
+    child = multiprocessing.get_context("fork").Process(target=_child_put, args=(path,))
+    child.start()
+    child.join()
+    assert parent.get("from-child") == b"hello"
+
+
+def test_torn_or_in_progress_writes_read_as_misses(tmp_path):
+    cache = SharedCache(str(tmp_path / "c.cache"), slots=1, slot_size=256)
+    cache.put("goal", b"fitness", ttl=60)
+    buf, offset = cache._map, cache._offset(0)
+
+    # a writer died or is mid-write: odd sequence
+    seq = SLOT_HEADER.unpack_from(buf, offset)[0]
+    struct.pack_into("<I", buf, offset, seq + 1)
+    assert cache.get("goal") is None
+
+    # value bytes changed underneath an even sequence
+    struct.pack_into("<I", buf, offset, seq + 2)
+    buf[offset + SLOT_HEADER.size] = ord("X")
+    assert cache.get("goal") is None
+    assert SLOT_HEADER.unpack_from(buf, offset)[1] == key_digest("goal")
+
+
+def test_a_put_after_a_torn_write_can_be_read(tmp_path):
+    cache = SharedCache(str(tmp_path / "c.cache"), slots=1, slot_size=256)
+    cache.put("goal", b"fitness", ttl=60)
+    buf, offset = cache._map, cache._offset(0)
+
+    # the last writer died mid-write, leaving the sequence odd
+    seq = SLOT_HEADER.unpack_from(buf, offset)[0]
+    struct.pack_into("<I", buf, offset, seq + 1)
+    assert cache.get("goal") is None
+
+    cache.put("goal", b"creative", ttl=60)
+    assert SLOT_HEADER.unpack_from(buf, offset)[0] % 2 == 0
+    assert cache.get("goal") == b"creative"
+
+
+def test_classifier_asks_bedrock_once_per_goal(tmp_path, monkeypatch):
+    calls = []
+
+    async def fake_invoke(model_id, body, region=None, kind=None):
+        calls.append(model_id)
+        return InvocationResult(
+            {"content": [{"text": "fitness"}]}, "us-east-1", False, 5.0
+        )
+
+    monkeypatch.setattr(settings, "USE_MOCK_AWS", False)
+    monkeypatch.setattr(settings, "SHARED_CACHE_ENABLED", True)
+    monkeypatch.setattr(classifier, "invoke_model", fake_invoke)
+    monkeypatch.setattr(
+        classifier,
+        "classification_cache",
+        SharedCache(str(tmp_path / "c.cache"), 64, 128),
+    )
+
+    first = asyncio.run(classifier.classify_goal("Run a 5k"))
+    second = asyncio.run(classifier.classify_goal("  run a   5K "))
+    assert first == second == "fitness"
+    assert len(calls) == 1
@@ -0,0 +1,76 @@
+import json
+
+import pytest
+
+from app.models.schemas import GeneratedPlan
+from app.services import synthetic_plans
+from app.services.planner import parse_plan
+
+
+def test_same_goal_and_seed_give_the_same_text():
+    first = synthetic_plans.generate_plan_text(
+        "Learn Spanish in 6 months", "skill-learning"
+    )
+    again = synthetic_plans.generate_plan_text(
+        "Learn Spanish in 6 months", "skill-learning"
+    )
+    other_seed = synthetic_plans.generate_plan_text(
+        "Learn Spanish in 6 months", "skill-learning", seed=1
+    )
+    assert first == again
+    assert first != other_seed
+
+
+@pytest.mark.parametrize("weeks", [1, 12, 52])
+def test_sizes_are_configurable_and_valid(weeks):
+    plan = synthetic_plans.generate_plan_dict(
+        "Run a marathon", "fitness", weeks=weeks, tasks_per_week=4, resources=5
+    )
+    validated = GeneratedPlan.model_validate(plan)
+    assert validated.estimated_duration_weeks == weeks
+    assert len(validated.weekly_breakdown) == weeks
+    assert all(len(week.tasks) == 4 for week in validated.weekly_breakdown)
+    assert len(validated.resources) == 5
+    assert validated.total_estimated_hours == pytest.approx(
+        sum(t.estimated_hours for w in validated.weekly_breakdown for t in w.tasks)
+    )
+
+
+def test_weeks_follow_the_goal_horizon():
+    assert synthetic_plans.goal_weeks("Pass the AWS exam in 3 months") == 12
+    assert synthetic_plans.goal_weeks("Write a novel in 2 years") == 52
+    assert synthetic_plans.goal_weeks("Get better at chess") == 8
+
+
+def test_every_llm_quirk_still_parses():
+    plan = synthetic_plans.generate_plan_dict("Learn to paint", "creative", weeks=3)
+    quirky = [
+        synthetic_plans.render_llm_text(
+            plan, fence_rate=f, preamble_rate=p, trailing_rate=t
+        )
+        for f in (0, 1)
+        for p in (0, 1)
+        for t in (0, 1)
+    ]
+    assert any(text.startswith("```json") for text in quirky)
+    assert any(not text.rstrip().endswith(("}", "```")) for text in quirky)
+    for text in quirky:
+        assert (
+            parse_plan(text).model_dump()
+            == GeneratedPlan.model_validate(plan).model_dump()
+        )
+
+
+def test_goal_is_read_back_from_the_planner_prompt():
+    messages = [
+        {"role": "user", "content": "Goal: Learn Rust\nAdditional context: none"}
+    ]
+    assert synthetic_plans.goal_from_prompt(messages) == "Learn Rust"
+    assert (
+        synthetic_plans.goal_from_prompt([{"role": "user", "content": "Classify"}])
+        is None
+    )
+    bare = synthetic_plans.render_llm_text(
+        {"a": 1}, fence_rate=0, preamble_rate=0, trailing_rate=0
+    )
+    assert json.loads(bare) == {"a": 1}
@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+
+from app.middleware import TracingMiddleware
+from app.services import tracing
+from app.services.tracing import span, start_trace
+
+UPSTREAM = "Root=1-5759e988-bd862e3fe1be46a994272793;Parent=53995c3f42cd8ad8;Sampled=1"
+
+
+def test_segment_document_nests_spans_and_joins_upstream_trace():
+    async def handle():
+        trace = start_trace(trace_header=UPSTREAM)
+        with span("generation"):
+            with span("llm", model="haiku"):
+                await asyncio.sleep(0.01)
+            with span("validate"):
+                pass
+        with span("llm"):
+            pass
+        return trace
+
+    trace = asyncio.run(handle())
+    segment = trace.segment()
+
+    assert segment["trace_id"] == "1-5759e988-bd862e3fe1be46a994272793"
+    assert segment["parent_id"] == "53995c3f42cd8ad8"
+    assert segment["start_time"] <= segment["end_time"]
+    generation = segment["subsegments"][0]
+    assert [s["name"] for s in generation["subsegments"]] == ["llm", "validate"]
+    assert generation["subsegments"][0]["annotations"] == {"model": "haiku"}
+
+    timing = dict(entry.split(";dur=") for entry in trace.server_timing().split(", "))
+    assert list(timing) == ["generation", "llm", "validate", "total"]
+    assert float(timing["llm"]) >= 10
+
+
+def test_spans_outside_a_trace_are_timed_but_not_recorded():
+    with span("classification") as s:
+        pass
+    assert s.duration_ms >= 0
+    assert tracing.current_trace() is None
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_bedrock_call_splits_time_to_first_byte_and_body(
+    streaming, fake_bedrock, make_invoker, model_id, bedrock_body
+):
+    server = fake_bedrock(latency_ms=30, response_text="word " * 50)
+    invoker = make_invoker(server, streaming=streaming)
+
+    async def call():
+        trace = start_trace()
+        with span("llm"):
+            await invoker.invoke(model_id, dict(bedrock_body, max_tokens=400))
+        return trace
+
+    trace = asyncio.run(call())
+
+    llm = trace.root.children[0]
+    names = [child.name for child in llm.children]
+    assert names == ["llm_ttfb", "llm_body"]
+    assert llm.children[0].duration_ms >= 30
+
+
+def test_middleware_adds_server_timing_header():
+    async def app(scope, receive, send):
+        with span("classification"):
+            pass
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"{}"})
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": "/api/v1/generate-plan",
+        "headers": [],
+    }
+    asyncio.run(TracingMiddleware(app, server_timing=True)(scope, receive, send))
+
+    headers = dict(sent[0]["headers"])
+    assert headers[b"server-timing"].startswith(b"classification;dur=")
+    assert b"total;dur=" in headers[b"server-timing"]
@@ -0,0 +1,180 @@
+import asyncio
+from datetime import datetime, timezone
+
+import httpx
+import pytest
+
+from app.config import settings
+from app import main, router
+from app.main import app
+from app.services import background, usage_rollups
+from app.services.usage_rollups import MemoryRollupStore, RollupBuffer
+
+NINE = datetime(2026, 10, 19, 9, tzinfo=timezone.utc).timestamp()
+USAGE = {"input_tokens": 700, "output_tokens": 1300, "cost_usd": 0.00180}
+
+
+def use_local_rollups(monkeypatch, flush_seconds=3600):
+    monkeypatch.setattr(settings, "BACKGROUND_WORK", False)
+    store = MemoryRollupStore()
+    monkeypatch.setattr(usage_rollups, "store", store)
+    monkeypatch.setattr(
+        usage_rollups, "buffer", RollupBuffer(flush_seconds, max_buckets=100)
+    )
+    return store
+
+
+def test_summary_reads_one_item_per_bucket_and_category(monkeypatch):
+    store = use_local_rollups(monkeypatch)
+    writes = []
+    real_add = store.add
+    monkeypatch.setattr(
+        store, "add", lambda *args: writes.append(args) or real_add(*args)
+    )
+
+    for hour in range(3):
+        for index in range(100):
+            usage_rollups.record(
+                "fitness" if index % 4 else "creative",
+                success=index % 10 != 0,
+                latency_ms=1000 + 10 * index,  # p95: ~1950 ms
+                usage=USAGE,
+                timestamp=NINE + hour * 3600 + index,
+            )
+    usage_rollups.buffer.flush()
+    # 300 requests: (3 hours + 1 day) x 2 categories
+    assert len(writes) == 8
+
+    start, end = datetime(2026, 10, 19, 9), datetime(2026, 10, 19, 11, 30)
+    summary = asyncio.run(usage_rollups.summary("hour", start, end))
+    assert store.reads == 6
+    assert [(row["bucket"], row["category"]) for row in summary["buckets"]] == [
+        ("2026-10-19-09", "creative"),
+        ("2026-10-19-09", "fitness"),
+        ("2026-10-19-10", "creative"),
+        ("2026-10-19-10", "fitness"),
+        ("2026-10-19-11", "creative"),
+        ("2026-10-19-11", "fitness"),
+    ]
+    fitness = summary["buckets"][1]
+    assert (fitness["requests"], fitness["errors"]) == (75, 5)
+    assert fitness["total_tokens"] == 75 * 2000
+    assert fitness["cost_usd"] == pytest.approx(75 * 0.0018)
+    assert 1850 < fitness["p95_latency_ms"] < 2050
+    assert summary["categories"]["creative"]["requests"] == 75
+    assert summary["categories"]["fitness"]["requests"] == 225
+
+    daily = asyncio.run(usage_rollups.summary("day", start, end, category="fitness"))
+    assert [(row["bucket"], row["requests"]) for row in daily["buckets"]] == [
+        ("2026-10-19", 225)
+    ]
+
+
+def test_rollups_add_up_across_flushes_and_processes(monkeypatch):
+    store = use_local_rollups(monkeypatch)
+    other_process = RollupBuffer(3600, max_buckets=100)
+    for buffer in (usage_rollups.buffer, other_process):
+        buffer.add("fitness", True, 500.0, USAGE, NINE)
+        buffer.flush()
+        buffer.add("fitness", False, 700.0, {}, NINE + 60)
+        buffer.flush()
+
+    end = f"2026-10-19-09#{usage_rollups.SORT_KEY_END}"
+    [item] = store.query("hour#2026-10-19", "2026-10-19-09#", end)
+    stats = usage_rollups.summarize(item)
+    assert (stats["requests"], stats["errors"], stats["input_tokens"]) == (4, 2, 1400)
+
+    with pytest.raises(ValueError):
+        usage_rollups.bucket_range("hour", datetime(2026, 1, 1), datetime(2026, 10, 19))
+
+
+def test_rollups_are_flushed_when_the_lambda_environment_shuts_down(monkeypatch):
+    store = use_local_rollups(monkeypatch)
+    usage_rollups.record("fitness", True, 500.0, USAGE, NINE)
+    assert store.query("hour#2026-10-19", "2026-10-19-09#", "2026-10-19-10#") == []
+
+    main.finish_lambda_environment()
+    [item] = store.query("hour#2026-10-19", "2026-10-19-09#", "2026-10-19-10#")
+    assert usage_rollups.summarize(item)["requests"] == 1
+
+
+def test_usage_summary_endpoint(monkeypatch):
+    use_local_rollups(monkeypatch)
+    monkeypatch.setattr(settings, "USE_MOCK_AWS", True)
+    monkeypatch.setattr(settings, "SHARED_CACHE_ENABLED", False)
+    monkeypatch.setattr(settings, "PLAN_LIBRARY_ENABLED", False)
+    for kind in ("usage_log", "plan_store"):
+        monkeypatch.setitem(background._handlers, kind, lambda **fields: None)
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://test"
+        ) as client:
+            for goal in ("Run a marathon in 4 months", "Learn Python in 3 months"):
+                assert (
+                    await client.post("/api/v1/generate-plan", json={"goal": goal})
+                ).status_code == 200
+            usage_rollups.buffer.flush()
+            summary = await client.get("/api/v1/usage/summary")
+            daily = await client.get(
+                "/api/v1/usage/summary", params={"granularity": "day"}
+            )
+            errors = [
+                await client.get(
+                    "/api/v1/usage/summary", params={"granularity": "week"}
+                ),
+                await client.get(
+                    "/api/v1/usage/summary",
+                    params={
+                        "start": "2026-10-19T12:00:00",
+                        "end": "2026-10-19T09:00:00",
+                    },
+                ),
+            ]
+            return summary, daily, errors
+
+    summary, daily, errors = asyncio.run(run())
+    assert summary.status_code == daily.status_code == 200
+    body = summary.json()
+    assert sum(stats["requests"] for stats in body["categories"].values()) == 2
+    assert all(row["p95_latency_ms"] is not None for row in body["buckets"])
+    assert sum(row["requests"] for row in daily.json()["buckets"]) == 2
+    assert [r.status_code for r in errors] == [422, 422]
+
+
+def test_rejected_requests_are_counted_as_errors(monkeypatch):
+    store = use_local_rollups(monkeypatch)
+    monkeypatch.setattr(settings, "USE_MOCK_AWS", True)
+    monkeypatch.setattr(settings, "SHARED_CACHE_ENABLED", False)
+    monkeypatch.setattr(settings, "PLAN_LIBRARY_ENABLED", False)
+    for kind in ("usage_log", "plan_store"):
+        monkeypatch.setitem(background._handlers, kind, lambda **fields: None)
+    monkeypatch.setattr(
+        router.cost_guard, "estimate_cost", lambda goal, context: 10**6
+    )
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://test"
+        ) as client:
+            rejected = await client.post(
+                "/api/v1/generate-plan", json={"goal": "Run a marathon in 4 months"}
+            )
+            unknown = await client.post(
+                "/api/v1/revise-plan", json={"request_id": "no-such-plan", "weeks": [1]}
+            )
+            return rejected, unknown
+
+    rejected, unknown = asyncio.run(run())
+    assert (rejected.status_code, unknown.status_code) == (413, 404)
+    usage_rollups.buffer.flush()
+    day = usage_rollups.bucket_of(usage_rollups.DAY, datetime.utcnow())
+    end = f"{day}#{usage_rollups.SORT_KEY_END}"
+    items = store.query(usage_rollups.period_of(usage_rollups.DAY, day), f"{day}#", end)
+    assert (
+        sum(item["requests"] for item in items)
+        == sum(item["errors"] for item in items)
+        == 2
+    )